@@ -0,0 +1,130 @@
+import argparse
+import asyncio
+import io
+import statistics
+import sys
+from pathlib import Path
+from time import perf_counter
+
+parent_path = Path(__file__).parent.parent
+sys.path.append(str(parent_path))
+
+from fastapi import UploadFile
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+
+from common import FakeCloudinary
+from src.database.models import Base, User
+from src.repository import images as repository_images
+from src.services.album import upload_album
+from src.services.cloudinary import CloudImage
+from src.services.feed import feed
+from src.services.response_cache import response_cache
+from src.services.tags_index import tag_index
+
+
+"""To start the benchmark, enter : python benchmarks/bench_album.py --files 20 --cloudinary-latency-ms 50
+Cloudinary is replaced by a stand-in with the given latency, the database is SQLite in memory
+You must be in the killer_instagram directory in the console"""
+
+TAGS = ["holiday", "sea", "summer"]
+
+
+def album(number: int, files: int) -> list:
+    return [UploadFile(io.BytesIO(b"image"), filename=f"album{number}_photo{index}.jpg") for index in range(files)]
+
+
+async def upload_one_by_one(db: Session, user: User, files: list, description: str, tags: list) -> list:
+    # what an album costs with POST /images for every file: an upload, a transaction and a call for the tags
+    images = []
+    for file in files:
+        public_id = CloudImage.generate_name_image(email=user.email, filename=file.filename)
+        cloud = CloudImage.upload_image(file=file.file, public_id=public_id)
+        images.append(await repository_images.create_image(
+            db=db, user_id=user.id, description=description, image_url=cloud["secure_url"],
+            public_id=cloud["public_id"], tags=tags, file_extension="jpg",
+        ))
+        tag_index.add(tags)
+        CloudImage.add_tags(cloud["public_id"], tags)
+    return images
+
+
+async def upload_concurrently(db: Session, user: User, files: list, description: str, tags: list,
+                              concurrency: int) -> list:
+    results = await upload_album(db, user, files, description, tags, concurrency=concurrency)
+    assert all(result["error"] is None for result in results)
+    return [result["image"] for result in results]
+
+
+async def measure(upload, db: Session, albums, queries: list) -> tuple:
+    timings, statements = [], []
+    for files in albums:
+        queries.clear()
+        started = perf_counter()
+        await upload(db, files)
+        timings.append(perf_counter() - started)
+        statements.append(len(queries))
+    return timings, statistics.median(statements)
+
+
+async def run(args) -> float:
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    queries = []
+    event.listen(engine, "before_cursor_execute", lambda *_: queries.append(1))
+    # only Cloudinary and the database are measured, there is no Redis for the caches and the feed
+    response_cache.enabled = False
+    feed.enabled = False
+    cloud = FakeCloudinary(args.cloudinary_latency_ms / 1000)
+    cloud.install()
+
+    with Session(engine) as db:
+        user = User(username="photographer", email="photographer@example.com", password="x", confirmed=True)
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+
+        async def serial(db, files):
+            return await upload_one_by_one(db, user, files, "album", TAGS)
+
+        async def concurrent(db, files):
+            return await upload_concurrently(db, user, files, "album", TAGS, args.concurrency)
+
+        rounds = range(args.rounds)
+        calls = cloud.calls
+        baseline, baseline_queries = await measure(serial, db, (album(number, args.files) for number in rounds),
+                                                   queries)
+        baseline_calls = (cloud.calls - calls) / args.rounds
+        calls = cloud.calls
+        measured, measured_queries = await measure(concurrent, db,
+                                                   (album(args.rounds + number, args.files) for number in rounds),
+                                                   queries)
+        measured_calls = (cloud.calls - calls) / args.rounds
+
+    for name, timings, statements, cloud_calls in (("one by one", baseline, baseline_queries, baseline_calls),
+                                                   ("album", measured, measured_queries, measured_calls)):
+        median = statistics.median(timings)
+        print(f"{name:<12} {median * 1000:9.1f} ms per album  {args.files / median:8.1f} images/s  "
+              f"{statements:5.0f} statements  {cloud_calls:4.0f} Cloudinary calls")
+    return statistics.median(baseline) / statistics.median(measured)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upload of an album against uploads of its files one by one")
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--cloudinary-latency-ms", type=float, default=50.0)
+    parser.add_argument("--min-speedup", type=float, default=4.0)
+    args = parser.parse_args()
+
+    speedup = asyncio.run(run(args))
+    if speedup < args.min_speedup:
+        print(f"FAIL: the album is only {speedup:.1f}x faster than uploads one by one, "
+              f"expected at least {args.min_speedup}x")
+        sys.exit(1)
+    print(f"OK: the album is {speedup:.1f}x faster than uploads one by one")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+import argparse
+import random
+import sys
+from pathlib import Path
+from time import perf_counter
+
+parent_path = Path(__file__).parent.parent
+sys.path.append(str(parent_path))
+
+from src.services.ban_list import BanList, build_lists
+
+
+"""To start the benchmark, enter : python benchmarks/bench_ban_list.py --networks 100000 --user-agents 10000
+You must be in the killer_instagram directory in the console"""
+
+
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/118.0 Safari/537.36",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148",
+    "python-requests/2.31.0",
+]
+
+
+def random_networks(quantity: int) -> list:
+    networks = []
+    for _ in range(quantity):
+        if random.random() < 0.8:
+            address = random.getrandbits(32) & ~0xFF
+            networks.append(f"{address >> 24}.{address >> 16 & 255}.{address >> 8 & 255}.0/{random.choice([24, 28, 32])}")
+        else:
+            networks.append(f"2001:db8:{random.getrandbits(16):x}:{random.getrandbits(16):x}::/64")
+    return networks
+
+
+def random_addresses(quantity: int) -> list:
+    addresses = [".".join(str(random.getrandbits(8)) for _ in range(4)) for _ in range(quantity * 4 // 5)]
+    addresses += [f"2001:db8:{random.getrandbits(16):x}::{random.getrandbits(16):x}" for _ in range(quantity // 5)]
+    random.shuffle(addresses)
+    return addresses
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time of one check of the ban lists")
+    parser.add_argument("--networks", type=int, default=100000)
+    parser.add_argument("--user-agents", type=int, default=10000)
+    parser.add_argument("--checks", type=int, default=100000)
+    parser.add_argument("--max-us", type=float, default=10.0)
+    args = parser.parse_args()
+    random.seed(42)
+
+    started = perf_counter()
+    networks, user_agents = build_lists(
+        random_networks(args.networks), [f"scanner-{number:05d}" for number in range(args.user_agents)] + ["re:^curl/"]
+    )
+    print(f"{args.networks} networks and {args.user_agents} user agents built in {perf_counter() - started:.2f} s")
+    ban_list = BanList(redis_client=None)
+    ban_list.networks, ban_list.user_agents = networks, user_agents
+
+    addresses = random_addresses(args.checks)
+    agents = [USER_AGENTS[number % len(USER_AGENTS)] for number in range(args.checks)]
+    started = perf_counter()
+    banned = sum(ban_list.check(address, agent) is not None for address, agent in zip(addresses, agents))
+    per_check = (perf_counter() - started) / args.checks * 10 ** 6
+    print(f"{per_check:.2f} us per check, {banned} of {args.checks} random clients are banned")
+
+    if per_check > args.max_us:
+        print(f"FAIL: a check takes {per_check:.2f} us, expected at most {args.max_us} us")
+        sys.exit(1)
+    print(f"OK: a check takes {per_check:.2f} us")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+from time import perf_counter
+
+parent_path = Path(__file__).parent.parent
+sys.path.append(str(parent_path))
+
+import aiosmtplib
+
+from src.services.email import build_message, email_template
+from src.services.mailer import Mailer, SMTPPool
+from src.services.smtp_sink import SMTPSink
+
+
+"""To start the benchmark, enter : python benchmarks/bench_email.py --messages 500
+The SMTP server is a local sink with delays of a remote server, no email leaves the machine
+You must be in the killer_instagram directory in the console"""
+
+
+def make_messages(quantity: int) -> list:
+    return [
+        build_message(f"user{number}@example.com", "Confirm your email ",
+                      email_template.render(host="http://localhost:8000/", username=f"user{number}", token="token"))
+        for number in range(quantity)
+    ]
+
+
+async def connection_per_message(sink: SMTPSink, messages: list) -> float:
+    """Sends messages one by one with a new connection for every message, like the old send_email did."""
+    started = perf_counter()
+    for message in messages:
+        await aiosmtplib.send(message, hostname=sink.host, port=sink.port, use_tls=False)
+    return perf_counter() - started
+
+
+async def pooled_mailer(sink: SMTPSink, messages: list, workers: int, batch_size: int) -> float:
+    mailer = Mailer(SMTPPool(hostname=sink.host, port=sink.port, use_tls=False),
+                    workers=workers, batch_size=batch_size, rate_limit=0)
+    started = perf_counter()
+    for message in messages:
+        mailer.enqueue(message)
+    await mailer.stop(timeout=600)
+    return perf_counter() - started
+
+
+async def run(args) -> float:
+    messages = make_messages(args.messages)
+    results = {}
+    for name in ("connection per message", "pooled mailer"):
+        async with SMTPSink(connect_delay=args.connect_ms / 1000, message_delay=args.message_ms / 1000) as sink:
+            if name == "pooled mailer":
+                elapsed = await pooled_mailer(sink, messages, args.workers, args.batch_size)
+            else:
+                elapsed = await connection_per_message(sink, messages)
+            assert len(sink.messages) == len(messages), f"{len(sink.messages)} of {len(messages)} messages received"
+            results[name] = elapsed
+            print(f"{name:<24} {len(messages) / elapsed:8.1f} messages/s  {sink.connections:5d} connections  "
+                  f"{elapsed:6.2f}s")
+    return results["connection per message"] / results["pooled mailer"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput of the pooled mailer against a connection per message")
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=2, help="Workers and pooled connections of the mailer")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--connect-ms", type=float, default=50.0,
+                        help="Delay of a new connection, like the TLS handshake and login of a real server")
+    parser.add_argument("--message-ms", type=float, default=5.0, help="Delay of the answer to every message")
+    parser.add_argument("--min-speedup", type=float, default=5.0)
+    args = parser.parse_args()
+
+    speedup = asyncio.run(run(args))
+    if speedup < args.min_speedup:
+        print(f"FAIL: the pooled mailer is {speedup:.1f} times faster, expected at least {args.min_speedup}")
+        sys.exit(1)
+    print(f"OK: the pooled mailer is {speedup:.1f} times faster")
+
+
+if __name__ == '__main__':
+    main()
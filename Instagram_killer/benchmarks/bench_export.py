@@ -0,0 +1,107 @@
+import argparse
+import resource
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+from time import perf_counter
+
+parent_path = Path(__file__).parent.parent
+sys.path.append(str(parent_path))
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import Session
+
+from common import insert_chunks
+from src.database.models import Base, User
+from src.repository import users as repository_users
+from src.services import export as service_export
+
+
+"""To start the benchmark, enter : python benchmarks/bench_export.py --users 10000000 --format ndjson
+The database is seeded once and kept in benchmarks/data, seeding 10M users takes several minutes
+You must be in the killer_instagram directory in the console"""
+
+DATA_FOLDER = Path(__file__).parent / "data"
+
+
+def seeded_engine(users: int, reseed: bool):
+    """
+    The seeded_engine function returns an engine of a SQLite database with only the users table filled.
+    The database file is reused by next runs while it has the requested quantity of users.
+
+    :param users: int: Quantity of users
+    :param reseed: bool: Recreate the database even if it exists
+    :return: An engine
+    """
+    DATA_FOLDER.mkdir(exist_ok=True)
+    path = DATA_FOLDER / f"users_{users}.db"
+    engine = create_engine(f"sqlite:///{path}")
+    if path.exists() and not reseed:
+        with engine.connect() as conn:
+            if conn.execute(select(func.count()).select_from(User.__table__)).scalar() == users:
+                return engine
+    Base.metadata.drop_all(bind=engine, tables=[User.__table__])
+    Base.metadata.create_all(bind=engine, tables=[User.__table__])
+    started = datetime(2023, 1, 1)
+    seeding = perf_counter()
+    insert_chunks(engine, User.__table__, (
+        {"id": user_id, "username": f"user{user_id}", "email": f"user{user_id}@example.com",
+         "password": "$2b$12$" + "x" * 53, "refresh_token": "y" * 200, "confirmed": True,
+         "role": "user", "banned": False, "created_at": started + timedelta(seconds=user_id)}
+        for user_id in range(1, users + 1)
+    ))
+    print(f"seeded {users} users in {perf_counter() - seeding:.1f}s")
+    return engine
+
+
+def counted(batches, totals: dict):
+    for batch in batches:
+        totals["rows"] += len(batch)
+        yield batch
+
+
+def max_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput and memory of the streaming export of users")
+    parser.add_argument("--users", type=int, default=10_000_000)
+    parser.add_argument("--format", choices=sorted(service_export.CHUNKS), default="ndjson")
+    parser.add_argument("--batch-size", type=int, default=repository_users.EXPORT_BATCH_SIZE)
+    parser.add_argument("--reseed", action="store_true")
+    parser.add_argument("--budget-mb", type=float, default=64.0,
+                        help="Maximum growth of the peak memory of the process during the export")
+    args = parser.parse_args()
+
+    engine = seeded_engine(args.users, args.reseed)
+    rss_before = max_rss_mb()
+    totals = {"rows": 0}
+    size = 0
+    first_chunk = None
+    started = perf_counter()
+    with Session(engine) as db:
+        batches = repository_users.export_users(db, batch_size=args.batch_size)
+        for chunk in service_export.CHUNKS[args.format](counted(batches, totals), repository_users.EXPORT_FIELDS):
+            if first_chunk is None:
+                first_chunk = perf_counter() - started
+            size += len(chunk)
+    elapsed = perf_counter() - started
+    growth = max_rss_mb() - rss_before
+    rows = totals["rows"]
+
+    print(f"exported {rows} users as {args.format}: {size / 2 ** 20:.1f} MB in {elapsed:.1f}s, "
+          f"{rows / elapsed:,.0f} rows/s, first chunk after {first_chunk * 1000:.1f}ms")
+    print(f"peak memory grew by {growth:.1f} MB")
+    if rows != args.users:
+        print(f"FAIL: {args.users - rows} users are missing in the export")
+        sys.exit(1)
+    if growth > args.budget_mb:
+        print(f"FAIL: memory grew above {args.budget_mb} MB")
+        sys.exit(1)
+    print(f"OK: memory grew below {args.budget_mb} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+import argparse
+import asyncio
+import statistics
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+from time import perf_counter
+
+parent_path = Path(__file__).parent.parent
+sys.path.append(str(parent_path))
+
+from redis.exceptions import RedisError
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import Session
+
+from common import insert_chunks
+from src.conf.config import settings
+from src.database.models import Base, Image, User
+from src.services.feed import Feed
+from src.services.metrics import InstrumentedRedis
+from src.services.response_cache import ResponseCache
+
+
+"""To start the benchmark, enter : python benchmarks/bench_feed.py --users 100000 --images 10000000
+The database is seeded once and kept in benchmarks/data, seeding 10M images takes several minutes
+Redis from the settings is used when it is running, otherwise only the database path of the feed is measured
+You must be in the killer_instagram directory in the console"""
+
+DATA_FOLDER = Path(__file__).parent / "data"
+TABLES = [User.__table__, Image.__table__]
+
+
+def seeded_engine(users: int, images: int, reseed: bool):
+    """
+    The seeded_engine function returns an engine of a SQLite database with users and their images.
+    The database file is reused by next runs while it has the requested quantity of images.
+
+    :param users: int: Quantity of users
+    :param images: int: Quantity of images, owners are spread over all users
+    :param reseed: bool: Recreate the database even if it exists
+    :return: An engine
+    """
+    DATA_FOLDER.mkdir(exist_ok=True)
+    path = DATA_FOLDER / f"feed_{users}_{images}.db"
+    engine = create_engine(f"sqlite:///{path}")
+    if path.exists() and not reseed:
+        with engine.connect() as conn:
+            if conn.execute(select(func.count()).select_from(Image.__table__)).scalar() == images:
+                return engine
+    Base.metadata.drop_all(bind=engine, tables=TABLES)
+    Base.metadata.create_all(bind=engine, tables=TABLES)
+    started = datetime(2023, 1, 1)
+    seeding = perf_counter()
+    insert_chunks(engine, User.__table__, (
+        {"id": user_id, "username": f"user{user_id}", "email": f"user{user_id}@example.com",
+         "password": "$2b$12$" + "x" * 53, "confirmed": True, "role": "user", "banned": False}
+        for user_id in range(1, users + 1)
+    ))
+    insert_chunks(engine, Image.__table__, (
+        {"id": image_id, "user_id": image_id * 7919 % users + 1, "description": f"image number {image_id}",
+         "image_url": f"https://res.cloudinary.com/demo/image/upload/{image_id}.jpg", "public_id": f"image_{image_id}",
+         "file_extension": "jpg", "comment_count": image_id % 13, "upload_time": started + timedelta(seconds=image_id)}
+        for image_id in range(1, images + 1)
+    ))
+    print(f"seeded {users} users and {images} images in {perf_counter() - seeding:.1f}s")
+    return engine
+
+
+def scan_page(db: Session, limit: int, offset: int) -> list:
+    # what a feed reads without the timeline: the newest images of all users with their owners
+    return db.execute(
+        select(Image.id, Image.user_id, User.username, Image.description, Image.image_url,
+               Image.comment_count, Image.upload_time)
+        .join(User, User.id == Image.user_id)
+        .order_by(Image.upload_time.desc()).limit(limit).offset(offset)
+    ).all()
+
+
+async def feed_pages(feed: Feed, db: Session, limit: int, pages: int) -> int:
+    before, quantity = None, 0
+    for _ in range(pages):
+        image_ids, before = await feed.page(db, limit=limit, before=before)
+        quantity += len(await feed.cards(db, image_ids))
+        if before is None:
+            break
+    return quantity
+
+
+def describe(timings: list) -> str:
+    timings = sorted(timings)
+    return f"p50 {statistics.median(timings) * 1000:9.3f} ms  p99 {timings[int(len(timings) * 0.99)] * 1000:9.3f} ms"
+
+
+async def timings(function, requests: int) -> list:
+    measured = []
+    for _ in range(requests):
+        started = perf_counter()
+        await function()
+        measured.append(perf_counter() - started)
+    return measured
+
+
+async def redis_is_running(redis_client: InstrumentedRedis) -> bool:
+    try:
+        await redis_client.ping()
+        return True
+    except (RedisError, OSError):
+        return False
+
+
+async def run(args) -> float:
+    engine = seeded_engine(args.users, args.images, args.reseed)
+    redis_client = InstrumentedRedis(host=settings.redis_host, port=settings.redis_port,
+                                     password=settings.redis_password, socket_connect_timeout=0.5)
+    redis_running = await redis_is_running(redis_client)
+    feed = Feed(redis_client, ResponseCache(redis_client, prefix="bench_response"), size=args.timeline,
+                prefix="bench_feed")
+    if redis_running:
+        await redis_client.delete(feed.timeline)
+    else:
+        print(f"Redis on {settings.redis_host}:{settings.redis_port} is not running, "
+              f"the feed is read from the database by id")
+        feed.redis_down_until = float("inf")
+        feed.cache.redis_down_until = float("inf")
+
+    with Session(engine) as db:
+        async def scan():
+            return scan_page(db, args.limit, 0)
+
+        async def scan_deep():
+            return scan_page(db, args.limit, args.limit * (args.pages - 1))
+
+        async def first_page():
+            return await feed_pages(feed, db, args.limit, 1)
+
+        async def deep_pages():
+            return await feed_pages(feed, db, args.limit, args.pages)
+
+        baseline = await timings(scan, args.scans)
+        print(f"{'scan, page 1':<28} {describe(baseline)}")
+        print(f"{f'scan, page {args.pages}':<28} {describe(await timings(scan_deep, args.scans))}")
+        # the first page rebuilds the timeline and renders the cards
+        await first_page()
+        measured = await timings(first_page, args.requests)
+        print(f"{'feed, page 1':<28} {describe(measured)}")
+        print(f"{f'feed, pages 1-{args.pages}':<28} {describe(await timings(deep_pages, max(1, args.requests // 10)))}")
+
+    if redis_running:
+        image_ids = iter(range(args.images + 1, args.images + args.requests + 1))
+
+        async def publish():
+            await feed.publish(next(image_ids))
+        print(f"{'fan-out of a new image':<28} {describe(await timings(publish, args.requests))}")
+        await redis_client.delete(feed.timeline)
+    await redis_client.close()
+    return statistics.median(baseline) / statistics.median(measured)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency of the feed against a scan of the newest images")
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--images", type=int, default=10_000_000)
+    parser.add_argument("--timeline", type=int, default=settings.feed_timeline_size)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--scans", type=int, default=5)
+    parser.add_argument("--reseed", action="store_true")
+    parser.add_argument("--min-speedup", type=float, default=10.0)
+    args = parser.parse_args()
+
+    speedup = asyncio.run(run(args))
+    if speedup < args.min_speedup:
+        print(f"FAIL: the first page of the feed is only {speedup:.1f}x faster than the scan, "
+              f"expected at least {args.min_speedup}x")
+        sys.exit(1)
+    print(f"OK: the first page of the feed is {speedup:.1f}x faster than the scan")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+import argparse
+import asyncio
+import statistics
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+from time import perf_counter
+
+parent_path = Path(__file__).parent.parent
+sys.path.append(str(parent_path))
+
+from sqlalchemy import create_engine, delete, func, select
+from sqlalchemy.orm import Session
+
+from common import insert_chunks
+from src.database.models import Base, Follow, User
+from src.repository import follows as repository_follows
+from src.services.response_cache import response_cache
+
+
+"""To start the benchmark, enter : python benchmarks/bench_follows.py --followers 1000000
+The database is seeded once and kept in benchmarks/data, seeding 1M followers takes about a minute
+You must be in the killer_instagram directory in the console"""
+
+DATA_FOLDER = Path(__file__).parent / "data"
+TABLES = [User.__table__, Follow.__table__]
+CELEBRITY_ID = 1
+
+
+def seeded_engine(followers: int, reseed: bool):
+    """
+    The seeded_engine function returns an engine of a SQLite database with a celebrity followed by all other users.
+    Every follower follows a few other users too, so the index of followers is not made of one user only.
+    The database file is reused by next runs while it has the requested quantity of followers.
+
+    :param followers: int: Quantity of followers of the celebrity
+    :param reseed: bool: Recreate the database even if it exists
+    :return: An engine
+    """
+    DATA_FOLDER.mkdir(exist_ok=True)
+    path = DATA_FOLDER / f"follows_{followers}.db"
+    engine = create_engine(f"sqlite:///{path}")
+    if path.exists() and not reseed:
+        with engine.connect() as conn:
+            if conn.execute(select(User.followers_count).where(User.id==CELEBRITY_ID)).scalar() == followers:
+                return engine
+    Base.metadata.drop_all(bind=engine, tables=TABLES)
+    Base.metadata.create_all(bind=engine, tables=TABLES)
+    users = followers + 1
+    started = datetime(2023, 1, 1)
+    seeding = perf_counter()
+    insert_chunks(engine, User.__table__, (
+        {"id": user_id, "username": f"user{user_id}", "email": f"user{user_id}@example.com",
+         "password": "$2b$12$" + "x" * 53, "confirmed": True, "role": "user", "banned": False,
+         "followers_count": followers if user_id == CELEBRITY_ID else 3, "following_count": 4}
+        for user_id in range(1, users + 1)
+    ))
+    insert_chunks(engine, Follow.__table__, (
+        {"follower_id": user_id, "followed_id": followed_id, "created_at": started + timedelta(seconds=user_id)}
+        for user_id in range(2, users + 1)
+        for followed_id in sorted({CELEBRITY_ID} | {(user_id + step * 7919) % followers + 2 for step in (1, 2, 3)}
+                                  - {user_id})
+    ))
+    print(f"seeded {users} users and their follows in {perf_counter() - seeding:.1f}s")
+    return engine
+
+
+def offset_page(db: Session, limit: int, offset: int) -> list:
+    # what a page of followers costs without the keyset: every skipped row is read
+    return db.execute(
+        select(User.id, User.username, User.avatar, Follow.created_at)
+        .join(Follow, Follow.follower_id==User.id).where(Follow.followed_id==CELEBRITY_ID)
+        .order_by(Follow.created_at.desc(), Follow.follower_id.desc()).limit(limit).offset(offset)
+    ).all()
+
+
+def describe(timings: list) -> str:
+    timings = sorted(timings)
+    return f"p50 {statistics.median(timings) * 1000:9.3f} ms  p99 {timings[int(len(timings) * 0.99)] * 1000:9.3f} ms"
+
+
+async def timings(function, requests: int) -> list:
+    measured = []
+    for _ in range(requests):
+        started = perf_counter()
+        await function()
+        measured.append(perf_counter() - started)
+    return measured
+
+
+async def run(args) -> float:
+    engine = seeded_engine(args.followers, args.reseed)
+    # only the database is measured, follows would invalidate cached profiles in Redis
+    response_cache.enabled = False
+    deep_offset = args.followers // 2
+    with Session(engine) as db:
+        # the keyset of the row at the deep offset, where a client scrolling the followers would be
+        deep = offset_page(db, 1, deep_offset - 1)[0]
+        before = (deep.created_at, deep.id)
+
+        async def count_scan():
+            return db.execute(select(func.count()).where(Follow.followed_id==CELEBRITY_ID)).scalar()
+
+        async def count_cached():
+            return db.execute(select(User.followers_count).where(User.id==CELEBRITY_ID)).scalar()
+
+        async def offset_deep():
+            return offset_page(db, args.limit, deep_offset)
+
+        async def keyset_first():
+            return await repository_follows.get_followers(CELEBRITY_ID, db, limit=args.limit)
+
+        async def keyset_deep():
+            return await repository_follows.get_followers(CELEBRITY_ID, db, limit=args.limit, before=before)
+
+        async def relationship():
+            return await repository_follows.get_relationship(CELEBRITY_ID, args.followers // 3, db)
+
+        assert [row.id for row in await keyset_deep()] == [row.id for row in await offset_deep()]
+        print(f"{'COUNT(*) of followers':<34} {describe(await timings(count_scan, args.scans))}")
+        print(f"{'cached count of followers':<34} {describe(await timings(count_cached, args.requests))}")
+        baseline = await timings(offset_deep, args.scans)
+        print(f"{f'OFFSET page at {deep_offset}':<34} {describe(baseline)}")
+        print(f"{'keyset page 1':<34} {describe(await timings(keyset_first, args.requests))}")
+        measured = await timings(keyset_deep, args.requests)
+        print(f"{f'keyset page at {deep_offset}':<34} {describe(measured)}")
+        print(f"{'mutual follow check':<34} {describe(await timings(relationship, args.requests))}")
+
+        # a new user follows a batch of accounts, the celebrity among them, then repeats the request
+        follower_id = args.followers + 2
+        db.add(User(id=follower_id, username="newcomer", email="newcomer@example.com", password="x", confirmed=True))
+        db.commit()
+        batch = list(range(1, args.batch + 1))
+        started = perf_counter()
+        followed, _ = await repository_follows.follow_users(follower_id, batch, db)
+        print(f"{f'follow {args.batch} users':<34} {(perf_counter() - started) * 1000:9.3f} ms  {len(followed)} new")
+        started = perf_counter()
+        followed, _ = await repository_follows.follow_users(follower_id, batch, db)
+        print(f"{f'repeat of the follow':<34} {(perf_counter() - started) * 1000:9.3f} ms  {len(followed)} new")
+        await repository_follows.unfollow_users(follower_id, batch, db)
+        db.execute(delete(User).where(User.id==follower_id))
+        db.commit()
+    return statistics.median(baseline) / statistics.median(measured)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Follower lists, counts and checks of a celebrity account")
+    parser.add_argument("--followers", type=int, default=1_000_000)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--scans", type=int, default=5)
+    parser.add_argument("--reseed", action="store_true")
+    parser.add_argument("--min-speedup", type=float, default=100.0)
+    args = parser.parse_args()
+
+    speedup = asyncio.run(run(args))
+    if speedup < args.min_speedup:
+        print(f"FAIL: a deep page of followers is only {speedup:.1f}x faster than OFFSET, "
+              f"expected at least {args.min_speedup}x")
+        sys.exit(1)
+    print(f"OK: a deep page of followers is {speedup:.1f}x faster than OFFSET")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+import argparse
+import asyncio
+import statistics
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+from time import perf_counter
+
+parent_path = Path(__file__).parent.parent
+sys.path.append(str(parent_path))
+
+from redis.exceptions import RedisError
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import Session
+
+from common import insert_chunks
+from src.conf.config import settings
+from src.database.models import Base, Image, Rating, User
+from src.repository import rating as repository_rating
+from src.services.metrics import InstrumentedRedis
+from src.services.ranking import RANKINGS, ImageRanking
+
+
+"""To start the benchmark, enter : python benchmarks/bench_ranking.py --images 1000000
+The database is seeded once and kept in benchmarks/data
+Redis from the settings is used when it is running, otherwise only the compaction and the scan are measured
+You must be in the killer_instagram directory in the console"""
+
+DATA_FOLDER = Path(__file__).parent / "data"
+TABLES = [User.__table__, Image.__table__, Rating.__table__]
+
+
+def seeded_engine(images: int, ratings_per_image: int, reseed: bool):
+    """
+    The seeded_engine function returns an engine of a SQLite database with rated images.
+    The database file is reused by next runs while it has the requested quantity of images.
+
+    :param images: int: Quantity of images
+    :param ratings_per_image: int: Maximum quantity of ratings of an image, images get 0 to this many
+    :param reseed: bool: Recreate the database even if it exists
+    :return: An engine
+    """
+    DATA_FOLDER.mkdir(exist_ok=True)
+    path = DATA_FOLDER / f"ranking_{images}_{ratings_per_image}.db"
+    engine = create_engine(f"sqlite:///{path}")
+    if path.exists() and not reseed:
+        with engine.connect() as conn:
+            if conn.execute(select(func.count()).select_from(Image.__table__)).scalar() == images:
+                return engine
+    Base.metadata.drop_all(bind=engine, tables=TABLES)
+    Base.metadata.create_all(bind=engine, tables=TABLES)
+    started = datetime(2023, 1, 1)
+    seeding = perf_counter()
+    insert_chunks(engine, User.__table__, (
+        {"id": user_id, "username": f"user{user_id}", "email": f"user{user_id}@example.com",
+         "password": "$2b$12$" + "x" * 53, "confirmed": True, "role": "user", "banned": False}
+        for user_id in range(1, ratings_per_image + 2)
+    ))
+    insert_chunks(engine, Image.__table__, (
+        {"id": image_id, "user_id": 1, "description": f"image number {image_id}",
+         "image_url": f"https://res.cloudinary.com/demo/image/upload/{image_id}.jpg", "public_id": f"image_{image_id}",
+         "file_extension": "jpg", "comment_count": 0, "upload_time": started + timedelta(seconds=image_id * 7)}
+        for image_id in range(1, images + 1)
+    ))
+    insert_chunks(engine, Rating.__table__, (
+        {"image_id": image_id, "user_id": rater + 2, "rating": (image_id * 31 + rater * 17) % 5 + 1}
+        for image_id in range(1, images + 1)
+        for rater in range(image_id * 7919 % (ratings_per_image + 1))
+    ))
+    print(f"seeded {images} images in {perf_counter() - seeding:.1f}s")
+    return engine
+
+
+def scan_top(db: Session, limit: int) -> list:
+    # what the top costs without the rankings: the average of every image on every request
+    average = func.avg(Rating.rating)
+    return db.execute(select(Rating.image_id, average).group_by(Rating.image_id)
+                      .order_by(average.desc(), func.count(Rating.id).desc()).limit(limit)).all()
+
+
+def describe(timings: list) -> str:
+    timings = sorted(timings)
+    return f"p50 {statistics.median(timings) * 1000:9.3f} ms  p99 {timings[int(len(timings) * 0.99)] * 1000:9.3f} ms"
+
+
+async def timings(function, requests: int) -> list:
+    measured = []
+    for _ in range(requests):
+        started = perf_counter()
+        await function()
+        measured.append(perf_counter() - started)
+    return measured
+
+
+async def redis_is_running(redis_client: InstrumentedRedis) -> bool:
+    try:
+        await redis_client.ping()
+        return True
+    except (RedisError, OSError):
+        return False
+
+
+async def run(args) -> float:
+    engine = seeded_engine(args.images, args.ratings, args.reseed)
+    redis_client = InstrumentedRedis(host=settings.redis_host, port=settings.redis_port,
+                                     password=settings.redis_password, socket_connect_timeout=0.5)
+    redis_running = await redis_is_running(redis_client)
+    ranking = ImageRanking(redis_client, size=args.size, prefix="bench_top")
+
+    with Session(engine) as db:
+        async def scan():
+            return scan_top(db, args.limit)
+
+        baseline = await timings(scan, args.scans)
+        print(f"{'AVG scan, top page':<28} {describe(baseline)}")
+
+        started = perf_counter()
+        rankings = ranking.rank(repository_rating.iter_rating_stats(db))
+        elapsed = perf_counter() - started
+        print(f"{'ranking of all images':<28} {elapsed:9.3f} s   {args.images / elapsed:12.0f} images/s")
+
+        if not redis_running:
+            print(f"Redis on {settings.redis_host}:{settings.redis_port} is not running, "
+                  f"reads of the rankings are not measured")
+            await redis_client.close()
+            return 0.0
+
+        started = perf_counter()
+        await ranking.compact(db)
+        print(f"{'compaction to Redis':<28} {perf_counter() - started:9.3f} s   "
+              f"{len(rankings[0])} images in every ranking")
+
+        for kind in RANKINGS:
+            async def top():
+                return await ranking.top(db, kind, limit=args.limit)
+            measured = await timings(top, args.requests)
+            print(f"{f'top {kind}, page 1':<28} {describe(measured)}")
+
+        image_ids = iter(range(1, args.requests + 1))
+
+        async def refresh():
+            await ranking.refresh(db, next(image_ids))
+        print(f"{'update after a rating':<28} {describe(await timings(refresh, args.requests))}")
+
+    await redis_client.delete(*(ranking.key(kind) for kind in RANKINGS))
+    await redis_client.close()
+    return statistics.median(baseline) / statistics.median(measured)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency of the top images against an AVG scan of all ratings")
+    parser.add_argument("--images", type=int, default=1_000_000)
+    parser.add_argument("--ratings", type=int, default=5, help="maximum quantity of ratings of an image")
+    parser.add_argument("--size", type=int, default=settings.top_images_size)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--scans", type=int, default=5)
+    parser.add_argument("--reseed", action="store_true")
+    parser.add_argument("--min-speedup", type=float, default=100.0)
+    args = parser.parse_args()
+
+    speedup = asyncio.run(run(args))
+    if not speedup:
+        print("SKIP: start Redis to compare the top with the scan")
+        return
+    if speedup < args.min_speedup:
+        print(f"FAIL: the top is only {speedup:.1f}x faster than the scan, expected at least {args.min_speedup}x")
+        sys.exit(1)
+    print(f"OK: the top is {speedup:.1f}x faster than the scan")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+import argparse
+import asyncio
+import statistics
+import sys
+from pathlib import Path
+from time import perf_counter
+
+parent_path = Path(__file__).parent.parent
+sys.path.append(str(parent_path))
+
+import httpx
+from fastapi import Depends, FastAPI
+from redis.exceptions import RedisError
+
+from src.conf.config import settings
+from src.services.metrics import InstrumentedRedis
+from src.services.rate_limit import TOKEN_BUCKET_SCRIPT, RateLimit, limiter
+
+
+"""To start the benchmark, enter : python benchmarks/bench_rate_limit.py --requests 5000
+Redis from the settings is measured when it is running, buckets in memory are measured always
+You must be in the killer_instagram directory in the console"""
+
+
+def make_app() -> FastAPI:
+    app = FastAPI()
+    limited = RateLimit("bench", 10 ** 9, 1)
+
+    @app.get("/plain")
+    async def plain():
+        return {"ok": True}
+
+    @app.get("/limited", dependencies=[Depends(limited)])
+    async def limited_route():
+        return {"ok": True}
+
+    return app
+
+
+async def latencies(http: httpx.AsyncClient, path: str, requests: int) -> list:
+    timings = []
+    for _ in range(requests):
+        started = perf_counter()
+        response = await http.get(path)
+        timings.append(perf_counter() - started)
+        assert response.status_code == 200, response.text
+    return timings
+
+
+def describe(timings: list) -> str:
+    timings = sorted(timings)
+    p50 = statistics.median(timings) * 1000
+    p99 = timings[int(len(timings) * 0.99)] * 1000
+    return f"p50 {p50:7.3f} ms  p99 {p99:7.3f} ms"
+
+
+async def redis_is_running(redis_client: InstrumentedRedis) -> bool:
+    try:
+        await redis_client.ping()
+        return True
+    except (RedisError, OSError):
+        return False
+
+
+async def run(args) -> float:
+    app = make_app()
+    redis_client = InstrumentedRedis(host=settings.redis_host, port=settings.redis_port,
+                                     password=settings.redis_password, socket_connect_timeout=0.5)
+    backends = ["memory"]
+    if await redis_is_running(redis_client):
+        backends.insert(0, "redis")
+        # the first request loads the script, it is loaded here to keep it out of the timings
+        await redis_client.script_load(TOKEN_BUCKET_SCRIPT)
+    else:
+        print(f"Redis on {settings.redis_host}:{settings.redis_port} is not running, only memory buckets are measured")
+
+    worst = 0.0
+    async with httpx.AsyncClient(app=app, base_url="http://bench") as http:
+        await latencies(http, "/plain", 100)
+        plain = await latencies(http, "/plain", args.requests)
+        print(f"{'without limit':<16} {describe(plain)}")
+        limiter.enabled = True
+        for backend in backends:
+            # buckets in memory are used while Redis is considered down
+            limiter.redis_down_until = 0.0 if backend == "redis" else float("inf")
+            limited = await latencies(http, "/limited", args.requests)
+            added = (statistics.median(limited) - statistics.median(plain)) * 1000
+            worst = max(worst, added)
+            print(f"{backend + ' limit':<16} {describe(limited)}  added p50 {added:6.3f} ms")
+    await redis_client.close()
+    return worst
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency added to a request by the rate limit dependency")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--max-added-ms", type=float, default=1.0)
+    args = parser.parse_args()
+
+    added = asyncio.run(run(args))
+    if added > args.max_added_ms:
+        print(f"FAIL: the rate limit adds {added:.3f} ms, expected at most {args.max_added_ms} ms")
+        sys.exit(1)
+    print(f"OK: the rate limit adds {added:.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+import pytest
+from sqlalchemy import func, select
+
+from src.database.models import Image, User, image_m2m_tag, Tag
+from src.repository import images as repository_images
+from src.repository import logout as repository_logout
+from src.repository import rating as repository_rating
+from src.repository import users as repository_users
+
+
+"""To start the benchmark, enter : pytest benchmarks/bench_repository.py --scales 1000,100000,1000000 --benchmark-json benchmarks/results/repository.json
+To keep the results of every run for trend tracking, add --benchmark-autosave and compare runs with --benchmark-compare
+You must be in the killer_instagram directory in the console"""
+
+
+def run(coroutine):
+    """
+    The run function completes a coroutine of a repository function without an event loop.
+    Repository functions use the synchronous session and never really await, so the coroutine
+    finishes on the first step and the timing does not include the scheduling of an event loop.
+    """
+    try:
+        coroutine.send(None)
+    except StopIteration as stop:
+        return stop.value
+    coroutine.close()
+    raise RuntimeError("Repository function awaited something, run it in an event loop")
+
+
+def measure(benchmark, queries, max_queries: int, scale: int, call):
+    """
+    The measure function checks the query budget of the call once and then times it.
+    The quantity of queries and the scale are saved with the timings in the JSON results.
+    """
+    with queries.budget(max_queries):
+        result = call()
+    benchmark.extra_info.update(scale=scale, queries=max_queries)
+    benchmark(call)
+    return result
+
+
+def popular_tag(db) -> str:
+    return db.execute(
+        select(Tag.tag).join(image_m2m_tag, image_m2m_tag.c.tag_id == Tag.id)
+        .group_by(Tag.tag).order_by(func.count().desc()).limit(1)
+    ).scalar()
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_get_image_by_id(benchmark, db, queries, scale):
+    image_id = scale // 2
+    image = measure(benchmark, queries, 1, scale,
+                    lambda: run(repository_images.get_image_by_id(db=db, image_id=image_id)))
+    assert image.id == image_id
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_get_image_by_id_with_links(benchmark, db, queries, scale):
+    image_id = scale // 2
+    image = measure(benchmark, queries, 1, scale,
+                    lambda: run(repository_images.get_image_by_id(db=db, image_id=image_id, with_links=True)))
+    assert image.transformed_links == []
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_create_image(benchmark, db, queries, scale):
+    tags = [popular_tag(db), "benchmark", "new_image"]
+    # image, tags lookup and links to tags, new tag names are created by the first call
+    run(repository_images.create_image(db=db, user_id=1, description="benchmark", image_url="url",
+                                       public_id="benchmark", tags=tags, file_extension="jpg"))
+    image = measure(benchmark, queries, 3, scale,
+                    lambda: run(repository_images.create_image(db=db, user_id=1, description="benchmark",
+                                                               image_url="url", public_id="benchmark",
+                                                               tags=tags, file_extension="jpg")))
+    assert image.description == "benchmark"
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_find_images_by_tag(benchmark, db, queries, scale):
+    tag = popular_tag(db)
+    user_id = db.execute(
+        select(Image.user_id).join(image_m2m_tag, image_m2m_tag.c.image_id == Image.id)
+        .join(Tag, Tag.id == image_m2m_tag.c.tag_id).where(Tag.tag == tag).limit(1)
+    ).scalar()
+    images = measure(benchmark, queries, 2, scale,
+                     lambda: run(repository_images.find_images_by_tag(user_id=user_id, db=db, tag_name=tag, date=True)))
+    assert len(images) >= 1
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_get_average_rating_for_image(benchmark, db, queries, scale):
+    image = run(repository_images.get_image_by_id(db=db, image_id=scale // 2, with_links=True))
+    result = measure(benchmark, queries, 1, scale,
+                     lambda: run(repository_rating.get_average_rating_for_image(image=image, db=db)))
+    assert 1 <= result["rating"] <= 5
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_get_user_by_email(benchmark, db, queries, scale):
+    email = f"user{scale // 2}@example.com"
+    user = measure(benchmark, queries, 1, scale,
+                   lambda: run(repository_users.get_user_by_email(email=email, db=db)))
+    assert user.email == email
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_get_user_profile(benchmark, db, queries, scale):
+    username = f"user{scale // 2}"
+    profile = measure(benchmark, queries, 1, scale,
+                      lambda: run(repository_users.get_user_profile(username=username, db=db)))
+    assert profile["quantity_of_loaded_images"] == 1
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_token_to_blacklist(benchmark, db, queries, scale):
+    user_id = db.execute(select(User.id).where(User.email == f"user{scale // 3}@example.com")).scalar()
+    run(repository_logout.token_to_blacklist(access_token="first", user_id=user_id, db=db))
+    # lookup of the old token, its delete, insert of the new one and refresh
+    token = measure(benchmark, queries, 4, scale,
+                    lambda: run(repository_logout.token_to_blacklist(access_token="token", user_id=user_id, db=db)))
+    assert token.user_id == user_id
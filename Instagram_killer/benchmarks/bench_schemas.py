@@ -0,0 +1,138 @@
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+from time import perf_counter
+
+parent_path = Path(__file__).parent.parent
+sys.path.append(str(parent_path))
+
+import pydantic
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute, serialize_response
+
+from bench_serialization import make_comments, make_images, make_ratings, make_users
+from src.routes import auth, comments, images, rating, tags, users
+
+
+"""To start the benchmark, enter : python benchmarks/bench_schemas.py --items 100 --save before.json
+Every route of the API with a request body or a response model is measured: validation of a sample body
+and serialization of sample ORM objects by the response model, the same calls FastAPI does for a request.
+Run it on two versions of the code and compare them with --compare before.json
+You must be in the killer_instagram directory in the console"""
+
+BODIES = {
+    "UserModel": {"username": "bench_user", "email": "Bench@Example.com", "password": "password"},
+    "RequestEmail": {"email": "bench@example.com"},
+    "ChangePassword": {"new_password": "new_password"},
+    "UserRoleUpdate": {"role": "moderator"},
+    "ImageDescriptionUpdate": {"new_description": "a new description"},
+    "RatingModel": {"image_id": 1, "rating": 5},
+    "CommentModel": {"comment": "a comment", "image_id": 1},
+    "CommentBulkDelete": {"comment_ids": list(range(1, 101)), "created_after": "2023-11-05T10:00:00"},
+    "CommentUpdate": {"new_comment": "an updated comment"},
+}
+
+
+def responses(items: int) -> dict:
+    return {
+        "TokenResponce": {"access_token": "a" * 150, "refresh_token": "r" * 150, "token_type": "bearer"},
+        "UserResponce": make_users(1)[0],
+        "UserListResponse": {"users": make_users(items), "next_cursor": "eyJpZCI6IDEwMH0"},
+        "ImageResponse": make_images(1)[0],
+        "CommentListResponse": {"comments": make_comments(items), "comment_count": items, "next_cursor": None},
+        "RatingResponse": make_ratings(1)[0],
+        "CommentResponce": make_comments(1)[0],
+        "CommentBulkDeleteResponse": {"deleted": items, "images": 3, "dry_run": False},
+        "List[str]": [f"tag{number}" for number in range(min(items, 10))],
+        "List[TagUsageResponse]": [{"tag": f"tag{number}", "count": number} for number in range(min(items, 10))],
+    }
+
+
+def make_app() -> FastAPI:
+    app = FastAPI()
+    for module in (auth, users, images, rating, comments, tags):
+        app.include_router(module.router, prefix='/api')
+    return app
+
+
+def type_name(field) -> str:
+    # outer_type_ of pydantic 1 and the annotation of pydantic 2 are the declared type, like List[TagUsageResponse]
+    annotation = getattr(field, "outer_type_", None) or field.field_info.annotation
+    args = getattr(annotation, "__args__", None)
+    return f"List[{args[0].__name__}]" if args else annotation.__name__
+
+
+def timing(function, repeat: int) -> float:
+    function()
+    started = perf_counter()
+    for _ in range(repeat):
+        function()
+    return (perf_counter() - started) / repeat
+
+
+async def async_timing(function, repeat: int) -> float:
+    await function()
+    started = perf_counter()
+    for _ in range(repeat):
+        await function()
+    return (perf_counter() - started) / repeat
+
+
+async def measure(args) -> dict:
+    samples = responses(args.items)
+    results = {}
+    for route in make_app().routes:
+        if not isinstance(route, APIRoute):
+            continue
+        name = f"{'/'.join(sorted(route.methods))} {route.path}"
+        if route.body_field is not None and type_name(route.body_field) in BODIES:
+            body = BODIES[type_name(route.body_field)]
+
+            def validate(field=route.body_field, body=body):
+                value, errors = field.validate(body, {}, loc=("body",))
+                assert not errors, errors
+            results[f"{name} request"] = timing(validate, args.repeat)
+        if route.response_field is not None and type_name(route.response_field) in samples:
+            content = samples[type_name(route.response_field)]
+
+            async def serialize(field=route.response_field, content=content):
+                return JSONResponse(await serialize_response(field=field, response_content=content)).body
+            results[f"{name} response"] = await async_timing(serialize, args.repeat)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cost of request validation and response serialization of every route")
+    parser.add_argument("--items", type=int, default=100, help="Items of the list responses")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--save", help="Save the results to a json file")
+    parser.add_argument("--compare", help="Compare with results saved by --save")
+    parser.add_argument("--min-speedup", type=float, default=1.0, help="Expected total speedup against --compare")
+    args = parser.parse_args()
+
+    results = asyncio.run(measure(args))
+    before = json.loads(Path(args.compare).read_text())["results"] if args.compare else {}
+    print(f"pydantic {pydantic.VERSION}")
+    for name, seconds in results.items():
+        line = f"{name:<60} {seconds * 1e6:10.1f} µs"
+        if name in before:
+            line += f" {before[name] * 1e6:10.1f} µs before {before[name] / seconds:6.1f}x"
+        print(line)
+    total = sum(results.values())
+    print(f"{'total':<60} {total * 1e6:10.1f} µs")
+    if args.save:
+        Path(args.save).write_text(json.dumps({"pydantic": pydantic.VERSION, "results": results}, indent=2))
+    if before:
+        common = [name for name in results if name in before]
+        speedup = sum(before[name] for name in common) / sum(results[name] for name in common)
+        if speedup < args.min_speedup:
+            print(f"FAIL: only {speedup:.1f}x faster than {args.compare}, expected at least {args.min_speedup}x")
+            sys.exit(1)
+        print(f"OK: {speedup:.1f}x faster in total over {len(common)} measurements")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+import argparse
+import asyncio
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+from time import perf_counter
+from typing import List
+
+parent_path = Path(__file__).parent.parent
+sys.path.append(str(parent_path))
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from src.database.models import Comment, Image, Rating, TransformedImageLink, User
+from src.schemas.comments import CommentResponce
+from src.schemas.images import ImageResponse
+from src.schemas.rating import RatingResponse
+from src.schemas.users import UserResponce
+from src.services.serialization import trusted_response
+
+
+"""To start the benchmark, enter : python benchmarks/bench_serialization.py --sizes 1 100 1000
+Serialization of ORM objects by response schemas is compared, the database is not used
+You must be in the killer_instagram directory in the console"""
+
+STARTED = datetime(2023, 11, 5, 10, 0)
+
+
+def make_images(quantity: int) -> list:
+    images = []
+    for number in range(quantity):
+        image = Image(id=number, user_id=number % 50, description=f"image number {number}",
+                      image_url=f"https://res.cloudinary.com/demo/image/upload/{number}.jpg",
+                      public_id=f"image_{number}", file_extension="jpg", comment_count=number % 7,
+                      upload_time=STARTED + timedelta(minutes=number))
+        image.transformed_links = [
+            TransformedImageLink(id=number * 2 + link, image_id=number, created_at=STARTED + timedelta(hours=link),
+                                 transformation_url=f"https://res.cloudinary.com/demo/image/upload/e_{link}/{number}.jpg",
+                                 qr_code_url=None)
+            for link in range(2)
+        ]
+        images.append(image)
+    return images
+
+
+def make_users(quantity: int) -> list:
+    return [User(id=number, username=f"user{number}", email=f"user{number}@example.com", password="$2b$12$" + "x" * 53,
+                 avatar=f"https://www.gravatar.com/avatar/{number}", role="user", banned=False)
+            for number in range(quantity)]
+
+
+def make_comments(quantity: int) -> list:
+    return [Comment(id=number, comment=f"comment number {number}", image_id=number % 100, user_id=number % 50,
+                    created_at=STARTED + timedelta(seconds=number), updated_at=None)
+            for number in range(quantity)]
+
+
+def make_ratings(quantity: int) -> list:
+    return [Rating(id=number, image_id=number % 100, user_id=number % 50, rating=number % 5 + 1)
+            for number in range(quantity)]
+
+
+SHAPES = {
+    "ImageResponse": (ImageResponse, make_images),
+    "UserResponce": (UserResponce, make_users),
+    "CommentResponce": (CommentResponce, make_comments),
+    "RatingResponse": (RatingResponse, make_ratings),
+}
+
+
+async def default_path(field, items: list) -> bytes:
+    # what FastAPI does with the value returned by a route with response_model
+    return JSONResponse(await serialize_response(field=field, response_content=items)).body
+
+
+async def orjson_path(field, items: list) -> bytes:
+    return ORJSONResponse(await serialize_response(field=field, response_content=items)).body
+
+
+async def trusted_path(schema, items: list) -> bytes:
+    return trusted_response(items, schema).body
+
+
+async def timing(function, argument, items: list, repeat: int) -> float:
+    await function(argument, items)
+    started = perf_counter()
+    for _ in range(repeat):
+        await function(argument, items)
+    return (perf_counter() - started) / repeat
+
+
+async def run(args) -> float:
+    print(f"{'shape':<16} {'items':>6} {'default':>11} {'orjson':>11} {'trusted':>11} {'speedup':>8}")
+    slowest = float("inf")
+    for name, (schema, make) in SHAPES.items():
+        field = create_response_field(name=f"response_{name}", type_=List[schema])
+        for size in args.sizes:
+            items = make(size)
+            repeat = max(5, args.items // size)
+            default = await timing(default_path, field, items, repeat)
+            orjson_only = await timing(orjson_path, field, items, repeat)
+            trusted = await timing(trusted_path, schema, items, repeat)
+            slowest = min(slowest, default / trusted)
+            print(f"{name:<16} {size:>6} {default * 1000:8.3f} ms {orjson_only * 1000:8.3f} ms "
+                  f"{trusted * 1000:8.3f} ms {default / trusted:7.1f}x")
+    return slowest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cost of serializing responses by shape and size")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 100, 1000])
+    parser.add_argument("--items", type=int, default=20000, help="Items serialized for every measurement")
+    parser.add_argument("--min-speedup", type=float, default=1.0)
+    args = parser.parse_args()
+
+    speedup = asyncio.run(run(args))
+    if speedup < args.min_speedup:
+        print(f"FAIL: the trusted path is only {speedup:.1f}x faster, expected at least {args.min_speedup}x")
+        sys.exit(1)
+    print(f"OK: the trusted path is at least {speedup:.1f}x faster")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+import argparse
+import random
+import string
+import sys
+from pathlib import Path
+from time import perf_counter
+
+parent_path = Path(__file__).parent.parent
+sys.path.append(str(parent_path))
+
+from src.services.tags_index import TagIndex
+
+
+"""To start the benchmark, enter : python benchmarks/bench_tags_suggest.py --tags 1000000
+You must be in the killer_instagram directory in the console"""
+
+
+def generate_usage(quantity: int, seed: int) -> dict:
+    """
+    The generate_usage function builds distinct random tag names with skewed usage counts,
+    a few tags are used very often and most of them only a couple of times.
+
+    :param quantity: int: Quantity of distinct tags
+    :param seed: int: Seed of the random generator
+    :return: A dict of tag name and usage count
+    """
+    rnd = random.Random(seed)
+    usage = {}
+    while len(usage) < quantity:
+        tag = "".join(rnd.choices(string.ascii_lowercase, k=rnd.randint(3, 12)))
+        usage[tag] = int(rnd.paretovariate(1.2))
+    return usage
+
+
+def percentile(timings: list, value: float) -> float:
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * value))]
+
+
+def report(name: str, timings: list) -> float:
+    p50, p99 = percentile(timings, 0.5) * 1e6, percentile(timings, 0.99) * 1e6
+    print(f"{name:<28} p50={p50:9.1f}us  p99={p99:9.1f}us  max={max(timings) * 1e6:9.1f}us")
+    return p99
+
+
+def measure_suggest(tag_index: TagIndex, prefixes: list, limit: int) -> list:
+    timings = []
+    for prefix in prefixes:
+        started = perf_counter()
+        tag_index.suggest(prefix, limit)
+        timings.append(perf_counter() - started)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency of TagIndex.suggest at a large tag vocabulary")
+    parser.add_argument("--tags", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=20_000)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--budget-us", type=float, default=1000.0)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    started = perf_counter()
+    usage = generate_usage(args.tags, args.seed)
+    print(f"generated {len(usage)} tags in {perf_counter() - started:.1f}s")
+
+    tag_index = TagIndex()
+    started = perf_counter()
+    tag_index.load(usage.items())
+    print(f"loaded index in {perf_counter() - started:.1f}s")
+
+    rnd = random.Random(args.seed)
+    names = list(usage)
+    prefixes = [tag[:rnd.randint(1, 4)] for tag in rnd.choices(names, k=args.queries)]
+
+    tag_index.suggest("", args.limit)
+    first_pass = measure_suggest(tag_index, prefixes, args.limit)
+    second_pass = measure_suggest(tag_index, prefixes, args.limit)
+
+    updates = []
+    for tag in rnd.choices(names, k=args.queries):
+        started = perf_counter()
+        tag_index.add([tag])
+        updates.append(perf_counter() - started)
+
+    after_updates = measure_suggest(tag_index, prefixes, args.limit)
+
+    removals = []
+    for tag in rnd.choices(names, k=args.queries):
+        started = perf_counter()
+        tag_index.remove([tag])
+        removals.append(perf_counter() - started)
+
+    # the most used tags lose images, so they sink in the cached tops of their prefixes
+    for tag in tag_index.suggest("", tag_index.TOP_SIZE):
+        tag_index.remove([tag])
+    after_removals = measure_suggest(tag_index, [""] + prefixes, args.limit)
+
+    started = perf_counter()
+    tag_index.load(usage.items())
+    print(f"reloaded index in {perf_counter() - started:.1f}s")
+    after_reload = measure_suggest(tag_index, [""] + prefixes, args.limit)
+
+    report("suggest (first pass)", first_pass)
+    checked = [
+        report("suggest (warm)", second_pass),
+        report("suggest (after updates)", after_updates),
+        report("suggest (after removals)", after_removals),
+        report("suggest (after reload)", after_reload),
+    ]
+    report("add existing tag", updates)
+    report("remove tag", removals)
+
+    if max(checked) > args.budget_us:
+        print(f"FAIL: p99 is above {args.budget_us}us")
+        sys.exit(1)
+    print(f"OK: p99 is below {args.budget_us}us")
+
+
+if __name__ == '__main__':
+    main()
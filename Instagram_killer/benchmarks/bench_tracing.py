@@ -0,0 +1,110 @@
+import argparse
+import asyncio
+import sys
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+parent_path = Path(__file__).parent.parent
+sys.path.append(str(parent_path))
+
+from src.services import tracing as service_tracing
+
+
+"""To start the benchmark, enter : python benchmarks/bench_tracing.py --requests 20000
+You must be in the killer_instagram directory in the console"""
+
+
+@service_tracing.traced
+async def get_image(image_id: int) -> int:
+    return await get_owner(image_id)
+
+
+@service_tracing.traced
+async def get_owner(image_id: int) -> int:
+    return image_id
+
+
+async def untraced_get_image(image_id: int) -> int:
+    return await untraced_get_owner(image_id)
+
+
+async def untraced_get_owner(image_id: int) -> int:
+    return image_id
+
+
+async def handle_request(image_id: int, calls: int) -> None:
+    with service_tracing.start_request_span("GET", f"/api/images/{image_id}", {}):
+        for _ in range(calls):
+            await get_image(image_id)
+
+
+async def untraced_handle_request(image_id: int, calls: int) -> None:
+    for _ in range(calls):
+        await untraced_get_image(image_id)
+
+
+def percentile(timings: list, value: float) -> float:
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * value))]
+
+
+async def measure(func, requests: int, calls: int) -> list:
+    timings = []
+    for image_id in range(requests):
+        started = perf_counter()
+        await func(image_id, calls)
+        timings.append(perf_counter() - started)
+    return timings
+
+
+def report(name: str, timings: list, baseline: float, spans: int) -> float:
+    mean = sum(timings) / len(timings) * 1e6
+    p50, p99 = percentile(timings, 0.5) * 1e6, percentile(timings, 0.99) * 1e6
+    overhead = (mean - baseline) / spans
+    print(f"{name:<14} mean={mean:8.1f}us  p50={p50:8.1f}us  p99={p99:8.1f}us  overhead per span={overhead:6.2f}us")
+    return overhead
+
+
+async def run(args) -> float:
+    # a request span with two nested spans for every repository call
+    spans = 1 + 2 * args.calls
+    baseline_timings = await measure(untraced_handle_request, args.requests, args.calls)
+    baseline = sum(baseline_timings) / len(baseline_timings) * 1e6
+    report("no tracing", baseline_timings, baseline, spans)
+
+    service_tracing.setup_tracing(sample_ratio=0)
+    report("tracing off", await measure(handle_request, args.requests, args.calls), baseline, spans)
+
+    overhead = 0.0
+    with tempfile.TemporaryDirectory() as folder:
+        for ratio in args.ratios:
+            path = Path(folder) / f"traces_{ratio}.jsonl"
+            service_tracing.setup_tracing(sample_ratio=ratio, exporter=service_tracing.file_exporter(str(path)))
+            overhead = report(f"sampled {ratio:.0%}", await measure(handle_request, args.requests, args.calls),
+                              baseline, spans)
+            service_tracing.shutdown_tracing()
+            with open(path) as file:
+                exported = sum(1 for _ in file)
+            print(f"{'':<14} exported {exported} spans")
+    return overhead
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Overhead of tracing spans on requests making traced calls")
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--calls", type=int, default=5, help="Traced calls made by every request")
+    parser.add_argument("--ratios", type=float, nargs="+", default=[0.01, 0.1, 1.0],
+                        help="Sampling ratios, the budget is checked for the last one")
+    parser.add_argument("--budget-us", type=float, default=100.0, help="Maximum overhead per span")
+    args = parser.parse_args()
+
+    overhead = asyncio.run(run(args))
+    if overhead > args.budget_us:
+        print(f"FAIL: overhead per span is above {args.budget_us}us")
+        sys.exit(1)
+    print(f"OK: overhead per span is below {args.budget_us}us")
+
+
+if __name__ == '__main__':
+    main()
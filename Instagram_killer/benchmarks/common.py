@@ -0,0 +1,187 @@
+import random
+import string
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+import cloudinary.api
+import cloudinary.uploader
+from passlib.context import CryptContext
+from sqlalchemy import insert
+from sqlalchemy.engine import Engine
+
+from src.database.models import Base, Comment, Image, Rating, Tag, User, image_m2m_tag
+
+
+"""Helpers shared by the benchmarks: a generator of a realistic dataset, a stand-in of Cloudinary and latency statistics."""
+
+PASSWORD = "password"
+CHUNK_SIZE = 5000
+
+
+@dataclass
+class Dataset:
+    """Sizes and generated values of a seeded database, the ids are given in insertion order."""
+    users: int
+    images: int
+    tags: List[str]
+    image_owners: List[int] = field(repr=False)
+
+    def user_email(self, user_id: int) -> str:
+        return f"user{user_id}@example.com"
+
+    def user_name(self, user_id: int) -> str:
+        return f"user{user_id}"
+
+
+def random_words(rnd: random.Random, quantity: int, length: tuple = (3, 12)) -> List[str]:
+    words = set()
+    while len(words) < quantity:
+        words.add("".join(rnd.choices(string.ascii_lowercase, k=rnd.randint(*length))))
+    return sorted(words)
+
+
+def insert_chunks(engine: Engine, table, rows) -> None:
+    """
+    The insert_chunks function inserts generated rows with executemany statements of CHUNK_SIZE rows,
+    so millions of rows never stay in memory at once.
+
+    :param engine: Engine: The engine of the benchmark database
+    :param table: Table: The table to fill
+    :param rows: Iterable[dict]: Generated rows
+    :return: None
+    """
+    chunk = []
+    with engine.begin() as conn:
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= CHUNK_SIZE:
+                conn.execute(insert(table), chunk)
+                chunk = []
+        if chunk:
+            conn.execute(insert(table), chunk)
+
+
+def seed_database(engine: Engine, users: int = 200, images_per_user: int = 10, tags: int = 500,
+                  tags_per_image: int = 3, ratings_per_image: int = 3, comments_per_image: int = 5,
+                  seed: int = 42) -> Dataset:
+    """
+    The seed_database function recreates the tables and fills them with users, images, tags, ratings and comments.
+    Tag usage is skewed like in real life: a few tags are on many images and most of them only on a couple.
+    Every user has the same password PASSWORD and a confirmed email, so any of them can log in.
+
+    :param engine: Engine: The engine of the benchmark database
+    :param users: int: Quantity of users
+    :param images_per_user: int: Quantity of images of every user
+    :param tags: int: Quantity of distinct tags
+    :param tags_per_image: int: Quantity of tags of every image
+    :param ratings_per_image: int: Quantity of ratings of every image, from other users
+    :param comments_per_image: int: Quantity of comments of every image
+    :param seed: int: Seed of the random generator
+    :return: The description of the seeded data
+    """
+    rnd = random.Random(seed)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+    password = CryptContext(schemes=["bcrypt"], deprecated="auto").hash(PASSWORD)
+    dataset = Dataset(users=users, images=users * images_per_user, tags=random_words(rnd, tags),
+                      image_owners=[user_id for user_id in range(1, users + 1) for _ in range(images_per_user)])
+    started = datetime(2023, 1, 1)
+    tag_weights = [1 / rank for rank in range(1, tags + 1)]
+
+    insert_chunks(engine, User.__table__, (
+        {"id": user_id, "username": dataset.user_name(user_id), "email": dataset.user_email(user_id),
+         "password": password, "confirmed": True, "role": "admin" if user_id == 1 else "user",
+         "banned": False, "created_at": started}
+        for user_id in range(1, users + 1)
+    ))
+    insert_chunks(engine, Tag.__table__, ({"id": tag_id, "tag": tag} for tag_id, tag in enumerate(dataset.tags, 1)))
+    insert_chunks(engine, Image.__table__, (
+        {"id": image_id, "user_id": owner, "description": " ".join(rnd.choices(dataset.tags, k=4)),
+         "image_url": f"https://res.cloudinary.com/demo/image/upload/image{image_id}.jpg",
+         "public_id": f"image{image_id}", "file_extension": "jpg", "comment_count": comments_per_image,
+         "upload_time": started + timedelta(minutes=image_id)}
+        for image_id, owner in enumerate(dataset.image_owners, 1)
+    ))
+    insert_chunks(engine, image_m2m_tag, (
+        {"image_id": image_id, "tag_id": tag_id}
+        for image_id in range(1, dataset.images + 1)
+        for tag_id in set(rnd.choices(range(1, tags + 1), weights=tag_weights, k=tags_per_image))
+    ))
+
+    def raters(owner: int, quantity: int) -> List[int]:
+        others = rnd.sample(range(1, users + 1), min(users, quantity + 1))
+        return [user_id for user_id in others if user_id != owner][:quantity]
+
+    insert_chunks(engine, Rating.__table__, (
+        {"image_id": image_id, "user_id": user_id, "rating": rnd.randint(1, 5)}
+        for image_id, owner in enumerate(dataset.image_owners, 1)
+        for user_id in raters(owner, ratings_per_image)
+    ))
+    insert_chunks(engine, Comment.__table__, (
+        {"image_id": image_id, "user_id": rnd.randint(1, users), "comment": " ".join(rnd.choices(dataset.tags, k=5)),
+         "created_at": started + timedelta(minutes=image_id, seconds=number)}
+        for image_id in range(1, dataset.images + 1)
+        for number in range(comments_per_image)
+    ))
+    return dataset
+
+
+def percentile(timings: list, value: float) -> float:
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * value))]
+
+
+def summarize(timings: list, elapsed: float) -> Dict[str, float]:
+    """
+    The summarize function turns latencies of one operation into the statistics stored in benchmark results.
+
+    :param timings: list: Latencies in seconds
+    :param elapsed: float: Wall time of the whole run in seconds, used for the throughput
+    :return: A dict with count, throughput and p50/p95/p99/max latencies in milliseconds
+    """
+    return {
+        "count": len(timings),
+        "throughput": round(len(timings) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(timings, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(timings, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(timings, 0.99) * 1000, 3),
+        "max_ms": round(max(timings) * 1000, 3),
+    }
+
+
+class FakeCloudinary:
+    """
+    Stand-in of the Cloudinary SDK calls made by CloudImage. The SDK is blocking,
+    so the delay is a blocking sleep as well, exactly like a real call holds the event loop.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+
+    def _call(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def upload(self, file, public_id: str = None, **kwargs):
+        self._call()
+        public_id = public_id or f"transformed{self.calls}"
+        return {"public_id": public_id, "version": 1,
+                "secure_url": f"https://res.cloudinary.com/demo/image/upload/v1/{public_id}.png"}
+
+    def destroy(self, public_id: str, **kwargs):
+        self._call()
+        return {"result": "ok"}
+
+    def update(self, public_id: str, **kwargs):
+        self._call()
+        return {"public_id": public_id}
+
+    def install(self):
+        cloudinary.uploader.upload = self.upload
+        cloudinary.uploader.destroy = self.destroy
+        cloudinary.api.update = self.update
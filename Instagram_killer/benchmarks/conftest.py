@@ -0,0 +1,76 @@
+import sys
+from pathlib import Path
+
+parent_path = Path(__file__).parent.parent
+sys.path.append(str(parent_path))
+sys.path.append(str(parent_path / "tests"))
+
+import pytest
+from sqlalchemy import create_engine, event, func, select
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.schema import CreateIndex
+
+from common import seed_database
+from helpers import QueryCounter
+from src.database.models import Base, User
+
+
+"""Fixtures of the repository benchmarks: seeded databases of several sizes and a query counter."""
+
+DATA_FOLDER = Path(__file__).parent / "data"
+
+
+def pytest_addoption(parser):
+    parser.addoption("--scales", default="1000,100000,1000000",
+                     help="Comma separated quantities of users and images in the benchmark databases")
+    parser.addoption("--reseed", action="store_true", help="Recreate benchmark databases that already exist")
+
+
+def pytest_generate_tests(metafunc):
+    if "scale" in metafunc.fixturenames:
+        scales = [int(scale) for scale in metafunc.config.getoption("scales").split(",") if scale.strip()]
+        metafunc.parametrize("scale", scales, scope="session")
+
+
+@pytest.fixture(scope="session")
+def engine(scale, request):
+    """
+    The engine fixture returns an engine of a SQLite database with scale users and scale images.
+    Seeding a million rows takes minutes, so the database file is kept in benchmarks/data and reused by next runs.
+    """
+    DATA_FOLDER.mkdir(exist_ok=True)
+    path = DATA_FOLDER / f"repository_{scale}.db"
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    seeded = path.exists() and not request.config.getoption("reseed")
+    if seeded:
+        with engine.connect() as conn:
+            seeded = conn.execute(select(func.count()).select_from(User.__table__)).scalar() == scale
+    if not seeded:
+        seed_database(engine, users=scale, images_per_user=1, tags=max(scale // 100, 100),
+                      tags_per_image=3, ratings_per_image=3, comments_per_image=1)
+    else:
+        # indexes added to the models after the database was seeded
+        with engine.begin() as conn:
+            for table in Base.metadata.sorted_tables:
+                for index in table.indexes:
+                    conn.execute(CreateIndex(index, if_not_exists=True))
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture(scope="function")
+def db(engine):
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        yield session
+    finally:
+        session.rollback()
+        session.close()
+
+
+@pytest.fixture(scope="function")
+def queries(engine):
+    counter = QueryCounter()
+    event.listen(engine, "before_cursor_execute", counter)
+    yield counter
+    event.remove(engine, "before_cursor_execute", counter)
@@ -0,0 +1,282 @@
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import sys
+from datetime import datetime
+from pathlib import Path
+from time import perf_counter
+
+parent_path = Path(__file__).parent.parent
+sys.path.append(str(parent_path))
+sys.path.append(str(parent_path.parent))
+sys.path.append(str(parent_path / "tests"))
+
+import httpx
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from common import PASSWORD, FakeCloudinary, seed_database, summarize
+from helpers import FakeRedis
+from main import app
+from src.database.db import get_db, track_queries
+from src.services import email as service_email
+from src.services.auth import service_auth
+from src.services.feed import feed
+from src.services.ranking import ranking
+from src.services.outbox import OutboxWorker
+from src.services.rate_limit import limiter
+from src.services.response_cache import response_cache
+from src.services.smtp_sink import SMTPSink
+
+
+"""To start the benchmark, enter : python benchmarks/load_test.py --clients 20 --requests 200
+To compare with a stored run, enter : python benchmarks/load_test.py --compare benchmarks/results/<file>.json
+You must be in the killer_instagram directory in the console"""
+
+RESULTS_FOLDER = Path(__file__).parent / "results"
+PNG = bytes.fromhex("89504e470d0a1a0a0000000d49484452000000010000000108060000001f15c489"
+                    "0000000d49444154789c6360000002000100e221bc330000000049454e44ae426082")
+
+
+class VirtualClient:
+    """A logged in user that sends a random mix of requests, like the scenario weights say."""
+
+    def __init__(self, http: httpx.AsyncClient, dataset, user_id: int, rnd: random.Random):
+        self.http = http
+        self.dataset = dataset
+        self.user_id = user_id
+        self.rnd = rnd
+        self.headers = {}
+
+    def other_image(self) -> int:
+        while True:
+            image_id = self.rnd.randint(1, self.dataset.images)
+            if self.dataset.image_owners[image_id - 1] != self.user_id:
+                return image_id
+
+    def tag(self) -> str:
+        # popular tags are searched more often
+        return self.dataset.tags[min(int(self.rnd.paretovariate(1.2)) - 1, len(self.dataset.tags) - 1)]
+
+    async def login(self):
+        response = await self.http.post("/api/auth/login", data={
+            "username": self.dataset.user_email(self.user_id), "password": PASSWORD
+        })
+        response.raise_for_status()
+        self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        return response
+
+    async def get_image(self):
+        return await self.http.get(f"/api/images/{self.other_image()}", headers=self.headers)
+
+    async def get_image_rating(self):
+        return await self.http.get(f"/api/images/{self.other_image()}/rating", headers=self.headers)
+
+    async def list_comments(self):
+        return await self.http.get(f"/api/images/{self.other_image()}/comments", params={"limit": 20},
+                                   headers=self.headers)
+
+    async def find_by_tag(self):
+        return await self.http.get("/api/images/find/by_tag", params={"tag": self.tag()}, headers=self.headers)
+
+    async def find_by_keyword(self):
+        return await self.http.get("/api/images/find/by_keyword", params={"keyword": self.tag()[:3]},
+                                   headers=self.headers)
+
+    async def suggest_tags(self):
+        return await self.http.get("/api/tags/suggest", params={"prefix": self.tag()[:2]}, headers=self.headers)
+
+    async def read_me(self):
+        return await self.http.get("/api/users/me", headers=self.headers)
+
+    async def add_comment(self):
+        return await self.http.post("/api/images/comments/", json={"comment": "nice picture", "image_id": self.other_image()},
+                                    headers=self.headers)
+
+    async def rate_image(self):
+        return await self.http.post("/api/images/rating/", json={"rating": self.rnd.randint(1, 5), "image_id": self.other_image()},
+                                    headers=self.headers)
+
+    async def upload_image(self):
+        return await self.http.post("/api/images/", params={"description": "load test", "tags": self.rnd.sample(self.dataset.tags, 3)},
+                                    files={"file": ("load_test.png", PNG, "image/png")}, headers=self.headers)
+
+    async def signup(self):
+        name = f"new{self.rnd.getrandbits(40):x}"
+        return await self.http.post("/api/auth/signup", json={"username": name, "email": f"{name}@example.com",
+                                                              "password": PASSWORD})
+
+
+# name of the measured endpoint, the client method that calls it and its share in the traffic
+SCENARIOS = [
+    ("GET /api/images/{image_id}", VirtualClient.get_image, 30),
+    ("GET /api/images/{image_id}/rating", VirtualClient.get_image_rating, 10),
+    ("GET /api/images/{image_id}/comments", VirtualClient.list_comments, 10),
+    ("GET /api/images/find/by_tag", VirtualClient.find_by_tag, 10),
+    ("GET /api/images/find/by_keyword", VirtualClient.find_by_keyword, 10),
+    ("GET /api/tags/suggest", VirtualClient.suggest_tags, 10),
+    ("GET /api/users/me", VirtualClient.read_me, 10),
+    ("POST /api/images/comments/", VirtualClient.add_comment, 8),
+    ("POST /api/images/rating/", VirtualClient.rate_image, 5),
+    ("POST /api/images/", VirtualClient.upload_image, 5),
+    ("POST /api/auth/signup", VirtualClient.signup, 2),
+]
+
+
+async def timed(timings: dict, statuses: dict, name: str, call):
+    started = perf_counter()
+    try:
+        status = str((await call()).status_code)
+    except Exception:
+        status = "exception"
+    timings.setdefault(name, []).append(perf_counter() - started)
+    counts = statuses.setdefault(name, {})
+    counts[status] = counts.get(status, 0) + 1
+
+
+async def run_client(client: VirtualClient, requests: int, timings: dict, statuses: dict):
+    await timed(timings, statuses, "POST /api/auth/login", client.login)
+    names, calls, weights = zip(*SCENARIOS)
+    for _ in range(requests):
+        index = client.rnd.choices(range(len(SCENARIOS)), weights=weights)[0]
+        await timed(timings, statuses, names[index], lambda: calls[index](client))
+
+
+async def run_load(args, dataset, session_factory) -> dict:
+    timings, statuses = {}, {}
+    rnd = random.Random(args.seed)
+    user_ids = rnd.sample(range(1, dataset.users + 1), min(args.clients, dataset.users))
+    async with SMTPSink(message_delay=args.smtp_latency_ms / 1000) as sink, \
+            httpx.AsyncClient(app=app, base_url="http://loadtest") as http:
+        pool = service_email.mailer.pool
+        pool.hostname, pool.port, pool.use_tls, pool.username = sink.host, sink.port, False, None
+        # signup saves emails in the outbox, the worker sends them to the sink like the worker process does in production
+        worker = OutboxWorker(session_factory, service_email.mailer, poll_interval=0.1)
+        worker.start()
+        clients = [VirtualClient(http, dataset, user_id, random.Random(args.seed + user_id)) for user_id in user_ids]
+        started = perf_counter()
+        await asyncio.gather(*(run_client(client, args.requests, timings, statuses) for client in clients))
+        elapsed = perf_counter() - started
+        await worker.stop()
+        while await worker.drain_once():
+            pass
+        await service_email.mailer.stop()
+    endpoints = {}
+    for name, values in sorted(timings.items()):
+        errors = sum(count for status, count in statuses[name].items() if not status.startswith(("2", "3", "4")))
+        endpoints[name] = dict(summarize(values, elapsed), errors=errors, statuses=statuses[name])
+    total = sum(len(values) for values in timings.values())
+    return {"elapsed_s": round(elapsed, 3), "requests": total, "throughput": round(total / elapsed, 2),
+            "errors": sum(stats["errors"] for stats in endpoints.values()), "emails": len(sink.messages),
+            "endpoints": endpoints}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_report(result: dict):
+    print(f"{'endpoint':<36} {'count':>6} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>6}  statuses")
+    for name, stats in result["endpoints"].items():
+        statuses = " ".join(f"{status}:{count}" for status, count in sorted(stats["statuses"].items()))
+        print(f"{name:<36} {stats['count']:>6} {stats['throughput']:>8.1f} {stats['p50_ms']:>8.2f} "
+              f"{stats['p95_ms']:>8.2f} {stats['p99_ms']:>8.2f} {stats['errors']:>6}  {statuses}")
+    print(f"total {result['requests']} requests in {result['elapsed_s']}s, "
+          f"{result['throughput']} requests/s, {result['errors']} errors, {result['emails']} emails sent")
+
+
+def compare(result: dict, baseline: dict, max_regression: float) -> bool:
+    """
+    The compare function prints the change of every endpoint against a stored run
+    and checks that p95 latency did not grow more than max_regression percent.
+
+    :param result: dict: The current run
+    :param baseline: dict: The stored run
+    :param max_regression: float: Allowed growth of p95 latency in percent
+    :return: True if no endpoint regressed
+    """
+    print(f"\ncompared with {baseline['commit']} from {baseline['date']}")
+    print(f"{'endpoint':<36} {'p50':>9} {'p95':>9} {'p99':>9} {'rps':>9}")
+    passed = True
+    for name, stats in result["endpoints"].items():
+        old = baseline["endpoints"].get(name)
+        if old is None:
+            print(f"{name:<36} new endpoint")
+            continue
+        changes = [(stats[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+                   for key in ("p50_ms", "p95_ms", "p99_ms", "throughput")]
+        regressed = changes[1] > max_regression
+        passed = passed and not regressed
+        print(f"{name:<36} " + " ".join(f"{change:>+8.1f}%" for change in changes) + ("  REGRESSION" if regressed else ""))
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of the whole API with a seeded database and fake external services")
+    parser.add_argument("--database-url", default="sqlite:///./load_test.db",
+                        help="Database to seed, it is recreated on every run")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--images-per-user", type=int, default=10)
+    parser.add_argument("--tags", type=int, default=500)
+    parser.add_argument("--clients", type=int, default=20, help="Concurrent virtual users")
+    parser.add_argument("--requests", type=int, default=200, help="Requests of every virtual user")
+    parser.add_argument("--redis-latency-ms", type=float, default=0.2)
+    parser.add_argument("--cloudinary-latency-ms", type=float, default=50.0)
+    parser.add_argument("--smtp-latency-ms", type=float, default=20.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=Path, help="Where to store the results, by default in benchmarks/results")
+    parser.add_argument("--compare", type=Path, help="Stored results to compare with")
+    parser.add_argument("--max-regression", type=float, default=20.0, help="Allowed growth of p95 latency in percent")
+    args = parser.parse_args()
+
+    connect_args = {"check_same_thread": False} if args.database_url.startswith("sqlite") else {}
+    engine = create_engine(args.database_url, connect_args=connect_args)
+    track_queries(engine)
+    session_local = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    started = perf_counter()
+    dataset = seed_database(engine, users=args.users, images_per_user=args.images_per_user, tags=args.tags, seed=args.seed)
+    print(f"seeded {dataset.users} users and {dataset.images} images in {perf_counter() - started:.1f}s")
+
+    def override_get_db():
+        db = session_local()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    redis_client = FakeRedis(args.redis_latency_ms / 1000)
+    service_auth.r_cashe = redis_client
+    response_cache.redis = redis_client
+    feed.redis = redis_client
+    ranking.redis = redis_client
+    # all virtual users come from one address, rate limits would answer most of their requests with 429
+    limiter.enabled = False
+    FakeCloudinary(args.cloudinary_latency_ms / 1000).install()
+
+    result = asyncio.run(run_load(args, dataset, session_local))
+    result.update(commit=git_commit(), date=datetime.now().isoformat(timespec="seconds"),
+                  parameters={key: str(value) for key, value in vars(args).items()})
+    print_report(result)
+
+    output = args.output or RESULTS_FOLDER / f"load_test_{result['commit']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, indent=2))
+    print(f"results are stored in {output}")
+
+    if args.compare:
+        if not compare(result, json.loads(args.compare.read_text()), args.max_regression):
+            print(f"FAIL: p95 latency grew more than {args.max_regression}%")
+            sys.exit(1)
+        print(f"OK: p95 latency grew less than {args.max_regression}%")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,9 @@
 import os
+from typing import Optional
 
 from dotenv import load_dotenv
-from pydantic import BaseSettings, EmailStr
+from pydantic import EmailStr
+from pydantic_settings import BaseSettings, SettingsConfigDict
 
 load_dotenv()
 
@@ -14,17 +16,56 @@ class Settings(BaseSettings):
     mail_from: EmailStr = os.environ.get('MAIL_FROM')
     mail_port: int = os.environ.get('MAIL_PORT')
     mail_server: str = os.environ.get('MAIL_SERVER')
+    mail_ssl_tls: bool = os.environ.get('MAIL_SSL_TLS', True)
+    mail_pool_size: int = os.environ.get('MAIL_POOL_SIZE', 2)
+    mail_batch_size: int = os.environ.get('MAIL_BATCH_SIZE', 50)
+    mail_rate_limit: float = os.environ.get('MAIL_RATE_LIMIT', 10)
+    mail_max_retries: int = os.environ.get('MAIL_MAX_RETRIES', 5)
+    mail_retry_backoff: float = os.environ.get('MAIL_RETRY_BACKOFF', 1)
+    mail_idle_timeout: float = os.environ.get('MAIL_IDLE_TIMEOUT', 60)
+    outbox_worker_in_app: bool = os.environ.get('OUTBOX_WORKER_IN_APP', True)
+    outbox_batch_size: int = os.environ.get('OUTBOX_BATCH_SIZE', 100)
+    outbox_poll_interval: float = os.environ.get('OUTBOX_POLL_INTERVAL', 1)
+    outbox_lease_seconds: float = os.environ.get('OUTBOX_LEASE_SECONDS', 300)
+    outbox_max_attempts: int = os.environ.get('OUTBOX_MAX_ATTEMPTS', 8)
+    outbox_retry_backoff: float = os.environ.get('OUTBOX_RETRY_BACKOFF', 30)
+    outbox_retention_days: float = os.environ.get('OUTBOX_RETENTION_DAYS', 7)
     cloudinary_name: str = os.environ.get('CLOUDINARY_NAME')
     cloudinary_api_key: str = os.environ.get('CLOUDINARY_API_KEY')
     cloudinary_api_secret: str = os.environ.get('CLOUDINARY_API_SECRET')
-    redis_name: str = os.environ.get('REDIS_NAME')
+    redis_name: Optional[str] = os.environ.get('REDIS_NAME')
     redis_password: str = os.environ.get('REDIS_PASSWORD')
     redis_host: str = os.environ.get('REDIS_HOST')
     redis_port: int = os.environ.get('REDIS_PORT')
-    redis_db: int = os.environ.get('REDIS_DB')
+    redis_db: Optional[int] = os.environ.get('REDIS_DB')
+    rate_limit_enabled: bool = os.environ.get('RATE_LIMIT_ENABLED', True)
+    rate_limits: str = os.environ.get('RATE_LIMITS', '')
+    rate_limit_redis_timeout: float = os.environ.get('RATE_LIMIT_REDIS_TIMEOUT', 0.05)
+    rate_limit_retry_interval: float = os.environ.get('RATE_LIMIT_RETRY_INTERVAL', 5)
+    response_cache_enabled: bool = os.environ.get('RESPONSE_CACHE_ENABLED', True)
+    response_cache_bodies: bool = os.environ.get('RESPONSE_CACHE_BODIES', True)
+    response_cache_ttl: int = os.environ.get('RESPONSE_CACHE_TTL', 600)
+    response_cache_redis_timeout: float = os.environ.get('RESPONSE_CACHE_REDIS_TIMEOUT', 0.05)
+    feed_enabled: bool = os.environ.get('FEED_ENABLED', True)
+    feed_timeline_size: int = os.environ.get('FEED_TIMELINE_SIZE', 1000)
+    feed_timeline_ttl: int = os.environ.get('FEED_TIMELINE_TTL', 3600)
+    feed_redis_timeout: float = os.environ.get('FEED_REDIS_TIMEOUT', 0.05)
+    top_images_enabled: bool = os.environ.get('TOP_IMAGES_ENABLED', True)
+    top_images_size: int = os.environ.get('TOP_IMAGES_SIZE', 1000)
+    top_images_half_life_hours: float = os.environ.get('TOP_IMAGES_HALF_LIFE_HOURS', 24)
+    top_images_compaction_seconds: float = os.environ.get('TOP_IMAGES_COMPACTION_SECONDS', 3600)
+    top_images_redis_timeout: float = os.environ.get('TOP_IMAGES_REDIS_TIMEOUT', 0.05)
+    album_max_files: int = os.environ.get('ALBUM_MAX_FILES', 20)
+    album_upload_concurrency: int = os.environ.get('ALBUM_UPLOAD_CONCURRENCY', 4)
+    ban_list_refresh_seconds: float = os.environ.get('BAN_LIST_REFRESH_SECONDS', 5)
+    tag_index_refresh_seconds: int = os.environ.get('TAG_INDEX_REFRESH_SECONDS', 300)
+    slow_query_threshold_ms: float = os.environ.get('SLOW_QUERY_THRESHOLD_MS', 200)
+    metrics_buckets: str = os.environ.get('METRICS_BUCKETS', '0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10')
+    tracing_sample_ratio: float = os.environ.get('TRACING_SAMPLE_RATIO', 0)
+    tracing_file: str = os.environ.get('TRACING_FILE', 'traces.jsonl')
+    tracing_otlp_endpoint: str = os.environ.get('TRACING_OTLP_ENDPOINT', '')
 
-    class Config:
-        env_file = ".env"
-        env_file_encoding = "utf-8"
+    # variables of docker-compose in .env, like POSTGRES_DB, are not settings of the app
+    model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8", extra="ignore")
 
 settings = Settings()
@@ -0,0 +1,128 @@
+import argparse
+from typing import Dict
+
+from sqlalchemy import func, inspect, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateIndex
+
+from .db import engine
+from .models import Comment, Image
+
+
+"""Migration of an existing database to the denormalized comment_count of images.
+To run it, enter : python -m src.database.backfill_comment_count --dry-run
+You must be in the killer_instagram directory in the console"""
+
+
+images_table = Image.__table__
+comments_table = Comment.__table__
+
+
+def has_column(engine: Engine) -> bool:
+    """
+    The has_column function checks if the images table of the database already has the comment_count column.
+
+    :param engine: Engine: The engine of the database
+    :return: A boolean value
+    """
+    return "comment_count" in {column["name"] for column in inspect(engine).get_columns(images_table.name)}
+
+
+def add_column(engine: Engine) -> None:
+    """
+    The add_column function adds the comment_count column to the images table, filled with zeros.
+
+    :param engine: Engine: The engine of the database
+    :return: None
+    """
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {images_table.name} ADD COLUMN comment_count INTEGER NOT NULL DEFAULT 0"))
+
+
+def backfill_comment_count(engine: Engine, batch_size: int = 1000, dry_run: bool = False) -> int:
+    """
+    The backfill_comment_count function stores the quantity of comments of existing images in comment_count.
+        Images are read in batches by id and every batch is updated in its own short transaction,
+        so the table is never locked for long. Only images with a wrong count are updated.
+
+    :param engine: Engine: The engine of the database
+    :param batch_size: int: Quantity of images read at once
+    :param dry_run: bool: Only count the images that would be updated
+    :return: The quantity of updated images
+    """
+    counted = select(func.count(comments_table.c.id))\
+        .where(comments_table.c.image_id == images_table.c.id).scalar_subquery()
+    updated, last_id = 0, 0
+    while True:
+        with engine.begin() as conn:
+            ids = conn.execute(
+                select(images_table.c.id).where(images_table.c.id > last_id)
+                .order_by(images_table.c.id).limit(batch_size)
+            ).scalars().all()
+            if not ids:
+                return updated
+            in_batch = images_table.c.id.between(ids[0], ids[-1])
+            last_id = ids[-1]
+            if dry_run:
+                updated += conn.execute(
+                    select(func.count()).select_from(images_table)
+                    .where(in_batch, images_table.c.comment_count != counted)
+                ).scalar()
+            else:
+                updated += conn.execute(
+                    images_table.update().where(in_batch, images_table.c.comment_count != counted)
+                    .values(comment_count=counted)
+                ).rowcount
+
+
+def create_indexes(engine: Engine) -> None:
+    """
+    The create_indexes function creates indexes of the comments table that the database does not have yet.
+
+    :param engine: Engine: The engine of the database
+    :return: None
+    """
+    with engine.begin() as conn:
+        for index in comments_table.indexes:
+            conn.execute(CreateIndex(index, if_not_exists=True))
+
+
+def migrate(engine: Engine, batch_size: int = 1000, dry_run: bool = False) -> Dict[str, object]:
+    """
+    The migrate function adds the comment_count column and the index of comments that the database does not have yet
+        and stores the quantity of comments of every image. A dry run of a database without the column
+        only reports that the column is missing.
+
+    :param engine: Engine: The engine of the database
+    :param batch_size: int: Quantity of images updated in one transaction
+    :param dry_run: bool: Only report what would be done
+    :return: A dict with the flag of the added column and the quantity of updated images
+    """
+    column_added = not has_column(engine)
+    if dry_run:
+        updated = None if column_added else backfill_comment_count(engine, batch_size=batch_size, dry_run=True)
+        return {"column_added": column_added, "updated_images": updated}
+    if column_added:
+        add_column(engine)
+    create_indexes(engine)
+    return {"column_added": column_added,
+            "updated_images": backfill_comment_count(engine, batch_size=batch_size)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill comment_count of existing images")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    result = migrate(engine, batch_size=args.batch_size, dry_run=args.dry_run)
+    action = "would be" if args.dry_run else "was"
+    if result["column_added"]:
+        print(f"comment_count column {action} added to {images_table.name}")
+    if result["updated_images"] is not None:
+        action = "would be" if args.dry_run else "were"
+        print(f"comment_count of {result['updated_images']} images {action} updated")
+
+
+if __name__ == '__main__':
+    main()
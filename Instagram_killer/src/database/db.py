@@ -1,13 +1,99 @@
+import logging
+import sys
 from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker, Session
 
 from ..conf.config import settings
 
 
+logger = logging.getLogger(__name__)
+
+
+class QueryStats:
+    """Quantity and total duration of SQL statements executed while handling one request."""
+    __slots__ = ("count", "duration")
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def server_timing(self) -> str:
+        """
+        The server_timing function formats the stats as a Server-Timing header value.
+
+        :param self: Represent the instance of the class
+        :return: A string like db;dur=1.25;desc="3 queries"
+        """
+        return f'db;dur={self.duration * 1000:.2f};desc="{self.count} queries"'
+
+
+query_stats: ContextVar[QueryStats | None] = ContextVar("query_stats", default=None)
+
+
+def find_query_caller() -> str:
+    """
+    The find_query_caller function walks the call stack and returns the repository function that ran the query.
+    If the query was not made by a repository, the first function of the application is returned.
+    It is only called for slow queries, so walking the stack does not cost anything on the usual path.
+
+    :return: A string like src.repository.images.get_image_by_id
+    """
+    caller = "unknown"
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if module != __name__ and (module.startswith("src.") or ".src." in module):
+            if ".repository." in module:
+                return f"{module}.{frame.f_code.co_name}"
+            if caller == "unknown":
+                caller = f"{module}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return caller
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = perf_counter() - conn.info["query_start"].pop()
+    stats = query_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.duration += duration
+    if duration * 1000 >= settings.slow_query_threshold_ms:
+        logger.warning("Slow query %.1f ms in %s: %s; parameters: %.500r",
+                       duration * 1000, find_query_caller(), statement, parameters)
+
+
+def handle_error(exception_context):
+    # a failed statement never reaches after_cursor_execute, so its start time is dropped here
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_start"):
+        conn.info["query_start"].pop()
+
+
+def track_queries(db_engine: Engine) -> None:
+    """
+    The track_queries function registers event hooks that count the queries of the current request
+    and log the ones slower than slow_query_threshold_ms together with their parameters.
+
+    :param db_engine: Engine: The engine to track
+    :return: None
+    """
+    event.listen(db_engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(db_engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(db_engine, "handle_error", handle_error)
+
+
 SQLALCHEMY_DATABASE_URL = settings.sqlalchemy_database_url
 engine = create_engine(SQLALCHEMY_DATABASE_URL)
+track_queries(engine)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
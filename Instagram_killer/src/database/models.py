@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, func, CheckConstraint, Table
+from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, func, CheckConstraint, Table, Index
 from sqlalchemy.orm import relationship, declarative_base
 from sqlalchemy.sql.sqltypes import DateTime
 
@@ -21,6 +21,8 @@ class User(Base):
     confirmed = Column(Boolean, default=False)
     role = Column(String(20), nullable=False, default='user')
     banned = Column(Boolean, default=False)
+    followers_count = Column(Integer, nullable=False, default=0, server_default="0")
+    following_count = Column(Integer, nullable=False, default=0, server_default="0")
     ratings = relationship("Rating", back_populates="user")
     blacklisted_token = relationship('BlacklistedToken', uselist=False, back_populates='user')
     images = relationship('Image', back_populates='user')
@@ -30,12 +32,31 @@ class User(Base):
             role.in_(['admin', 'moderator', 'user']),
             name='check_valid_role'
         ),
+        # usernames keep their case for display but must be unique and are looked up ignoring it,
+        # emails are stored in lower case, so the unique index of the column is enough for them
+        Index('ix_users_table_username_lower', func.lower(username), unique=True),
     )
 
     def __str__(self):
         return str(self.id)
 
 
+class Follow(Base):
+    __tablename__ = "follows_table"
+
+    # the primary key finds whether one user follows another with one lookup
+    follower_id = Column(Integer, ForeignKey("users_table.id", ondelete="CASCADE"), primary_key=True)
+    followed_id = Column(Integer, ForeignKey("users_table.id", ondelete="CASCADE"), primary_key=True)
+    created_at = Column(DateTime, nullable=False, default=func.now())
+
+    __table_args__ = (
+        CheckConstraint(follower_id != followed_id, name='check_not_follow_self'),
+        # both lists are read newest first page by page in (created_at, id of the other user) order
+        Index('ix_follows_table_follower_id_created_at', 'follower_id', 'created_at', 'followed_id'),
+        Index('ix_follows_table_followed_id_created_at', 'followed_id', 'created_at', 'follower_id'),
+    )
+
+
 image_m2m_tag = Table(
     "image_m2m_tag",
     Base.metadata,
@@ -56,11 +77,17 @@ class Image(Base):
     image_url = Column(String)
     public_id = Column(String(255))
     file_extension = Column(String, nullable=False)
+    comment_count = Column(Integer, nullable=False, default=0, server_default="0")
     rating = relationship("Rating", back_populates="image")
     user = relationship("User", back_populates="images")
     tags = relationship("Tag", secondary="image_m2m_tag", back_populates="images")
     transformed_links = relationship("TransformedImageLink", back_populates="image")
 
+    __table_args__ = (
+        # profile stats count and sum images of one user
+        Index('ix_images_table_user_id', 'user_id'),
+    )
+
 
 class TransformedImageLink(Base):
     __tablename__ = "transformed_image_links"
@@ -86,6 +113,11 @@ class Comment(Base):
     image = relationship('Image', back_populates='comments')
     user = relationship('User', back_populates='comments')
 
+    __table_args__ = (
+        # comments of an image are listed page by page in (created_at, id) order
+        Index('ix_comments_image_id_created_at_id', 'image_id', 'created_at', 'id'),
+    )
+
 
 class Tag(Base):
     __tablename__ = 'tags_table'
@@ -105,10 +137,40 @@ class Rating(Base):
     image = relationship('Image', back_populates='rating')
     user = relationship('User', back_populates='ratings')
 
+    __table_args__ = (
+        # averages are computed per image, the rating is included so the table itself is not read
+        Index('ix_rating_table_image_id_rating', 'image_id', 'rating'),
+    )
+
 class BlacklistedToken(Base):
     __tablename__ = 'blacklisted_tokens'
 
     id = Column(Integer, primary_key=True)
     blacklisted_token = Column(String(255), nullable=True)
     user_id = Column('user_id', ForeignKey('users_table.id', ondelete='CASCADE'), unique=True)
-    user = relationship('User', back_populates='blacklisted_token')
\ No newline at end of file
+    user = relationship('User', back_populates='blacklisted_token')
+
+class EmailOutbox(Base):
+    __tablename__ = 'email_outbox'
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(30), nullable=False)
+    email = Column(String(100), nullable=False)
+    username = Column(String(50), nullable=False)
+    host = Column(String(255), nullable=False)
+    idempotency_key = Column(String(64), nullable=False, unique=True)
+    status = Column(String(20), nullable=False, default='pending')
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False)
+    created_at = Column(DateTime, nullable=False)
+    sent_at = Column(DateTime, nullable=True)
+    last_error = Column(String(500), nullable=True)
+
+    __table_args__ = (
+        CheckConstraint(
+            status.in_(['pending', 'sending', 'sent', 'dead']),
+            name='check_valid_outbox_status'
+        ),
+        # the worker looks for due emails, the lease of a claimed one is kept in next_attempt_at as well
+        Index('ix_email_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
@@ -0,0 +1,117 @@
+import argparse
+import sys
+from typing import Dict, List, Tuple
+
+from sqlalchemy import bindparam, func, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateIndex
+
+from .db import engine
+from .models import User
+
+
+"""Migration of an existing database to case-insensitive emails and usernames.
+To run it, enter : python -m src.database.normalize_users --dry-run
+You must be in the killer_instagram directory in the console"""
+
+
+users_table = User.__table__
+
+
+def find_conflicts(engine: Engine) -> Dict[str, List[Tuple[str, int]]]:
+    """
+    The find_conflicts function finds emails and usernames that differ only by case.
+        Such users can not be merged automatically, the unique indexes can not be created while they exist.
+
+    :param engine: Engine: The engine of the database
+    :return: A dict with lists of the lower case value and the quantity of users for email and username
+    """
+    conflicts = {}
+    with engine.connect() as conn:
+        for field in ("email", "username"):
+            lowered = func.lower(users_table.c[field])
+            conflicts[field] = [tuple(row) for row in conn.execute(
+                select(lowered, func.count()).group_by(lowered).having(func.count() > 1).order_by(lowered)
+            )]
+    return conflicts
+
+
+def backfill_emails(engine: Engine, batch_size: int = 1000, dry_run: bool = False) -> int:
+    """
+    The backfill_emails function stores emails of existing users in lower case, like signup does for new ones.
+        Users are read in batches by id and every batch is updated in its own short transaction,
+        so the table is never locked for long.
+
+    :param engine: Engine: The engine of the database
+    :param batch_size: int: Quantity of users read at once
+    :param dry_run: bool: Only count the users that would be updated
+    :return: The quantity of updated users
+    """
+    statement = users_table.update().where(users_table.c.id == bindparam("user_id")).values(email=bindparam("new_email"))
+    updated, last_id = 0, 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                select(users_table.c.id, users_table.c.email)
+                .where(users_table.c.id > last_id).order_by(users_table.c.id).limit(batch_size)
+            ).all()
+            if not rows:
+                return updated
+            last_id = rows[-1].id
+            changed = [{"user_id": row.id, "new_email": row.email.lower()}
+                       for row in rows if row.email != row.email.lower()]
+            if changed and not dry_run:
+                conn.execute(statement, changed)
+            updated += len(changed)
+
+
+def create_indexes(engine: Engine) -> None:
+    """
+    The create_indexes function creates indexes of the users table that the database does not have yet.
+
+    :param engine: Engine: The engine of the database
+    :return: None
+    """
+    # checkfirst does not see indexes of expressions on every database, IF NOT EXISTS does
+    with engine.begin() as conn:
+        for index in users_table.indexes:
+            conn.execute(CreateIndex(index, if_not_exists=True))
+
+
+def migrate(engine: Engine, batch_size: int = 1000, dry_run: bool = False) -> Dict[str, object]:
+    """
+    The migrate function checks that no users differ only by case, stores emails in lower case
+        and creates the index of lower case usernames. Nothing is changed if there are conflicts.
+
+    :param engine: Engine: The engine of the database
+    :param batch_size: int: Quantity of users updated in one transaction
+    :param dry_run: bool: Only report what would be done
+    :return: A dict with the conflicts and the quantity of updated emails
+    """
+    conflicts = find_conflicts(engine)
+    if any(conflicts.values()):
+        return {"conflicts": conflicts, "updated_emails": 0}
+    updated = backfill_emails(engine, batch_size=batch_size, dry_run=dry_run)
+    if not dry_run:
+        create_indexes(engine)
+    return {"conflicts": conflicts, "updated_emails": updated}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Make emails and usernames of existing users case-insensitive")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    result = migrate(engine, batch_size=args.batch_size, dry_run=args.dry_run)
+    for field, values in result["conflicts"].items():
+        for value, quantity in values:
+            print(f"{quantity} users have the {field} {value} in different case, merge or rename them first")
+    if any(result["conflicts"].values()):
+        sys.exit(1)
+    action = "would be" if args.dry_run else "were"
+    print(f"{result['updated_emails']} emails {action} stored in lower case")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,99 @@
+from time import perf_counter
+from typing import Callable
+
+from fastapi import Request, status
+from fastapi.responses import JSONResponse
+
+from ..database.db import QueryStats, query_stats
+from ..services import ban_list as service_ban_list, metrics as service_metrics, tracing as service_tracing
+
+
+async def query_stats_middleware(request: Request, call_next: Callable):
+    """
+    The query_stats_middleware function counts SQL queries made while handling the request
+    and returns their quantity and total duration in the Server-Timing header.
+
+    :param request: Request: Get the request object
+    :param call_next: Callable: Pass the request to the next handler
+    :return: The response with the Server-Timing header
+    """
+    stats = QueryStats()
+    token = query_stats.set(stats)
+    try:
+        response = await call_next(request)
+    finally:
+        query_stats.reset(token)
+    response.headers.append("Server-Timing", stats.server_timing())
+    return response
+
+
+async def metrics_middleware(request: Request, call_next: Callable):
+    """
+    The metrics_middleware function records the duration of the request in a histogram labeled 
+    with the route template, and keeps the gauge of requests in progress.
+
+    :param request: Request: Get the request object
+    :param call_next: Callable: Pass the request to the next handler
+    :return: The response
+    """
+    in_progress = service_metrics.http_requests_in_progress.labels(request.method)
+    in_progress.inc()
+    started = perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        in_progress.dec()
+        service_metrics.http_request_duration.labels(
+            request.method, service_metrics.route_template(request), status_code
+        ).observe(perf_counter() - started)
+
+
+async def tracing_middleware(request: Request, call_next: Callable):
+    """
+    The tracing_middleware function wraps the handling of the request in a server span,
+    so spans of repository functions, Redis, Cloudinary and email calls made by the route become its children.
+    After the route is matched the span is renamed to the route template.
+
+    :param request: Request: Get the request object
+    :param call_next: Callable: Pass the request to the next handler
+    :return: The response
+    """
+    if service_tracing.get_tracer() is None:
+        return await call_next(request)
+    with service_tracing.start_request_span(request.method, request.url.path, request.headers) as span:
+        response = await call_next(request)
+        template = service_metrics.route_template(request)
+        span.update_name(f"{request.method} {template}")
+        span.set_attribute("http.route", template)
+        span.set_attribute("http.status_code", response.status_code)
+        return response
+
+
+async def ban_middleware(request: Request, call_next: Callable):
+    """
+    The ban_middleware function answers 403 Forbidden to clients whose IP address is in a banned network
+    or whose user agent matches a banned pattern, before the request reaches the routes.
+
+    :param request: Request: Get the address and the user agent of the client
+    :param call_next: Callable: Pass the request to the next handler
+    :return: The response
+    """
+    reason = service_ban_list.ban_list.check(request.client.host if request.client else None,
+                                             request.headers.get("user-agent"))
+    if reason is not None:
+        service_metrics.banned_requests.labels(reason).inc()
+        return JSONResponse(status_code=status.HTTP_403_FORBIDDEN, content={"detail": "You are banned"})
+    return await call_next(request)
+
+
 # from ipaddress import ip_address
 # from typing import Callable
 
 # from fastapi import Request, HTTPException, status, Depends
 # from fastapi.responses import JSONResponse
-# from fastapi_limiter import FastAPILimiter
 
 # import redis.asyncio as redis
 
@@ -23,8 +113,6 @@
 
 
 # allowed_ips = []
-# banned_ips = []
-# user_agent_ban_list = []
 
 
 # def get_db():
@@ -61,20 +149,6 @@
 #         raise HTTPException(status_code=403, detail="Permission denied. Admin or moderator role required")
 
 
-# async def startup_event():
-#     r = await redis.Redis(host=settings.redis_host, port=settings.redis_port, db=settings.redis_db, encoding="utf-8",
-#                           decode_responses=True)
-#     await FastAPILimiter.init(r)
-
-
-# async def ban_ips_middleware(request: Request, call_next: Callable):
-#     ip = ip_address(request.client.host)
-#     if ip in banned_ips:
-#         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You are banned")
-#     response = await call_next(request)
-#     return response
-
-
 # async def limit_access_by_ip(request: Request, call_next: Callable):
 #     ip = ip_address(request.client.host)
 #     if ip not in allowed_ips:
@@ -82,6 +156,3 @@
 #     response = await call_next(request)
 #     return response
 
-
-# async def user_agent_ban_middleware(request: Request, call_next: Callable):
-#     user_agent = request.headers.get("user-agent")
\ No newline at end of file
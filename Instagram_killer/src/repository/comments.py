@@ -1,11 +1,16 @@
 from datetime import datetime
+from typing import List, Optional, Tuple
 
+from sqlalchemy import delete, func, select, tuple_, update
 from sqlalchemy.orm import Session
 
-from ..database.models import Comment
+from ..database.models import Comment, Image
 from ..schemas import comments as schema_comments
+from ..services.response_cache import image_keys, response_cache
+from ..services.tracing import traced
 
 
+@traced
 async def add_new_comment(body: schema_comments.CommentModel, user_id: int, db: Session) -> Comment:
     """
     The add_new_comment function creates a new comment in the database.
@@ -22,13 +27,21 @@ async def add_new_comment(body: schema_comments.CommentModel, user_id: int, db:
     comment: Comment = Comment(
         comment=body.comment,
         image_id=body.image_id,
-        user_id=user_id
+        user_id=user_id,
+        created_at=datetime.now()
     )
     db.add(comment)
+    owner_id = db.execute(
+        update(Image).where(Image.id==body.image_id)
+        .values(comment_count=Image.comment_count + 1).returning(Image.user_id),
+        execution_options={"synchronize_session": False}
+    ).scalar()
     db.commit()
+    await response_cache.invalidate(*image_keys(body.image_id, owner_id))
     return comment
 
 
+@traced
 async def get_comment_by_id(comment_id: int, db: Session) -> Comment | None:
     """
     The get_comment_by_id function returns a comment object from the database based on its id.
@@ -46,6 +59,7 @@ async def get_comment_by_id(comment_id: int, db: Session) -> Comment | None:
     return exist_comment
 
 
+@traced
 async def update_comment(comment_to_update: Comment, body: schema_comments.CommentUpdate, db: Session) -> Comment:
     """
     The update_comment function updates a comment in the database.
@@ -62,10 +76,12 @@ async def update_comment(comment_to_update: Comment, body: schema_comments.Comme
     comment_to_update.comment = body.new_comment
     comment_to_update.updated_at = datetime.now()
     db.commit()
+    await response_cache.invalidate(f"comment:{comment_to_update.id}")
     db.refresh(comment_to_update)
     return comment_to_update
 
 
+@traced
 async def delete_comment(comment_to_delete: Comment, db: Session) -> Comment:
     """
     The delete_comment function deletes a comment from the database.
@@ -79,11 +95,19 @@ async def delete_comment(comment_to_delete: Comment, db: Session) -> Comment:
     :param db: Session: Pass the database session to the function
     :return: The deleted comment
     """
+    comment_id, image_id = comment_to_delete.id, comment_to_delete.image_id
     db.delete(comment_to_delete)
+    owner_id = db.execute(
+        update(Image).where(Image.id==image_id)
+        .values(comment_count=Image.comment_count - 1).returning(Image.user_id),
+        execution_options={"synchronize_session": False}
+    ).scalar()
     db.commit()
+    await response_cache.invalidate(f"comment:{comment_id}", *image_keys(image_id, owner_id))
     return comment_to_delete
 
 
+@traced
 async def get_comment(comment_id: int, db: Session) -> Comment | None:
     """
     The get_comment function returns a comment object from the database.
@@ -98,4 +122,85 @@ async def get_comment(comment_id: int, db: Session) -> Comment | None:
     :return: A comment object or none
     """
     comment: Comment = db.query(Comment).filter(Comment.id==comment_id).first()
-    return comment
\ No newline at end of file
+    return comment
+
+
+@traced
+async def get_comments_for_image(image_id: int, db: Session, limit: int,
+                                 after: Optional[Tuple[datetime, int]] = None) -> List[Comment]:
+    """
+    The get_comments_for_image function returns a page of comments of the image, the oldest first.
+        Pages are read with keyset pagination: the next page starts right after the (created_at, id) of
+        the last comment of the previous one, so every page is a range scan of the
+        ix_comments_image_id_created_at_id index, no matter how deep the client scrolls.
+
+    :param image_id: int: Get comments of this image
+    :param db: Session: Pass the database session to the function
+    :param limit: int: Maximum quantity of returned comments
+    :param after: Optional[Tuple[datetime, int]]: The created_at and id of the last comment of the previous page
+    :return: A list of comments
+    """
+    query = db.query(Comment).filter(Comment.image_id==image_id)
+    if after is not None:
+        query = query.filter(tuple_(Comment.created_at, Comment.id) > tuple_(*after))
+    return query.order_by(Comment.created_at, Comment.id).limit(limit).all()
+
+
+def bulk_delete_conditions(body: schema_comments.CommentBulkDelete) -> list:
+    conditions = []
+    if body.comment_ids:
+        conditions.append(Comment.id.in_(body.comment_ids))
+    if body.user_id:
+        conditions.append(Comment.user_id==body.user_id)
+    if body.image_id:
+        conditions.append(Comment.image_id==body.image_id)
+    if body.created_after:
+        conditions.append(Comment.created_at>=body.created_after)
+    if body.created_before:
+        conditions.append(Comment.created_at<body.created_before)
+    return conditions
+
+
+@traced
+async def count_comments_to_delete(body: schema_comments.CommentBulkDelete, db: Session) -> Tuple[int, int]:
+    """
+    The count_comments_to_delete function counts comments that match the filters of a bulk delete
+        and images they belong to, without deleting anything.
+
+    :param body: schema_comments.CommentBulkDelete: Filters of the comments
+    :param db: Session: Pass the database session to the function
+    :return: The quantity of comments and the quantity of their images
+    """
+    per_image = db.query(Comment.image_id, func.count(Comment.id))\
+        .filter(*bulk_delete_conditions(body)).group_by(Comment.image_id).all()
+    return sum(count for _, count in per_image), len(per_image)
+
+
+@traced
+async def delete_comments(body: schema_comments.CommentBulkDelete, db: Session) -> Tuple[int, int]:
+    """
+    The delete_comments function deletes all comments that match the filters with one DELETE statement.
+        Comment counts of the affected images are lowered by one UPDATE in the same transaction, it runs first
+        and selects the images and their matching comments with subqueries, so no ids are sent back and forth.
+
+    :param body: schema_comments.CommentBulkDelete: Filters of the comments
+    :param db: Session: Pass the database session to the function
+    :return: The quantity of deleted comments and the quantity of their images
+    """
+    conditions = bulk_delete_conditions(body)
+    deleted_per_image = select(func.count(Comment.id))\
+        .where(Comment.image_id==Image.id, *conditions).scalar_subquery()
+    owners = db.execute(
+        update(Image).where(Image.id.in_(select(Comment.image_id).where(*conditions)))
+        .values(comment_count=Image.comment_count - deleted_per_image)
+        .returning(Image.id, Image.user_id),
+        execution_options={"synchronize_session": False}
+    ).all()
+    deleted = db.execute(
+        delete(Comment).where(*conditions).returning(Comment.id),
+        execution_options={"synchronize_session": False}
+    ).scalars().all()
+    db.commit()
+    await response_cache.invalidate(*(f"comment:{comment_id}" for comment_id in deleted),
+                                    *(key for image_id, owner_id in owners for key in image_keys(image_id, owner_id)))
+    return len(deleted), len(owners)
@@ -0,0 +1,45 @@
+from typing import List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Session
+
+from ..database.models import Image, User
+from ..services.tracing import traced
+
+
+@traced
+async def get_recent_image_ids(db: Session, limit: int, before_id: Optional[int] = None) -> List[int]:
+    """
+    The get_recent_image_ids function returns ids of the newest images of all users, newest first.
+        Ids grow with the upload time, so the primary key index serves the query and the cursor.
+
+    :param db: Session: Pass the database session to the function
+    :param limit: int: Maximum quantity of ids
+    :param before_id: Optional[int]: Return only images older than this one
+    :return: A list of image ids
+    """
+    query = select(Image.id).order_by(Image.id.desc()).limit(limit)
+    if before_id is not None:
+        query = query.where(Image.id < before_id)
+    return list(db.scalars(query))
+
+
+@traced
+async def get_feed_cards(db: Session, image_ids: List[int]) -> List[Row]:
+    """
+    The get_feed_cards function reads the fields of feed cards of many images in one query.
+        Images that were deleted after their ids were read are not returned.
+
+    :param db: Session: Pass the database session to the function
+    :param image_ids: List[int]: Ids of the images
+    :return: Rows with the fields of FeedImageResponse, in no particular order
+    """
+    if not image_ids:
+        return []
+    return db.execute(
+        select(Image.id, Image.user_id, User.username, Image.description, Image.image_url,
+               Image.comment_count, Image.upload_time)
+        .join(User, User.id == Image.user_id)
+        .where(Image.id.in_(image_ids))
+    ).all()
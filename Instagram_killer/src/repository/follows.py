@@ -0,0 +1,164 @@
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import and_, delete, or_, select, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Session
+
+from ..database.models import Follow, User
+from ..services.response_cache import response_cache
+from ..services.tracing import traced
+
+INSERT_IGNORING_DUPLICATES = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def insert_follows(db: Session, rows: List[dict]):
+    # ON CONFLICT DO NOTHING RETURNING reports only the follows that did not exist, even under concurrent requests
+    insert = INSERT_IGNORING_DUPLICATES[db.get_bind().dialect.name]
+    return insert(Follow).values(rows).on_conflict_do_nothing().returning(Follow.followed_id)
+
+
+async def update_counts(follower_id: int, changed: List[int], step: int, db: Session) -> int:
+    """
+    The update_counts function changes the cached counts of follows by step for every changed follow
+        and commits them together with the follows.
+
+    :param follower_id: int: Id of the user who follows
+    :param changed: List[int]: Ids of the users whose followers changed
+    :param step: int: 1 for new follows, -1 for removed ones
+    :param db: Session: Pass the database session to the function
+    :return: The new quantity of users the follower follows
+    """
+    if not changed:
+        return db.execute(select(User.following_count).where(User.id==follower_id)).scalar()
+    db.execute(
+        update(User).where(User.id.in_(changed)).values(followers_count=User.followers_count + step),
+        execution_options={"synchronize_session": False}
+    )
+    following_count = db.execute(
+        update(User).where(User.id==follower_id)
+        .values(following_count=User.following_count + step * len(changed)).returning(User.following_count),
+        execution_options={"synchronize_session": False}
+    ).scalar()
+    db.commit()
+    await response_cache.invalidate(*(f"user:{user_id}" for user_id in [follower_id, *changed]))
+    return following_count
+
+
+@traced
+async def follow_users(follower_id: int, user_ids: List[int], db: Session) -> Tuple[List[int], int]:
+    """
+    The follow_users function makes a user follow many users with one INSERT.
+        Follows that already exist, the user himself and users that do not exist are skipped,
+        so repeating the request changes nothing. Counts of follows change only for the new follows.
+
+    :param follower_id: int: Id of the user who follows
+    :param user_ids: List[int]: Ids of the users to follow
+    :param db: Session: Pass the database session to the function
+    :return: Ids of the newly followed users and the new quantity of users the follower follows
+    """
+    user_ids = set(user_ids) - {follower_id}
+    existing = db.execute(select(User.id).where(User.id.in_(user_ids))).scalars().all() if user_ids else []
+    followed = []
+    if existing:
+        now = datetime.now()
+        followed = db.execute(insert_follows(db, [
+            {"follower_id": follower_id, "followed_id": user_id, "created_at": now} for user_id in sorted(existing)
+        ])).scalars().all()
+    return followed, await update_counts(follower_id, followed, 1, db)
+
+
+@traced
+async def unfollow_users(follower_id: int, user_ids: List[int], db: Session) -> Tuple[List[int], int]:
+    """
+    The unfollow_users function makes a user stop following many users with one DELETE.
+        Users he does not follow are skipped, so repeating the request changes nothing.
+
+    :param follower_id: int: Id of the user who follows
+    :param user_ids: List[int]: Ids of the users to unfollow
+    :param db: Session: Pass the database session to the function
+    :return: Ids of the unfollowed users and the new quantity of users the follower follows
+    """
+    unfollowed = db.execute(
+        delete(Follow).where(Follow.follower_id==follower_id, Follow.followed_id.in_(set(user_ids)))
+        .returning(Follow.followed_id),
+        execution_options={"synchronize_session": False}
+    ).scalars().all()
+    return unfollowed, await update_counts(follower_id, unfollowed, -1, db)
+
+
+async def get_follows_page(user_column, other_column, user_id: int, db: Session, limit: int,
+                           before: Optional[Tuple[datetime, int]] = None) -> List[Row]:
+    query = select(User.id, User.username, User.avatar, Follow.created_at.label("followed_at")) \
+        .join(Follow, other_column==User.id).where(user_column==user_id)
+    if before is not None:
+        query = query.where(tuple_(Follow.created_at, other_column) < tuple_(*before))
+    return db.execute(query.order_by(Follow.created_at.desc(), other_column.desc()).limit(limit)).all()
+
+
+@traced
+async def get_followers(user_id: int, db: Session, limit: int,
+                        before: Optional[Tuple[datetime, int]] = None) -> List[Row]:
+    """
+    The get_followers function returns a page of followers of the user, the newest first.
+        Pages are read with keyset pagination on the ix_follows_table_followed_id_created_at index,
+        so a page of a user with millions of followers costs the same at any depth.
+
+    :param user_id: int: Id of the followed user
+    :param db: Session: Pass the database session to the function
+    :param limit: int: Maximum quantity of returned users
+    :param before: Optional[Tuple[datetime, int]]: The followed_at and id of the last user of the previous page
+    :return: A list of rows with id, username, avatar and followed_at
+    """
+    return await get_follows_page(Follow.followed_id, Follow.follower_id, user_id, db, limit, before)
+
+
+@traced
+async def get_following(user_id: int, db: Session, limit: int,
+                        before: Optional[Tuple[datetime, int]] = None) -> List[Row]:
+    """
+    The get_following function returns a page of users the user follows, the most recently followed first.
+
+    :param user_id: int: Id of the follower
+    :param db: Session: Pass the database session to the function
+    :param limit: int: Maximum quantity of returned users
+    :param before: Optional[Tuple[datetime, int]]: The followed_at and id of the last user of the previous page
+    :return: A list of rows with id, username, avatar and followed_at
+    """
+    return await get_follows_page(Follow.follower_id, Follow.followed_id, user_id, db, limit, before)
+
+
+@traced
+async def get_relationship(user_id: int, other_id: int, db: Session) -> Tuple[bool, bool]:
+    """
+    The get_relationship function finds whether two users follow each other with two lookups of the primary key.
+
+    :param user_id: int: Id of one user
+    :param other_id: int: Id of the other user
+    :param db: Session: Pass the database session to the function
+    :return: Whether the user follows the other one and whether the other one follows the user
+    """
+    followers = db.execute(select(Follow.follower_id).where(or_(
+        and_(Follow.follower_id==user_id, Follow.followed_id==other_id),
+        and_(Follow.follower_id==other_id, Follow.followed_id==user_id),
+    ))).scalars().all()
+    return user_id in followers, other_id in followers
+
+
+async def forget_follows(user_id: int, db: Session) -> None:
+    """
+    The forget_follows function deletes follows of a user who is being deleted and fixes the counts of the others,
+        it does not commit.
+
+    :param user_id: int: Id of the user
+    :param db: Session: Pass the database session to the function
+    :return: None
+    """
+    options = {"synchronize_session": False}
+    db.execute(update(User).where(User.id.in_(select(Follow.followed_id).where(Follow.follower_id==user_id)))
+               .values(followers_count=User.followers_count - 1), execution_options=options)
+    db.execute(update(User).where(User.id.in_(select(Follow.follower_id).where(Follow.followed_id==user_id)))
+               .values(following_count=User.following_count - 1), execution_options=options)
+    db.execute(delete(Follow).where(or_(Follow.follower_id==user_id, Follow.followed_id==user_id)),
+               execution_options=options)
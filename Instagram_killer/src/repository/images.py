@@ -1,13 +1,17 @@
 from typing import List, Optional
 
 from fastapi import HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload, raiseload
 
 from ..database.models import Image,  TransformedImageLink, User, image_m2m_tag
 from ..repository import tags as repository_tags
 from ..schemas.images import ImageResponse, ImageStatusUpdate
+from ..services.feed import feed
+from ..services.response_cache import response_cache
+from ..services.tracing import traced
 
 
+@traced
 async def add_tag_to_image(db: Session, image_id: int, tag_id: int):
     """
     Add a tag to an image in the database.
@@ -23,20 +27,39 @@ async def add_tag_to_image(db: Session, image_id: int, tag_id: int):
     db.commit()
 
 
-async def get_image_by_id(db: Session, image_id: int) -> Image | None:
+@traced
+async def get_image_by_id(db: Session, image_id: int, with_links: bool = False) -> Image | None:
     """
     Get an image by its ID.
 
     Args:
         db (Session): The database session.
         image_id (int): The ID of the image.
+        with_links (bool): Load transformed links in the same query, 
+            use it when the image is serialized with ImageResponse.
 
     Returns:
         Image | None: The image or None if not found.
     """
-    return db.query(Image).filter(Image.id == image_id).first()
+    query = db.query(Image)
+    if with_links:
+        query = query.options(joinedload(Image.transformed_links))
+    return query.filter(Image.id == image_id).first()
 
 
+@traced
+async def get_images_by_ids(db: Session, image_ids: List[int]) -> List[Image]:
+    """
+    The get_images_by_ids function returns many images with their transformed links in one query.
+
+    :param db: Session: Pass the database session to the function
+    :param image_ids: List[int]: Ids of the images
+    :return: Images that exist, in no particular order
+    """
+    return db.query(Image).options(joinedload(Image.transformed_links)).filter(Image.id.in_(image_ids)).all()
+
+
+@traced
 async def get_image_by_id_user_id(image_id: int, user_id: int, db: Session) -> Image | None:
     """
     The get_image_by_id_user_id function returns an image object from the database if it exists.
@@ -54,6 +77,7 @@ async def get_image_by_id_user_id(image_id: int, user_id: int, db: Session) -> I
     return image
 
 
+@traced
 async def update_image_in_db(db: Session, image_id: int, new_description: str) -> ImageResponse | None:
     """
     Update the description of an image.
@@ -70,11 +94,13 @@ async def update_image_in_db(db: Session, image_id: int, new_description: str) -
     if image:
         image.description = new_description
         db.commit()
+        await response_cache.invalidate(f"image:{image_id}")
         db.refresh(image)
-        return ImageResponse.from_orm(image)
+        return ImageResponse.model_validate(image)
     return None
 
 
+@traced
 async def delete_image_from_db(db: Session, image_id: int) -> bool:
     """
     Delete an image by its ID.
@@ -112,6 +138,7 @@ async def delete_image_from_db(db: Session, image_id: int) -> bool:
         )
 
 
+@traced
 async def convert_db_model_to_response_model(db: Image) -> ImageResponse:
     """
     Convert a database model (ImageDB) to a response model (ImageResponse).
@@ -125,6 +152,7 @@ async def convert_db_model_to_response_model(db: Image) -> ImageResponse:
     return response_model
 
 
+@traced
 async def create_image(
     db: Session,
     user_id: int,
@@ -156,16 +184,72 @@ async def create_image(
         file_extension=file_extension,
     )
     db.add(image)
+    db.flush()
+    image_tags = await repository_tags.get_or_create_tags(db, tags)
+    if image_tags:
+        db.execute(
+            image_m2m_tag.insert(),
+            [{"image_id": image.id, "tag_id": tag.id} for tag in image_tags]
+        )
+    # A new image has no transformed links yet, so there is no need to load them.
+    # The response is built before the commit expires the image, so it is not read again
+    response = ImageResponse(
+        id=image.id,
+        user_id=image.user_id,
+        description=image.description,
+        transformed_links=[],
+        image_url=image.image_url,
+    )
     db.commit()
-    db.refresh(image)
-    for tag_name in tags:
-        tag = await repository_tags.get_or_create_tag(db, tag_name)
-        await add_tag_to_image(db, image_id=image.id, tag_id=tag.id)
+    await response_cache.invalidate(f"user:{user_id}")
+    await feed.publish(response.id)
+    return response
+
+
+@traced
+async def create_images(db: Session, user_id: int, images: List[dict], tags: List[str]) -> List[ImageResponse]:
+    """
+    Create many images of one user with the same tags in one transaction.
+    The images are inserted together, the tags are resolved once for all of them
+    and their links are inserted by one statement.
+
+    Args:
+        db (Session): The database session.
+        user_id (int): The ID of the user creating the images.
+        images (List[dict]): Columns of every image: description, image_url, public_id and file_extension.
+        tags (List[str]): The list of tags for every image.
 
-    # return image
-    return ImageResponse.from_db_model(image)
+    Returns:
+        List[ImageResponse]: The created images in the order of images.
+    """
+    created = [Image(user_id=user_id, **image) for image in images]
+    db.add_all(created)
+    db.flush()
+    image_tags = await repository_tags.get_or_create_tags(db, tags)
+    if image_tags:
+        db.execute(
+            image_m2m_tag.insert(),
+            [{"image_id": image.id, "tag_id": tag.id} for image in created for tag in image_tags]
+        )
+    # Responses are built before the commit expires the images, so they are not read again
+    responses = [
+        ImageResponse(
+            id=image.id,
+            user_id=image.user_id,
+            description=image.description,
+            transformed_links=[],
+            image_url=image.image_url,
+        )
+        for image in created
+    ]
+    db.commit()
+    await response_cache.invalidate(f"user:{user_id}")
+    for response in responses:
+        await feed.publish(response.id)
+    return responses
 
 
+@traced
 async def update_image_cloudinary_info(
     db: Session,
     image_id: int,
@@ -190,6 +274,7 @@ async def update_image_cloudinary_info(
         image.public_id = public_id
 
         db.commit()
+        await response_cache.invalidate(f"image:{image_id}")
         db.refresh(image)
     except Exception as e:
         db.rollback()
@@ -199,6 +284,7 @@ async def update_image_cloudinary_info(
         )
 
 
+@traced
 async def get_tags_count_for_image(db: Session, image_id: int) -> int:
     """
     Get the count of tags for an image.
@@ -213,6 +299,7 @@ async def get_tags_count_for_image(db: Session, image_id: int) -> int:
     return db.query(image_m2m_tag).filter(image_m2m_tag.c.image_id == image_id).count()
 
 
+@traced
 async def check_tags_limit(db: Session, image_id: int) -> bool:
     """
     Check if the number of tags for an image has reached the limit.
@@ -228,6 +315,7 @@ async def check_tags_limit(db: Session, image_id: int) -> bool:
     return tags_count < 5
 
 
+@traced
 async def create_transformed_image_link(
     db: Session,
     image_id: int,
@@ -253,6 +341,7 @@ async def create_transformed_image_link(
         existing_link.transformation_url = transformation_url
         existing_link.qr_code_url = qr_code_url
         db.commit()
+        await response_cache.invalidate(f"image:{image_id}")
         return existing_link
     else:
         # If no record exists, create a new one
@@ -264,6 +353,7 @@ async def create_transformed_image_link(
         db.add(new_link)
 
     db.commit()
+    await response_cache.invalidate(f"image:{image_id}")
 
     response_data = {
         "done": True,
@@ -273,6 +363,21 @@ async def create_transformed_image_link(
 
     return ImageStatusUpdate(**response_data)
 
+@traced
+async def get_first_transformed_link(db: Session, image_id: int) -> TransformedImageLink | None:
+    """
+    Get the first transformed link of an image without loading its other links.
+
+    Args:
+        db (Session): The database session.
+        image_id (int): The ID of the original image.
+
+    Returns:
+        TransformedImageLink | None: The link or None if the image has no links.
+    """
+    return db.query(TransformedImageLink).filter_by(image_id=image_id).order_by(TransformedImageLink.id).first()
+
+@traced
 def get_transformation_url_by_image_id(db: Session, image_id: int) -> str:
     """
     Get the transformation URL for a given image ID from the database.
@@ -290,6 +395,7 @@ def get_transformation_url_by_image_id(db: Session, image_id: int) -> str:
     # Return the transformation URL if found, otherwise return an empty string
     return link.transformation_url if link else ""
 
+@traced
 async def get_qr_code_url_by_image_id(db: Session, image_id: int) -> str:
     """
     Get the QR code URL for a given image ID from the database.
@@ -308,6 +414,7 @@ async def get_qr_code_url_by_image_id(db: Session, image_id: int) -> str:
     return qr_code_link.qr_code_url if qr_code_link else ""
 
     
+@traced
 async def find_images_by_keyword(user_id: int, db: Session, 
                       keyword: str, 
                       date: bool = False) -> List[Optional[Image]]:
@@ -322,15 +429,19 @@ async def find_images_by_keyword(user_id: int, db: Session,
     :param date: bool: Determine whether the images should be returned in order of upload time
     :return: A list of images that match the keyword
     """
+    # Only columns are returned, relationships must not be lazy loaded for every row
     if date:
-        images = db.query(Image).filter(Image.user_id==user_id, Image.description.like(f"%{keyword}%"))\
+        images = db.query(Image).options(raiseload("*"))\
+                 .filter(Image.user_id==user_id, Image.description.like(f"%{keyword}%"))\
                  .order_by(Image.upload_time.desc()).all()
         return images
     else:
-        images = db.query(Image).filter(Image.user_id==user_id, Image.description.like(f"%{keyword}%")).all()
+        images = db.query(Image).options(raiseload("*"))\
+                 .filter(Image.user_id==user_id, Image.description.like(f"%{keyword}%")).all()
         return images
     
 
+@traced
 async def find_images_by_tag(user_id: int, db: Session, 
                       tag_name: str,
                       date: bool = False) -> List[Optional[Image]]:
@@ -350,8 +461,10 @@ async def find_images_by_tag(user_id: int, db: Session,
     if tag is None:
         return None
     if date:
-        images = db.query(Image).filter(Image.user_id==user_id, Image.tags.contains(tag)).order_by(Image.upload_time.desc()).all()
+        images = db.query(Image).options(raiseload("*"))\
+                 .filter(Image.user_id==user_id, Image.tags.contains(tag)).order_by(Image.upload_time.desc()).all()
         return images
     else:
-        images = db.query(Image).filter(Image.user_id==user_id, Image.tags.contains(tag)).all()
+        images = db.query(Image).options(raiseload("*"))\
+                 .filter(Image.user_id==user_id, Image.tags.contains(tag)).all()
         return images
\ No newline at end of file
@@ -1,8 +1,10 @@
 from sqlalchemy.orm import Session
 
 from ..database.models import BlacklistedToken 
+from ..services.tracing import traced
 
 
+@traced
 async def token_to_blacklist(access_token: str, user_id, db: Session):
     """
     The token_to_blacklist function takes in a token and adds it to the blacklist.
@@ -26,6 +28,7 @@ async def token_to_blacklist(access_token: str, user_id, db: Session):
     db.refresh(token)
     return token
 
+@traced
 async def is_token_blacklisted(user_id, db: Session):
     """
     The is_token_blacklisted function checks if a token is blacklisted.
@@ -47,6 +50,7 @@ async def is_token_blacklisted(user_id, db: Session):
     else:
         return "Ready to write a new blacklist_token"
 
+@traced
 async def remove_old_blacklisted_token(token: BlacklistedToken, db: Session):
     """
     The remove_old_blacklisted_token function removes old blacklisted tokens from the database.
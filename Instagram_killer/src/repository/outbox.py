@@ -0,0 +1,189 @@
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+from uuid import uuid4
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from ..database.models import EmailOutbox
+from ..services.tracing import traced
+
+
+OUTBOX_KINDS = ("confirm_email", "reset_password")
+# a claimed email is "sending" until it is marked, when its lease expires another worker takes it again
+WAITING_STATUSES = ("pending", "sending")
+
+
+def utcnow() -> datetime:
+    """
+    The utcnow function returns the current time in UTC without a time zone, like the outbox stores it.
+
+    :return: A naive datetime in UTC
+    """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+@traced
+async def add_email(kind: str, email: str, username: str, host: str, db: Session) -> EmailOutbox:
+    """
+    The add_email function puts an email in the outbox without committing,
+        so the email is saved in the same transaction as the change it is about, or not at all.
+
+    :param kind: str: What email to send, one of OUTBOX_KINDS
+    :param email: str: Email address of the user
+    :param username: str: Username of the user
+    :param host: str: Base url of the application for links in the email
+    :param db: Session: Access the database
+    :return: The added outbox row
+    """
+    if kind not in OUTBOX_KINDS:
+        raise ValueError(f"Unknown kind of email: {kind}")
+    now = utcnow()
+    outbox = EmailOutbox(kind=kind, email=email, username=username, host=str(host),
+                         idempotency_key=uuid4().hex, status="pending", attempts=0,
+                         next_attempt_at=now, created_at=now)
+    db.add(outbox)
+    return outbox
+
+
+@traced
+async def claim_due_emails(limit: int, lease: float, max_attempts: int, db: Session) -> List[EmailOutbox]:
+    """
+    The claim_due_emails function takes emails whose time has come and leases them to the calling worker.
+        Rows locked by another worker are skipped, so several workers never claim the same email.
+        Every claim counts as an attempt. An email that is due again after max_attempts claims
+        crashed the worker every time before it was marked, it is dead-lettered instead of claimed.
+
+    :param limit: int: Maximum quantity of emails to claim
+    :param lease: float: Seconds the worker has to send the emails before they are claimed again
+    :param max_attempts: int: Attempts before an email is dead-lettered
+    :param db: Session: Access the database
+    :return: The claimed outbox rows
+    """
+    now = utcnow()
+    due = (EmailOutbox.status.in_(WAITING_STATUSES), EmailOutbox.next_attempt_at <= now)
+    db.execute(
+        update(EmailOutbox)
+        .where(*due, EmailOutbox.attempts >= max_attempts)
+        .values(status="dead", last_error=f"Not sent after {max_attempts} attempts, the lease expired")
+    )
+    emails = db.scalars(
+        select(EmailOutbox)
+        .where(*due)
+        .order_by(EmailOutbox.next_attempt_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    ).all()
+    for outbox in emails:
+        outbox.status = "sending"
+        outbox.attempts += 1
+        outbox.next_attempt_at = now + timedelta(seconds=lease)
+    db.commit()
+    return emails
+
+
+@traced
+async def mark_sent(outbox_ids: List[int], db: Session) -> int:
+    """
+    The mark_sent function marks emails as sent with one statement.
+
+    :param outbox_ids: List[int]: Ids of the sent emails
+    :param db: Session: Access the database
+    :return: The quantity of marked emails
+    """
+    if not outbox_ids:
+        return 0
+    result = db.execute(
+        update(EmailOutbox)
+        .where(EmailOutbox.id.in_(outbox_ids), EmailOutbox.status == "sending")
+        .values(status="sent", sent_at=utcnow(), last_error=None)
+    )
+    db.commit()
+    return result.rowcount
+
+
+@traced
+async def release_emails(outbox_ids: List[int], db: Session) -> None:
+    """
+    The release_emails function gives claimed emails back before their lease expires, when the worker is stopped.
+
+    :param outbox_ids: List[int]: Ids of the claimed emails
+    :param db: Session: Access the database
+    :return: None
+    """
+    db.execute(
+        update(EmailOutbox)
+        .where(EmailOutbox.id.in_(outbox_ids), EmailOutbox.status == "sending")
+        .values(status="pending", next_attempt_at=utcnow())
+    )
+    db.commit()
+
+
+@traced
+async def mark_failed(outbox_id: int, error: str, retry_at: Optional[datetime], db: Session) -> None:
+    """
+    The mark_failed function schedules the next attempt of an email or dead-letters it.
+
+    :param outbox_id: int: Id of the email
+    :param error: str: Description of the error
+    :param retry_at: Optional[datetime]: Time of the next attempt, None means the email is dead
+    :param db: Session: Access the database
+    :return: None
+    """
+    values = {"status": "dead"} if retry_at is None else {"status": "pending", "next_attempt_at": retry_at}
+    db.execute(
+        update(EmailOutbox)
+        .where(EmailOutbox.id == outbox_id, EmailOutbox.status == "sending")
+        .values(last_error=error[:500], **values)
+    )
+    db.commit()
+
+
+@traced
+def get_outbox_lag(db: Session) -> Tuple[int, float]:
+    """
+    The get_outbox_lag function measures the queue of emails that are not sent yet.
+        It is a plain function because metrics are collected outside of the event loop.
+
+    :param db: Session: Access the database
+    :return: The quantity of waiting emails and the age of the oldest one in seconds
+    """
+    quantity, oldest = db.execute(
+        select(func.count(), func.min(EmailOutbox.created_at))
+        .where(EmailOutbox.status.in_(WAITING_STATUSES))
+    ).one()
+    return quantity, (utcnow() - oldest).total_seconds() if oldest is not None else 0.0
+
+
+@traced
+async def requeue_dead_emails(db: Session) -> int:
+    """
+    The requeue_dead_emails function gives dead-lettered emails a new set of attempts, for example after SMTP settings were fixed.
+
+    :param db: Session: Access the database
+    :return: The quantity of requeued emails
+    """
+    result = db.execute(
+        update(EmailOutbox)
+        .where(EmailOutbox.status == "dead")
+        .values(status="pending", attempts=0, next_attempt_at=utcnow())
+    )
+    db.commit()
+    return result.rowcount
+
+
+@traced
+async def delete_sent_emails(older_than: timedelta, db: Session) -> int:
+    """
+    The delete_sent_emails function removes sent emails that are older than the retention period.
+
+    :param older_than: timedelta: How long sent emails are kept
+    :param db: Session: Access the database
+    :return: The quantity of deleted emails
+    """
+    result = db.execute(
+        EmailOutbox.__table__.delete()
+        .where(EmailOutbox.status == "sent", EmailOutbox.sent_at < utcnow() - older_than)
+    )
+    db.commit()
+    return result.rowcount
@@ -1,10 +1,69 @@
-from sqlalchemy import func
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.engine import Row
 from sqlalchemy.orm import Session
 
 from ..database.models import Image, Rating
 from ..schemas.images import ImageResponse
+from ..services.response_cache import image_keys, response_cache
+from ..services.tracing import traced
+
+STATS_BATCH_SIZE = 10000
+
+
+def rating_stats_query():
+    # the covering index of rating_table serves the count and the sum without reading the table
+    return select(Image.id, Image.upload_time, func.count(Rating.id).label("count"),
+                  func.sum(Rating.rating).label("total")) \
+        .join(Rating, Rating.image_id == Image.id).group_by(Image.id, Image.upload_time)
+
+
+@traced
+async def get_rating_stats(image_id: int, db: Session) -> Optional[Row]:
+    """
+    The get_rating_stats function returns the quantity and the sum of ratings of an image with its upload time.
+
+    :param image_id: int: Id of the image
+    :param db: Session: Pass the database session to the function
+    :return: A row with id, upload_time, count and total, None if the image has no ratings
+    """
+    return db.execute(rating_stats_query().where(Image.id == image_id)).first()
+
+
+def iter_rating_stats(db: Session, batch_size: int = STATS_BATCH_SIZE) -> Iterator[List[Row]]:
+    """
+    The iter_rating_stats function yields rating stats of all rated images in batches, for the compaction
+        of the ranking. Rows are fetched with yield_per, so only one batch is in memory.
+
+    :param db: Session: Database session
+    :param batch_size: int: Quantity of rows fetched at once
+    :return: An iterator of lists of rows with id, upload_time, count and total
+    """
+    result = db.execute(rating_stats_query().execution_options(yield_per=batch_size))
+    try:
+        yield from result.partitions()
+    finally:
+        result.close()
+
+
+@traced
+async def get_average_ratings(image_ids: List[int], db: Session) -> Dict[int, Tuple[float, int]]:
+    """
+    The get_average_ratings function returns average ratings of many images in one query.
+
+    :param image_ids: List[int]: Ids of the images
+    :param db: Session: Pass the database session to the function
+    :return: The average rating and the quantity of ratings of every rated image by its id
+    """
+    if not image_ids:
+        return {}
+    rows = db.execute(select(Rating.image_id, func.avg(Rating.rating), func.count(Rating.id))
+                      .where(Rating.image_id.in_(image_ids)).group_by(Rating.image_id))
+    return {image_id: (round(float(average), 2), count) for image_id, average, count in rows}
 
 
+@traced
 async def creare_rating(image_id: int, user_id: int, rating: int, db: Session) -> Rating:
     """
     The creare_rating function creates a new rating for an image.
@@ -31,10 +90,13 @@ async def creare_rating(image_id: int, user_id: int, rating: int, db: Session) -
     )
     db.add(new_rating)
     db.commit()
+    owner_id = db.query(Image.user_id).filter(Image.id==image_id).scalar()
+    await response_cache.invalidate(*image_keys(image_id, owner_id))
     db.refresh(new_rating)
     return new_rating
 
 
+@traced
 async def get_rating_using_id_user_id(image_id: int, user_id: int, db: Session) -> Rating | None:
     """
     The get_rating_using_id_user_id function returns a Rating object if the image_id and user_id are found in the database.
@@ -49,6 +111,7 @@ async def get_rating_using_id_user_id(image_id: int, user_id: int, db: Session)
     return rating
 
 
+@traced
 async def get_rating_using_id(rating_id: int, db: Session) -> Rating | None:
     """
     The get_rating_using_id function returns a rating object using the id of the rating.
@@ -66,6 +129,7 @@ async def get_rating_using_id(rating_id: int, db: Session) -> Rating | None:
     return rating
 
 
+@traced
 async def get_average_rating_for_image(image: Image, db: Session) -> dict:
     """
     The get_average_rating_for_image function takes an image and a database session as arguments.
@@ -84,6 +148,7 @@ async def get_average_rating_for_image(image: Image, db: Session) -> dict:
     return {"image": responce_image, "rating": average_rating}
 
 
+@traced
 async def delete_rating(rating_id: int, db: Session) -> Rating:
     """
     The delete_rating function deletes a rating from the database.
@@ -97,7 +162,10 @@ async def delete_rating(rating_id: int, db: Session) -> Rating:
     raiting_to_delete: Rating = db.query(Rating).filter(Rating.id==rating_id).first()
     if not raiting_to_delete:
         return None
+    image_id = raiting_to_delete.image_id
+    owner_id = db.query(Image.user_id).filter(Image.id==image_id).scalar()
     db.delete(raiting_to_delete)
     db.commit()
+    await response_cache.invalidate(*image_keys(image_id, owner_id))
     return raiting_to_delete
 
@@ -1,10 +1,13 @@
-from typing import List
+from typing import List, Tuple
 
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 
-from ..database.models import Tag
+from ..database.models import Tag, image_m2m_tag
+from ..services.tracing import traced
 
 
+@traced
 async def get_or_create_tag(db: Session, tag_name: str) -> Tag:
     """
     The get_or_create_tag function will either return an existing tag from the database, or create a new one if it doesn't exist.
@@ -25,6 +28,30 @@ async def get_or_create_tag(db: Session, tag_name: str) -> Tag:
 
     return new_tag
 
+
+@traced
+async def get_or_create_tags(db: Session, tag_names: List[str]) -> List[Tag]:
+    """
+    The get_or_create_tags function resolves all tag names in one query and adds the missing ones.
+    New tags are only flushed, so the caller commits them together with the rest of its changes.
+    
+    :param db: Session: Connect to the database
+    :param tag_names: List[str]: Tag names referenced by the image
+    :return: A list of tag objects in the same order as the names
+    """
+    tag_names = list(dict.fromkeys(tag_names))
+    if not tag_names:
+        return []
+    existing_tags = {tag.tag: tag for tag in db.query(Tag).filter(Tag.tag.in_(tag_names)).all()}
+    new_tags = [Tag(tag=tag_name) for tag_name in tag_names if tag_name not in existing_tags]
+    if new_tags:
+        db.add_all(new_tags)
+        db.flush()
+        existing_tags.update({tag.tag: tag for tag in new_tags})
+    return [existing_tags[tag_name] for tag_name in tag_names]
+
+
+@traced
 async def get_existing_tags(db: Session) -> list:
     """
     The get_existing_tags function returns a list of all the tags that are currently in the database.
@@ -37,6 +64,36 @@ async def get_existing_tags(db: Session) -> list:
     return [tag.tag for tag in existing_tags]
 
 
+@traced
+async def get_tags_usage(db: Session) -> List[Tuple[str, int]]:
+    """
+    The get_tags_usage function returns every tag with the quantity of images that have it.
+        Tags without images are returned with zero count.
+    
+    :param db: Session: Pass in the database session
+    :return: A list of (tag, count) pairs
+    """
+    tags_usage = db.query(Tag.tag, func.count(image_m2m_tag.c.image_id))\
+                   .outerjoin(image_m2m_tag, image_m2m_tag.c.tag_id == Tag.id)\
+                   .group_by(Tag.tag).all()
+    return [(tag, count) for tag, count in tags_usage]
+
+
+@traced
+async def get_tag_names_for_image(db: Session, image_id: int) -> List[str]:
+    """
+    The get_tag_names_for_image function returns names of all tags linked to the image.
+    
+    :param db: Session: Pass in the database session
+    :param image_id: int: Id of the image
+    :return: A list of tag names
+    """
+    tags = db.query(Tag.tag).join(image_m2m_tag, image_m2m_tag.c.tag_id == Tag.id)\
+             .filter(image_m2m_tag.c.image_id == image_id).all()
+    return [tag.tag for tag in tags]
+
+
+@traced
 async def get_tag_by_name(tag: str, db: Session) -> Tag | None:
     """
     The get_tag_by_name function returns a tag object from the database if it exists, otherwise None.
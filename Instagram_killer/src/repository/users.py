@@ -1,9 +1,20 @@
+from typing import Iterator, List, Optional
+
+from sqlalchemy import Row, func, or_, select
 from sqlalchemy.orm import Session
 
-from ..database.models import User, Image
+from ..database.models import User, Image, Comment, Rating
+from ..repository.follows import forget_follows
 from ..schemas.users import UserModel, UserRoleUpdate
+from ..services.response_cache import response_cache
+from ..services.tracing import traced
+
+
+EXPORT_FIELDS = ("id", "username", "email", "role", "confirmed", "banned", "created_at")
+EXPORT_BATCH_SIZE = 1000
 
 
+@traced
 async def create_user(body: UserModel, db: Session) -> User:
     """
     The create_user function creates a new user in the database.
@@ -13,7 +24,7 @@ async def create_user(body: UserModel, db: Session) -> User:
     :param db: Session: Access the database
     :return: A user object
     """
-    user = User(**body.dict())
+    user = User(**body.model_dump())
     db.add(user)
     db.commit()
     if user.id == 1:
@@ -23,31 +34,57 @@ async def create_user(body: UserModel, db: Session) -> User:
     return user
 
 
+@traced
 async def get_user_by_email(email: str, db: Session) -> User | None:
     """
     The get_user_by_email function takes in an email and a database session,
     and returns the user with that email if it exists. If no such user exists,
     it returns None.
 
+    Emails are stored in lower case, so the lookup ignores the case of the given email
+    and still uses the unique index of the column.
+
     :param email: str: Specify the email of the user we want to get from our database
     :param db: Session: Pass the database session to the function
     :return: A user object or none if the user is not found
     """
-    return db.query(User).filter(User.email==email).first()
+    if email is None:
+        return None
+    return db.query(User).filter(User.email==email.lower()).first()
 
 
+@traced
 async def get_user_by_username(username: str, db: Session) -> User | None:
     """
     The get_user_by_email function takes in an email and a database session,
     and returns the user with that email if it exists. If no such user exists,
     it returns None.
 
+    The case of the username is ignored, the lookup uses the ix_users_table_username_lower index.
+
     :param email: str: Specify the email of the user we want to get from our database
     :param db: Session: Pass the database session to the function
     :return: A user object or none if the user is not found
     """
-    return db.query(User).filter(User.username==username).first()
+    return db.query(User).filter(func.lower(User.username)==func.lower(username)).first()
 
+
+@traced
+async def get_users_by_email_or_username(email: str, username: str, db: Session) -> List[User]:
+    """
+    The get_users_by_email_or_username function finds users that already have the email or the username
+        of a new user with one query, both conditions are served by unique indexes and the case is ignored.
+
+    :param email: str: Email of the new user
+    :param username: str: Username of the new user
+    :param db: Session: Pass the database session to the function
+    :return: A list of at most two users
+    """
+    return db.query(User).filter(
+        or_(User.email==email.lower(), func.lower(User.username)==func.lower(username))
+    ).all()
+
+@traced
 async def update_token(user: User, refresh_token: str, db: Session) -> None:
     """
     The update_token function updates the refresh_token for a user in the database.
@@ -66,6 +103,7 @@ async def update_token(user: User, refresh_token: str, db: Session) -> None:
     db.refresh(user)
 
 
+@traced
 async def confirmed_email(email: str, db: Session) -> None:
     """
     The confirmed_email function sets the confirmed field of a user to True.
@@ -79,6 +117,7 @@ async def confirmed_email(email: str, db: Session) -> None:
     db.commit()
 
 
+@traced
 async def change_password(user: User, new_password: str, db: Session) -> None:
     """
     The change_password function changes the password of a user.
@@ -98,6 +137,7 @@ async def change_password(user: User, new_password: str, db: Session) -> None:
     db.refresh(user)
 
 
+@traced
 async def update_avatar(email, url: str, db: Session) -> User:
     """
     The update_avatar function updates the avatar of a user.
@@ -115,10 +155,12 @@ async def update_avatar(email, url: str, db: Session) -> User:
     user = await get_user_by_email(email, db)
     user.avatar = url
     db.commit()
+    await response_cache.invalidate(f"user:{user.id}")
     db.refresh(user)
     return user
 
 
+@traced
 async def get_user_by_id(user_id: int, db: Session) -> User | None:
     """
     The get_user_by_id function returns a User object from the database, given an id.
@@ -134,6 +176,7 @@ async def get_user_by_id(user_id: int, db: Session) -> User | None:
     return db.query(User).filter(User.id==user_id).first()
 
 
+@traced
 async def change_user_role(user: User, body: UserRoleUpdate, db: Session) -> User:
     """
     The change_user_role function changes the role of a user.
@@ -150,13 +193,17 @@ async def change_user_role(user: User, body: UserRoleUpdate, db: Session) -> Use
     """
     user.role = body.role
     db.commit()
+    await response_cache.invalidate(f"user:{user.id}")
     db.refresh(user)
     return user
     
     
+@traced
 async def delete_user(user_id: int, db: Session) -> None:
     """
     The delete_user function deletes a user from the database based on the user ID.
+        Comments of the user are deleted with it, comment_count of the commented images is recomputed
+        without them in the same transaction.
 
     :param user_id: int: ID of the user to be deleted
     :param db: Session: Database session
@@ -164,36 +211,86 @@ async def delete_user(user_id: int, db: Session) -> None:
     """
     user = db.query(User).filter(User.id == user_id).first()
     if user:
+        username = user.username
+        commented_images = select(Comment.image_id).where(Comment.user_id == user_id)
+        remaining_comments = select(func.count(Comment.id))\
+            .where(Comment.image_id == Image.id, Comment.user_id != user_id).scalar_subquery()
+        db.query(Image).filter(Image.id.in_(commented_images))\
+            .update({Image.comment_count: remaining_comments}, synchronize_session=False)
+        db.query(Comment).filter(Comment.user_id == user_id).delete(synchronize_session=False)
+        await forget_follows(user_id, db)
         db.delete(user)
         db.commit()
+        # comments and ratings of the user are deleted with him, so all cached responses are stale
+        await response_cache.delete_alias(f"username:{username.lower()}")
+        await response_cache.invalidate_all()
     return None 
 
-async def get_imagis_quantity(user:User, db: Session):
+@traced
+async def get_user_profile(username: str, db: Session) -> dict | None:
     """
-    The get_imagis_quantity function returns the number of images that a user has uploaded to the database.
-        Args:
-            user (User): The User object whose image quantity is being requested.
-            db (Session): The database session used for querying and updating data in the database.
+    The get_user_profile function returns a user with the stats of his profile in one query.
+        Quantity of images and of comments on them come from the indexed images of the user
+        and their comment_count counters, ratings are aggregated through the index of rating_table.
     
-    :param user:User: Get the user_id of the user
-    :param db: Session: Connect to the database and query it
-    :return: The quantity of images that a user has uploaded to the database
+    :param username: str: Username of the user
+    :param db: Session: Pass the database session to the function
+    :return: A dictionary with the user and his stats or None if the user is not found
+    """
+    of_user = Image.user_id==User.id
+    images = select(func.count(Image.id)).where(of_user).scalar_subquery()
+    comments = select(func.coalesce(func.sum(Image.comment_count), 0)).where(of_user).scalar_subquery()
+    ratings = select(func.count(Rating.id)).join(Image, Image.id==Rating.image_id).where(of_user).scalar_subquery()
+    average = select(func.avg(Rating.rating)).join(Image, Image.id==Rating.image_id).where(of_user).scalar_subquery()
+    row = db.execute(
+        select(User, images, comments, ratings, average).where(func.lower(User.username)==func.lower(username))
+    ).first()
+    if row is None:
+        return None
+    user, images, comments, ratings, average_rating = row
+    return {
+        "user": user,
+        "quantity_of_loaded_images": images,
+        "quantity_of_comments": comments,
+        "quantity_of_ratings": ratings,
+        "average_rating": None if average_rating is None else round(average_rating, 2),
+    }
+
+@traced
+async def get_users(db: Session, limit: int, after: Optional[int] = None) -> List[Row]:
     """
-    all_images = db.query(Image).filter_by(user_id = user.id).all()
-    quantity_of_loaded_images = len(all_images)
-    return quantity_of_loaded_images
+    The get_users function returns a page of users ordered by id, only their ids and usernames are selected.
+        The next page starts right after the id of the last user of the previous one.
+
+    :param db: Session: Database session
+    :param limit: int: Maximum quantity of returned users
+    :param after: Optional[int]: The id of the last user of the previous page
+    :return: A list of rows with id and username
+    """
+    query = select(User.id, User.username)
+    if after is not None:
+        query = query.where(User.id > after)
+    return db.execute(query.order_by(User.id).limit(limit)).all()
+
 
-async def return_all_users(db: Session) -> dict:
+def export_users(db: Session, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[List[Row]]:
     """
-    The return_all_users function retrieves all usernames from the User table.
+    The export_users function yields all users in batches for the export, without password hashes and tokens.
+        Rows are fetched with yield_per, so the driver uses a server side cursor where it has one
+        and only one batch is in memory no matter how many users there are.
 
     :param db: Session: Database session
-    :return: A dictionary containing all usernames from the User table
+    :param batch_size: int: Quantity of rows fetched at once
+    :return: An iterator of lists of rows with EXPORT_FIELDS columns
     """
-    users = db.query(User).all()
-    usernames = {f"username(id: {user.id})": user.username for user in users}
-    return usernames
+    columns = [getattr(User, field) for field in EXPORT_FIELDS]
+    result = db.execute(select(*columns).order_by(User.id).execution_options(yield_per=batch_size))
+    try:
+        yield from result.partitions()
+    finally:
+        result.close()
 
+@traced
 async def update_banned_status(user: User, db: Session):
     """
     The update_banned_status function updates the banned status of a user for bunned.
@@ -206,9 +303,11 @@ async def update_banned_status(user: User, db: Session):
     """
     user.banned = True
     db.commit()
+    await response_cache.invalidate(f"user:{user.id}")
     db.refresh(user)
     return user
 
+@traced
 async def update_unbanned_status(user: User, db: Session):
     """
     The update_гтbanned_status function updates the banned status of a user for unbanned.
@@ -221,6 +320,7 @@ async def update_unbanned_status(user: User, db: Session):
     """
     user.banned = False
     db.commit()
+    await response_cache.invalidate(f"user:{user.id}")
     db.refresh(user)
     return user
 
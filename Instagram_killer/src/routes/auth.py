@@ -1,17 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Security, BackgroundTasks, Request
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, status, Security, Request
 from fastapi.security import OAuth2PasswordRequestForm, HTTPAuthorizationCredentials, HTTPBearer
 from sqlalchemy.orm import Session
 
 from ..database.db import get_db
 from ..database.models import User
-from ..repository import users as repository_users
+from ..repository import users as repository_users, outbox as repository_outbox
 from ..repository.logout import token_to_blacklist
 from ..services.auth import service_auth
 from ..services import (
-    email as service_email,
     roles as service_roles,
     banned as service_banned,
-    logout as service_logout
+    logout as service_logout,
+    rate_limit as service_rate_limit,
 )
 from ..schemas import (
     users as schema_users,
@@ -27,41 +29,41 @@ allowd_operation_by_admin= service_roles.RoleRights(["admin"])
 allowd_operation_any_user = service_roles.RoleRights(["user", "moderator", "admin"])
 #allowd_operation_delete_user = service_roles.RoleRights(["admin"])
 
-@router.post('/signup', status_code=status.HTTP_201_CREATED)
+@router.post('/signup', status_code=status.HTTP_201_CREATED,
+             dependencies=[Depends(service_rate_limit.signup_limit)])
 async def signup(body: schema_users.UserModel, 
-                 background_tasks: BackgroundTasks, 
                  request: Request, 
                  db: Session = Depends(get_db)):
     """
     The signup function creates a new user in the database.
         It also sends an email to the user's email address for verification purposes.
+        The email is saved in the outbox in the same transaction as the user and sent later by the outbox worker.
         The function returns a dict containing the newly created user and a detail message.
     
     :param body: schema_users.UserModel: Validate the input data, and it is also used to create a new user
-    :param background_tasks: BackgroundTasks: Add a task to the background tasks queue
     :param request: Request: Get the base url of the application
     :param db: Session: Get the database session,
     :return: A dictionary
     """
-    exist_user_with_email: User = await repository_users.get_user_by_email(body.email, db)
+    exist_users: List[User] = await repository_users.get_users_by_email_or_username(body.email, body.username, db)
 
-    if exist_user_with_email:
+    if any(exist_user.email == body.email for exist_user in exist_users):
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f'User with email: {body.email} already exists')
     
-    exist_user_with_username: User = await repository_users.get_user_by_username(body.username, db)
-    
-    if exist_user_with_username:
+    if exist_users:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail= f'User with name: {body.username} already exists')
     
     body.password = service_auth.get_password_hash(body.password)
+    await repository_outbox.add_email("confirm_email", body.email, body.username, request.base_url, db)
+    # create_user commits the user together with the email
     user = await repository_users.create_user(body, db)
-    background_tasks.add_task(service_email.send_email, user.email, user.username, request.base_url)
     return {'user': user, 'detail': 'User successfully created, please check your email for verification'}
 
 
 @router.post("/login", 
              response_model=schema_token.TokenResponce, 
-             status_code=status.HTTP_202_ACCEPTED)
+             status_code=status.HTTP_202_ACCEPTED,
+             dependencies=[Depends(service_rate_limit.login_limit)])
 async def login(body: OAuth2PasswordRequestForm = Depends(), 
                 db: Session = Depends(get_db)):
                
@@ -149,17 +151,16 @@ async def confirm_email(token: str, db: Session = Depends(get_db)):
     return {'detail': 'Email is confirmed'}
 
 
-@router.post('/request_email', status_code=status.HTTP_202_ACCEPTED)
-async def request_email(body: schema_email.RequestEmail, background_task: BackgroundTasks, 
-                        request: Request, db: Session = Depends(get_db)):
+@router.post('/request_email', status_code=status.HTTP_202_ACCEPTED,
+             dependencies=[Depends(service_rate_limit.email_request_limit)])
+async def request_email(body: schema_email.RequestEmail, request: Request, db: Session = Depends(get_db)):
     """
     The request_email function is used to send an email to the user with a link
     to confirm their account. The function takes in a RequestEmail object, which 
     contains the user's email address. It then checks if that email address exists 
-    in our database and if it does, sends an email containing a confirmation link.
+    in our database and if it does, saves an email containing a confirmation link in the outbox.
     
     :param body: RequestEmail: Get the email from the request body
-    :param background_task: BackgroundTasks: Add a task to the background tasks queue
     :param request: Request: Get the base url of the application
     :param db: Session: Get the database session
     :return: A string
@@ -168,27 +169,28 @@ async def request_email(body: schema_email.RequestEmail, background_task: Backgr
     if user is not None and user.confirmed:
         return {'detail': 'Email is already confirmed'}
     if user:
-        background_task.add_task(service_email.send_email, user.email, user.username, request.base_url)
+        await repository_outbox.add_email("confirm_email", user.email, user.username, request.base_url, db)
+        db.commit()
     return {'detail': 'Check your email for further information'}
 
 
-@router.post('/reset_password', status_code=status.HTTP_202_ACCEPTED)
-async def reset_password_request(body: schema_email.RequestEmail, background_task: BackgroundTasks,
-                          request: Request, db: Session = Depends(get_db)):
+@router.post('/reset_password', status_code=status.HTTP_202_ACCEPTED,
+             dependencies=[Depends(service_rate_limit.email_request_limit)])
+async def reset_password_request(body: schema_email.RequestEmail, request: Request, db: Session = Depends(get_db)):
     """
     The reset_password_request function is used to send a reset password email to the user.
         The function takes in an email address and sends a reset password link to that address.
-        If the user does not exist, then no action is taken.
+        If the user does not exist, then no action is taken. The email is saved in the outbox and sent by the outbox worker.
     
     :param body: RequestEmail: Get the email from the request body
-    :param background_task: BackgroundTasks: Add a task to the background tasks queue
     :param request: Request: Get the base_url of the server to be used in the email
     :param db: Session: Get the database session
     :return: A string
     """
     user = await repository_users.get_user_by_email(body.email, db)
     if user:
-        background_task.add_task(service_email.send_reset_password_email, user.email, user.username, request.base_url)
+        await repository_outbox.add_email("reset_password", user.email, user.username, request.base_url, db)
+        db.commit()
     return {'detail': 'Check your email for further information'}
 
 
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
 
 from ..database.models import User, Comment, Image
@@ -8,6 +8,7 @@ from ..repository import comments as repository_comments, images as repository_i
 from ..schemas import comments as schema_comments
 from ..services.roles import RoleRights
 from ..services.logout import logout_dependency
+from ..services.response_cache import response_cache
 
 router = APIRouter(prefix='/images/comments', tags=['comments'])
 
@@ -43,25 +44,54 @@ async def add_comment(body: schema_comments.CommentModel,
     return comment
 
 
+@router.post("/bulk_delete", status_code=200,
+             response_model=schema_comments.CommentBulkDeleteResponse,
+             dependencies=[Depends(logout_dependency), Depends(allowd_operation_admin_moderator)])
+async def bulk_delete_comments(body: schema_comments.CommentBulkDelete,
+                               current_user: User = Depends(service_auth.get_current_user),
+                               db: Session = Depends(get_db)):
+    """
+    The bulk_delete_comments function deletes many comments at once, for example all spam of one user.
+        Comments are selected by a list of ids, by author or by image, the filters can be combined
+        and narrowed with a time window. With dry_run the comments are only counted.
+    
+    :param body: schema_comments.CommentBulkDelete: Filters of the comments and the dry_run flag
+    :param current_user: User: Get the current user from the token
+    :param db: Session: Pass the database session to the function
+    :return: Quantity of deleted comments and of images they belonged to
+    """
+    if body.dry_run:
+        deleted, images = await repository_comments.count_comments_to_delete(body=body, db=db)
+    else:
+        deleted, images = await repository_comments.delete_comments(body=body, db=db)
+    return {"deleted": deleted, "images": images, "dry_run": body.dry_run}
+
+
 @router.get("/{comment_id}", status_code=200, 
              response_model=schema_comments.CommentResponce,
              dependencies=[Depends(logout_dependency), Depends(allowd_operation_any_user)])
 async def read_comment(comment_id: int,
+                        request: Request,
                         current_user: User = Depends(service_auth.get_current_user),
                         db: Session = Depends(get_db)):
     """
     The read_comment function returns a comment by its id.
         The function will return an HTTP 404 error if the comment doesn't exist.
+        The response has an ETag of the version of the comment, a matching If-None-Match header gets 304.
     
     :param comment_id: int: Specify the comment id to be read
+    :param request: Request: Get the If-None-Match header
     :param current_user: User: Get the current user from the database
     :param db: Session: Get a database session from the dependency injection container
     :return: A comment object
     """
+    cached = await response_cache.lookup(request, "comment", f"comment:{comment_id}")
+    if cached.response is not None:
+        return cached.response
     comment: Comment = await repository_comments.get_comment(comment_id=comment_id, db=db)
     if not comment:
         raise HTTPException(status_code=404, detail="Comment doesn't exist")
-    return comment
+    return await cached.render(schema_comments.CommentResponce.model_validate(comment))
 
 
 @router.put("/{comment_id}", status_code=200,
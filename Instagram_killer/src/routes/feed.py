@@ -0,0 +1,55 @@
+from typing import Optional
+
+import orjson
+from fastapi import APIRouter, Depends, Query, status
+from sqlalchemy.orm import Session
+
+from ..database.db import get_db
+from ..database.models import User
+from ..schemas import feed as schema_feed
+from ..services.auth import service_auth
+from ..services import (
+    roles as service_roles,
+    logout as service_logout,
+    banned as service_banned,
+    feed as service_feed,
+    pagination as service_pagination,
+    serialization as service_serialization,
+)
+
+router = APIRouter(prefix='/feed', tags=['feed'])
+
+allowd_operation_any_user = service_roles.RoleRights(["user", "moderator", "admin"])
+
+
+@router.get("/",
+            response_model=schema_feed.FeedResponse,
+            response_class=service_serialization.FastJSONResponse,
+            status_code=status.HTTP_200_OK,
+            dependencies=[Depends(service_logout.logout_dependency),
+                          Depends(allowd_operation_any_user),
+                          Depends(service_banned.banned_dependency)])
+async def get_feed(limit: int = Query(20, ge=1, le=100),
+                   cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+                   current_user: User = Depends(service_auth.get_current_user),
+                   db: Session = Depends(get_db)):
+    """
+    The get_feed function returns the newest images of all users page by page, newest first.
+        Ids of the images are read from the timeline in Redis and their cards from the cache,
+        so a page usually reads the database only for the cards that changed.
+        The response has next_cursor, pass it as cursor to get the next page. It is null on the last page.
+
+    :param limit: int: Maximum quantity of images on the page
+    :param cursor: Optional[str]: The next_cursor of the previous page
+    :param current_user: User: Get the current user
+    :param db: Session: Get the database session
+    :return: A page of image cards with the cursor of the next page
+    """
+    before = service_pagination.decode_cursor(cursor, int)[0] if cursor else None
+    image_ids, last_id = await service_feed.feed.page(db, limit=limit, before=before)
+    cards = await service_feed.feed.cards(db, image_ids)
+    return service_serialization.FastJSONResponse({
+        # cards are rendered JSON already, they are embedded without parsing
+        "images": [orjson.Fragment(card) for card in cards.values()],
+        "next_cursor": service_pagination.encode_cursor(last_id) if last_id is not None else None,
+    })
@@ -0,0 +1,180 @@
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session
+
+from ..database.db import get_db
+from ..database.models import User
+from ..repository import follows as repository_follows, users as repository_users
+from ..schemas import follows as schema_follows
+from ..services.auth import service_auth
+from ..services import (
+    roles as service_roles,
+    logout as service_logout,
+    banned as service_banned,
+    pagination as service_pagination,
+    serialization as service_serialization,
+)
+
+router = APIRouter(prefix='/users', tags=['follows'])
+
+allowd_operation_any_user = service_roles.RoleRights(["user", "moderator", "admin"])
+
+DEPENDENCIES = [Depends(service_logout.logout_dependency),
+                Depends(allowd_operation_any_user),
+                Depends(service_banned.banned_dependency)]
+
+
+async def get_user_or_404(user_id: int, db: Session) -> User:
+    user = await repository_users.get_user_by_id(user_id=user_id, db=db)
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    return user
+
+
+@router.post('/follow', response_model=schema_follows.FollowChangeResponse, status_code=status.HTTP_200_OK,
+             dependencies=DEPENDENCIES)
+async def follow_users(body: schema_follows.FollowModel,
+                       current_user: User = Depends(service_auth.get_current_user),
+                       db: Session = Depends(get_db)):
+    """
+    The follow_users function makes the current user follow many users at once.
+        Users he already follows, himself and users that do not exist are skipped, so the request can be repeated.
+
+    :param body: schema_follows.FollowModel: Ids of the users to follow
+    :param current_user: User: Get the current user
+    :param db: Session: Get the database session
+    :return: Ids of the newly followed users and the quantity of users the current user follows
+    """
+    followed, following_count = await repository_follows.follow_users(current_user.id, body.user_ids, db)
+    return {"user_ids": followed, "following_count": following_count}
+
+
+@router.post('/unfollow', response_model=schema_follows.FollowChangeResponse, status_code=status.HTTP_200_OK,
+             dependencies=DEPENDENCIES)
+async def unfollow_users(body: schema_follows.FollowModel,
+                         current_user: User = Depends(service_auth.get_current_user),
+                         db: Session = Depends(get_db)):
+    """
+    The unfollow_users function makes the current user stop following many users at once.
+
+    :param body: schema_follows.FollowModel: Ids of the users to unfollow
+    :param current_user: User: Get the current user
+    :param db: Session: Get the database session
+    :return: Ids of the unfollowed users and the quantity of users the current user follows
+    """
+    unfollowed, following_count = await repository_follows.unfollow_users(current_user.id, body.user_ids, db)
+    return {"user_ids": unfollowed, "following_count": following_count}
+
+
+@router.put('/{user_id}/follow', response_model=schema_follows.FollowChangeResponse,
+            status_code=status.HTTP_200_OK, dependencies=DEPENDENCIES)
+async def follow_user(user_id: int,
+                      current_user: User = Depends(service_auth.get_current_user),
+                      db: Session = Depends(get_db)):
+    """
+    The follow_user function makes the current user follow a user, following him again changes nothing.
+
+    :param user_id: int: Id of the user to follow
+    :param current_user: User: Get the current user
+    :param db: Session: Get the database session
+    :return: The id of the user if he was not followed yet and the quantity of users the current user follows
+    """
+    if user_id == current_user.id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="You can't follow yourself")
+    await get_user_or_404(user_id, db)
+    followed, following_count = await repository_follows.follow_users(current_user.id, [user_id], db)
+    return {"user_ids": followed, "following_count": following_count}
+
+
+@router.delete('/{user_id}/follow', response_model=schema_follows.FollowChangeResponse,
+               status_code=status.HTTP_200_OK, dependencies=DEPENDENCIES)
+async def unfollow_user(user_id: int,
+                        current_user: User = Depends(service_auth.get_current_user),
+                        db: Session = Depends(get_db)):
+    """
+    The unfollow_user function makes the current user stop following a user, unfollowing him again changes nothing.
+
+    :param user_id: int: Id of the user to unfollow
+    :param current_user: User: Get the current user
+    :param db: Session: Get the database session
+    :return: The id of the user if he was followed and the quantity of users the current user follows
+    """
+    unfollowed, following_count = await repository_follows.unfollow_users(current_user.id, [user_id], db)
+    return {"user_ids": unfollowed, "following_count": following_count}
+
+
+async def follows_page(get_page, user_id: int, count: int, limit: int, cursor: Optional[str], db: Session):
+    before = tuple(service_pagination.decode_cursor(cursor, datetime, int)) if cursor else None
+    users = await get_page(user_id, db, limit=limit + 1, before=before)
+    next_cursor = None
+    if len(users) > limit:
+        users = users[:limit]
+        next_cursor = service_pagination.encode_cursor(users[-1].followed_at, users[-1].id)
+    return service_serialization.trusted_response({"users": users, "count": count, "next_cursor": next_cursor},
+                                                  schema_follows.FollowListResponse)
+
+
+@router.get('/{user_id}/followers', response_model=schema_follows.FollowListResponse,
+            response_class=service_serialization.FastJSONResponse,
+            status_code=status.HTTP_200_OK, dependencies=DEPENDENCIES)
+async def get_followers(user_id: int,
+                        limit: int = Query(20, ge=1, le=100),
+                        cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+                        current_user: User = Depends(service_auth.get_current_user),
+                        db: Session = Depends(get_db)):
+    """
+    The get_followers function returns followers of a user page by page, the newest first.
+        count is the cached quantity of all followers, it is not counted per request.
+        The response has next_cursor, pass it as cursor to get the next page. It is null on the last page.
+
+    :param user_id: int: Id of the user
+    :param limit: int: Maximum quantity of users on the page
+    :param cursor: Optional[str]: The next_cursor of the previous page
+    :param current_user: User: Get the current user
+    :param db: Session: Get the database session
+    :return: A page of followers with their quantity and the cursor of the next page
+    """
+    user = await get_user_or_404(user_id, db)
+    return await follows_page(repository_follows.get_followers, user_id, user.followers_count, limit, cursor, db)
+
+
+@router.get('/{user_id}/following', response_model=schema_follows.FollowListResponse,
+            response_class=service_serialization.FastJSONResponse,
+            status_code=status.HTTP_200_OK, dependencies=DEPENDENCIES)
+async def get_following(user_id: int,
+                        limit: int = Query(20, ge=1, le=100),
+                        cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+                        current_user: User = Depends(service_auth.get_current_user),
+                        db: Session = Depends(get_db)):
+    """
+    The get_following function returns users a user follows page by page, the most recently followed first.
+
+    :param user_id: int: Id of the user
+    :param limit: int: Maximum quantity of users on the page
+    :param cursor: Optional[str]: The next_cursor of the previous page
+    :param current_user: User: Get the current user
+    :param db: Session: Get the database session
+    :return: A page of followed users with their quantity and the cursor of the next page
+    """
+    user = await get_user_or_404(user_id, db)
+    return await follows_page(repository_follows.get_following, user_id, user.following_count, limit, cursor, db)
+
+
+@router.get('/{user_id}/relationship', response_model=schema_follows.RelationshipResponse,
+            status_code=status.HTTP_200_OK, dependencies=DEPENDENCIES)
+async def get_relationship(user_id: int,
+                           current_user: User = Depends(service_auth.get_current_user),
+                           db: Session = Depends(get_db)):
+    """
+    The get_relationship function tells whether the current user and a user follow each other.
+        It is two lookups of the primary key of follows, no matter how many followers they have.
+
+    :param user_id: int: Id of the other user
+    :param current_user: User: Get the current user
+    :param db: Session: Get the database session
+    :return: Whether the current user follows the user, is followed by him and both
+    """
+    following, followed_by = await repository_follows.get_relationship(current_user.id, user_id, db)
+    return {"following": following, "followed_by": followed_by, "mutual": following and followed_by}
@@ -1,10 +1,15 @@
-from typing import List, Optional
+import math
+from datetime import datetime
+from typing import Dict, List, Optional
 
-from fastapi import APIRouter, Depends, File, UploadFile, HTTPException, status, Query
+import orjson
+from fastapi import APIRouter, Depends, File, UploadFile, HTTPException, Request, status, Query
+from redis.exceptions import RedisError
 from sqlalchemy.orm import Session
 
+from ..conf.config import settings
 from ..database.db import get_db, db_transaction
-from ..schemas import images as schemas_images
+from ..schemas import images as schemas_images, comments as schema_comments, feed as schema_feed
 from ..database.models import User, Image
 from ..services.auth import service_auth
 from ..services import (
@@ -12,12 +17,21 @@ from ..services import (
     logout as service_logout,
     banned as service_banned,
     qr_code as service_qr_code,
-    cloudinary as service_cloudinary
+    cloudinary as service_cloudinary,
+    tags_index as service_tags_index,
+    pagination as service_pagination,
+    rate_limit as service_rate_limit,
+    response_cache as service_response_cache,
+    serialization as service_serialization,
+    feed as service_feed,
+    ranking as service_ranking,
+    album as service_album,
 )
 from ..repository import (
     images as repository_images, 
     rating as repository_rating, 
-    tags as repository_tags
+    tags as repository_tags,
+    comments as repository_comments
 )
 
 router = APIRouter(prefix='/images', tags=['images'])
@@ -29,7 +43,8 @@ allowd_operation_delete_user = service_roles.RoleRights(["admin"])
 
 @router.post("/", 
              status_code=status.HTTP_200_OK,
-             dependencies=[Depends(service_logout.logout_dependency), 
+             dependencies=[Depends(service_rate_limit.upload_image_limit),
+                           Depends(service_logout.logout_dependency), 
                            Depends(allowd_operation_any_user),
                            Depends(service_banned.banned_dependency)],
              response_model=schemas_images.ImageResponse)
@@ -74,11 +89,8 @@ async def upload_image(
             file_extension=file_extension,
         )
 
-        # Add new tags to the existing tags list
-        existing_tags = await repository_tags.get_existing_tags(db)
-        for tag_name in tags:
-            if tag_name not in existing_tags:
-                existing_tags.append(tag_name)
+        # Count the image in the tag index used by autocomplete and suggestions
+        service_tags_index.tag_index.add(tags)
 
         # Add tags to the uploaded image on Cloudinary
         service_cloudinary.CloudImage.add_tags(cloudinary_response["public_id"], tags)
@@ -93,6 +105,61 @@ async def upload_image(
         )
 
 
+@router.post("/album",
+             status_code=status.HTTP_200_OK,
+             dependencies=[Depends(service_rate_limit.upload_album_limit),
+                           Depends(service_logout.logout_dependency),
+                           Depends(allowd_operation_any_user),
+                           Depends(service_banned.banned_dependency)],
+             response_model=schemas_images.AlbumUploadResponse,
+             response_class=service_serialization.FastJSONResponse,
+             responses={status.HTTP_207_MULTI_STATUS: {"model": schemas_images.AlbumUploadResponse,
+                                                        "description": "Some files are not uploaded"}})
+async def upload_album(
+    description: str,
+    tags: List[str] = Query(..., description="List of tags of every image. Use existing tags or add new ones."),
+    files: List[UploadFile] = File(...),
+    current_user: User = Depends(service_auth.get_current_user),
+    db: Session = Depends(get_db),
+):
+    """
+    Create many images with the same description and tags at once.
+    Files are uploaded to Cloudinary concurrently and all images are saved by one transaction.
+    A file that fails does not stop the others, the response has the result of every file
+    and its status is 207 when some of them failed.
+
+    Args:
+        description (str): The description for every image.
+        tags (List[str]): List of tags for every image.
+        files (List[UploadFile]): The image files to be uploaded.
+        current_user (User): The current user uploading the images.
+        db (Session): The database session.
+
+    Returns:
+        AlbumUploadResponse: The image or the error of every file and their quantities.
+    """
+    if len(tags) > 5:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Too many tags. Maximum is 5.")
+    if len(files) > settings.album_max_files:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"Too many files. Maximum is {settings.album_max_files}.")
+
+    try:
+        results = await service_album.upload_album(db, current_user, files, description, tags)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Internal Server Error: {str(e)}",
+        )
+
+    failed = sum(result["error"] is not None for result in results)
+    return service_serialization.trusted_response(
+        {"images": results, "uploaded": len(results) - failed, "failed": failed},
+        schemas_images.AlbumUploadResponse,
+        status_code=status.HTTP_207_MULTI_STATUS if failed else status.HTTP_200_OK,
+    )
+
+
 @router.delete("/{image_id}",
                dependencies=[Depends(service_logout.logout_dependency), 
                              Depends(allowd_operation_any_user),
@@ -125,12 +192,20 @@ async def delete_image(
         if image.user_id != current_user.id and current_user.role != "admin":
             raise HTTPException(status_code=403, detail="Permission denied")
 
+        image_tags = await repository_tags.get_tag_names_for_image(db=db, image_id=image_id)
+
         # Delete image from Cloudinary
         service_cloudinary.CloudImage.delete_image(public_id=image.public_id)
 
         # Delete image from the database
         await repository_images.delete_image_from_db(db=db, image_id=image_id)
 
+    service_tags_index.tag_index.remove(image_tags)
+    # the transaction is committed by now, comments and ratings of the image are deleted with it
+    await service_response_cache.response_cache.invalidate_all()
+    await service_feed.feed.remove(image_id)
+    await service_ranking.ranking.remove(image_id)
+
     return {"message": "Image deleted successfully"}
 
 
@@ -184,48 +259,148 @@ async def update_image_description(
         )
 
 
+@router.get("/top",
+            response_model=schema_feed.TopImagesResponse,
+            response_class=service_serialization.FastJSONResponse,
+            status_code=status.HTTP_200_OK,
+            dependencies=[Depends(service_logout.logout_dependency),
+                          Depends(allowd_operation_any_user),
+                          Depends(service_banned.banned_dependency)])
+async def get_top_images(sort: str = Query("trending", pattern="^(trending|rated)$"),
+                         limit: int = Query(20, ge=1, le=100),
+                         cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+                         current_user: User = Depends(service_auth.get_current_user),
+                         db: Session = Depends(get_db)):
+    """
+    The get_top_images function returns the best rated images page by page, the best first.
+        trending ranks recent images higher, its score halves every TOP_IMAGES_HALF_LIFE_HOURS,
+        rated ranks by the lower bound of the rating, so a few ratings do not beat many good ones.
+        Rankings are read from sorted sets in Redis, which are updated when images are rated,
+        so a page does not depend on the quantity of images. Only the best TOP_IMAGES_SIZE images are ranked.
+        The cursor holds the score and the id of the last image, so rating changes do not shift the next page.
+        While the rankings are rebuilt by another request the answer is 503 with Retry-After.
+
+    :param sort: str: trending or rated
+    :param limit: int: Maximum quantity of images on the page
+    :param cursor: Optional[str]: The next_cursor of the previous page
+    :param current_user: User: Get the current user
+    :param db: Session: Get the database session
+    :return: A page of image cards with their ratings and the cursor of the next page
+    """
+    after = tuple(service_pagination.decode_cursor(cursor, float, int)) if cursor else None
+    if after is not None and not math.isfinite(after[0]):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    try:
+        ranked = await service_ranking.ranking.top(db, sort, limit=limit + 1, after=after)
+    except (RedisError, OSError, service_ranking.RankingUnavailable):
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="Top images are not available, try again later", headers={"Retry-After": "1"})
+    has_next = len(ranked) > limit
+    ranked = ranked[:limit]
+    image_ids = [image_id for image_id, _ in ranked]
+    cards = await service_feed.feed.cards(db, image_ids)
+    ratings = await repository_rating.get_average_ratings(image_ids, db)
+    return service_serialization.FastJSONResponse({
+        # images deleted or unrated since the last compaction are skipped
+        "images": [{"image": orjson.Fragment(cards[image_id]), "rating": ratings[image_id][0],
+                    "rating_count": ratings[image_id][1], "score": score}
+                   for image_id, score in ranked if image_id in cards and image_id in ratings],
+        "next_cursor": service_pagination.encode_cursor(ranked[-1][1], ranked[-1][0]) if has_next else None,
+    })
+
+
+@router.post("/batch",
+             response_model=schemas_images.ImageBatchResponse,
+             response_class=service_serialization.FastJSONResponse,
+             status_code=status.HTTP_200_OK,
+             dependencies=[Depends(service_logout.logout_dependency),
+                           Depends(allowd_operation_any_user),
+                           Depends(service_banned.banned_dependency)])
+async def get_images_batch(body: schemas_images.ImageBatchRequest,
+                           current_user: User = Depends(service_auth.get_current_user),
+                           db: Session = Depends(get_db)):
+    """
+    The get_images_batch function returns many images at once, like GET /images/{image_id} does one by one.
+        Bodies stored by the response cache for either endpoint are reused, the missing images are read
+        with their transformed links by one query, so a grid costs one request instead of one per tile.
+
+    :param body: schemas_images.ImageBatchRequest: Ids of the images, up to 100
+    :param current_user: User: Get the current user
+    :param db: Session: Get the database session
+    :return: Images by id, null for images that do not exist
+    """
+    image_ids = list(dict.fromkeys(body.ids))
+
+    async def render(missing: List[int]) -> Dict[int, bytes]:
+        serialize = service_serialization.model_serializer(schemas_images.ImageResponse)
+        return {image.id: orjson.dumps(serialize(image))
+                for image in await repository_images.get_images_by_ids(db, missing)}
+
+    bodies = await service_response_cache.response_cache.render_many(
+        "image", {image_id: f"image:{image_id}" for image_id in image_ids}, render
+    )
+    return service_serialization.FastJSONResponse({
+        "images": {image_id: orjson.Fragment(bodies[image_id]) if image_id in bodies else None
+                   for image_id in image_ids},
+    })
+
+
 @router.get("/{image_id}", response_model=schemas_images.ImageResponse,
             dependencies=[Depends(service_logout.logout_dependency), 
                           Depends(allowd_operation_any_user),
                           Depends(service_banned.banned_dependency)], 
                           status_code=status.HTTP_200_OK)
 async def get_image(image_id: int, 
+                    request: Request,
                     db: Session = Depends(get_db),
                     current_user: User = Depends(service_auth.get_current_user)):
     """
     Get an image by its ID.
+    The response has an ETag of the version of the image, with a matching If-None-Match header
+    the client gets 304 and the database is not asked, the rendered body is kept in the cache too.
 
     Args:
         image_id (int): The ID of the image to retrieve.
+        request (Request): The request with the If-None-Match header.
         db (Session): The database session.
 
     Returns:
         ImageResponse: The retrieved image.
     """
-    image = await repository_images.get_image_by_id(db=db, image_id=image_id)
+    cached = await service_response_cache.response_cache.lookup(request, "image", f"image:{image_id}")
+    if cached.response is not None:
+        return cached.response
+
+    image = await repository_images.get_image_by_id(db=db, image_id=image_id, with_links=True)
     if not image:
         raise HTTPException(status_code=404, detail="Image not found")
 
     # Assuming that you have a function to convert the database model to the response model
     image_response = schemas_images.ImageResponse.from_db_model(image)
 
-    return image_response
+    return await cached.render(image_response)
 
 
 @router.get("/transformed_image/{image_id}", response_model=schemas_images.ImageResponse)
-async def get_transformed_image(image_id: int, current_user: User = Depends(service_auth.get_current_user), db: Session = Depends(get_db)):
+async def get_transformed_image(image_id: int, request: Request, current_user: User = Depends(service_auth.get_current_user), db: Session = Depends(get_db)):
     """
     Get transformed image links by the ID of the original image.
+    The response is cached like the one of get_image.
 
     Args:
         image_id (int): The ID of the original image.
+        request (Request): The request with the If-None-Match header.
         db (Session): The database session.
 
     Returns:
         List[TransformedImageLink]: List of transformed image links.
     """
+    cached = await service_response_cache.response_cache.lookup(request, "transformed_image", f"image:{image_id}")
+    if cached.response is not None:
+        return cached.response
+
     # Отримати зображення за його ID
-    image = await repository_images.get_image_by_id(db=db, image_id=image_id)
+    image = await repository_images.get_image_by_id(db=db, image_id=image_id, with_links=True)
     if not image:
         raise HTTPException(status_code=404, detail="Image not found")
     
@@ -234,18 +409,19 @@ async def get_transformed_image(image_id: int, current_user: User = Depends(serv
     # Отримати трансформовані посилання для цього зображення
     links = image_response.transformed_links
 
-    return schemas_images.ImageResponse(
+    return await cached.render(schemas_images.ImageResponse(
         id=image_response.id,
         user_id=image_response.user_id,
         public_id=image_response.public_id,
         description=image_response.description,
         transformed_links=links,
         image_url=image_response.image_url,
-    )
+    ))
 
 
 @router.patch("/remove_object/{image_id}",
-             dependencies=[Depends(service_logout.logout_dependency), 
+             dependencies=[Depends(service_rate_limit.transform_image_limit),
+                           Depends(service_logout.logout_dependency), 
                            Depends(allowd_operation_any_user),
                            Depends(service_banned.banned_dependency)], 
                            status_code=status.HTTP_202_ACCEPTED)
@@ -313,7 +489,8 @@ async def remove_object_from_image(
 
 
 @router.post("/apply_rounded_corners/{image_id}",
-             dependencies=[Depends(service_logout.logout_dependency), 
+             dependencies=[Depends(service_rate_limit.transform_image_limit),
+                           Depends(service_logout.logout_dependency), 
                            Depends(allowd_operation_any_user),
                            Depends(service_banned.banned_dependency)])
 async def apply_rounded_corners_to_image(
@@ -379,7 +556,8 @@ async def apply_rounded_corners_to_image(
 
 
 @router.put("/improve_photo/{image_id}",
-            dependencies=[Depends(service_logout.logout_dependency), 
+            dependencies=[Depends(service_rate_limit.transform_image_limit),
+                          Depends(service_logout.logout_dependency), 
                           Depends(allowd_operation_any_user),
                           Depends(service_banned.banned_dependency)])
 async def improve_photo(
@@ -460,15 +638,14 @@ async def get_transformed_image_link_qrcode(
         if not image:
             raise HTTPException(status_code=404, detail="Image not found")
 
-        image_response = schemas_images.ImageResponse.from_db_model(image)
-
-        # Перевірити, чи список не порожній
-        if not image_response.transformed_links:
+        # Only the first link is used, so the other links are not loaded
+        link = await repository_images.get_first_transformed_link(db=db, image_id=image_id)
+        if not link:
             raise HTTPException(status_code=404, detail="No transformed links found for the image")
 
         # Отримати перший URL трансформованого зображення
-        selected_transformation_url = image_response.transformed_links[0].qr_code_url if image_response.transformed_links else None
-        url = image_response.transformed_links[0].transformation_url if image_response.transformed_links else None
+        selected_transformation_url = link.qr_code_url
+        url = link.transformation_url
 
         response_data = {
             "transformation_url": url,
@@ -485,7 +662,8 @@ async def get_transformed_image_link_qrcode(
         )
 
 
-@router.post("/make_qr_code/{image_id}")
+@router.post("/make_qr_code/{image_id}",
+             dependencies=[Depends(service_rate_limit.transform_image_limit)])
 async def make_qr_code_url_for_image(
     image_id: int,
     current_user: User = Depends(service_auth.get_current_user),
@@ -507,14 +685,13 @@ async def make_qr_code_url_for_image(
         if not image:
             raise HTTPException(status_code=404, detail="Image not found")
 
-        image_response = schemas_images.ImageResponse.from_db_model(image)
-
-        # Перевірити, чи список не порожній
-        if not image_response.transformed_links:
+        # Only the first link is used, so the other links are not loaded
+        link = await repository_images.get_first_transformed_link(db=db, image_id=image_id)
+        if not link:
             raise HTTPException(status_code=404, detail="No transformed links found for the image")
 
         # Отримати перший URL трансформованого зображення
-        selected_transformation_url = image_response.transformed_links[0].transformation_url if image_response.transformed_links else None
+        selected_transformation_url = link.transformation_url
 
         # Генерація QR-коду
         qr_code = await service_qr_code.generate_qr_code(selected_transformation_url)
@@ -546,28 +723,71 @@ async def make_qr_code_url_for_image(
 @router.get("/{image_id}/rating", status_code=200,
             dependencies=[Depends(service_logout.logout_dependency), Depends(allowd_operation_any_user)])
 async def get_average_rating(image_id: int, 
+                     request: Request,
                      current_user: User = Depends(service_auth.get_current_user),
                      db: Session = Depends(get_db)):
     """
     The get_rating function returns the average rating for a given image.
         The function takes an image_id as input and returns the average rating of that image.
         If no ratings have been made yet, it will return a message saying so.
+        The response is cached with the version of the image, ratings change it too.
     
     :param image_id: int: Get the image id from the request
+    :param request: Request: Get the If-None-Match header
     :param current_user: User: Get the user that is currently logged in
     :param db: Session: Get the database session
     :return: A dictionary with the message key
     """
+    cached = await service_response_cache.response_cache.lookup(request, "image_rating", f"image:{image_id}")
+    if cached.response is not None:
+        return cached.response
     image: Image = await repository_images.get_image_by_id(db=db, image_id=image_id)
     if image is None:
         raise HTTPException(status_code=404, detail="Image doesn't exist yet")
     average_rating = await repository_rating.get_average_rating_for_image(image=image, db=db)
     if average_rating is None:
         return HTTPException(status_code=404, detail="Image has no rating yet")
-    return average_rating
+    return await cached.render(average_rating)
+
+
+@router.get("/{image_id}/comments", status_code=200,
+            response_model=schema_comments.CommentListResponse,
+            response_class=service_serialization.FastJSONResponse,
+            dependencies=[Depends(service_logout.logout_dependency), Depends(allowd_operation_any_user)])
+async def get_image_comments(image_id: int,
+                             limit: int = Query(20, ge=1, le=100),
+                             cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+                             current_user: User = Depends(service_auth.get_current_user),
+                             db: Session = Depends(get_db)):
+    """
+    The get_image_comments function returns comments of the image page by page, the oldest first.
+        The response has next_cursor, pass it as cursor to get the next page. It is null on the last page.
+        The total quantity of comments is taken from the image, it is not counted on every request.
+        Comments come from the database, so they are serialized without validating them again.
+
+    :param image_id: int: Get comments of this image
+    :param limit: int: Maximum quantity of comments on the page
+    :param cursor: Optional[str]: The next_cursor of the previous page
+    :param current_user: User: Get the user that is currently logged in
+    :param db: Session: Get the database session
+    :return: A page of comments with the cursor of the next page
+    """
+    image: Image = await repository_images.get_image_by_id(db=db, image_id=image_id)
+    if image is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    after = service_pagination.decode_cursor(cursor, datetime, int) if cursor else None
+    comments = await repository_comments.get_comments_for_image(image_id=image_id, db=db, limit=limit + 1, after=after)
+    next_cursor = None
+    if len(comments) > limit:
+        comments = comments[:limit]
+        next_cursor = service_pagination.encode_cursor(comments[-1].created_at, comments[-1].id)
+    return service_serialization.trusted_response(
+        {"comments": comments, "comment_count": image.comment_count, "next_cursor": next_cursor},
+        schema_comments.CommentListResponse,
+    )
 
 
-@router.get('/find/by_keyword', status_code=200)
+@router.get('/find/by_keyword', status_code=200, response_class=service_serialization.FastJSONResponse)
 async def find_images_by_keyword(keyword: str, 
                       date: Optional[bool] = False,
                       current_user: User = Depends(service_auth.get_current_user),
@@ -588,10 +808,10 @@ async def find_images_by_keyword(keyword: str,
     images = await repository_images.find_images_by_keyword(keyword=keyword, 
                                                 date=date, 
                                                 user_id=current_user.id, db=db)
-    return images
+    return service_serialization.FastJSONResponse(images)
     
 
-@router.get('/find/by_tag', status_code=200)
+@router.get('/find/by_tag', status_code=200, response_class=service_serialization.FastJSONResponse)
 async def find_images_by_tag(tag: str, 
                       date: Optional[bool] = False,
                       current_user: User = Depends(service_auth.get_current_user),
@@ -612,4 +832,4 @@ async def find_images_by_tag(tag: str,
                                                 user_id=current_user.id, db=db)
     if images is None:
         raise HTTPException(status_code=404, detail="There are no images with this tag")
-    return images
\ No newline at end of file
+    return service_serialization.FastJSONResponse(images)
\ No newline at end of file
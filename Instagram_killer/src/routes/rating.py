@@ -8,6 +8,7 @@ from ..database.models import User, Image, Rating
 from ..services.roles import RoleRights
 from ..services.logout import logout_dependency
 from ..services.banned import banned_dependency
+from ..services.ranking import ranking
 from ..schemas import rating as schema_rating
 from ..repository import rating as repository_rating
 
@@ -44,6 +45,7 @@ async def rate_image(body: schema_rating.RatingModel,
     new_rating = await repository_rating.creare_rating(image_id=body.image_id, user_id=current_user.id, rating=body.rating, db=db)
     if new_rating is False:
         raise HTTPException(status_code=403, detail="You have already rated this image before")
+    await ranking.refresh(db=db, image_id=body.image_id)
     return new_rating
 
 
@@ -90,5 +92,6 @@ async def delete_rating(rating_id: int,
     rating_to_delete: Rating = await repository_rating.delete_rating(rating_id=rating_id, db=db)
     if not rating_to_delete:
         raise HTTPException(status_code=404, detail="Rating not found")
+    await ranking.refresh(db=db, image_id=rating_to_delete.image_id)
     return {"Deleted raiting": rating_to_delete}
     
\ No newline at end of file
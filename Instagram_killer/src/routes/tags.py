@@ -0,0 +1,71 @@
+from typing import List
+
+from fastapi import APIRouter, BackgroundTasks, Depends, Query, status
+from sqlalchemy.orm import Session
+
+from ..database.db import get_db
+from ..database.models import User
+from ..schemas import tags as schema_tags
+from ..services.auth import service_auth
+from ..services import (
+    roles as service_roles,
+    logout as service_logout,
+    banned as service_banned,
+    tags_index as service_tags_index
+)
+
+router = APIRouter(prefix='/tags', tags=['tags'])
+
+allowd_operation_any_user = service_roles.RoleRights(["user", "moderator", "admin"])
+
+
+@router.get("/autocomplete",
+            response_model=List[str],
+            status_code=status.HTTP_200_OK,
+            dependencies=[Depends(service_logout.logout_dependency),
+                          Depends(allowd_operation_any_user),
+                          Depends(service_banned.banned_dependency)])
+async def autocomplete_tags(background_tasks: BackgroundTasks,
+                            prefix: str = Query(..., min_length=1, max_length=30),
+                            limit: int = Query(10, ge=1, le=50),
+                            current_user: User = Depends(service_auth.get_current_user),
+                            db: Session = Depends(get_db)):
+    """
+    The autocomplete_tags function returns existing tags that start with the given prefix.
+        Tags are taken from the in-memory tag index, the database is read only when the index is loaded.
+
+    :param background_tasks: BackgroundTasks: Reload the tag index after the response when it is stale
+    :param prefix: str: Beginning of the tag name
+    :param limit: int: Maximum quantity of returned tags
+    :param current_user: User: Get the current user
+    :param db: Session: Get the database session
+    :return: A list of tag names in alphabetical order
+    """
+    tag_index = await service_tags_index.get_tag_index(db, background_tasks)
+    return tag_index.search(prefix=prefix, limit=limit)
+
+
+@router.get("/suggest",
+            response_model=List[schema_tags.TagUsageResponse],
+            status_code=status.HTTP_200_OK,
+            dependencies=[Depends(service_logout.logout_dependency),
+                          Depends(allowd_operation_any_user),
+                          Depends(service_banned.banned_dependency)])
+async def suggest_tags(background_tasks: BackgroundTasks,
+                       prefix: str = Query("", max_length=30),
+                       limit: int = Query(10, ge=1, le=service_tags_index.TagIndex.TOP_SIZE),
+                       current_user: User = Depends(service_auth.get_current_user),
+                       db: Session = Depends(get_db)):
+    """
+    The suggest_tags function returns the most popular tags that start with the given prefix.
+        Popularity is the quantity of images with the tag. Without prefix the most popular tags overall are returned.
+
+    :param background_tasks: BackgroundTasks: Reload the tag index after the response when it is stale
+    :param prefix: str: Beginning of the tag name
+    :param limit: int: Maximum quantity of returned tags
+    :param current_user: User: Get the current user
+    :param db: Session: Get the database session
+    :return: A list of tags with their usage counts, the most used first
+    """
+    tag_index = await service_tags_index.get_tag_index(db, background_tasks)
+    return [{"tag": tag, "count": tag_index.count(tag)} for tag in tag_index.suggest(prefix=prefix, limit=limit)]
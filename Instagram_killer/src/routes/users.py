@@ -1,4 +1,7 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Security
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status, UploadFile, File, Security
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from sqlalchemy.orm import Session
 
@@ -6,12 +9,17 @@ from ..database.db import get_db
 from ..database.models import User
 from ..repository import users as repository_users
 from ..services.auth import service_auth
-from ..schemas.users import UserResponce
+from ..schemas.users import UserListResponse, UserResponce
 from ..services import (
     roles as service_roles,
     logout as service_logout,
     banned as service_banned,
-    cloudinary as service_cloudinary
+    cloudinary as service_cloudinary,
+    etag as service_etag,
+    export as service_export,
+    pagination as service_pagination,
+    response_cache as service_response_cache,
+    serialization as service_serialization
 )
 
 
@@ -23,22 +31,57 @@ allowd_operation_by_admin = service_roles.RoleRights(["admin"])
 
 
 @router.get('/',
+            response_model=UserListResponse,
+            response_class=service_serialization.FastJSONResponse,
             status_code=status.HTTP_200_OK,
             dependencies=[Depends(service_logout.logout_dependency), 
                           Depends(allowd_operation),
                           Depends(service_banned.banned_dependency)]
             )
-async def get_all_usernames(current_user: User = Depends(service_auth.get_current_user),
+async def get_all_usernames(limit: int = Query(20, ge=1, le=100),
+                            cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+                            current_user: User = Depends(service_auth.get_current_user),
                             db: Session = Depends(get_db)):
     """
-    The get_all_usernames function returns a list of all usernames in the database.
+    The get_all_usernames function returns ids and usernames of users page by page.
+        The response has next_cursor, pass it as cursor to get the next page. It is null on the last page.
+    
+    :param limit: int: Maximum quantity of users on the page
+    :param cursor: Optional[str]: The next_cursor of the previous page
+    :param current_user: User: Get the current user from the database
+    :param db: Session: Get the database session from the dependency injection
+    :return: A page of users with the cursor of the next page
+    """
+    after = service_pagination.decode_cursor(cursor, int)[0] if cursor else None
+    users = await repository_users.get_users(db, limit=limit + 1, after=after)
+    next_cursor = None
+    if len(users) > limit:
+        users = users[:limit]
+        next_cursor = service_pagination.encode_cursor(users[-1].id)
+    return service_serialization.trusted_response({"users": users, "next_cursor": next_cursor}, UserListResponse)
+
+
+@router.get('/export',
+            status_code=status.HTTP_200_OK,
+            dependencies=[Depends(service_logout.logout_dependency), 
+                          Depends(allowd_operation_by_admin)]
+            )
+async def export_users(format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+                       current_user: User = Depends(service_auth.get_current_user),
+                       db: Session = Depends(get_db)):
+    """
+    The export_users function streams all users as NDJSON or CSV, only admin can export them.
+        Users are read in batches and every batch is sent as soon as it is serialized,
+        so the memory used does not grow with the quantity of users.
     
+    :param format: str: ndjson or csv
     :param current_user: User: Get the current user from the database
     :param db: Session: Get the database session from the dependency injection
-    :return: A list of all the usernames in the database
+    :return: A streaming response
     """
-    usernames = await repository_users.return_all_users(db)
-    return usernames
+    chunks = service_export.CHUNKS[format](repository_users.export_users(db), repository_users.EXPORT_FIELDS)
+    return StreamingResponse(chunks, media_type=service_export.MEDIA_TYPES[format],
+                             headers={"Content-Disposition": f'attachment; filename="users.{format}"'})
 
 
 @router.get('/me', response_model=UserResponce,
@@ -69,25 +112,37 @@ async def read_users_me(current_user: User = Depends(service_auth.get_current_us
                           Depends(service_banned.banned_dependency)],
             description = "Any User")
 async def get_user_profile(username, 
+                           request: Request,
                            current_user: User = Depends(service_auth.get_current_user),
                            db: Session = Depends(get_db)):
     """
     The get_user_profile function returns a user profile by username.
         Args:
             username (str): The name of the user to get.
+        The user and the stats of the profile are read by one query.
+        The response has an ETag of the version of the profile, with a matching If-None-Match header
+        the client gets 304 without a body and the database is not asked.
+        The id of the user is remembered for the username, until then the ETag is a hash of the body.
     
     :param username: Get the username
+    :param request: Request: Get the If-None-Match header
     :param current_user: User: Get the current user from the database
     :param db: Session: Get the database connection
     :return: A dictionary
     """
-    
-    user = await repository_users.get_user_by_username(username, db)
+    cache = service_response_cache.response_cache
+    alias = f"username:{username.lower()}"
+    key = await cache.get_alias(alias)
+    cached = await cache.lookup(request, "profile", key)
+    if cached.response is not None:
+        return cached.response
 
-    if not user:
+    profile = await repository_users.get_user_profile(username, db)
+
+    if not profile:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f'User with username: {username} not found.')
     
-    quantity_of_loaded_images: int = await repository_users.get_imagis_quantity(user, db)
+    user: User = profile["user"]
 
     user_profile = {
                     "user id": user.id,
@@ -97,10 +152,19 @@ async def get_user_profile(username,
                     "banned": user.banned,
                     "user role":user.role,
                     "avatar URL": user.avatar,
-                    "quantity_of_loaded_images": quantity_of_loaded_images,
+                    "quantity_of_loaded_images": profile["quantity_of_loaded_images"],
+                    "quantity_of_comments": profile["quantity_of_comments"],
+                    "quantity_of_ratings": profile["quantity_of_ratings"],
+                    "average_rating": profile["average_rating"],
+                    "quantity_of_followers": user.followers_count,
+                    "quantity_of_following": user.following_count,
                     }
 
-    return user_profile
+    if key != f"user:{user.id}":
+        # the version was read for another user with this username, or none at all
+        await cache.set_alias(alias, f"user:{user.id}")
+        return service_etag.etag_response(request, user_profile)
+    return await cached.render(user_profile)
 
 
 @router.patch('/avatar', response_model=UserResponce, 
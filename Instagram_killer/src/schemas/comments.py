@@ -1,7 +1,7 @@
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, model_validator
 
 
 class CommentModel(BaseModel):
@@ -14,13 +14,38 @@ class CommentResponce(BaseModel):
     comment: str
     image_id: int
     created_at: datetime
-    updated_at: Optional[datetime]
+    updated_at: Optional[datetime] = None
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
+
+
+class CommentListResponse(BaseModel):
+    comments: List[CommentResponce]
+    comment_count: int
+    next_cursor: Optional[str] = None
 
 
 class CommentUpdate(BaseModel):
     new_comment: str = Field(max_length=100)
 
 
+class CommentBulkDelete(BaseModel):
+    comment_ids: Optional[List[int]] = Field(None, min_length=1, max_length=10000)
+    user_id: Optional[int] = Field(None, ge=1)
+    image_id: Optional[int] = Field(None, ge=1)
+    created_after: Optional[datetime] = None
+    created_before: Optional[datetime] = None
+    dry_run: bool = False
+
+    @model_validator(mode="after")
+    def check_filters(self):
+        # a time window alone would select comments of every image
+        if not (self.comment_ids or self.user_id or self.image_id):
+            raise ValueError("Set comment_ids, user_id or image_id")
+        return self
+
+
+class CommentBulkDeleteResponse(BaseModel):
+    deleted: int
+    images: int
+    dry_run: bool
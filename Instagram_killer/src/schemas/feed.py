@@ -0,0 +1,33 @@
+from datetime import datetime
+from typing import List, Optional
+
+from pydantic import BaseModel, ConfigDict
+
+
+class FeedImageResponse(BaseModel):
+    id: int
+    user_id: int
+    username: str
+    description: Optional[str] = None
+    image_url: Optional[str] = None
+    comment_count: int = 0
+    upload_time: Optional[datetime] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class FeedResponse(BaseModel):
+    images: List[FeedImageResponse]
+    next_cursor: Optional[str] = None
+
+
+class TopImageResponse(BaseModel):
+    image: FeedImageResponse
+    rating: float
+    rating_count: int
+    score: float
+
+
+class TopImagesResponse(BaseModel):
+    images: List[TopImageResponse]
+    next_cursor: Optional[str] = None
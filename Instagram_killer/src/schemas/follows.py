@@ -0,0 +1,34 @@
+from datetime import datetime
+from typing import List, Optional
+
+from pydantic import BaseModel, ConfigDict, Field
+
+
+class FollowModel(BaseModel):
+    user_ids: List[int] = Field(min_length=1, max_length=1000)
+
+
+class FollowChangeResponse(BaseModel):
+    user_ids: List[int]
+    following_count: int
+
+
+class FollowUser(BaseModel):
+    id: int
+    username: str
+    avatar: Optional[str] = None
+    followed_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class FollowListResponse(BaseModel):
+    users: List[FollowUser]
+    count: int
+    next_cursor: Optional[str] = None
+
+
+class RelationshipResponse(BaseModel):
+    following: bool
+    followed_by: bool
+    mutual: bool
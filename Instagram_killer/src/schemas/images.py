@@ -1,7 +1,7 @@
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 from fastapi import UploadFile
 
 from ..database.models import Image
@@ -16,8 +16,8 @@ class ImageModel(BaseModel):
 
 class ImageStatusUpdate(BaseModel):
     done: bool
-    transformation_url: Optional[str]
-    qr_code_url: Optional[str]
+    transformation_url: Optional[str] = None
+    qr_code_url: Optional[str] = None
 
 
 class ImageDescriptionUpdate(BaseModel):
@@ -29,18 +29,23 @@ class TransformedImageLinkResponse(BaseModel):
     image_id: int
     created_at: datetime
     transformation_url: str
-    qr_code_url: Optional[str]
+    qr_code_url: Optional[str] = None
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class ImageResponse(BaseModel):
     id: int
     user_id: int
-    description: Optional[str]
-    transformed_links: Optional[List[TransformedImageLinkResponse]]
-    image_url: Optional[str]
+    description: Optional[str] = None
+    transformed_links: Optional[List[TransformedImageLinkResponse]] = None
+    image_url: Optional[str] = None
+    comment_count: int = 0
+
+    @field_validator("comment_count", mode="before")
+    def comment_count_of_new_image(cls, value):
+        # the column default is applied on insert, so an image that is not flushed yet has None
+        return value or 0
 
     @staticmethod
     def from_db_model(db_model: Image):
@@ -51,15 +56,37 @@ class ImageResponse(BaseModel):
             upload_time=db_model.upload_time,
             transformed_links=db_model.transformed_links,
             image_url=db_model.image_url,
+            comment_count=db_model.comment_count,
         )
 
-    class Config:
-        orm_mode = True
-        schema_extra = {
+    model_config = ConfigDict(
+        from_attributes=True,
+        json_schema_extra={
             "example": {
                 "id": 1,
                 "user_id": 1,
                 "description": "example_description",
                 "image_url": "https://example.com/image.jpg",
             }
-        }
+        },
+    )
+
+
+class ImageBatchRequest(BaseModel):
+    ids: List[int] = Field(min_length=1, max_length=100)
+
+
+class ImageBatchResponse(BaseModel):
+    images: Dict[int, Optional[ImageResponse]]
+
+
+class AlbumFileResult(BaseModel):
+    filename: Optional[str] = None
+    image: Optional[ImageResponse] = None
+    error: Optional[str] = None
+
+
+class AlbumUploadResponse(BaseModel):
+    images: List[AlbumFileResult]
+    uploaded: int
+    failed: int
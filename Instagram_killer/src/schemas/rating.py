@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 
 from ..database.models import Rating
 
@@ -20,6 +20,6 @@ class RatingResponse(BaseModel):
             image_id=rating_db.image_id,
             rating=rating_db.rating
         )
-    class Config:
-        orm_mode = True
+
+    model_config = ConfigDict(from_attributes=True)
 
@@ -0,0 +1,6 @@
+from pydantic import BaseModel
+
+
+class TagUsageResponse(BaseModel):
+    tag: str
+    count: int
@@ -1,6 +1,6 @@
-from typing import Optional
+from typing import List, Optional
 
-from pydantic import BaseModel, Field, EmailStr
+from pydantic import BaseModel, ConfigDict, Field, EmailStr, field_validator
 
 
 class UserModel(BaseModel):
@@ -8,6 +8,10 @@ class UserModel(BaseModel):
     email: EmailStr = Field(default='example@gmail.com')
     password: str = Field(min_length=8, max_length=15, default='password')
 
+    @field_validator("email")
+    def email_in_lower_case(cls, value):
+        return value.lower()
+
 
 class UserResponce(BaseModel):
     id: int = 1
@@ -18,9 +22,19 @@ class UserResponce(BaseModel):
     role: str = "role"
     banned: Optional[bool] = None
 
+    model_config = ConfigDict(from_attributes=True)
+
+
+class UserShort(BaseModel):
+    id: int
+    username: str
+
+    model_config = ConfigDict(from_attributes=True)
+
 
-    class Config:
-        orm_mode = True
+class UserListResponse(BaseModel):
+    users: List[UserShort]
+    next_cursor: Optional[str] = None
 
 
 class ChangePassword(BaseModel):
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+from typing import List, Optional
+
+from fastapi import UploadFile
+from sqlalchemy.orm import Session
+
+from ..conf.config import settings
+from ..database.models import User
+from ..repository import images as repository_images
+from ..services.cloudinary import CloudImage
+from ..services.tags_index import tag_index
+
+
+logger = logging.getLogger(__name__)
+
+
+def check_files(files: List[UploadFile]) -> List[Optional[str]]:
+    """
+    The check_files function finds files of an album that can't be uploaded before anything is sent to Cloudinary.
+        The name of a file is a part of its public_id, so the second file with the same name would not be stored.
+
+    :param files: List[UploadFile]: Files of the album
+    :return: An error of every file, None for files that can be uploaded
+    """
+    errors, names = [], set()
+    for file in files:
+        if not file.filename:
+            errors.append("File has no name")
+        elif file.filename in names:
+            errors.append("Another file of the album has the same name")
+        else:
+            names.add(file.filename)
+            errors.append(None)
+    return errors
+
+
+async def upload_files(user: User, files: List[UploadFile], tags: List[str], concurrency: int) -> list:
+    """
+    The upload_files function uploads files to Cloudinary at the same time, no more than concurrency at once.
+        The SDK is blocking, so every upload runs in a thread and the event loop keeps serving other requests.
+
+    :param user: User: Owner of the files
+    :param files: List[UploadFile]: Files to upload
+    :param tags: List[str]: Tags of every file
+    :param concurrency: int: Maximum quantity of uploads at the same time
+    :return: The response of Cloudinary or the exception of every file, in the order of files
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def upload(file: UploadFile):
+        public_id = CloudImage.generate_name_image(email=user.email, filename=file.filename)
+        async with semaphore:
+            return await asyncio.to_thread(CloudImage.upload_image, file.file, public_id, tags)
+
+    return await asyncio.gather(*(upload(file) for file in files), return_exceptions=True)
+
+
+async def delete_files(public_ids: List[str], concurrency: int) -> None:
+    """
+    The delete_files function deletes uploaded files whose images were not saved, errors are only logged.
+
+    :param public_ids: List[str]: Public ids of the files on Cloudinary
+    :param concurrency: int: Maximum quantity of deletions at the same time
+    :return: None
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def delete(public_id: str):
+        async with semaphore:
+            await asyncio.to_thread(CloudImage.delete_image, public_id)
+
+    results = await asyncio.gather(*(delete(public_id) for public_id in public_ids), return_exceptions=True)
+    for public_id, result in zip(public_ids, results):
+        if isinstance(result, BaseException):
+            logger.warning("Uploaded file %s of a failed album is not deleted: %r", public_id, result)
+
+
+async def upload_album(db: Session, user: User, files: List[UploadFile], description: str, tags: List[str],
+                       concurrency: int = settings.album_upload_concurrency) -> List[dict]:
+    """
+    The upload_album function uploads many images of a user with the same description and tags.
+        Files are uploaded to Cloudinary concurrently with their tags, then all images are saved
+        by one transaction. A file that fails to upload does not stop the others, it gets an error
+        in the result. If the transaction fails, uploaded files are deleted and the exception is raised.
+
+    :param db: Session: The database session
+    :param user: User: Owner of the images
+    :param files: List[UploadFile]: Image files
+    :param description: str: Description of every image
+    :param tags: List[str]: Tags of every image
+    :param concurrency: int: Maximum quantity of uploads at the same time
+    :return: A dict of filename, image and error for every file, in the order of files
+    """
+    results = [{"filename": file.filename, "image": None, "error": error}
+               for file, error in zip(files, check_files(files))]
+    pending = [index for index, result in enumerate(results) if result["error"] is None]
+    responses = await upload_files(user, [files[index] for index in pending], tags, concurrency)
+
+    uploaded = []
+    for index, response in zip(pending, responses):
+        if isinstance(response, BaseException):
+            logger.warning("File %s of an album is not uploaded: %r", files[index].filename, response)
+            results[index]["error"] = f"Upload failed: {response}"
+        else:
+            uploaded.append((index, response))
+    if not uploaded:
+        return results
+
+    try:
+        images = await repository_images.create_images(db, user.id, [
+            {
+                "description": description,
+                "image_url": response["secure_url"],
+                "public_id": response["public_id"],
+                "file_extension": files[index].filename.split(".")[-1],
+            }
+            for index, response in uploaded
+        ], tags)
+    except Exception:
+        db.rollback()
+        await delete_files([response["public_id"] for _, response in uploaded], concurrency)
+        raise
+
+    for (index, _), image in zip(uploaded, images):
+        results[index]["image"] = image
+        # Count every image in the tag index used by autocomplete and suggestions
+        tag_index.add(tags)
+    return results
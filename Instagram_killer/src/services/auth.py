@@ -2,7 +2,6 @@ from datetime import datetime, timedelta
 from typing import Optional
 import pickle
 
-import redis.asyncio as redis
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
@@ -12,6 +11,7 @@ from sqlalchemy.orm import Session
 from ..repository import users as repository_auth
 from ..database.db import get_db
 from ..conf.config import settings
+from ..services.metrics import InstrumentedRedis
 
 
 class Auth:
@@ -19,7 +19,7 @@ class Auth:
     SECRET_KEY = settings.secret_key
     ALGORITHM = settings.algorithm
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
-    r_cashe = redis.Redis(host=settings.redis_host, port=settings.redis_port, password=settings.redis_password)
+    r_cashe = InstrumentedRedis(host=settings.redis_host, port=settings.redis_port, password=settings.redis_password)
 
     def verify_password(self, plain_password, hashed_password):
         """
@@ -0,0 +1,329 @@
+import argparse
+import asyncio
+import logging
+import re
+from bisect import bisect_right
+from ipaddress import ip_network
+from socket import AF_INET, AF_INET6, inet_pton
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from redis.exceptions import RedisError
+
+from ..conf.config import settings
+from ..services import metrics as service_metrics
+from ..services.metrics import InstrumentedRedis
+
+
+"""Lists of banned IP addresses and user agents, kept in Redis and reloaded by every application process.
+To change them, enter : python -m src.services.ban_list add ip 203.0.113.0/24
+                        python -m src.services.ban_list add user_agent "re:^curl/"
+You must be in the killer_instagram directory in the console"""
+
+
+logger = logging.getLogger(__name__)
+
+BAN_KINDS = ("ip", "user_agent")
+
+
+def address_value(address: str) -> Optional[Tuple[int, int]]:
+    """
+    The address_value function converts an IP address to its version and number.
+        inet_pton is used because it is several times faster than the ipaddress module,
+        IPv4-mapped IPv6 addresses of dual stack servers are converted to IPv4.
+
+    :param address: str: The IP address
+    :return: The version and the number of the address, None if it is not an IP address
+    """
+    try:
+        return 4, int.from_bytes(inet_pton(AF_INET, address), "big")
+    except (OSError, ValueError):
+        pass
+    try:
+        value = int.from_bytes(inet_pton(AF_INET6, address), "big")
+    except (OSError, ValueError):
+        return None
+    if value >> 32 == 0xFFFF:
+        return 4, value & 0xFFFFFFFF
+    return 6, value
+
+
+class CIDRSet:
+    """
+    Networks merged into sorted intervals of addresses that do not overlap, one array of starts and one of ends
+    for IPv4 and for IPv6. An address is found with one binary search, however many networks are banned.
+    """
+
+    def __init__(self, networks: Iterable[str] = ()):
+        """
+        :param networks: Iterable[str]: Addresses and networks like 203.0.113.7 or 2001:db8::/32, invalid ones are skipped
+        """
+        intervals: Dict[int, list] = {4: [], 6: []}
+        self.invalid: List[str] = []
+        for network in networks:
+            try:
+                parsed = ip_network(network.strip(), strict=False)
+            except ValueError:
+                self.invalid.append(network)
+                continue
+            intervals[parsed.version].append((int(parsed.network_address), int(parsed.broadcast_address)))
+        self._starts: Dict[int, List[int]] = {}
+        self._ends: Dict[int, List[int]] = {}
+        for version, items in intervals.items():
+            items.sort()
+            starts, ends = [], []
+            for start, end in items:
+                if ends and start <= ends[-1] + 1:
+                    ends[-1] = max(ends[-1], end)
+                else:
+                    starts.append(start)
+                    ends.append(end)
+            self._starts[version], self._ends[version] = starts, ends
+
+    def __len__(self) -> int:
+        return len(self._starts[4]) + len(self._starts[6])
+
+    def __contains__(self, address: str) -> bool:
+        if not self._starts[4] and not self._starts[6]:
+            return False
+        parsed = address_value(address)
+        if parsed is None:
+            return False
+        version, value = parsed
+        index = bisect_right(self._starts[version], value) - 1
+        return index >= 0 and value <= self._ends[version][index]
+
+
+def trie_regex(words: Iterable[str]) -> str:
+    """
+    The trie_regex function builds one regular expression that matches any of the words.
+        Words are put in a trie first, so words with a common prefix share it in the expression
+        and the regex engine does not try every word at every position of the text.
+
+    :param words: Iterable[str]: Literal words
+    :return: The pattern
+    """
+    trie: dict = {}
+    for word in words:
+        if not word:
+            continue
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def pattern(node: dict) -> str:
+        if "" in node:
+            # a shorter word is found already, longer words with the same beginning add nothing to a search
+            return ""
+        branches = [(re.escape(char), pattern(child)) for char, child in sorted(node.items())]
+        if len(branches) == 1:
+            return "".join(branches[0])
+        if all(not rest for _, rest in branches):
+            return f"[{''.join(char for char, _ in branches)}]"
+        return f"(?:{'|'.join(char + rest for char, rest in branches)})"
+
+    return pattern(trie)
+
+
+class UserAgentMatcher:
+    """
+    Matches user agents against all banned patterns with one compiled regular expression.
+    A pattern is a substring of the user agent ignoring case, patterns starting with "re:" are regular expressions.
+    """
+
+    def __init__(self, patterns: Iterable[str] = ()):
+        """
+        :param patterns: Iterable[str]: Banned patterns, invalid regular expressions are skipped
+        """
+        literals, expressions = [], []
+        self.invalid: List[str] = []
+        for value in patterns:
+            if value.startswith("re:"):
+                try:
+                    re.compile(value[3:])
+                except re.error:
+                    self.invalid.append(value)
+                    continue
+                expressions.append(f"(?:{value[3:]})")
+            elif value.strip():
+                literals.append(value.strip().lower())
+        parts = ([trie_regex(literals)] if literals else []) + expressions
+        self.size = len(literals) + len(expressions)
+        self._regex = re.compile("|".join(parts), re.IGNORECASE) if parts else None
+
+    def __len__(self) -> int:
+        return self.size
+
+    def matches(self, user_agent: str) -> bool:
+        return self._regex is not None and self._regex.search(user_agent) is not None
+
+
+def build_lists(networks: Iterable[str], user_agents: Iterable[str]) -> tuple:
+    return CIDRSet(networks), UserAgentMatcher(user_agents)
+
+
+class BanList:
+    """
+    Banned networks and user agents of this process. The lists are stored as sets in Redis,
+    every change increases a version key, and processes rebuild their lists when the version differs from theirs.
+    When Redis is not available the last loaded lists are used.
+    """
+
+    def __init__(self, redis_client: InstrumentedRedis, refresh_interval: float = 5, prefix: str = "ban"):
+        """
+        :param redis_client: InstrumentedRedis: Client of the Redis shared by all application servers
+        :param refresh_interval: float: Seconds between checks of the version
+        :param prefix: str: Prefix of the keys in Redis
+        """
+        self.redis = redis_client
+        self.refresh_interval = refresh_interval
+        self.prefix = prefix
+        self.networks = CIDRSet()
+        self.user_agents = UserAgentMatcher()
+        self.version: Optional[bytes] = None
+        self._loaded = False
+        self._task: Optional[asyncio.Task] = None
+
+    def key(self, kind: str) -> str:
+        return f"{self.prefix}:{kind}s"
+
+    @property
+    def version_key(self) -> str:
+        return f"{self.prefix}:version"
+
+    def check(self, address: Optional[str], user_agent: Optional[str]) -> Optional[str]:
+        """
+        The check function tells why the client is banned.
+
+        :param address: Optional[str]: IP address of the client
+        :param user_agent: Optional[str]: User-Agent header of the request
+        :return: ip, user_agent or None if the client is not banned
+        """
+        if address and address in self.networks:
+            return "ip"
+        if user_agent and self.user_agents.matches(user_agent):
+            return "user_agent"
+        return None
+
+    async def reload(self) -> bool:
+        """
+        The reload function rebuilds the lists when their version in Redis has changed.
+            The lists are built in a thread and replace the old ones at once, requests never see half of a list.
+
+        :return: True if the lists were rebuilt
+        """
+        version = await self.redis.get(self.version_key)
+        if self._loaded and version == self.version:
+            return False
+        async with self.redis.pipeline(transaction=True) as pipe:
+            version, networks, user_agents = await (
+                pipe.get(self.version_key).smembers(self.key("ip")).smembers(self.key("user_agent")).execute()
+            )
+        networks, user_agents = await asyncio.to_thread(
+            build_lists, [value.decode() for value in networks], [value.decode() for value in user_agents]
+        )
+        self.networks, self.user_agents, self.version, self._loaded = networks, user_agents, version, True
+        for kind, banned in (("ip", networks), ("user_agent", user_agents)):
+            service_metrics.ban_list_entries.labels(kind).set(len(banned))
+            if banned.invalid:
+                logger.warning("Invalid banned %s entries are skipped: %s", kind, ", ".join(banned.invalid[:10]))
+        logger.info("Ban list version %s: %d networks, %d user agents", version, len(networks), len(user_agents))
+        return True
+
+    async def run(self) -> None:
+        """
+        The run function reloads the lists every refresh_interval seconds until it is cancelled.
+
+        :return: None
+        """
+        redis_down = False
+        while True:
+            try:
+                await self.reload()
+                redis_down = False
+            except (RedisError, OSError) as err:
+                if not redis_down:
+                    logger.warning("Ban list is not reloaded, the last loaded one is used: %r", err)
+                redis_down = True
+            except Exception:
+                logger.exception("Ban list failed to reload")
+            await asyncio.sleep(self.refresh_interval)
+
+    def start(self) -> None:
+        """
+        The start function reloads the lists in a task of the running event loop.
+
+        :return: None
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self) -> None:
+        """
+        The stop function cancels the reloading.
+
+        :return: None
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def change(self, action: str, kind: str, entries: List[str]) -> int:
+        """
+        The change function adds entries to a list or removes them, and increases the version
+            in the same transaction, so every process reloads the lists.
+
+        :param action: str: add or remove
+        :param kind: str: ip or user_agent
+        :param entries: List[str]: Networks or user agent patterns
+        :return: The quantity of added or removed entries
+        """
+        if kind not in BAN_KINDS:
+            raise ValueError(f"Unknown ban list: {kind}")
+        if kind == "ip":
+            invalid = CIDRSet(entries).invalid
+            if invalid:
+                raise ValueError(f"Invalid networks: {', '.join(invalid)}")
+        async with self.redis.pipeline(transaction=True) as pipe:
+            command = pipe.sadd if action == "add" else pipe.srem
+            changed, _ = await command(self.key(kind), *entries).incr(self.version_key).execute()
+        return changed
+
+    async def entries(self, kind: str) -> List[str]:
+        return sorted(value.decode() for value in await self.redis.smembers(self.key(kind)))
+
+
+ban_list = BanList(
+    InstrumentedRedis(host=settings.redis_host, port=settings.redis_port, password=settings.redis_password,
+                      socket_connect_timeout=5, socket_timeout=5),
+    refresh_interval=settings.ban_list_refresh_seconds,
+)
+
+
+async def manage(args) -> None:
+    try:
+        if args.action == "list":
+            for kind in [args.kind] if args.kind else BAN_KINDS:
+                for entry in await ban_list.entries(kind):
+                    print(f"{kind}\t{entry}")
+        else:
+            changed = await ban_list.change(args.action, args.kind, args.entries)
+            print(f"{changed} entries of the {args.kind} ban list were {'added' if args.action == 'add' else 'removed'}")
+    finally:
+        await ban_list.redis.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Change the lists of banned networks and user agents")
+    parser.add_argument("action", choices=["add", "remove", "list"])
+    parser.add_argument("kind", nargs="?", choices=BAN_KINDS)
+    parser.add_argument("entries", nargs="*", help="Networks like 203.0.113.0/24, user agents like bot or re:^curl/")
+    args = parser.parse_args()
+    if args.action != "list" and (not args.kind or not args.entries):
+        parser.error("add and remove need a list and at least one entry")
+    asyncio.run(manage(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -9,6 +9,8 @@ from cloudinary import uploader
 from cloudinary.utils import cloudinary_url
 
 from ..conf.config import settings
+from ..services.metrics import track_cloudinary
+from ..services.tracing import traced
 
 
 class CloudImage:
@@ -20,6 +22,7 @@ class CloudImage:
     )
 
     @staticmethod
+    @traced
     def generate_name_avatar(email: str):
         """
         The generate_name_avatar function takes an email address as a string and returns the path to where the avatar should be stored.
@@ -33,6 +36,7 @@ class CloudImage:
         return f"Users/{user_folder}/Avatar/{name}"
 
     @staticmethod
+    @traced
     def generate_name_image(email: str, filename: int):
         """
         The generate_name_image function takes in an email and a filename,
@@ -50,6 +54,8 @@ class CloudImage:
         return f"Users/{user_folder}/Images/{unique_name}"
 
     @staticmethod
+    @traced
+    @track_cloudinary
     def upload_avatar(file, public_id: str):
         """
         The upload_avatar function uploads an avatar to Cloudinary.
@@ -65,20 +71,26 @@ class CloudImage:
         return cloud
 
     @staticmethod
-    def upload_image(file, public_id: str):
+    @traced
+    @track_cloudinary
+    def upload_image(file, public_id: str, tags: List[str] = None):
         """
         The upload_image function takes a file and public_id as arguments.
         The function then uploads the file to Cloudinary using the public_id provided.
         If an image with that public_id already exists, it will not be overwritten.
+        Tags given with the file are set by the same call, so add_tags is not needed after it.
         
         :param file: Upload the image to cloudinary
         :param public_id: str: Set the public_id of the image
+        :param tags: List[str]: Tags of the image on Cloudinary
         :return: A dictionary
         """
-        cloud = cloudinary.uploader.upload(file, public_id=public_id, overwrite=False)
+        options = {"tags": ','.join(tags)} if tags else {}
+        cloud = cloudinary.uploader.upload(file, public_id=public_id, overwrite=False, **options)
         return cloud
 
     @staticmethod
+    @traced
     def get_url(public_id, cloud):
         """
         The get_url function takes a public_id and cloud object as arguments.
@@ -95,6 +107,8 @@ class CloudImage:
         return src_url
 
     @staticmethod
+    @traced
+    @track_cloudinary
     def delete_image(public_id: str):
         """
         The delete_image function deletes an image from the cloudinary server.
@@ -108,6 +122,8 @@ class CloudImage:
         cloudinary.uploader.destroy(public_id)
 
     @staticmethod
+    @traced
+    @track_cloudinary
     def update_image_description_cloudinary(public_id: str, new_description: str):
         """
         The update_image_description_cloudinary function updates the description of an image in Cloudinary.
@@ -122,6 +138,8 @@ class CloudImage:
         cloudinary.api.update(public_id, context=f"description={new_description}")
 
     @staticmethod
+    @traced
+    @track_cloudinary
     def add_tags(public_id: str, tags: List[str]):
         """
         The add_tags function takes a public_id and a list of tags as arguments.
@@ -137,6 +155,8 @@ class CloudImage:
         cloudinary.api.update(public_id, tags=tags_str, resource_type='image')
 
     @staticmethod
+    @traced
+    @track_cloudinary
     def remove_object(public_id, prompt):
         """
         The remove_object function takes a public_id and prompt as arguments.
@@ -153,6 +173,8 @@ class CloudImage:
         # return cloudinary.api.update(public_id, transformation=transformation)
 
     @staticmethod
+    @traced
+    @track_cloudinary
     def apply_rounded_corners(public_id, border, radius):
         """
         The apply_rounded_corners function takes a public_id, border and radius as arguments.
@@ -168,6 +190,8 @@ class CloudImage:
         return cloudinary.uploader.upload(transformed_image_url)
 
     @staticmethod
+    @traced
+    @track_cloudinary
     def improve_photo(public_id, mode, blend):
         """
         The improve_photo function takes a public_id, mode, and blend as arguments.
@@ -1,79 +1,114 @@
+from email.message import EmailMessage
+from email.utils import formataddr
 from pathlib import Path
 
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from fastapi_mail.errors import ConnectionErrors
+from jinja2 import Environment, FileSystemLoader, select_autoescape
 from pydantic import EmailStr
 
+from ..services import metrics as service_metrics
 from ..services.auth import service_auth
+from ..services.mailer import Mailer, SMTPPool
+from ..services.tracing import traced
 from ..conf.config import settings
 
-conf = ConnectionConfig(
-    MAIL_USERNAME=settings.mail_username,
-    MAIL_PASSWORD=settings.mail_password,
-    MAIL_FROM=EmailStr(settings.mail_from),
-    MAIL_PORT=settings.mail_port,
-    MAIL_SERVER=settings.mail_server,
-    MAIL_FROM_NAME="Alghorithmic",
-    MAIL_STARTTLS=False,
-    MAIL_SSL_TLS=True,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True,
-    TEMPLATE_FOLDER=Path(__file__).parent.parent / 'templates',
+
+MAIL_FROM_NAME = "Alghorithmic"
+TEMPLATE_FOLDER = Path(__file__).parent.parent / 'templates'
+
+templates = Environment(loader=FileSystemLoader(TEMPLATE_FOLDER), autoescape=select_autoescape(["html"]))
+# templates are compiled once when the application starts, not for every message
+email_template = templates.get_template("email_template.html")
+reset_password_template = templates.get_template("reset_password.html")
+# subject and template of every kind of email that can wait in the outbox
+EMAILS = {
+    "confirm_email": ("Confirm your email ", email_template),
+    "reset_password": ("Reset password ", reset_password_template),
+}
+
+mailer = Mailer(
+    pool=SMTPPool(
+        hostname=settings.mail_server,
+        port=settings.mail_port,
+        username=settings.mail_username,
+        password=settings.mail_password,
+        use_tls=settings.mail_ssl_tls,
+        idle_timeout=settings.mail_idle_timeout,
+    ),
+    workers=settings.mail_pool_size,
+    batch_size=settings.mail_batch_size,
+    rate_limit=settings.mail_rate_limit,
+    max_retries=settings.mail_max_retries,
+    retry_backoff=settings.mail_retry_backoff,
 )
+service_metrics.email_queue_size.set_function(lambda: mailer.queue_size)
+
+
+def build_message(email: str, subject: str, html: str) -> EmailMessage:
+    """
+    The build_message function creates an HTML message from the application to the user.
+
+    :param email: str: Email address of the user
+    :param subject: str: Subject of the message
+    :param html: str: Rendered body of the message
+    :return: A message ready to be sent
+    """
+    message = EmailMessage()
+    message["From"] = formataddr((MAIL_FROM_NAME, settings.mail_from))
+    message["To"] = email
+    message["Subject"] = subject
+    message.set_content(html, subtype="html")
+    return message
 
 
+@traced
+async def render_email(kind: str, email: str, username: str, host: str) -> EmailMessage:
+    """
+    The render_email function creates an email of the given kind with a new verification token.
+
+    :param kind: str: Kind of the email, a key of EMAILS
+    :param email: str: Email address of the user
+    :param username: str: Username of the user
+    :param host: str: Base url of the application for the link in the email
+    :return: A message ready to be sent
+    """
+    subject, template = EMAILS[kind]
+    token_verification = await service_auth.create_email_token({"sub": email})
+    html = template.render(host=host, username=username, token=token_verification)
+    return build_message(email, subject, html)
+
+
+@traced
 async def send_email(email: EmailStr, username: str, host: str) -> None:
     """
     The send_email function sends an email to the user with a link to confirm their email address.
 
         The function takes in three arguments:
             email: the user's email address, which is used as a unique identifier for them.
-            username: the username of the user who is registering for an account. 
+            username: the username of the user who is registering for an account.
             host: this is where we are hosting our application, which will be used as part of our URL when sending out emails.
-    
+        The message is put in the queue of the mailer, which sends it over a pooled SMTP connection.
+
     :param email: EmailStr: Validate the email address
     :param username: str: Pass the username to the email template
     :param host: str: Pass the hostname of the server to be used in the link for email verification
     :return: None
     """
-    try:
-        token_verification = await service_auth.create_email_token({"sub": email})
-        message = MessageSchema(
-            subject="Confirm your email ",
-            recipients=[email],
-            template_body={"host": host, "username": username, "token": token_verification},
-            subtype=MessageType.html
-        )
-
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="email_template.html")
-    except ConnectionErrors as err:
-        print(err)
+    mailer.enqueue(await render_email("confirm_email", email, username, host))
 
 
+@traced
 async def send_reset_password_email(email: EmailStr, username: str, host: str) -> None:
     """
     The send_reset_password_email function sends an email to the user with a link to reset their password.
         Args:
             email (str): The user's email address.
             username (str): The user's username.
-            host (str): The hostname of the server where this function is being called from, e.g., &quot;localhost&quot; or &quot;127.0.0.&quot; 
-    
+            host (str): The hostname of the server where this function is being called from, e.g., &quot;localhost&quot; or &quot;127.0.0.&quot;
+        The message is put in the queue of the mailer, which sends it over a pooled SMTP connection.
+
     :param email: EmailStr: Specify the email address of the user who is requesting a password reset
     :param username: str: Pass the username to the template, so it can be displayed in the email
     :param host: str: Pass the hostname of the server to the email template
     :return: None
     """
-    try:
-        token_verification = await service_auth.create_email_token({"sub": email})
-        message = MessageSchema(
-            subject="Reset password ",
-            recipients=[email],
-            template_body={"host": host, "username": username, "token": token_verification},
-            subtype=MessageType.html
-        )
-
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="reset_password.html")
-    except ConnectionErrors as err:
-        print(err)
\ No newline at end of file
+    mailer.enqueue(await render_email("reset_password", email, username, host))
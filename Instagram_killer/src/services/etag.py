@@ -0,0 +1,54 @@
+import hashlib
+from typing import Any
+
+from fastapi import Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(body: bytes) -> str:
+    """
+    The make_etag function returns a strong entity tag of a response body.
+
+    :param body: bytes: The rendered body of the response
+    :return: A quoted hash of the body
+    """
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """
+    The etag_matches function checks whether the client already has the representation with this etag.
+        If-None-Match can hold several tags separated by commas, weak tags are compared by their value.
+
+    :param request: Request: The request of the client
+    :param etag: str: The etag of the current representation
+    :return: True if the client may use its cached copy
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+
+def etag_response(request: Request, content: Any) -> Response:
+    """
+    The etag_response function renders content as JSON and adds an ETag to it.
+        If the client sends the same ETag in If-None-Match, an empty 304 response is returned instead.
+        Responses are private because they are shown to authorized users only.
+
+    :param request: Request: The request of the client
+    :param content: Any: The content of the response
+    :return: A JSON response or a 304 response
+    """
+    response = JSONResponse(content=jsonable_encoder(content))
+    etag = make_etag(response.body)
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return response
@@ -0,0 +1,56 @@
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Any, Iterable, Iterator, Sequence
+
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def plain(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def ndjson_chunks(batches: Iterable[Sequence], fields: Sequence[str]) -> Iterator[str]:
+    """
+    The ndjson_chunks function turns batches of rows into newline delimited JSON, one object per row.
+        Every batch becomes one chunk of the response, so the client gets data while the next batch is read.
+
+    :param batches: Iterable[Sequence]: Batches of rows with values in the order of fields
+    :param fields: Sequence[str]: Names of the columns
+    :return: An iterator of strings
+    """
+    encode = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False).encode
+    for rows in batches:
+        yield "".join(encode(dict(zip(fields, map(plain, row)))) + "\n" for row in rows)
+
+
+def csv_chunks(batches: Iterable[Sequence], fields: Sequence[str]) -> Iterator[str]:
+    """
+    The csv_chunks function turns batches of rows into CSV with a header line.
+        Every batch becomes one chunk of the response, the buffer is emptied after each of them.
+
+    :param batches: Iterable[Sequence]: Batches of rows with values in the order of fields
+    :param fields: Sequence[str]: Names of the columns
+    :return: An iterator of strings
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for rows in batches:
+        writer.writerows(map(plain, row) for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+CHUNKS = {
+    "ndjson": ndjson_chunks,
+    "csv": csv_chunks,
+}
@@ -0,0 +1,191 @@
+import logging
+from time import monotonic
+from typing import Dict, List, Optional, Tuple
+
+import orjson
+from redis.exceptions import RedisError
+from sqlalchemy.orm import Session
+
+from ..conf.config import settings
+from ..repository import feed as repository_feed
+from ..schemas.feed import FeedImageResponse
+from ..services import metrics as service_metrics
+from ..services.metrics import InstrumentedRedis
+from ..services.response_cache import ResponseCache, response_cache
+from ..services.serialization import model_serializer
+
+
+logger = logging.getLogger(__name__)
+
+CARD_ENDPOINT = "feed_card"
+# member with the lowest score of a timeline that holds all images, ids of images start from 1
+END = 0
+
+
+class Feed:
+    """
+    Timeline of the newest images of all users: a sorted set of image ids in Redis, scored by the id,
+    which grows with the upload time. New images are fanned out to it and it is trimmed to the newest size ids.
+    A missing timeline is rebuilt from the database, it expires after ttl, so an image that was not fanned out
+    because Redis failed appears after the next rebuild at the latest. A timeline rebuilt from fewer than size images
+    holds the whole feed and ends with the END member, trimming removes it first when the timeline overflows.
+    Pages are hydrated with image cards kept by the response cache, the missing ones are read with one query.
+    Pages past the end of a timeline without END and all pages while Redis is not available are read from the database.
+    """
+
+    def __init__(self, redis_client: InstrumentedRedis, cache: ResponseCache, size: int = 1000, ttl: int = 3600,
+                 enabled: bool = True, retry_interval: float = 5.0, prefix: str = "feed"):
+        """
+        :param redis_client: InstrumentedRedis: Client of the Redis shared by all application servers
+        :param cache: ResponseCache: Cache of the rendered image cards
+        :param size: int: Quantity of the newest images kept in the timeline
+        :param ttl: int: Seconds until the timeline is rebuilt from the database
+        :param enabled: bool: Use the timeline at all, otherwise pages are read from the database
+        :param retry_interval: float: Seconds to skip the timeline after Redis failed
+        :param prefix: str: Prefix of the keys in Redis
+        """
+        self.redis = redis_client
+        self.cache = cache
+        self.size = size
+        self.ttl = ttl
+        self.enabled = enabled
+        self.retry_interval = retry_interval
+        self.timeline = f"{prefix}:timeline:all"
+        self.redis_down_until = 0.0
+
+    def _failed(self, err: Exception) -> None:
+        logger.warning("Feed timeline is skipped for %d s, Redis failed: %r", self.retry_interval, err)
+        self.redis_down_until = monotonic() + self.retry_interval
+
+    def _available(self) -> bool:
+        return self.enabled and monotonic() >= self.redis_down_until
+
+    async def publish(self, image_id: int, *timelines: str) -> None:
+        """
+        The publish function fans a new image out to timelines and trims them in one round trip,
+            timelines created by the image get their expiration in the second one.
+            It must be called after the image is committed.
+
+        :param image_id: int: Id of the new image
+        :param timelines: str: Keys of the timelines, the timeline of all users by default
+        :return: None
+        """
+        if not self.enabled:
+            return
+        timelines = timelines or (self.timeline,)
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for timeline in timelines:
+                    pipe.zadd(timeline, {image_id: image_id}).zremrangebyrank(timeline, 0, -self.size - 1).ttl(timeline)
+                results = await pipe.execute()
+                # a timeline created by this image has no expiration yet, older images follow it from the database
+                created = [timeline for timeline, ttl in zip(timelines, results[2::3]) if ttl == -1]
+                if created:
+                    for timeline in created:
+                        pipe.expire(timeline, self.ttl)
+                    await pipe.execute()
+        except (RedisError, OSError) as err:
+            logger.warning("Image %s is missing in the feed until the timeline is rebuilt, Redis failed: %r",
+                           image_id, err)
+
+    async def remove(self, image_id: int) -> None:
+        """
+        The remove function deletes an image from the timeline, it must be called after the image is deleted.
+            Cards of images deleted without it are skipped when the page is hydrated.
+
+        :param image_id: int: Id of the deleted image
+        :return: None
+        """
+        if not self.enabled:
+            return
+        try:
+            await self.redis.zrem(self.timeline, image_id)
+        except (RedisError, OSError) as err:
+            logger.warning("Image %s stays in the feed timeline, Redis failed: %r", image_id, err)
+
+    async def rebuild(self, db: Session) -> List[int]:
+        """
+        The rebuild function fills the timeline with the newest images from the database.
+            When the database has fewer than size images, the timeline gets END after them,
+            so an empty feed is stored as well.
+
+        :param db: Session: Pass the database session to the function
+        :return: Ids of the newest images, newest first
+        """
+        image_ids = await repository_feed.get_recent_image_ids(db, limit=self.size)
+        members = {image_id: image_id for image_id in image_ids}
+        if len(image_ids) < self.size:
+            members[END] = END
+        async with self.redis.pipeline(transaction=False) as pipe:
+            await pipe.zadd(self.timeline, members) \
+                .zremrangebyrank(self.timeline, 0, -self.size - 1).expire(self.timeline, self.ttl).execute()
+        return image_ids
+
+    async def _timeline_page(self, db: Session, count: int,
+                             before: Optional[int]) -> Optional[Tuple[List[int], bool]]:
+        if not self._available():
+            return None
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                exists, members = await pipe.exists(self.timeline).zrevrangebyscore(
+                    self.timeline, f"({before}" if before is not None else "+inf", "-inf", start=0, num=count
+                ).execute()
+            if exists:
+                image_ids = [int(member) for member in members]
+                complete = END in image_ids
+            else:
+                rebuilt = await self.rebuild(db)
+                image_ids = [image_id for image_id in rebuilt if before is None or image_id < before]
+                complete = len(rebuilt) < self.size
+        except (RedisError, OSError) as err:
+            self._failed(err)
+            return None
+        return [image_id for image_id in image_ids if image_id != END][:count], complete
+
+    async def page(self, db: Session, limit: int, before: Optional[int] = None) -> Tuple[List[int], Optional[int]]:
+        """
+        The page function returns ids of a page of the feed, newest first.
+
+        :param db: Session: Pass the database session to the function
+        :param limit: int: Maximum quantity of images on the page
+        :param before: Optional[int]: Return only images older than this one, the last id of the previous page
+        :return: Ids of the page and the id for the cursor of the next page, None on the last page
+        """
+        timeline = await self._timeline_page(db, limit + 1, before)
+        if timeline is not None and (len(timeline[0]) > limit or timeline[1]):
+            image_ids, source = timeline[0], "timeline"
+        else:
+            # the page runs past the end of the timeline, older images may follow in the database
+            image_ids = await repository_feed.get_recent_image_ids(db, limit=limit + 1, before_id=before)
+            source = "database"
+        service_metrics.feed_pages.labels(source).inc()
+        if len(image_ids) > limit:
+            return image_ids[:limit], image_ids[limit - 1]
+        return image_ids, None
+
+    async def cards(self, db: Session, image_ids: List[int]) -> Dict[int, bytes]:
+        """
+        The cards function returns rendered JSON cards of images in the given order.
+            Cards are versioned by the response cache, so a change of the image makes its card stale.
+
+        :param db: Session: Pass the database session to the function
+        :param image_ids: List[int]: Ids of the images
+        :return: JSON objects by image id in the given order, images that do not exist anymore are skipped
+        """
+        async def render(missing: List[int]) -> Dict[int, bytes]:
+            serialize = model_serializer(FeedImageResponse)
+            return {row.id: orjson.dumps(serialize(row)) for row in await repository_feed.get_feed_cards(db, missing)}
+
+        return await self.cache.render_many(CARD_ENDPOINT, {image_id: f"image:{image_id}" for image_id in image_ids},
+                                            render)
+
+
+feed = Feed(
+    InstrumentedRedis(host=settings.redis_host, port=settings.redis_port, password=settings.redis_password,
+                      socket_connect_timeout=settings.feed_redis_timeout,
+                      socket_timeout=settings.feed_redis_timeout),
+    response_cache,
+    size=settings.feed_timeline_size,
+    ttl=settings.feed_timeline_ttl,
+    enabled=settings.feed_enabled,
+)
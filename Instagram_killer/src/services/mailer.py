@@ -0,0 +1,315 @@
+import asyncio
+import logging
+import random
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from email.message import EmailMessage
+from time import monotonic, perf_counter
+from typing import AsyncIterator, List, Optional, Tuple
+
+import aiosmtplib
+from opentelemetry.trace import SpanKind
+
+from ..services import metrics as service_metrics, tracing as service_tracing
+
+
+logger = logging.getLogger(__name__)
+
+# errors of the connection itself, the message was not refused and the connection can not be used any more
+CONNECTION_ERRORS = (aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPConnectError, aiosmtplib.SMTPTimeoutError, OSError)
+# the server answered with an error, the connection is still fine
+RESPONSE_ERRORS = (aiosmtplib.SMTPResponseException, aiosmtplib.SMTPRecipientsRefused)
+
+
+def is_transient(error: Exception) -> bool:
+    """
+    The is_transient function tells whether sending may succeed if it is repeated later.
+        Broken connections and 4xx answers are temporary, 5xx answers mean the message is refused for good.
+
+    :param error: Exception: The error raised by aiosmtplib
+    :return: True if the message should be sent again
+    """
+    if isinstance(error, CONNECTION_ERRORS):
+        return True
+    if isinstance(error, aiosmtplib.SMTPRecipientsRefused):
+        return all(400 <= refused.code < 500 for refused in error.recipients)
+    if isinstance(error, aiosmtplib.SMTPResponseException):
+        return 400 <= error.code < 500
+    return False
+
+
+class SMTPPool:
+    """
+    Open SMTP connections that are reused between messages, so the TLS handshake and the login
+    are paid once per connection instead of once per message.
+    """
+
+    def __init__(self, hostname: str, port: int, username: Optional[str] = None, password: Optional[str] = None,
+                 use_tls: bool = True, timeout: float = 30, idle_timeout: float = 60):
+        """
+        :param hostname: str: SMTP server
+        :param port: int: Port of the SMTP server
+        :param username: Optional[str]: Login, the connection is not authenticated without it
+        :param password: Optional[str]: Password
+        :param use_tls: bool: Connect with TLS from the start, like port 465 needs
+        :param timeout: float: Timeout of SMTP commands in seconds
+        :param idle_timeout: float: Connections idle longer than this are reopened, servers drop them anyway
+        """
+        self.hostname = hostname
+        self.port = port
+        self.username = username or None
+        self.password = password or None
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.connections_opened = 0
+        self._idle: List[Tuple[aiosmtplib.SMTP, float]] = []
+
+    async def _open(self) -> aiosmtplib.SMTP:
+        smtp = aiosmtplib.SMTP(hostname=self.hostname, port=self.port, username=self.username,
+                               password=self.password, use_tls=self.use_tls, timeout=self.timeout)
+        await smtp.connect()
+        self.connections_opened += 1
+        return smtp
+
+    @asynccontextmanager
+    async def connection(self) -> AsyncIterator[aiosmtplib.SMTP]:
+        """
+        The connection function lends an open connection, an idle one if there is one or a new one.
+            The connection is returned to the pool afterwards, unless it broke.
+
+        :return: An async context manager with the connection
+        """
+        smtp = None
+        while self._idle and smtp is None:
+            candidate, released = self._idle.pop()
+            if candidate.is_connected and monotonic() - released < self.idle_timeout:
+                smtp = candidate
+            else:
+                candidate.close()
+        if smtp is None:
+            smtp = await self._open()
+        healthy = False
+        try:
+            yield smtp
+            healthy = True
+        except RESPONSE_ERRORS:
+            healthy = True
+            raise
+        finally:
+            if healthy and smtp.is_connected:
+                self._idle.append((smtp, monotonic()))
+            else:
+                smtp.close()
+
+    def discard(self) -> None:
+        """
+        The discard function drops idle connections without talking to the server,
+            for example when they belong to an event loop that is closed.
+
+        :return: None
+        """
+        for smtp, _ in self._idle:
+            smtp.close()
+        self._idle.clear()
+
+    async def close(self) -> None:
+        """
+        The close function says goodbye to the server on every idle connection and closes it.
+
+        :return: None
+        """
+        idle, self._idle = self._idle, []
+        for smtp, _ in idle:
+            try:
+                await smtp.quit()
+            except (aiosmtplib.SMTPException, OSError):
+                smtp.close()
+
+
+class RateLimiter:
+    """Spaces out operations to rate per second on average, allowing bursts of burst operations."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        :param rate: float: Operations per second, 0 or less means no limit
+        :param burst: int: Operations allowed at once after a quiet period
+        """
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._allowed_at = 0.0
+
+    async def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        now = monotonic()
+        self._allowed_at = max(self._allowed_at, now - (self.burst - 1) / self.rate)
+        wait = self._allowed_at - now
+        self._allowed_at += 1 / self.rate
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+@dataclass(eq=False)
+class Outgoing:
+    message: EmailMessage
+    future: Optional[asyncio.Future] = None
+    attempts: int = 0
+    finished: bool = False
+
+
+class Mailer:
+    """
+    A queue of outgoing messages drained by worker tasks. Every worker takes the messages that are waiting,
+    up to batch_size, and sends them one after another over one pooled connection.
+    """
+
+    def __init__(self, pool: SMTPPool, workers: int = 2, batch_size: int = 50, rate_limit: float = 10,
+                 max_retries: int = 5, retry_backoff: float = 1.0, max_backoff: float = 60.0):
+        """
+        :param pool: SMTPPool: Connections to the SMTP server
+        :param workers: int: Tasks sending in parallel, so at most this quantity of connections is open
+        :param batch_size: int: Maximum quantity of messages sent over a connection before it is lent again
+        :param rate_limit: float: Messages per second for all workers together, 0 or less means no limit
+        :param max_retries: int: How many times a message is sent again after a temporary error
+        :param retry_backoff: float: Delay before the first retry in seconds, it doubles with every next one
+        :param max_backoff: float: Maximum delay between retries in seconds
+        """
+        self.pool = pool
+        self.workers = workers
+        self.batch_size = batch_size
+        self.rate_limiter = RateLimiter(rate_limit, burst=batch_size)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def queue_size(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def start(self) -> None:
+        """
+        The start function starts the workers in the running event loop, it does nothing if they already run there.
+
+        :return: None
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._tasks:
+            return
+        # connections and tasks of another event loop can not be used in this one
+        self.pool.discard()
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._tasks = [loop.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = 10) -> None:
+        """
+        The stop function waits until queued messages are sent, stops the workers and closes the connections.
+
+        :param timeout: float: Maximum time to wait for the queue in seconds
+        :return: None
+        """
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Mailer stopped with %d messages in the queue", self._queue.qsize())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.pool.close()
+
+    def enqueue(self, message: EmailMessage) -> None:
+        """
+        The enqueue function queues a message and returns at once, errors of sending are only logged.
+
+        :param message: EmailMessage: The message
+        :return: None
+        """
+        self.start()
+        self._queue.put_nowait(Outgoing(message))
+
+    async def send(self, message: EmailMessage) -> None:
+        """
+        The send function queues a message and waits until it is sent.
+
+        :param message: EmailMessage: The message
+        :return: None, the error is raised if the message could not be sent
+        """
+        self.start()
+        outgoing = Outgoing(message, future=self._loop.create_future())
+        self._queue.put_nowait(outgoing)
+        await outgoing.future
+
+    def backoff(self, attempt: int) -> float:
+        delay = min(self.max_backoff, self.retry_backoff * 2 ** (attempt - 1))
+        # jitter spreads retries of messages that failed together
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _work(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self._deliver(batch)
+            except Exception as err:
+                logger.exception("Mailer failed to deliver a batch of %d messages", len(batch))
+                for outgoing in batch:
+                    self._finish(outgoing, err)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _deliver(self, batch: List[Outgoing]) -> None:
+        pending = batch
+        while pending:
+            retry: List[Outgoing] = []
+            with service_tracing.start_span("smtp batch", kind=SpanKind.CLIENT,
+                                            attributes={"messaging.batch.message_count": len(pending)}):
+                try:
+                    async with self.pool.connection() as smtp:
+                        for outgoing in pending:
+                            await self.rate_limiter.acquire()
+                            started = perf_counter()
+                            try:
+                                await smtp.send_message(outgoing.message)
+                            except RESPONSE_ERRORS as err:
+                                self._failed(outgoing, err, retry)
+                            else:
+                                service_metrics.email_send_duration.observe(perf_counter() - started)
+                                self._finish(outgoing)
+                except CONNECTION_ERRORS as err:
+                    logger.warning("SMTP connection failed: %r", err)
+                    for outgoing in pending:
+                        if not outgoing.finished and outgoing not in retry:
+                            self._failed(outgoing, err, retry)
+            pending = retry
+            if pending:
+                await asyncio.sleep(self.backoff(max(outgoing.attempts for outgoing in pending)))
+
+    def _failed(self, outgoing: Outgoing, error: Exception, retry: List[Outgoing]) -> None:
+        outgoing.attempts += 1
+        if is_transient(error) and outgoing.attempts <= self.max_retries:
+            service_metrics.email_messages.labels("retried").inc()
+            retry.append(outgoing)
+        else:
+            logger.error("Email to %s was not sent after %d attempts: %r",
+                         outgoing.message["To"], outgoing.attempts, error)
+            self._finish(outgoing, error)
+
+    def _finish(self, outgoing: Outgoing, error: Optional[Exception] = None) -> None:
+        if outgoing.finished:
+            return
+        outgoing.finished = True
+        service_metrics.email_messages.labels("failed" if error else "sent").inc()
+        if outgoing.future is not None and not outgoing.future.done():
+            if error is None:
+                outgoing.future.set_result(None)
+            else:
+                outgoing.future.set_exception(error)
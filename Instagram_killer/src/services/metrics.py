@@ -0,0 +1,163 @@
+from functools import wraps
+from time import perf_counter
+from typing import Callable, List
+
+import redis.asyncio as redis
+from fastapi import Request
+from opentelemetry.trace import SpanKind
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy.engine import Engine
+
+from ..conf.config import settings
+from ..services import tracing as service_tracing
+
+
+def parse_buckets(buckets: str) -> List[float]:
+    """
+    The parse_buckets function turns a comma separated string like "0.01,0.1,1" into histogram buckets.
+
+    :param buckets: str: Comma separated upper bounds of the buckets in seconds
+    :return: A sorted list of floats
+    """
+    return sorted(float(bucket) for bucket in buckets.split(",") if bucket.strip())
+
+
+BUCKETS = parse_buckets(settings.metrics_buckets)
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "Duration of HTTP requests",
+    ["method", "route", "status"], buckets=BUCKETS
+)
+http_requests_in_progress = Gauge(
+    "http_requests_in_progress", "HTTP requests being handled right now", ["method"]
+)
+redis_command_duration = Histogram(
+    "redis_command_duration_seconds", "Duration of Redis commands",
+    ["command"], buckets=BUCKETS
+)
+redis_command_errors = Counter(
+    "redis_command_errors_total", "Redis commands that raised an error", ["command"]
+)
+cloudinary_call_duration = Histogram(
+    "cloudinary_call_duration_seconds", "Duration of Cloudinary calls",
+    ["operation"], buckets=BUCKETS
+)
+cloudinary_call_errors = Counter(
+    "cloudinary_call_errors_total", "Cloudinary calls that raised an error", ["operation"]
+)
+email_send_duration = Histogram(
+    "email_send_duration_seconds", "Duration of sending one email over an open SMTP connection",
+    buckets=BUCKETS
+)
+email_queue_size = Gauge(
+    "email_queue_size", "Emails waiting in the queue of the mailer"
+)
+email_messages = Counter(
+    "email_messages_total", "Emails handled by the mailer by result: sent, retried or failed", ["result"]
+)
+rate_limit_requests = Counter(
+    "rate_limit_requests_total", "Requests checked by rate limits by backend: redis or local, and result: allowed or limited",
+    ["route", "backend", "result"]
+)
+response_cache_requests = Counter(
+    "response_cache_requests_total",
+    "Lookups of cached responses by endpoint and result: not_modified, hit or miss", ["endpoint", "result"]
+)
+feed_pages = Counter(
+    "feed_pages_total", "Pages of the feed by source of the image ids: timeline or database", ["source"]
+)
+ban_list_entries = Gauge(
+    "ban_list_entries", "Entries of the loaded ban lists by kind: ip or user_agent", ["kind"]
+)
+banned_requests = Counter(
+    "banned_requests_total", "Requests refused by the ban lists by reason: ip or user_agent", ["reason"]
+)
+email_outbox_delivery_lag = Histogram(
+    "email_outbox_delivery_lag_seconds", "Time from saving an email in the outbox until it is sent",
+    buckets=[1, 5, 15, 30, 60, 300, 900, 3600, 21600]
+)
+email_outbox_messages = Counter(
+    "email_outbox_messages_total", "Emails handled by the outbox worker by result: sent, retried or dead", ["result"]
+)
+
+
+def route_template(request: Request) -> str:
+    """
+    The route_template function returns the path template of the matched route, for example /api/images/{image_id}.
+    Templates are used as labels instead of real paths, so ids in urls do not create new time series.
+
+    :param request: Request: The handled request
+    :return: The path template or "unmatched" when no route was found
+    """
+    route = request.scope.get("route")
+    return getattr(route, "path", "unmatched")
+
+
+class DBPoolCollector:
+    """Reports the state of the SQLAlchemy connection pool when metrics are scraped."""
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+
+    def collect(self):
+        pool = self.engine.pool
+        for name, description in (("size", "Size of the connection pool"),
+                                  ("checkedin", "Idle connections in the pool"),
+                                  ("checkedout", "Connections in use"),
+                                  ("overflow", "Connections over the pool size")):
+            method = getattr(pool, name, None)
+            if method is None:
+                continue
+            yield GaugeMetricFamily(f"db_pool_{name}", description, value=method())
+
+
+def register_db_pool(engine: Engine) -> None:
+    """
+    The register_db_pool function adds pool gauges of the engine to the metrics registry.
+
+    :param engine: Engine: The engine of the application
+    :return: None
+    """
+    REGISTRY.register(DBPoolCollector(engine))
+
+
+class InstrumentedRedis(redis.Redis):
+    """Redis client that records duration and errors of every command and traces it as a span."""
+
+    async def execute_command(self, *args, **options):
+        command = str(args[0]).upper() if args else "UNKNOWN"
+        started = perf_counter()
+        try:
+            with service_tracing.start_span(f"redis {command}", kind=SpanKind.CLIENT,
+                                            attributes={"db.system": "redis", "db.operation": command}):
+                return await super().execute_command(*args, **options)
+        except Exception:
+            redis_command_errors.labels(command).inc()
+            raise
+        finally:
+            redis_command_duration.labels(command).observe(perf_counter() - started)
+
+
+def track_cloudinary(func: Callable) -> Callable:
+    """
+    The track_cloudinary function is a decorator that records duration and errors of a Cloudinary call.
+    The name of the decorated function is used as the operation label.
+
+    :param func: Callable: Function that calls Cloudinary
+    :return: The wrapped function
+    """
+    duration = cloudinary_call_duration.labels(func.__name__)
+    errors = cloudinary_call_errors.labels(func.__name__)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        started = perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            duration.observe(perf_counter() - started)
+    return wrapper
@@ -0,0 +1,252 @@
+import argparse
+import asyncio
+import logging
+import random
+from datetime import timedelta
+from time import monotonic
+from typing import Callable, List, Optional
+
+from prometheus_client import REGISTRY, start_http_server
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy.orm import Session, sessionmaker
+
+from ..conf.config import settings
+from ..database.db import engine
+from ..database.models import EmailOutbox
+from ..repository import outbox as repository_outbox
+from ..services import email as service_email, metrics as service_metrics
+from ..services.mailer import Mailer, is_transient
+
+
+"""Worker that sends emails saved in the outbox table by signup and other routes.
+The application runs it in process unless OUTBOX_WORKER_IN_APP=false, then it must run as its own process.
+To start it, enter : python -m src.services.outbox --metrics-port 9100
+You must be in the killer_instagram directory in the console"""
+
+
+logger = logging.getLogger(__name__)
+
+# rows are read after the commit that claims them, expiring them would reload every row with its own query
+OutboxSession = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+
+
+def message_id(outbox: EmailOutbox) -> str:
+    """
+    The message_id function derives the Message-ID header from the idempotency key of the email.
+        An email sent again after a crash has the same Message-ID, so mail servers and clients show it once.
+
+    :param outbox: EmailOutbox: The email
+    :return: A Message-ID like <outbox.0f3c...@example.com>
+    """
+    domain = (settings.mail_from or "localhost").split("@", 1)[-1]
+    return f"<outbox.{outbox.idempotency_key}@{domain}>"
+
+
+class OutboxWorker:
+    """
+    Claims due emails from the outbox in batches, sends them through the mailer and records the result.
+    Temporary errors are retried later with exponential backoff, permanent ones and emails out of attempts are dead-lettered.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session], mailer: Mailer, batch_size: int = 100,
+                 poll_interval: float = 1.0, lease: float = 300, max_attempts: int = 8,
+                 retry_backoff: float = 30, max_backoff: float = 3600, retention_days: float = 7):
+        """
+        :param session_factory: Callable[[], Session]: Creates database sessions
+        :param mailer: Mailer: Sends the messages
+        :param batch_size: int: Maximum quantity of emails claimed at once
+        :param poll_interval: float: Seconds to wait when there is nothing to send
+        :param lease: float: Seconds a claimed email may take before another worker claims it again
+        :param max_attempts: int: Attempts before an email is dead-lettered
+        :param retry_backoff: float: Delay before the second attempt in seconds, it doubles with every next one
+        :param max_backoff: float: Maximum delay between attempts in seconds
+        :param retention_days: float: Days sent emails are kept in the outbox, 0 keeps them forever
+        """
+        self.session_factory = session_factory
+        self.mailer = mailer
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        self.retention_days = retention_days
+        self._task: Optional[asyncio.Task] = None
+        self._purged_at = 0.0
+
+    def backoff(self, attempt: int) -> timedelta:
+        delay = min(self.max_backoff, self.retry_backoff * 2 ** (attempt - 1))
+        return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+    async def _send(self, outbox: EmailOutbox) -> None:
+        message = await service_email.render_email(outbox.kind, outbox.email, outbox.username, outbox.host)
+        message["Message-ID"] = message_id(outbox)
+        await self.mailer.send(message)
+
+    async def drain_once(self) -> int:
+        """
+        The drain_once function claims one batch of due emails, sends them and records the results.
+
+        :return: The quantity of claimed emails
+        """
+        with self.session_factory() as db:
+            emails = await repository_outbox.claim_due_emails(self.batch_size, self.lease, self.max_attempts, db)
+            if not emails:
+                return 0
+            try:
+                results = await asyncio.gather(*(self._send(outbox) for outbox in emails), return_exceptions=True)
+            except asyncio.CancelledError:
+                # the worker is stopped, the next one sends these emails at once instead of after the lease
+                await repository_outbox.release_emails([outbox.id for outbox in emails], db)
+                raise
+            sent: List[EmailOutbox] = [outbox for outbox, error in zip(emails, results) if error is None]
+            await repository_outbox.mark_sent([outbox.id for outbox in sent], db)
+            now = repository_outbox.utcnow()
+            for outbox in sent:
+                service_metrics.email_outbox_delivery_lag.observe((now - outbox.created_at).total_seconds())
+            service_metrics.email_outbox_messages.labels("sent").inc(len(sent))
+            for outbox, error in zip(emails, results):
+                if error is not None:
+                    await self._failed(outbox, error, db)
+        return len(emails)
+
+    async def _failed(self, outbox: EmailOutbox, error: BaseException, db: Session) -> None:
+        if is_transient(error) and outbox.attempts < self.max_attempts:
+            service_metrics.email_outbox_messages.labels("retried").inc()
+            retry_at = repository_outbox.utcnow() + self.backoff(outbox.attempts)
+        else:
+            service_metrics.email_outbox_messages.labels("dead").inc()
+            logger.error("Email %d to %s is dead after %d attempts: %r",
+                         outbox.id, outbox.email, outbox.attempts, error)
+            retry_at = None
+        await repository_outbox.mark_failed(outbox.id, repr(error), retry_at, db)
+
+    async def purge(self) -> int:
+        """
+        The purge function deletes sent emails older than the retention period, at most once an hour.
+
+        :return: The quantity of deleted emails
+        """
+        if self.retention_days <= 0 or monotonic() - self._purged_at < 3600:
+            return 0
+        self._purged_at = monotonic()
+        with self.session_factory() as db:
+            return await repository_outbox.delete_sent_emails(timedelta(days=self.retention_days), db)
+
+    async def run(self) -> None:
+        """
+        The run function drains the outbox until it is cancelled. A full batch is followed by the next one at once,
+            otherwise the worker waits poll_interval seconds. Errors of the database are logged and the loop goes on.
+
+        :return: None
+        """
+        while True:
+            try:
+                claimed = await self.drain_once()
+                await self.purge()
+            except Exception:
+                logger.exception("Outbox worker failed to drain the outbox")
+                claimed = 0
+            if claimed < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
+
+    def start(self) -> None:
+        """
+        The start function runs the worker as a task of the running event loop.
+
+        :return: None
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self) -> None:
+        """
+        The stop function cancels the worker. Emails it is sending are given back to the outbox,
+            if the process dies instead, they are claimed again when their lease expires.
+
+        :return: None
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+class OutboxCollector:
+    """
+    Reports the queue of the outbox when metrics are scraped. The numbers come from the database,
+    so the lag keeps growing on the dashboard even when no worker is running.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session]):
+        self.session_factory = session_factory
+
+    def describe(self):
+        # without describe the registry calls collect when it is registered, that is before the database is ready
+        yield GaugeMetricFamily("email_outbox_waiting", "Emails in the outbox that are not sent yet")
+        yield GaugeMetricFamily("email_outbox_lag_seconds", "Age of the oldest email that is not sent yet")
+
+    def collect(self):
+        try:
+            with self.session_factory() as db:
+                waiting, lag = repository_outbox.get_outbox_lag(db)
+        except Exception:
+            logger.exception("Outbox metrics are not available")
+            return
+        yield GaugeMetricFamily("email_outbox_waiting", "Emails in the outbox that are not sent yet", value=waiting)
+        yield GaugeMetricFamily("email_outbox_lag_seconds", "Age of the oldest email that is not sent yet", value=lag)
+
+
+def register_outbox_metrics(session_factory: Callable[[], Session] = OutboxSession) -> None:
+    """
+    The register_outbox_metrics function adds gauges of the outbox queue to the metrics registry.
+
+    :param session_factory: Callable[[], Session]: Creates database sessions
+    :return: None
+    """
+    REGISTRY.register(OutboxCollector(session_factory))
+
+
+worker = OutboxWorker(
+    OutboxSession,
+    service_email.mailer,
+    batch_size=settings.outbox_batch_size,
+    poll_interval=settings.outbox_poll_interval,
+    lease=settings.outbox_lease_seconds,
+    max_attempts=settings.outbox_max_attempts,
+    retry_backoff=settings.outbox_retry_backoff,
+    retention_days=settings.outbox_retention_days,
+)
+
+
+async def serve(once: bool) -> None:
+    try:
+        if once:
+            while await worker.drain_once():
+                pass
+        else:
+            await worker.run()
+    finally:
+        await worker.mailer.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send emails waiting in the outbox")
+    parser.add_argument("--once", action="store_true", help="Send what is due and exit")
+    parser.add_argument("--requeue-dead", action="store_true", help="Give dead-lettered emails new attempts first")
+    parser.add_argument("--metrics-port", type=int, default=0, help="Serve Prometheus metrics on this port")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.requeue_dead:
+        with OutboxSession() as db:
+            requeued = asyncio.run(repository_outbox.requeue_dead_emails(db))
+        print(f"{requeued} dead emails were requeued")
+    if args.metrics_port:
+        register_outbox_metrics()
+        start_http_server(args.metrics_port)
+    asyncio.run(serve(args.once))
+
+
+if __name__ == '__main__':
+    main()
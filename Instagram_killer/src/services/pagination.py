@@ -0,0 +1,38 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, List
+
+from fastapi import HTTPException, status
+
+
+def encode_cursor(*values: Any) -> str:
+    """
+    The encode_cursor function packs the sort key of the last returned row into an opaque string.
+    The client sends it back to get the next page, which starts right after this row.
+
+    :param values: Any: Values of the sort key, for example created_at and id
+    :return: An url safe string
+    """
+    raw = json.dumps([value.isoformat() if isinstance(value, datetime) else value for value in values],
+                     separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, *types: type) -> List[Any]:
+    """
+    The decode_cursor function unpacks a cursor made by encode_cursor and converts its values to the given types.
+
+    :param cursor: str: The cursor received from the client
+    :param types: type: Expected type of every value of the sort key
+    :return: A list of values
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(types):
+            raise ValueError(cursor)
+        return [datetime.fromisoformat(value) if value_type is datetime else value_type(value)
+                for value, value_type in zip(values, types)]
+    except (ValueError, TypeError, binascii.Error) as err:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor") from err
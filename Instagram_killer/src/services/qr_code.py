@@ -7,6 +7,7 @@ from cloudinary.uploader import upload
 
 from ..database.models import TransformedImageLink
 from ..schemas.images import ImageStatusUpdate
+from ..services.response_cache import response_cache
 
 
 async def get_qr_code_url(db: Session, image_id: int) -> str:
@@ -61,6 +62,7 @@ async def save_qr_code_url_to_db(
             db.add(new_link)
 
         db.commit()
+        await response_cache.invalidate(f"image:{image_id}")
 
         response_data = {
             "done": True,
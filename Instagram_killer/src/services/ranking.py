@@ -0,0 +1,371 @@
+import argparse
+import asyncio
+import heapq
+import logging
+import math
+import secrets
+from datetime import datetime, timezone
+from typing import Iterable, List, Optional, Tuple
+
+from redis.exceptions import RedisError
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Session
+
+from ..conf.config import settings
+from ..database.db import SessionLocal
+from ..repository import rating as repository_rating
+from ..services.metrics import InstrumentedRedis
+
+
+logger = logging.getLogger(__name__)
+
+RANKINGS = ("trending", "rated")
+# 95% confidence of the Wilson score interval
+CONFIDENCE_Z = 1.96
+
+
+class RankingUnavailable(Exception):
+    """The rankings are missing in Redis and another process is rebuilding them."""
+
+
+def rank_key(image_id: int, score: float) -> Tuple[float, str]:
+    """
+    The rank_key function returns the sort key of a ranked image, the best image has the highest one.
+        Redis orders members with the same score by their bytes, so ids are compared as text the same way.
+
+    :param image_id: int: Id of the image
+    :param score: float: Score of the image
+    :return: A tuple to compare
+    """
+    return score, str(image_id)
+
+
+def wilson_lower_bound(count: int, total: int, z: float = CONFIDENCE_Z) -> float:
+    """
+    The wilson_lower_bound function estimates the quality of an image from its star ratings, pessimistically
+        when there are only a few of them. A rating is a share of a positive vote, 1 star is 0 and 5 stars are 1,
+        and the lower bound of the Wilson score interval of the positive share is returned,
+        so one rating of 5 stars ranks below a hundred ratings of 4.5 on average.
+
+    :param count: int: Quantity of ratings
+    :param total: int: Sum of the stars of the ratings
+    :param z: float: Quantile of the normal distribution for the confidence
+    :return: The quality from 0 to 1
+    """
+    if count <= 0:
+        return 0.0
+    positive = (total - count) / (4 * count)
+    z2 = z * z
+    centre = positive + z2 / (2 * count)
+    margin = z * math.sqrt((positive * (1 - positive) + z2 / (4 * count)) / count)
+    return max(0.0, (centre - margin) / (1 + z2 / count))
+
+
+def trending_score(quality: float, upload_time: datetime, half_life: float) -> float:
+    """
+    The trending_score function ranks an image by its quality halved every half_life seconds of its age.
+        quality * 2 ** ((upload - now) / half_life) orders images the same way as log2(quality) + upload / half_life,
+        which does not depend on now, so the score is computed only when the ratings change
+        and scores in Redis never have to be decayed.
+
+    :param quality: float: The quality of the image, more than 0
+    :param upload_time: datetime: Upload time of the image, naive times are in UTC
+    :param half_life: float: Seconds after which an image needs twice the quality to keep its place
+    :return: The score
+    """
+    if upload_time.tzinfo is None:
+        upload_time = upload_time.replace(tzinfo=timezone.utc)
+    return math.log2(quality) + upload_time.timestamp() / half_life
+
+
+class ImageRanking:
+    """
+    Trending and top rated images kept in Redis sorted sets, so the top is read in constant time
+    no matter how many images there are.
+    The trending score decays with a half-life, the top rated one is the quality alone.
+    Both scores of an image change only when its ratings change, so they are updated incrementally,
+    and an image that dropped out of the set of size best ones can only come back with a new rating.
+    That keeps the sets trimmed to size.
+    A periodic compaction rebuilds both sets from the database. It fixes scores of updates that failed or raced
+    and refills the sets after removed images. A lock in Redis lets one process at a time compact the sets.
+    """
+
+    def __init__(self, redis_client: InstrumentedRedis, size: int = 1000, half_life_hours: float = 24,
+                 compaction_interval: float = 3600, enabled: bool = True, prefix: str = "top",
+                 compaction_lease: float = 600):
+        """
+        :param redis_client: InstrumentedRedis: Client of the Redis shared by all application servers
+        :param size: int: Quantity of the best images kept in every ranking
+        :param half_life_hours: float: Hours after which a trending image needs twice the quality to keep its place
+        :param compaction_interval: float: Seconds between rebuilds of the rankings, 0 to rebuild them only by the command
+        :param enabled: bool: Update the rankings at all
+        :param prefix: str: Prefix of the keys in Redis
+        :param compaction_lease: float: Seconds a compaction may take before another process may start one
+        """
+        self.redis = redis_client
+        self.size = size
+        self.half_life = half_life_hours * 3600
+        self.compaction_interval = compaction_interval
+        self.enabled = enabled
+        self.prefix = prefix
+        self.compaction_lease = compaction_lease
+        self._task: Optional[asyncio.Task] = None
+
+    def key(self, kind: str) -> str:
+        return f"{self.prefix}:{kind}"
+
+    def scores(self, upload_time: datetime, count: int, total: int) -> Optional[Tuple[float, float]]:
+        """
+        The scores function computes the trending and the top rated scores of an image.
+
+        :param upload_time: datetime: Upload time of the image
+        :param count: int: Quantity of ratings
+        :param total: int: Sum of the stars of the ratings
+        :return: Scores in the order of RANKINGS, None if the image is not ranked
+        """
+        quality = wilson_lower_bound(count, total)
+        if quality <= 0:
+            return None
+        return trending_score(quality, upload_time, self.half_life), quality
+
+    async def update(self, image_id: int, upload_time: datetime, count: int, total: int) -> None:
+        """
+        The update function replaces the scores of an image after its ratings changed and trims the rankings.
+
+        :param image_id: int: Id of the image
+        :param upload_time: datetime: Upload time of the image
+        :param count: int: Quantity of ratings
+        :param total: int: Sum of the stars of the ratings
+        :return: None
+        """
+        if not self.enabled:
+            return
+        scores = self.scores(upload_time, count, total)
+        if scores is None:
+            await self.remove(image_id)
+            return
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for kind, score in zip(RANKINGS, scores):
+                    pipe.zadd(self.key(kind), {image_id: score}).zremrangebyrank(self.key(kind), 0, -self.size - 1)
+                await pipe.execute()
+        except (RedisError, OSError) as err:
+            logger.warning("Scores of image %d are updated by the next compaction, Redis failed: %r", image_id, err)
+
+    async def remove(self, image_id: int) -> None:
+        """
+        The remove function deletes an image from the rankings, after it was deleted or lost its ratings.
+
+        :param image_id: int: Id of the image
+        :return: None
+        """
+        if not self.enabled:
+            return
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for kind in RANKINGS:
+                    pipe.zrem(self.key(kind), image_id)
+                await pipe.execute()
+        except (RedisError, OSError) as err:
+            logger.warning("Image %d stays ranked until the next compaction, Redis failed: %r", image_id, err)
+
+    async def refresh(self, db: Session, image_id: int) -> None:
+        """
+        The refresh function reads the ratings of an image and updates its scores, it must be called after they are committed.
+
+        :param db: Session: Pass the database session to the function
+        :param image_id: int: Id of the image
+        :return: None
+        """
+        if not self.enabled:
+            return
+        stats = await repository_rating.get_rating_stats(image_id=image_id, db=db)
+        if stats is None:
+            await self.remove(image_id)
+        else:
+            await self.update(image_id, stats.upload_time, stats.count, stats.total)
+
+    def rank(self, batches: Iterable[List[Row]]) -> Tuple[List[Tuple[int, float]], ...]:
+        """
+        The rank function selects the size best images of every ranking from rating stats of all images.
+
+        :param batches: Iterable[List[Row]]: Batches of rows with id, upload_time, count and total
+        :return: Lists of image ids with their scores in the order of RANKINGS, the best first
+        """
+        best = [[] for _ in RANKINGS]
+        for batch in batches:
+            for row in batch:
+                scores = self.scores(row.upload_time, row.count, row.total)
+                if scores is None:
+                    continue
+                for ranked, score in zip(best, scores):
+                    if len(ranked) < self.size:
+                        heapq.heappush(ranked, (score, row.id))
+                    elif score > ranked[0][0]:
+                        heapq.heapreplace(ranked, (score, row.id))
+        return tuple(sorted(((image_id, score) for score, image_id in ranked), key=lambda entry: rank_key(*entry),
+                            reverse=True) for ranked in best)
+
+    async def compact(self, db: Session) -> int:
+        """
+        The compact function rebuilds the rankings from the database and replaces them in one transaction.
+            Ratings committed while the stats are read may be missing until the next rating of the image
+            or the next compaction.
+
+        :param db: Session: Pass the database session to the function
+        :return: Quantity of ranked images
+        """
+        rankings = self.rank(repository_rating.iter_rating_stats(db))
+        async with self.redis.pipeline(transaction=True) as pipe:
+            for kind, ranked in zip(RANKINGS, rankings):
+                pipe.delete(self.key(kind))
+                if ranked:
+                    pipe.zadd(self.key(kind), dict(ranked))
+            await pipe.execute()
+        logger.info("Image rankings are compacted: %s", ", ".join(f"{kind} {len(ranked)}"
+                                                                   for kind, ranked in zip(RANKINGS, rankings)))
+        return len(rankings[0])
+
+    async def _lock(self) -> Optional[str]:
+        token = secrets.token_hex(8)
+        if await self.redis.set(f"{self.prefix}:compaction", token, nx=True, ex=max(1, int(self.compaction_lease))):
+            return token
+        return None
+
+    async def _unlock(self, token: str) -> None:
+        # the lease may have expired and another process may hold the lock by now
+        if await self.redis.get(f"{self.prefix}:compaction") == token.encode():
+            await self.redis.delete(f"{self.prefix}:compaction")
+
+    async def _compact_locked(self, db: Session) -> bool:
+        token = await self._lock()
+        if token is None:
+            return False
+        try:
+            await self.compact(db)
+        finally:
+            await self._unlock(token)
+        return True
+
+    async def _page(self, kind: str, limit: int,
+                    after: Optional[Tuple[float, int]]) -> Tuple[bool, List[Tuple[int, float]]]:
+        key = self.key(kind)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.exists(key)
+            if after is None:
+                pipe.zrevrangebyscore(key, "+inf", "-inf", start=0, num=limit, withscores=True)
+            else:
+                # images with the score of the cursor that follow it, at most size of them, then images with lower scores
+                score = repr(after[0])
+                pipe.zrevrangebyscore(key, score, score, withscores=True)
+                pipe.zrevrangebyscore(key, f"({score}", "-inf", start=0, num=limit, withscores=True)
+            exists, *pages = await pipe.execute()
+        ranked = [(int(image_id), score) for page in pages for image_id, score in page]
+        if after is not None:
+            ranked = [entry for entry in ranked if rank_key(*entry) < rank_key(after[1], after[0])]
+        return bool(exists), ranked[:limit]
+
+    async def top(self, db: Session, kind: str, limit: int,
+                  after: Optional[Tuple[float, int]] = None) -> List[Tuple[int, float]]:
+        """
+        The top function returns a page of a ranking. Pages follow the score and the id of the last image
+            of the previous page, so images moving up or down between two pages do not shift the next one.
+            Missing rankings are compacted by the process that takes the compaction lock,
+            the others raise RankingUnavailable instead of ranking all images from the database at once.
+            Without the rankings in Redis the page is ranked from the stats of all images on every call.
+
+        :param db: Session: Pass the database session to the function
+        :param kind: str: trending or rated
+        :param limit: int: Maximum quantity of images
+        :param after: Optional[Tuple[float, int]]: Score and id of the last image of the previous page
+        :return: Image ids with their scores, the best first
+        """
+        if not self.enabled:
+            ranked = self.rank(repository_rating.iter_rating_stats(db))[RANKINGS.index(kind)]
+            if after is not None:
+                ranked = [entry for entry in ranked if rank_key(*entry) < rank_key(after[1], after[0])]
+            return ranked[:limit]
+        exists, ranked = await self._page(kind, limit, after)
+        if not exists:
+            if not await self._compact_locked(db):
+                raise RankingUnavailable(kind)
+            _, ranked = await self._page(kind, limit, after)
+        return ranked
+
+    async def compact_if_due(self) -> bool:
+        """
+        The compact_if_due function compacts the rankings unless another process did it less than
+            compaction_interval seconds ago or is compacting them right now.
+
+        :return: True if the rankings were compacted
+        """
+        if not await self.redis.set(f"{self.prefix}:compacted", secrets.token_hex(8), nx=True,
+                                    ex=max(1, int(self.compaction_interval))):
+            return False
+        with SessionLocal() as db:
+            return await self._compact_locked(db)
+
+    async def run(self) -> None:
+        """
+        The run function compacts the rankings every compaction_interval seconds until it is cancelled.
+
+        :return: None
+        """
+        while True:
+            try:
+                await self.compact_if_due()
+            except (RedisError, OSError) as err:
+                logger.warning("Image rankings are not compacted, Redis failed: %r", err)
+            except Exception:
+                logger.exception("Image rankings failed to compact")
+            await asyncio.sleep(self.compaction_interval)
+
+    def start(self) -> None:
+        """
+        The start function compacts the rankings in a task of the running event loop.
+
+        :return: None
+        """
+        if self.enabled and self.compaction_interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self) -> None:
+        """
+        The stop function cancels the compaction.
+
+        :return: None
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+ranking = ImageRanking(
+    InstrumentedRedis(host=settings.redis_host, port=settings.redis_port, password=settings.redis_password,
+                      socket_connect_timeout=settings.top_images_redis_timeout,
+                      socket_timeout=settings.top_images_redis_timeout),
+    size=settings.top_images_size,
+    half_life_hours=settings.top_images_half_life_hours,
+    compaction_interval=settings.top_images_compaction_seconds,
+    enabled=settings.top_images_enabled,
+)
+
+
+async def compact(args) -> None:
+    try:
+        with SessionLocal() as db:
+            ranked = await ranking.compact(db)
+        print(f"{ranked} images are ranked")
+    finally:
+        await ranking.redis.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the trending and top rated images from the database")
+    args = parser.parse_args()
+    asyncio.run(compact(args))
+
+
+if __name__ == '__main__':
+    main()
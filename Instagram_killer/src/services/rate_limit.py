@@ -0,0 +1,235 @@
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from math import ceil
+from time import monotonic
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException, Request, Response, status
+from jose import JWTError, jwt
+from redis.exceptions import RedisError
+
+from ..conf.config import settings
+from ..services import metrics as service_metrics
+from ..services.metrics import InstrumentedRedis
+
+
+logger = logging.getLogger(__name__)
+
+# Token bucket in one round trip: the bucket is refilled for the time passed since the last request,
+# then one token is taken if there is one. The clock of Redis is used, so all application servers agree on time.
+# KEYS[1] - key of the bucket, ARGV[1] - capacity, ARGV[2] - tokens added per second
+# returns {1 if allowed else 0, tokens left, milliseconds until the next token}
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    retry_after = math.ceil((1 - tokens) / rate * 1000)
+end
+redis.call('HSET', KEYS[1], 'tokens', string.format('%.6f', tokens), 'updated', string.format('%.6f', now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return {allowed, math.floor(tokens), retry_after}
+"""
+
+
+@dataclass(frozen=True)
+class Limit:
+    """Requests allowed in a period of seconds, counted per user or per IP address."""
+    times: int
+    seconds: float
+    per: str = "user"
+
+    @property
+    def rate(self) -> float:
+        return self.times / self.seconds
+
+
+@dataclass(frozen=True)
+class Decision:
+    allowed: bool
+    remaining: int
+    retry_after: float
+
+
+def parse_limits(value: str) -> Dict[str, Limit]:
+    """
+    The parse_limits function reads limits of routes from a string like "login=10/60/ip,upload_image=20/60/user".
+        The last part is optional and defaults to user, 0 requests turn the limit of the route off.
+
+    :param value: str: Comma separated limits as route=times/seconds/per
+    :return: A dict of limits by route
+    """
+    limits = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        route, _, rule = item.partition("=")
+        times, seconds, *per = rule.split("/")
+        per = per[0].strip() if per else "user"
+        if per not in ("user", "ip"):
+            raise ValueError(f"Rate limit of {route.strip()} must be per user or ip, not {per}")
+        limits[route.strip()] = Limit(int(times), float(seconds), per)
+    return limits
+
+
+class LocalBuckets:
+    """
+    Token buckets in the memory of the process, used while Redis is not available.
+    Every process counts on its own, so the limit is multiplied by the quantity of processes.
+    """
+
+    def __init__(self, max_keys: int = 10000):
+        """
+        :param max_keys: int: Buckets kept at most, the least recently used are forgotten first
+        """
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def take(self, key: str, limit: Limit) -> Decision:
+        now = monotonic()
+        tokens, updated = self._buckets.pop(key, (limit.times, now))
+        tokens = min(limit.times, tokens + (now - updated) * limit.rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return Decision(allowed, int(tokens), 0.0 if allowed else (1 - tokens) / limit.rate)
+
+    def clear(self) -> None:
+        self._buckets.clear()
+
+
+class Limiter:
+    """
+    Checks limits with the token bucket script in Redis. When Redis fails, buckets in memory are used
+    and Redis is not asked again for retry_interval seconds, so requests do not wait for timeouts.
+    """
+
+    def __init__(self, redis_client: InstrumentedRedis, limits: Optional[Dict[str, Limit]] = None,
+                 enabled: bool = True, retry_interval: float = 5.0, prefix: str = "rate_limit"):
+        """
+        :param redis_client: InstrumentedRedis: Client of the Redis shared by all application servers
+        :param limits: Optional[Dict[str, Limit]]: Limits from settings, they replace the ones of the routes
+        :param enabled: bool: Check limits at all
+        :param retry_interval: float: Seconds to use buckets in memory after Redis failed
+        :param prefix: str: Prefix of the keys in Redis
+        """
+        self.redis_script = redis_client.register_script(TOKEN_BUCKET_SCRIPT)
+        self.limits = limits or {}
+        self.enabled = enabled
+        self.retry_interval = retry_interval
+        self.prefix = prefix
+        self.local = LocalBuckets()
+        self.redis_down_until = 0.0
+
+    async def hit(self, route: str, key: str, limit: Limit) -> Decision:
+        """
+        The hit function takes one token from the bucket of the client on the route.
+
+        :param route: str: Name of the limited route
+        :param key: str: The client, like user:<email> or ip:<address>
+        :param limit: Limit: The limit of the route
+        :return: The decision
+        """
+        if monotonic() >= self.redis_down_until:
+            try:
+                allowed, remaining, retry_after = await self.redis_script(
+                    keys=[f"{self.prefix}:{route}:{key}"], args=[limit.times, limit.rate]
+                )
+            except (RedisError, OSError) as err:
+                logger.warning("Rate limits are checked in memory for %d s, Redis failed: %r", self.retry_interval, err)
+                self.redis_down_until = monotonic() + self.retry_interval
+            else:
+                service_metrics.rate_limit_requests.labels(route, "redis", "allowed" if allowed else "limited").inc()
+                return Decision(bool(allowed), int(remaining), int(retry_after) / 1000)
+        decision = self.local.take(f"{route}:{key}", limit)
+        service_metrics.rate_limit_requests.labels(route, "local", "allowed" if decision.allowed else "limited").inc()
+        return decision
+
+
+def client_key(request: Request, per: str) -> str:
+    """
+    The client_key function identifies who makes the request: the user of a valid access token,
+        or the IP address for anonymous requests and limits per IP.
+        Only the signature of the token is checked, the database is not asked.
+
+    :param request: Request: The request
+    :param per: str: user or ip
+    :return: A key like user:<email> or ip:<address>
+    """
+    if per == "user":
+        scheme, _, token = request.headers.get("authorization", "").partition(" ")
+        if scheme.lower() == "bearer" and token:
+            try:
+                payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
+            except JWTError:
+                payload = {}
+            if payload.get("scope") == "access_token" and payload.get("sub"):
+                return f"user:{payload['sub']}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+limiter = Limiter(
+    InstrumentedRedis(host=settings.redis_host, port=settings.redis_port, password=settings.redis_password,
+                      socket_connect_timeout=settings.rate_limit_redis_timeout,
+                      socket_timeout=settings.rate_limit_redis_timeout),
+    limits=parse_limits(settings.rate_limits),
+    enabled=settings.rate_limit_enabled,
+    retry_interval=settings.rate_limit_retry_interval,
+)
+
+
+class RateLimit:
+    def __init__(self, route: str, times: int, seconds: float, per: str = "user"):
+        """
+        :param route: str: Name of the limit, routes with the same name share the buckets
+        :param times: int: Requests allowed in the period, RATE_LIMITS in settings can change it
+        :param seconds: float: The period
+        :param per: str: Count requests per user or per ip
+        """
+        self.route = route
+        self.default = Limit(times, seconds, per)
+
+    async def __call__(self, request: Request, response: Response):
+        """
+        The __call__ function is a dependency that lets the request in or answers 429 Too Many Requests.
+            It adds the limit and the remaining requests to the headers of the response.
+
+        :param self: Represent the instance of the class
+        :param request: Request: Get the client of the request
+        :param response: Response: Add headers to the response
+        :return: HTTPException if the limit is exceeded, otherwise nothing
+        """
+        limit = limiter.limits.get(self.route, self.default)
+        if not limiter.enabled or limit.times <= 0:
+            return
+        decision = await limiter.hit(self.route, client_key(request, limit.per), limit)
+        headers = {"X-RateLimit-Limit": str(limit.times), "X-RateLimit-Remaining": str(decision.remaining)}
+        if not decision.allowed:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests, try again later",
+                headers={**headers, "Retry-After": str(max(1, ceil(decision.retry_after)))},
+            )
+        response.headers.update(headers)
+
+
+login_limit = RateLimit("login", 10, 60, per="ip")
+signup_limit = RateLimit("signup", 5, 60, per="ip")
+email_request_limit = RateLimit("email_request", 3, 60, per="ip")
+upload_image_limit = RateLimit("upload_image", 20, 60)
+upload_album_limit = RateLimit("upload_album", 5, 60)
+transform_image_limit = RateLimit("transform_image", 30, 60)
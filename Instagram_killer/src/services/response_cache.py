@@ -0,0 +1,296 @@
+import logging
+import secrets
+from time import monotonic
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from fastapi import Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from redis.exceptions import RedisError
+
+from ..conf.config import settings
+from ..services import etag as service_etag, metrics as service_metrics
+from ..services.metrics import InstrumentedRedis
+
+
+logger = logging.getLogger(__name__)
+
+
+class CacheEntry:
+    """
+    Version of a resource read before the database, with the response for the client when it is known without the database:
+    304 if the client has the current version, the stored body if the cache has it.
+    """
+
+    def __init__(self, cache: "ResponseCache", request: Request, endpoint: str, key: Optional[str],
+                 version: Optional[str] = None, body: Optional[bytes] = None):
+        self.cache = cache
+        self.request = request
+        self.endpoint = endpoint
+        self.key = key
+        self.version = version
+        self.response: Optional[Response] = None
+        self.result = "bypass" if version is None else "miss"
+        if version is None:
+            return
+        headers = {"ETag": self.etag, "Cache-Control": service_etag.CACHE_CONTROL}
+        if service_etag.etag_matches(request, self.etag):
+            self.response = Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+            self.result = "not_modified"
+        elif body is not None:
+            self.response = Response(body, media_type="application/json", headers=headers)
+            self.result = "hit"
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.endpoint}.{self.version}"'
+
+    async def render(self, content: Any) -> Response:
+        """
+        The render function renders the content read from the database and keeps the body for the next requests.
+            Without a version, when Redis is not available, the ETag is a hash of the body like before.
+
+        :param content: Any: The content of the response
+        :return: A JSON response with the ETag
+        """
+        if self.version is None:
+            return service_etag.etag_response(self.request, content)
+        response = JSONResponse(content=jsonable_encoder(content))
+        response.headers.update({"ETag": self.etag, "Cache-Control": service_etag.CACHE_CONTROL})
+        if self.cache.store_bodies:
+            await self.cache.store(self.endpoint, self.key, self.version, response.body)
+        return response
+
+
+class ResponseCache:
+    """
+    Version-based ETags and rendered bodies of read endpoints, kept in Redis.
+    Every resource has a random version token, repositories replace it after they commit a change.
+    Deletions that cascade to other resources replace the token of all of them, it is a part of every version.
+    The token is read before the database, so a body rendered from old rows is never stored under a new token,
+    a new token is created when the old one expires, so a client never gets 304 for a token that was used before.
+    """
+
+    def __init__(self, redis_client: InstrumentedRedis, ttl: int = 600, store_bodies: bool = True,
+                 enabled: bool = True, retry_interval: float = 5.0, prefix: str = "response"):
+        """
+        :param redis_client: InstrumentedRedis: Client of the Redis shared by all application servers
+        :param ttl: int: Seconds versions and bodies are kept, a change that failed to reach Redis is seen after it at the latest
+        :param store_bodies: bool: Keep rendered bodies, otherwise only 304 responses skip the database
+        :param enabled: bool: Use the cache at all
+        :param retry_interval: float: Seconds to skip the cache after Redis failed
+        :param prefix: str: Prefix of the keys in Redis
+        """
+        self.redis = redis_client
+        self.ttl = ttl
+        self.store_bodies = store_bodies
+        self.enabled = enabled
+        self.retry_interval = retry_interval
+        self.prefix = prefix
+        self.redis_down_until = 0.0
+
+    def _failed(self, err: Exception) -> None:
+        logger.warning("Response cache is skipped for %d s, Redis failed: %r", self.retry_interval, err)
+        self.redis_down_until = monotonic() + self.retry_interval
+
+    def _available(self) -> bool:
+        return self.enabled and monotonic() >= self.redis_down_until
+
+    async def lookup(self, request: Request, endpoint: str, key: Optional[str]) -> CacheEntry:
+        """
+        The lookup function reads the version of the resource and its stored body in one round trip.
+
+        :param request: Request: The request of the client
+        :param endpoint: str: Name of the representation, like image or profile
+        :param key: Optional[str]: The resource, like image:5, None if it is not known without the database
+        :return: The entry, its response is None when the route has to read the database
+        """
+        if key is None or not self._available():
+            return CacheEntry(self, request, endpoint, None)
+        version_key, epoch_key = f"{self.prefix}:version:{key}", f"{self.prefix}:version:all"
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for new_version in (version_key, epoch_key):
+                    pipe.set(new_version, secrets.token_hex(8), nx=True, ex=self.ttl)
+                *_, version, epoch, stored = await (
+                    pipe.get(version_key).get(epoch_key).get(f"{self.prefix}:body:{endpoint}:{key}").execute()
+                )
+        except (RedisError, OSError) as err:
+            self._failed(err)
+            return CacheEntry(self, request, endpoint, None)
+        if version is None or epoch is None:
+            # the versions expired right after they were set
+            return CacheEntry(self, request, endpoint, None)
+        version = (version + epoch).decode()
+        entry = CacheEntry(self, request, endpoint, key, version, self._stored_body(stored, version))
+        service_metrics.response_cache_requests.labels(endpoint, entry.result).inc()
+        return entry
+
+    async def lookup_many(self, endpoint: str, keys: List[str]) -> Dict[str, Tuple[str, Optional[bytes]]]:
+        """
+        The lookup_many function reads versions and stored bodies of many resources in one round trip,
+            for endpoints that render a list of them, like cards of images in the feed.
+
+        :param endpoint: str: Name of the representation, like feed_card
+        :param keys: List[str]: The resources, like image:5
+        :return: Version and stored body, None if it is stale, of every key with a known version,
+            an empty dict when Redis is not available
+        """
+        if not keys or not self._available():
+            return {}
+        epoch_key = f"{self.prefix}:version:all"
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for new_version in [epoch_key] + [f"{self.prefix}:version:{key}" for key in keys]:
+                    pipe.set(new_version, secrets.token_hex(8), nx=True, ex=self.ttl)
+                pipe.get(epoch_key)
+                for key in keys:
+                    pipe.get(f"{self.prefix}:version:{key}").get(f"{self.prefix}:body:{endpoint}:{key}")
+                results = (await pipe.execute())[len(keys) + 1:]
+        except (RedisError, OSError) as err:
+            self._failed(err)
+            return {}
+        epoch, found = results[0], {}
+        if epoch is None:
+            return found
+        for key, version, stored in zip(keys, results[1::2], results[2::2]):
+            if version is None:
+                continue
+            version = (version + epoch).decode()
+            found[key] = version, self._stored_body(stored, version)
+            service_metrics.response_cache_requests.labels(endpoint, "miss" if found[key][1] is None else "hit").inc()
+        return found
+
+    @staticmethod
+    def _stored_body(stored: Optional[bytes], version: str) -> Optional[bytes]:
+        if stored is None:
+            return None
+        stored_version, _, stored_body = stored.partition(b"\n")
+        return stored_body if stored_version.decode() == version else None
+
+    async def store(self, endpoint: str, key: str, version: str, body: bytes) -> None:
+        await self.store_many(endpoint, {key: (version, body)})
+
+    async def store_many(self, endpoint: str, bodies: Dict[str, Tuple[str, bytes]]) -> None:
+        """
+        The store_many function keeps rendered bodies of many resources in one round trip.
+
+        :param endpoint: str: Name of the representation
+        :param bodies: Dict[str, Tuple[str, bytes]]: Version the body was rendered for and the body of every key
+        :return: None
+        """
+        if not bodies:
+            return
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for key, (version, body) in bodies.items():
+                    pipe.set(f"{self.prefix}:body:{endpoint}:{key}", version.encode() + b"\n" + body, ex=self.ttl)
+                await pipe.execute()
+        except (RedisError, OSError) as err:
+            self._failed(err)
+
+    async def render_many(self, endpoint: str, keys: Dict[Any, str],
+                          render: Callable[[List[Any]], Awaitable[Dict[Any, bytes]]]) -> Dict[Any, bytes]:
+        """
+        The render_many function returns bodies of many resources, the stored ones are read in one round trip,
+            the missing ones are rendered by one call of render and stored for the next requests.
+
+        :param endpoint: str: Name of the representation
+        :param keys: Dict[Any, str]: The resource of every item, like image:5 of the image 5
+        :param render: Callable[[List[Any]], Awaitable[Dict[Any, bytes]]]: Renders bodies of the items that are
+            not stored, items it skips do not exist
+        :return: Bodies by item in the order of keys, items that do not exist are skipped
+        """
+        cached = await self.lookup_many(endpoint, list(keys.values()))
+        bodies = {item: cached[key][1] for item, key in keys.items() if key in cached and cached[key][1] is not None}
+        missing = [item for item in keys if item not in bodies]
+        if missing:
+            rendered = await render(missing)
+            bodies.update(rendered)
+            if self.store_bodies:
+                await self.store_many(endpoint, {keys[item]: (cached[keys[item]][0], body)
+                                                 for item, body in rendered.items() if keys[item] in cached})
+        return {item: bodies[item] for item in keys if item in bodies}
+
+    async def invalidate(self, *keys: str) -> None:
+        """
+        The invalidate function gives the resources new versions, clients and stored bodies of the old ones are stale.
+            It must be called after the change is committed. Redis is asked even when it failed recently,
+            because a missed change is only seen when the old version expires.
+
+        :param keys: str: Changed resources, like image:5 or user:3
+        :return: None
+        """
+        if not self.enabled or not keys:
+            return
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.set(f"{self.prefix}:version:{key}", secrets.token_hex(8), ex=self.ttl)
+                await pipe.execute()
+        except (RedisError, OSError) as err:
+            logger.warning("Responses of %s stay cached until they expire, Redis failed: %r", ", ".join(keys), err)
+            self.redis_down_until = monotonic() + self.retry_interval
+
+    async def invalidate_all(self) -> None:
+        """
+        The invalidate_all function makes all cached responses stale, it is used after deletions
+            that cascade to resources the caller does not know, like comments of a deleted image.
+
+        :return: None
+        """
+        await self.invalidate("all")
+
+    async def get_alias(self, name: str) -> Optional[str]:
+        """
+        The get_alias function returns the resource key stored for another name of it, like a username for user:3.
+
+        :param name: str: The other name
+        :return: The key or None
+        """
+        if not self._available():
+            return None
+        try:
+            value = await self.redis.get(f"{self.prefix}:alias:{name}")
+        except (RedisError, OSError) as err:
+            self._failed(err)
+            return None
+        return None if value is None else value.decode()
+
+    async def set_alias(self, name: str, key: str) -> None:
+        if not self._available():
+            return
+        try:
+            await self.redis.set(f"{self.prefix}:alias:{name}", key, ex=self.ttl)
+        except (RedisError, OSError) as err:
+            self._failed(err)
+
+    async def delete_alias(self, name: str) -> None:
+        if not self.enabled:
+            return
+        try:
+            await self.redis.delete(f"{self.prefix}:alias:{name}")
+        except (RedisError, OSError) as err:
+            self._failed(err)
+
+
+response_cache = ResponseCache(
+    InstrumentedRedis(host=settings.redis_host, port=settings.redis_port, password=settings.redis_password,
+                      socket_connect_timeout=settings.response_cache_redis_timeout,
+                      socket_timeout=settings.response_cache_redis_timeout),
+    ttl=settings.response_cache_ttl,
+    store_bodies=settings.response_cache_bodies,
+    enabled=settings.response_cache_enabled,
+)
+
+
+def image_keys(image_id: int, owner_id: Optional[int] = None) -> list:
+    """
+    The image_keys function lists the resources changed with an image: the image and the profile of its owner,
+        whose stats count images, comments and ratings.
+
+    :param image_id: int: Id of the image
+    :param owner_id: Optional[int]: Id of the owner of the image, if it is known
+    :return: Keys to invalidate
+    """
+    return [f"image:{image_id}"] + ([f"user:{owner_id}"] if owner_id is not None else [])
@@ -0,0 +1,103 @@
+from decimal import Decimal
+from functools import lru_cache
+from typing import Any, Callable, Optional, Tuple, Type, Union, get_args, get_origin
+
+import orjson
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+
+def orjson_default(obj: Any) -> Any:
+    """
+    The orjson_default function converts values orjson does not know, like jsonable_encoder would:
+        pydantic models to dicts, SQLAlchemy models to their loaded attributes and decimals to floats.
+
+    :param obj: Any: The value
+    :return: A value orjson can serialize
+    """
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    if hasattr(obj, "_sa_instance_state"):
+        # the same attributes as jsonable_encoder with sqlalchemy_safe, relationships that are not loaded are skipped
+        return {key: value for key, value in vars(obj).items() if not key.startswith("_sa")}
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered by orjson, datetimes and uuids are serialized natively without jsonable_encoder."""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=orjson_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def unwrap_annotation(annotation: Any) -> Tuple[Any, bool, bool]:
+    """
+    The unwrap_annotation function finds the item type of a field annotation like Optional[List[Schema]].
+
+    :param annotation: Any: The annotation of a field
+    :return: The item type, whether the field is a list and whether it allows None
+    """
+    allow_none = False
+    if get_origin(annotation) is Union:
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        allow_none = len(args) < len(get_args(annotation))
+        if len(args) == 1:
+            annotation = args[0]
+    many = get_origin(annotation) in (list, tuple, set, frozenset)
+    return (get_args(annotation)[0] if many else annotation), many, allow_none
+
+
+@lru_cache(maxsize=None)
+def model_serializer(schema: Type[BaseModel]) -> Callable[[Any], dict]:
+    """
+    The model_serializer function builds a function that reads the fields of a response schema
+        straight from an ORM object, a row or a dict, the same way from_attributes does, without validating them.
+        Nested schemas and lists of them are read the same way. A missing value or None of a field
+        that is not Optional gets the default of the field, validators of the schema are not run,
+        so it is only meant for data read from the database.
+
+    :param schema: Type[BaseModel]: The response schema
+    :return: A function that converts one object to a dict
+    """
+    plan = []
+    for name, field in schema.model_fields.items():
+        item, many, allow_none = unwrap_annotation(field.annotation)
+        nested = model_serializer(item) if isinstance(item, type) and issubclass(item, BaseModel) else None
+        default = None if allow_none or field.is_required() else field.default
+        plan.append((field.alias or name, nested, many, default))
+
+    def serialize(obj: Any) -> dict:
+        data = {}
+        from_dict = isinstance(obj, dict)
+        for name, nested, many, default in plan:
+            value = obj.get(name) if from_dict else getattr(obj, name, None)
+            if value is None:
+                value = default
+            elif nested is not None:
+                value = [nested(item) for item in value] if many else nested(value)
+            data[name] = value
+        return data
+
+    return serialize
+
+
+def trusted_response(content: Any, schema: Optional[Type[BaseModel]] = None,
+                     status_code: int = 200) -> FastJSONResponse:
+    """
+    The trusted_response function renders ORM objects read by the route without the second validation
+        FastAPI runs for response_model and without jsonable_encoder. Only the fields of the schema are returned,
+        like with response_model, so it does not leak columns the schema does not have.
+
+    :param content: Any: An object or a list of objects to return
+    :param schema: Optional[Type[BaseModel]]: The response schema, without it the content is serialized as it is
+    :param status_code: int: Status code of the response
+    :return: The response
+    """
+    if schema is not None:
+        serialize = model_serializer(schema)
+        content = [serialize(item) for item in content] if isinstance(content, list) else serialize(content)
+    return FastJSONResponse(content, status_code=status_code)
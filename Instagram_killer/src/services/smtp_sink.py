@@ -0,0 +1,158 @@
+import argparse
+import asyncio
+from collections import deque
+from email import message_from_bytes, policy
+from email.message import EmailMessage
+from typing import List, Optional, Set
+
+
+"""A local SMTP server that keeps received messages in memory instead of delivering them.
+It is used by tests and benchmarks of the mailer, and for development with MAIL_SERVER=localhost MAIL_PORT=1025 MAIL_SSL_TLS=false.
+To start it, enter : python -m src.services.smtp_sink --port 1025
+You must be in the killer_instagram directory in the console"""
+
+
+class SMTPSink:
+    """
+    The SMTPSink class speaks enough of SMTP for aiosmtplib: EHLO, AUTH PLAIN, MAIL, RCPT, DATA, RSET, NOOP and QUIT.
+    Delays simulate the cost of a real server and failures can be scheduled to test retries.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0,
+                 connect_delay: float = 0.0, message_delay: float = 0.0):
+        """
+        :param host: str: Address to listen on
+        :param port: int: Port to listen on, 0 picks a free one
+        :param connect_delay: float: Seconds before the greeting, like a TLS handshake and login of a real server
+        :param message_delay: float: Seconds before the answer to DATA, like the round trip to a real server
+        """
+        self.host = host
+        self.port = port
+        self.connect_delay = connect_delay
+        self.message_delay = message_delay
+        self.messages: List[EmailMessage] = []
+        self.connections = 0
+        self._failures = deque()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._handlers: Set[asyncio.Task] = set()
+
+    async def start(self) -> "SMTPSink":
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        # connections that are still open, for example in the middle of a connect delay
+        for handler in self._handlers:
+            handler.cancel()
+        await asyncio.gather(*self._handlers, return_exceptions=True)
+
+    async def __aenter__(self) -> "SMTPSink":
+        return await self.start()
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.stop()
+
+    def fail_next(self, code: int = 451, text: str = "Try again later", times: int = 1) -> None:
+        """
+        The fail_next function makes the next messages be answered with an error instead of being accepted.
+
+        :param code: int: SMTP code of the answer, 4xx are temporary errors and 5xx are permanent ones
+        :param text: str: Text of the answer
+        :param times: int: Quantity of messages to fail
+        :return: None
+        """
+        self._failures.extend([(code, text)] * times)
+
+    def drop_next(self, times: int = 1) -> None:
+        """
+        The drop_next function makes the server close the connection instead of answering the next messages.
+
+        :param times: int: Quantity of messages to drop
+        :return: None
+        """
+        self._failures.extend([None] * times)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        handler = asyncio.current_task()
+        self._handlers.add(handler)
+
+        async def reply(line: str) -> None:
+            writer.write(line.encode() + b"\r\n")
+            await writer.drain()
+
+        try:
+            if self.connect_delay:
+                await asyncio.sleep(self.connect_delay)
+            await reply("220 smtp-sink ready")
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                command = line.decode(errors="replace").strip()
+                verb = command.split(" ", 1)[0].upper()
+                if verb == "EHLO":
+                    await reply("250-smtp-sink\r\n250-8BITMIME\r\n250 AUTH PLAIN")
+                elif verb == "AUTH":
+                    if len(command.split()) == 2:
+                        await reply("334 ")
+                        await reader.readline()
+                    await reply("235 Authentication succeeded")
+                elif verb in ("HELO", "MAIL", "RCPT", "RSET", "NOOP"):
+                    await reply("250 OK")
+                elif verb == "DATA":
+                    await reply("354 End data with <CR><LF>.<CR><LF>")
+                    data = []
+                    while True:
+                        data_line = await reader.readline()
+                        if data_line in (b".\r\n", b".\n", b""):
+                            break
+                        data.append(data_line[1:] if data_line.startswith(b"..") else data_line)
+                    if self.message_delay:
+                        await asyncio.sleep(self.message_delay)
+                    failure = self._failures.popleft() if self._failures else False
+                    if failure is None:
+                        return
+                    if failure:
+                        await reply(f"{failure[0]} {failure[1]}")
+                        continue
+                    self.messages.append(message_from_bytes(b"".join(data), policy=policy.default))
+                    await reply("250 Message accepted")
+                elif verb == "QUIT":
+                    await reply("221 Bye")
+                    return
+                else:
+                    await reply("502 Command not implemented")
+        except ConnectionError:
+            return
+        finally:
+            writer.close()
+            self._handlers.discard(handler)
+
+
+async def serve(host: str, port: int) -> None:
+    sink = await SMTPSink(host=host, port=port).start()
+    print(f"SMTP sink listening on {host}:{sink.port}")
+    received = 0
+    while True:
+        await asyncio.sleep(1)
+        for message in sink.messages[received:]:
+            print(f"{message['To']}: {message['Subject']}")
+        received = len(sink.messages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local SMTP server that prints received messages")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1025)
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+import asyncio
+import heapq
+from bisect import bisect_left, insort
+from threading import Lock
+from time import monotonic
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy.orm import Session
+
+from fastapi import BackgroundTasks
+
+from ..database.db import SessionLocal
+from ..repository import tags as repository_tags
+from ..conf.config import settings
+
+
+class TagIndex:
+    """
+    In-process index of tag names and their usage counts (quantity of images with the tag).
+    Names are kept in a sorted list, so every prefix is a contiguous slice found with bisect.
+    Small slices are ranked on the fly, for big ones the most used tags are cached per prefix
+    and updated incrementally when images get or lose tags.
+    Every cached prefix also keeps a floor: no tag of the prefix outside its cached top is used more often.
+    Cached tags that fall below the floor are dropped from the top, the prefix is ranked again
+    only when its top gets shorter than the requested limit.
+    """
+    SCAN_LIMIT = 1000
+    TOP_SIZE = 50
+
+    def __init__(self):
+        self._tags: List[str] = []
+        self._usage: Dict[str, int] = {}
+        self._top: Dict[str, List[str]] = {}
+        self._floor: Dict[str, int] = {}
+        self._lock = Lock()
+        self.loaded = False
+        self.loaded_at = 0.0
+        self.refreshing = False
+
+    def load(self, usage: Iterable[Tuple[str, int]]) -> None:
+        """
+        The load function replaces the content of the index with the given tag names and usage counts.
+        Prefixes that were cached before are ranked again on the new data, so a reload doesn't leave
+        the big prefixes to be ranked from scratch by the next requests.
+
+        :param self: Represent the instance of the class
+        :param usage: Iterable[Tuple[str, int]]: Pairs of tag name and quantity of images with this tag
+        :return: None
+        """
+        tags_usage = dict(usage)
+        sorted_tags = sorted(tags_usage)
+        top, floor = {}, {}
+        for prefix in list(self._top):
+            top[prefix], floor[prefix] = self._rank(sorted_tags, tags_usage, prefix)
+        with self._lock:
+            self._tags = sorted_tags
+            self._usage = tags_usage
+            self._top = top
+            self._floor = floor
+            self.loaded = True
+            self.loaded_at = monotonic()
+
+    def is_stale(self, max_age: float) -> bool:
+        """
+        The is_stale function checks if the index was loaded more than max_age seconds ago.
+        Zero max_age means that the index never gets stale.
+
+        :param self: Represent the instance of the class
+        :param max_age: float: Maximum age of the index in seconds
+        :return: A boolean value
+        """
+        return bool(max_age) and monotonic() - self.loaded_at > max_age
+
+    def start_refresh(self) -> bool:
+        """
+        The start_refresh function marks the index as being reloaded.
+        Only the first caller gets True, so concurrent requests schedule a single reload.
+
+        :param self: Represent the instance of the class
+        :return: True if the caller has to reload the index
+        """
+        with self._lock:
+            if self.refreshing:
+                return False
+            self.refreshing = True
+            return True
+
+    def add(self, tags: Iterable[str]) -> None:
+        """
+        The add function registers that an image got the given tags.
+        New names are inserted into the sorted list and usage counts of all tags are increased.
+        Nothing is done while the index is not loaded, the next load will read them from the database.
+
+        :param self: Represent the instance of the class
+        :param tags: Iterable[str]: Tag names linked to the image
+        :return: None
+        """
+        if not self.loaded:
+            return
+        with self._lock:
+            for tag in dict.fromkeys(tags):
+                if tag not in self._usage:
+                    insort(self._tags, tag)
+                    self._usage[tag] = 0
+                self._usage[tag] += 1
+                self._promote(tag)
+
+    def remove(self, tags: Iterable[str]) -> None:
+        """
+        The remove function registers that an image lost the given tags, for example when it was deleted.
+        Tag names stay in the index, because the tags themselves are not deleted from the database.
+
+        :param self: Represent the instance of the class
+        :param tags: Iterable[str]: Tag names unlinked from the image
+        :return: None
+        """
+        if not self.loaded:
+            return
+        with self._lock:
+            for tag in dict.fromkeys(tags):
+                if not self._usage.get(tag):
+                    continue
+                self._usage[tag] -= 1
+                self._demote(tag)
+
+    def count(self, tag: str) -> int:
+        """
+        The count function returns the quantity of images with the given tag.
+
+        :param self: Represent the instance of the class
+        :param tag: str: Tag name
+        :return: The usage count of the tag
+        """
+        return self._usage.get(tag, 0)
+
+    def search(self, prefix: str, limit: int = 10) -> List[str]:
+        """
+        The search function returns tag names that start with the prefix, in alphabetical order.
+
+        :param self: Represent the instance of the class
+        :param prefix: str: Beginning of the tag name
+        :param limit: int: Maximum quantity of returned tags
+        :return: A list of tag names
+        """
+        start, end = self._range(prefix)
+        return self._tags[start:min(end, start + limit)]
+
+    def suggest(self, prefix: str, limit: int = 10) -> List[str]:
+        """
+        The suggest function returns the most used tags that start with the prefix.
+        An empty prefix returns the most used tags overall.
+
+        :param self: Represent the instance of the class
+        :param prefix: str: Beginning of the tag name
+        :param limit: int: Maximum quantity of returned tags, not more than TOP_SIZE
+        :return: A list of tag names ordered by usage count
+        """
+        start, end = self._range(prefix)
+        if end - start <= self.SCAN_LIMIT:
+            return heapq.nlargest(limit, self._tags[start:end], key=self._usage.__getitem__)
+        top = self._top.get(prefix)
+        if top is None or len(top) < limit:
+            top, self._floor[prefix] = self._rank(self._tags, self._usage, prefix)
+            self._top[prefix] = top
+        return top[:limit]
+
+    def _range(self, prefix: str, tags: List[str] = None) -> Tuple[int, int]:
+        tags = self._tags if tags is None else tags
+        start = bisect_left(tags, prefix)
+        end = bisect_left(tags, prefix + "\U0010ffff", lo=start)
+        return start, end
+
+    def _rank(self, tags: List[str], usage: Dict[str, int], prefix: str) -> Tuple[List[str], int]:
+        start, end = self._range(prefix, tags)
+        top = heapq.nlargest(self.TOP_SIZE + 1, tags[start:end], key=usage.__getitem__)
+        floor = usage[top.pop()] if len(top) > self.TOP_SIZE else 0
+        return top, floor
+
+    def _prefixes(self, tag: str) -> Iterable[str]:
+        return (tag[:length] for length in range(len(tag) + 1))
+
+    def _promote(self, tag: str) -> None:
+        count = self._usage[tag]
+        for prefix in self._prefixes(tag):
+            top = self._top.get(prefix)
+            if top is None:
+                continue
+            if tag not in top:
+                if count <= self._floor[prefix]:
+                    continue
+                top.append(tag)
+            top.sort(key=self._usage.__getitem__, reverse=True)
+            if len(top) > self.TOP_SIZE:
+                self._floor[prefix] = max(self._floor[prefix], self._usage[top[self.TOP_SIZE]])
+                del top[self.TOP_SIZE:]
+
+    def _demote(self, tag: str) -> None:
+        count = self._usage[tag]
+        for prefix in self._prefixes(tag):
+            top = self._top.get(prefix)
+            if top is None or tag not in top:
+                continue
+            if count < self._floor[prefix]:
+                # a tag that is not cached may be used more often now
+                top.remove(tag)
+            else:
+                top.sort(key=self._usage.__getitem__, reverse=True)
+
+
+tag_index = TagIndex()
+
+
+def refresh_tag_index() -> None:
+    """
+    The refresh_tag_index function reloads the tag index from the database with its own session.
+    It is a plain function, so background tasks run it in the thread pool and neither the GROUP BY query
+    nor the sorting of tag names blocks the event loop.
+
+    :return: None
+    """
+    db = SessionLocal()
+    try:
+        tag_index.load(asyncio.run(repository_tags.get_tags_usage(db)))
+    finally:
+        db.close()
+        tag_index.refreshing = False
+
+
+async def get_tag_index(db: Session, background_tasks: BackgroundTasks) -> TagIndex:
+    """
+    The get_tag_index function returns the tag index, loading it from the database on the first call.
+    When the index is older than tag_index_refresh_seconds it is reloaded in a background task,
+    so tags added by other workers appear in it as well. The request is served from the old index meanwhile.
+
+    :param db: Session: Pass the database session to the function
+    :param background_tasks: BackgroundTasks: Schedule the reload after the response
+    :return: The loaded tag index
+    """
+    if not tag_index.loaded:
+        tag_index.load(await repository_tags.get_tags_usage(db))
+    elif tag_index.is_stale(settings.tag_index_refresh_seconds) and tag_index.start_refresh():
+        background_tasks.add_task(refresh_tag_index)
+    return tag_index
@@ -0,0 +1,173 @@
+import inspect
+import os
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from functools import wraps
+from typing import Callable, Mapping, Optional
+
+from opentelemetry.propagate import extract
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import ReadableSpan, TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter, SpanExporter
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from opentelemetry.trace import SpanKind, Tracer
+
+from ..conf.config import settings
+
+SERVICE_NAME = "instagram-killer"
+
+_tracer: Optional[Tracer] = None
+_provider: Optional[TracerProvider] = None
+# sampling decision of the current trace, None outside of a trace
+_sampled: ContextVar[Optional[bool]] = ContextVar("tracing_sampled", default=None)
+
+
+def format_span(span: ReadableSpan) -> str:
+    return span.to_json(indent=None) + os.linesep
+
+
+def file_exporter(path: str) -> SpanExporter:
+    """
+    The file_exporter function creates an exporter that appends finished spans to a file, one JSON object per line.
+
+    :param path: str: Path to the file with spans
+    :return: The span exporter
+    """
+    return ConsoleSpanExporter(service_name=SERVICE_NAME, out=open(path, "a", encoding="utf-8"), formatter=format_span)
+
+
+def otlp_exporter(endpoint: str) -> SpanExporter:
+    """
+    The otlp_exporter function creates an exporter that sends spans to an OpenTelemetry collector over HTTP.
+    The exporter package is optional, it is needed only when TRACING_OTLP_ENDPOINT is set.
+
+    :param endpoint: str: Url of the collector, for example http://localhost:4318/v1/traces
+    :return: The span exporter
+    """
+    try:
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+    except ImportError as err:
+        raise RuntimeError("Install opentelemetry-exporter-otlp-proto-http to send spans to a collector") from err
+    return OTLPSpanExporter(endpoint=endpoint)
+
+
+def setup_tracing(sample_ratio: float = settings.tracing_sample_ratio,
+                  exporter: Optional[SpanExporter] = None) -> Optional[TracerProvider]:
+    """
+    The setup_tracing function turns tracing on. Traces are sampled by trace id with the given ratio,
+    child spans follow the decision of their parent, so a trace is always recorded as a whole.
+    Spans are exported in a background thread through a bounded queue, when the queue is full new spans are dropped.
+    With a zero ratio tracing stays off and the traced functions are called without any span.
+
+    :param sample_ratio: float: Share of the traces to record, from 0 to 1
+    :param exporter: SpanExporter: Where to send the spans, by default to the collector or to the tracing file
+    :return: The tracer provider or None if tracing is off
+    """
+    global _tracer, _provider
+    shutdown_tracing()
+    if sample_ratio <= 0:
+        return None
+    if exporter is None:
+        exporter = otlp_exporter(settings.tracing_otlp_endpoint) if settings.tracing_otlp_endpoint \
+            else file_exporter(settings.tracing_file)
+    _provider = TracerProvider(sampler=ParentBased(TraceIdRatioBased(sample_ratio)),
+                               resource=Resource.create({"service.name": SERVICE_NAME}))
+    _provider.add_span_processor(BatchSpanProcessor(exporter))
+    _tracer = _provider.get_tracer(__name__)
+    return _provider
+
+
+def shutdown_tracing() -> None:
+    """
+    The shutdown_tracing function exports the spans left in the queue and turns tracing off.
+
+    :return: None
+    """
+    global _tracer, _provider
+    if _provider is not None:
+        _provider.shutdown()
+    _tracer, _provider = None, None
+
+
+def get_tracer() -> Optional[Tracer]:
+    return _tracer
+
+
+def _skip_span() -> bool:
+    return _tracer is None or _sampled.get() is False
+
+
+@contextmanager
+def _use_span(name: str, **kwargs):
+    with _tracer.start_as_current_span(name, **kwargs) as span:
+        token = _sampled.set(span.is_recording())
+        try:
+            yield span
+        finally:
+            _sampled.reset(token)
+
+
+def start_span(name: str, kind: SpanKind = SpanKind.INTERNAL, attributes: Optional[dict] = None):
+    """
+    The start_span function returns a context manager with a new span, which becomes the current one.
+    When tracing is off or the current trace is not sampled the context manager does nothing,
+    so calls made inside of a dropped trace do not pay for spans that would be dropped as well.
+
+    :param name: str: Name of the span
+    :param kind: SpanKind: Kind of the span
+    :param attributes: dict: Attributes of the span
+    :return: A context manager
+    """
+    if _skip_span():
+        return nullcontext()
+    return _use_span(name, kind=kind, attributes=attributes)
+
+
+def start_request_span(method: str, path: str, headers: Mapping[str, str]):
+    """
+    The start_request_span function starts the server span of an HTTP request.
+    A trace started by the caller is continued when the request has the traceparent header.
+
+    :param method: str: HTTP method of the request
+    :param path: str: Path of the request
+    :param headers: Mapping[str, str]: Headers of the request
+    :return: A context manager with the span
+    """
+    if _tracer is None:
+        return nullcontext()
+    return _use_span(f"{method} {path}", context=extract(headers), kind=SpanKind.SERVER,
+                     attributes={"http.method": method, "http.target": path})
+
+
+def span_name(func: Callable) -> str:
+    module = func.__module__.split("src.", 1)[-1]
+    return f"{module}.{func.__qualname__}"
+
+
+def traced(func: Callable) -> Callable:
+    """
+    The traced function is a decorator that records every call of the function as a span named after the function.
+    Calls inside of a trace that was not sampled are made without a span.
+    Works with coroutine functions and plain functions.
+
+    :param func: Callable: The function to trace
+    :return: The wrapped function
+    """
+    name = span_name(func)
+
+    if inspect.iscoroutinefunction(func):
+        @wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            if _skip_span():
+                return await func(*args, **kwargs)
+            with _use_span(name):
+                return await func(*args, **kwargs)
+        return async_wrapper
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if _skip_span():
+            return func(*args, **kwargs)
+        with _use_span(name):
+            return func(*args, **kwargs)
+    return wrapper
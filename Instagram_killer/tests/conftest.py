@@ -2,16 +2,21 @@ import sys
 from pathlib import Path
 
 path_root = Path(__file__).parent.parent.parent
-sys.path.append(path_root)
+sys.path.append(str(path_root))
 
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 
+from helpers import FakeRedis, QueryCounter
 from main import app
 from src.database.models import Base
-from src.database.db import get_db
+from src.database.db import get_db, track_queries
+from src.services.feed import feed
+from src.services.ranking import ranking
+from src.services.rate_limit import limiter
+from src.services.response_cache import response_cache
 
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
@@ -19,6 +24,7 @@ SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
 )
+track_queries(engine)
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
@@ -47,10 +53,29 @@ def client(session):
             session.close()
 
     app.dependency_overrides[get_db] = override_get_db
+    # all test requests come from one address, tests of rate limits turn the limiter on for themselves
+    limiter.enabled = False
+    # ids start from 1 in every test database, responses cached by a real Redis would belong to other data
+    response_cache.enabled = False
+    feed.enabled = False
+    ranking.enabled = False
 
     yield TestClient(app)
 
 
+@pytest.fixture(scope="function")
+def query_counter():
+    counter = QueryCounter()
+    event.listen(engine, "before_cursor_execute", counter)
+    yield counter
+    event.remove(engine, "before_cursor_execute", counter)
+
+
+@pytest.fixture(scope="function")
+def fake_redis():
+    return FakeRedis()
+
+
 @pytest.fixture(scope="module")
 def user():
     return {
@@ -0,0 +1,185 @@
+import asyncio
+from contextlib import contextmanager
+
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+
+"""Test doubles shared by the tests and the benchmarks, which add this folder to sys.path and import them."""
+
+
+class QueryCounter:
+    """Collects SQL statements executed on an engine, listen to before_cursor_execute with it."""
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    @contextmanager
+    def budget(self, max_queries: int):
+        """
+        The budget function fails the test if the code inside the with block
+        executes more SQL statements than max_queries.
+        """
+        start = len(self.statements)
+        yield self
+        executed = self.statements[start:]
+        assert len(executed) <= max_queries, \
+            f"{len(executed)} queries executed, budget is {max_queries}:\n" + "\n".join(executed)
+
+
+class FakeRedis:
+    """
+    In-memory stand-in of the async Redis client with the strings, sets, sorted sets and pipelines used by the services.
+    Every command can be delayed to imitate the network, a pipeline is delayed once, like one round trip.
+    Expiration is only remembered for ttl, keys do not expire. Set down to make every command fail like a Redis that is not there.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.data = {}
+        self.expirations = {}
+        self.latency = latency
+        self.commands = 0
+        self.down = False
+        self.in_pipeline = False
+
+    async def _command(self):
+        if self.down:
+            raise RedisConnectionError("Connection refused")
+        self.commands += 1
+        if self.latency and not self.in_pipeline:
+            await asyncio.sleep(self.latency)
+
+    async def get(self, key):
+        await self._command()
+        return self.data.get(key)
+
+    async def set(self, key, value, nx=False, ex=None):
+        await self._command()
+        if nx and key in self.data:
+            return None
+        self.data[key] = value if isinstance(value, bytes) else str(value).encode()
+        return True
+
+    async def expire(self, key, seconds):
+        await self._command()
+        if key not in self.data:
+            return False
+        self.expirations[key] = seconds
+        return True
+
+    async def ttl(self, key):
+        await self._command()
+        return self.expirations.get(key, -1) if key in self.data else -2
+
+    async def exists(self, *keys):
+        await self._command()
+        return sum(key in self.data for key in keys)
+
+    async def delete(self, *keys):
+        await self._command()
+        for key in keys:
+            self.expirations.pop(key, None)
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    async def incr(self, key):
+        await self._command()
+        value = int(self.data.get(key, b"0")) + 1
+        self.data[key] = str(value).encode()
+        return value
+
+    async def smembers(self, key):
+        await self._command()
+        return set(self.data.get(key, set()))
+
+    async def sadd(self, key, *values):
+        await self._command()
+        members = self.data.setdefault(key, set())
+        before = len(members)
+        members.update(value.encode() for value in values)
+        return len(members) - before
+
+    async def srem(self, key, *values):
+        await self._command()
+        members = self.data.setdefault(key, set())
+        before = len(members)
+        members.difference_update(value.encode() for value in values)
+        return before - len(members)
+
+    async def zadd(self, key, mapping):
+        await self._command()
+        members = self.data.setdefault(key, {})
+        before = len(members)
+        members.update({str(member).encode(): float(score) for member, score in mapping.items()})
+        return len(members) - before
+
+    async def zrem(self, key, *values):
+        await self._command()
+        members = self.data.get(key, {})
+        return sum(members.pop(str(value).encode(), None) is not None for value in values)
+
+    async def zremrangebyrank(self, key, start, stop):
+        await self._command()
+        members = self.data.get(key, {})
+        ranked = sorted(members, key=lambda member: (members[member], member))
+        removed = ranked[start:(stop + 1) or None] if stop >= 0 else ranked[start:len(ranked) + stop + 1]
+        for member in removed:
+            del members[member]
+        return len(removed)
+
+    async def zrevrange(self, key, start, stop, withscores=False):
+        await self._command()
+        members = self.data.get(key, {})
+        ranked = sorted(members, key=lambda member: (members[member], member), reverse=True)
+        found = ranked[start:(stop + 1) or None] if stop >= 0 else ranked[start:len(ranked) + stop + 1]
+        return [(member, members[member]) for member in found] if withscores else found
+
+    async def zrevrangebyscore(self, key, max, min, start=None, num=None, withscores=False):
+        await self._command()
+        def bound(value):
+            value = str(value)
+            return (float(value[1:]), True) if value.startswith("(") else (float(value), False)
+        (high, high_open), (low, low_open) = bound(max), bound(min)
+        members = self.data.get(key, {})
+        found = [member for member in sorted(members, key=lambda member: (members[member], member), reverse=True)
+                 if (members[member] < high if high_open else members[member] <= high)
+                 and (members[member] > low if low_open else members[member] >= low)]
+        found = found[start or 0:(start or 0) + num] if num is not None else found
+        return [(member, members[member]) for member in found] if withscores else found
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    """Queues commands of a FakeRedis and runs them together in execute."""
+
+    def __init__(self, redis_client: FakeRedis):
+        self.redis = redis_client
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+            return self
+        return queue
+
+    async def execute(self):
+        commands, self.commands = self.commands, []
+        await self.redis._command()
+        self.redis.in_pipeline = True
+        try:
+            return [await getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in commands]
+        finally:
+            self.redis.in_pipeline = False
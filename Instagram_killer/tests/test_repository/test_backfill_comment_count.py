@@ -0,0 +1,58 @@
+import sys
+from pathlib import Path
+
+parent_path = Path(__file__).parent.parent.parent
+sys.path.append(str(parent_path))
+
+import pytest
+from sqlalchemy import create_engine, insert, select
+
+from src.database.models import Base, User, Image, Comment
+from src.database.backfill_comment_count import migrate
+
+
+"""To start the test, enter : pytest tests/test_repository/test_backfill_comment_count.py -v
+You must be in the killer_instagram directory in the console"""
+
+
+@pytest.fixture(scope="function")
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'images.db'}")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User.__table__), [{"username": "username", "email": "example@example.com", "password": "password"}])
+        conn.execute(insert(Image.__table__), [{"user_id": 1, "file_extension": "jpg"} for _ in range(5)])
+        conn.execute(insert(Comment.__table__), [
+            {"comment": "comment", "image_id": image_id, "user_id": 1} for image_id in (1, 1, 2, 4, 4, 4)
+        ])
+    yield engine
+    engine.dispose()
+
+
+def stored_counts(engine):
+    with engine.connect() as conn:
+        return conn.execute(select(Image.comment_count).order_by(Image.id)).scalars().all()
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_migrate(engine):
+    result = migrate(engine, batch_size=2)
+    assert result == {"column_added": False, "updated_images": 3}
+    assert stored_counts(engine) == [2, 1, 0, 3, 0]
+    assert migrate(engine)["updated_images"] == 0
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_migrate_dry_run(engine):
+    assert migrate(engine, dry_run=True) == {"column_added": False, "updated_images": 3}
+    assert stored_counts(engine) == [0, 0, 0, 0, 0]
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_migrate_adds_column(engine):
+    with engine.begin() as conn:
+        # the database of an older version had no comment_count column
+        conn.exec_driver_sql("ALTER TABLE images_table DROP COLUMN comment_count")
+    assert migrate(engine, dry_run=True) == {"column_added": True, "updated_images": None}
+    assert migrate(engine) == {"column_added": True, "updated_images": 3}
+    assert stored_counts(engine) == [2, 1, 0, 3, 0]
@@ -1,7 +1,7 @@
 import sys
 import unittest
 from pathlib import Path
-from unittest.mock import MagicMock
+from unittest.mock import AsyncMock, MagicMock, patch
 
 parent_path = Path(__file__).parent.parent.parent
 sys.path.append(str(parent_path))
@@ -39,8 +39,14 @@ class TestImages(unittest.IsolatedAsyncioTestCase):
         )
 
 
-    async def test_create_image_ok(self):
+    @patch.object(repository_images, "feed")
+    @patch.object(repository_images, "response_cache")
+    async def test_create_image_ok(self, response_cache_mock, feed_mock):
+        response_cache_mock.invalidate = AsyncMock()
+        feed_mock.publish = AsyncMock()
         self.session.query().filter().first.return_value = None 
+        # the database gives the image its id when it is flushed
+        self.session.add.side_effect = lambda image: setattr(image, "id", self.test_image_id)
         result: schemas_images.ImageResponse = await repository_images.create_image(
             db=self.session,
             user_id=self.test_user_id,
@@ -50,9 +56,14 @@ class TestImages(unittest.IsolatedAsyncioTestCase):
             tags=self.test_tags,
             file_extension=self.test_file_extension
         )
+        self.assertEqual(result.id, self.test_image_id)
         self.assertEqual(result.description, self.test_description)
         self.assertEqual(result.user_id, self.test_user_id)
         self.assertEqual(result.image_url, self.test_image_url)
+        self.session.commit.assert_called_once()
+        self.session.refresh.assert_not_called()
+        response_cache_mock.invalidate.assert_awaited_once_with(f"user:{self.test_user_id}")
+        feed_mock.publish.assert_awaited_once_with(self.test_image_id)
 
 
     async def test_get_image_by_id_ok(self):
@@ -67,6 +78,21 @@ class TestImages(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(result.file_extension, self.test_file_extension)
 
 
+    async def test_get_image_by_id_with_links(self):
+        self.session.query().options().filter().first.return_value = self.image
+        result = await repository_images.get_image_by_id(db=self.session, image_id=self.test_image_id, with_links=True)
+        
+        self.assertEqual(result, self.image)
+
+
+    async def test_get_first_transformed_link(self):
+        link = MagicMock(image_id=self.test_image_id)
+        self.session.query().filter_by().order_by().first.return_value = link
+        result = await repository_images.get_first_transformed_link(db=self.session, image_id=self.test_image_id)
+
+        self.assertEqual(result, link)
+
+
     async def test_get_image_by_id_not_found(self):
         image_id = 99
         self.session.query().filter().first.return_value = None
@@ -156,7 +182,7 @@ class TestImages(unittest.IsolatedAsyncioTestCase):
 
 
     async def test_find_images_by_keyword(self):
-        self.session.query().filter().order_by().all.return_value = [self.image]
+        self.session.query().options().filter().order_by().all.return_value = [self.image]
         result = await repository_images.find_images_by_keyword(user_id=self.test_user_id,
                                                                 db=self.session,
                                                                 keyword="test",
@@ -166,7 +192,7 @@ class TestImages(unittest.IsolatedAsyncioTestCase):
 
 
     async def test_find_images_by_tag(self):
-        self.session.query().filter().order_by().all.return_value = [self.image]
+        self.session.query().options().filter().order_by().all.return_value = [self.image]
         result = await repository_images.find_images_by_tag(user_id=self.test_user_id,
                                                                 db=self.session,
                                                                 tag_name=self.test_tags[0],
@@ -0,0 +1,72 @@
+import sys
+from pathlib import Path
+
+parent_path = Path(__file__).parent.parent.parent
+sys.path.append(str(parent_path))
+
+import pytest
+from sqlalchemy import create_engine, insert, select
+
+from src.database.models import Base, User
+from src.database.normalize_users import migrate
+
+
+"""To start the test, enter : pytest tests/test_repository/test_normalize_users.py -v
+You must be in the killer_instagram directory in the console"""
+
+
+@pytest.fixture(scope="function")
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'users.db'}")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        # the database of an older version had no index of lower case usernames
+        conn.exec_driver_sql("DROP INDEX ix_users_table_username_lower")
+    yield engine
+    engine.dispose()
+
+
+def add_users(engine, *users):
+    with engine.begin() as conn:
+        conn.execute(insert(User.__table__), [
+            {"username": username, "email": email, "password": "password"} for username, email in users
+        ])
+
+
+def stored_emails(engine):
+    with engine.connect() as conn:
+        return conn.execute(select(User.email).order_by(User.id)).scalars().all()
+
+
+def index_names(engine):
+    # the inspector of SQLite skips indexes of expressions
+    with engine.connect() as conn:
+        return set(conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'index'").scalars())
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_migrate(engine):
+    add_users(engine, ("First", "First@Example.com"), ("second", "second@example.com"), ("Third", "THIRD@example.com"))
+    result = migrate(engine, batch_size=2)
+    assert result == {"conflicts": {"email": [], "username": []}, "updated_emails": 2}
+    assert stored_emails(engine) == ["first@example.com", "second@example.com", "third@example.com"]
+    assert "ix_users_table_username_lower" in index_names(engine)
+    assert migrate(engine)["updated_emails"] == 0
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_migrate_dry_run(engine):
+    add_users(engine, ("First", "First@Example.com"))
+    assert migrate(engine, dry_run=True)["updated_emails"] == 1
+    assert stored_emails(engine) == ["First@Example.com"]
+    assert "ix_users_table_username_lower" not in index_names(engine)
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_migrate_conflicts(engine):
+    add_users(engine, ("first", "first@example.com"), ("FIRST", "First@Example.com"), ("other", "other@example.com"))
+    result = migrate(engine)
+    assert result == {"conflicts": {"email": [("first@example.com", 2)], "username": [("first", 2)]},
+                      "updated_emails": 0}
+    assert stored_emails(engine) == ["first@example.com", "First@Example.com", "other@example.com"]
+    assert "ix_users_table_username_lower" not in index_names(engine)
@@ -42,6 +42,27 @@ class TestTags(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(result.id, self.test_tag.id)
         self.assertEqual(result.tag, self.test_tag.tag)
 
+    async def test_get_or_create_tags_mixed(self):
+        self.session.query().filter().all.return_value = [self.test_tag]
+        result = await repository_tags.get_or_create_tags(db=self.session, 
+                                                          tag_names=[self.test_tag_name, "new_tag", self.test_tag_name])
+
+        self.assertEqual([tag.tag for tag in result], [self.test_tag_name, "new_tag"])
+        self.assertEqual(result[0], self.test_tag)
+        self.session.flush.assert_called_once()
+
+    async def test_get_or_create_tags_empty(self):
+        result = await repository_tags.get_or_create_tags(db=self.session, tag_names=self.empty_list)
+
+        self.assertEqual(result, self.empty_list)
+        self.session.flush.assert_not_called()
+
+    async def test_get_tags_usage(self):
+        self.session.query().outerjoin().group_by().all.return_value = [(self.test_tag_name, 3)]
+        result = await repository_tags.get_tags_usage(db=self.session)
+
+        self.assertEqual(result, [(self.test_tag_name, 3)])
+
     async def test_get_existing_tags(self):
         self.session.query().distinct().all.return_value = [self.test_tag]
         result = await repository_tags.get_existing_tags(db=self.session)
@@ -14,7 +14,8 @@ from src.repository.users import (
     get_user_by_email,
     get_user_by_id,
     update_avatar,
-    change_user_role
+    change_user_role,
+    get_user_profile
 )
 from src.schemas.users import UserModel, UserRoleUpdate
 
@@ -96,5 +97,20 @@ class TestUsers(unittest.IsolatedAsyncioTestCase):
         self.assertTrue(hasattr(result, self.attribute_id))
 
 
+    async def test_get_user_profile_ok(self):
+        self.session.execute().first.return_value = (self.user_db, 2, 5, 3, 3.3333)
+        result = await get_user_profile(username=self.user_db.username, db=self.session)
+        self.assertEqual(result["user"], self.user_db)
+        self.assertEqual(result["quantity_of_loaded_images"], 2)
+        self.assertEqual(result["quantity_of_comments"], 5)
+        self.assertEqual(result["quantity_of_ratings"], 3)
+        self.assertEqual(result["average_rating"], 3.33)
+
+    async def test_get_user_profile_none(self):
+        self.session.execute().first.return_value = None
+        result = await get_user_profile(username=self.user_db.username, db=self.session)
+        self.assertIsNone(result)
+
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
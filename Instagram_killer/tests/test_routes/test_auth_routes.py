@@ -5,15 +5,15 @@ path_root = Path(__file__).parent.parent
 sys.path.append(str(path_root))
 
 import pytest
-from unittest.mock import MagicMock, patch
+from unittest.mock import patch
 from jose import jwt 
 
-from src.database.models import User
+from src.database.models import EmailOutbox, User
 from src.services.auth import service_auth
 from src.conf.config import settings
 
 
-"""To start the test, enter : pytest tests/test_routes/test_auth.py -v 
+"""To start the test, enter : pytest tests/test_routes/test_auth_routes.py -v 
 You must be in the killer_instagram directory in the console"""
 
 
@@ -42,9 +42,7 @@ def admin_login(client, user_id_2):
 #-----------------------------------------------------------------------------------------------------------------------------------------------
 
 @pytest.fixture(scope='function')
-def user_id_3_role_admin(client, user_id_3, session, monkeypatch):
-    mock_send_email = MagicMock()
-    monkeypatch.setattr("src.routes.auth.service_email.send_email", mock_send_email)
+def user_id_3_role_admin(client, user_id_3, session):
     signup_response = client.post(
         "/api/auth/signup",
         json=user_id_3,
@@ -58,9 +56,7 @@ def user_id_3_role_admin(client, user_id_3, session, monkeypatch):
 #-----------------------------------------------------------------------------------------------------------------------------------------------
 
 @pytest.fixture(scope='function')
-def get_email_from_signup(client, user_id_2, monkeypatch) -> str:
-    mock_send_email = MagicMock()
-    monkeypatch.setattr("src.routes.auth.service_email.send_email", mock_send_email)
+def get_email_from_signup(client, user_id_2) -> str:
     response = client.post(
         "/api/auth/signup",
         json=user_id_2,
@@ -91,9 +87,7 @@ def no_user_email_token():
 
 """Tests:"""
 
-def test_create_user(client, user, monkeypatch):
-    mock_send_email = MagicMock()
-    monkeypatch.setattr("src.routes.auth.service_email.send_email", mock_send_email)
+def test_create_user(client, user):
     response = client.post(
         "/api/auth/signup",
         json=user,
@@ -105,9 +99,7 @@ def test_create_user(client, user, monkeypatch):
 
 #-----------------------------------------------------------------------------------------------------------------------------------------------
 
-def test_create_user_again(client, user, monkeypatch):
-    mock_send_email = MagicMock()
-    monkeypatch.setattr("src.routes.auth.service_email.send_email", mock_send_email)
+def test_create_user_again(client, user):
     response = client.post(
         "/api/auth/signup",
         json=user,
@@ -224,11 +216,9 @@ def test_refresh_token_access_token(client, super_admin_login):
 
 #-----------------------------------------------------------------------------------------------------------------------------------------------
 
-def test_request_email_ok(client, get_email_from_signup, monkeypatch):
+def test_request_email_ok(client, get_email_from_signup):
     with patch.object(service_auth, 'r_cashe') as r_mock:
         r_mock.get.return_value = None
-        mock_send_email = MagicMock()
-        monkeypatch.setattr("src.routes.auth.service_email.send_email", mock_send_email)
         body: dict = {"email": get_email_from_signup}
         response = client.post(
             "api/auth/request_email",
@@ -252,11 +242,9 @@ def test_confirmed_email_ok(client, get_email_token):
 
 #-----------------------------------------------------------------------------------------------------------------------------------------------
 
-def test_request_email_again(client, user_id_2, monkeypatch):
+def test_request_email_again(client, user_id_2):
     with patch.object(service_auth, 'r_cashe') as r_mock:
         r_mock.get.return_value = None
-        mock_send_email = MagicMock()
-        monkeypatch.setattr("src.routes.auth.service_email.send_email", mock_send_email)
         body: dict = {"email": user_id_2["email"]}
         response = client.post(
             "api/auth/request_email",
@@ -292,11 +280,9 @@ def test_confirmed_email_no_user(client, no_user_email_token):
 
 #-----------------------------------------------------------------------------------------------------------------------------------------------
 
-def test_request_reset_password_email(client, user_id_2, monkeypatch):
+def test_request_reset_password_email(client, user_id_2):
     with patch.object(service_auth, 'r_cashe') as r_mock:
         r_mock.get.return_value = None
-        mock_send_email = MagicMock()
-        monkeypatch.setattr("src.routes.auth.service_email.send_reset_password_email", mock_send_email)
         body: dict = {"email": user_id_2["email"]}
         response = client.post(
             "api/auth/reset_password",
@@ -434,4 +420,94 @@ def test_change_role_role_not_found(client, super_admin_login):
         )    
         assert response.status_code == 400, response.text
         data: dict = response.json()
-        assert data["detail"] == "Invalid role provided"
\ No newline at end of file
+        assert data["detail"] == "Invalid role provided"
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_create_user_email_in_other_case(client, user, query_counter):
+    email = user["email"].upper()
+    # one lookup of the email and the username before the new user would be created
+    with query_counter.budget(1):
+        response = client.post(
+            "/api/auth/signup",
+            json={"username": "other_name", "email": email, "password": "password"},
+        )
+    assert response.status_code == 409, response.text
+    assert response.json()["detail"] == f'User with email: {user["email"]} already exists'
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_create_user_username_in_other_case(client, user):
+    username = user["username"].upper()
+    response = client.post(
+        "/api/auth/signup",
+        json={"username": username, "email": "new_user@example.com", "password": "password"},
+    )
+    assert response.status_code == 409, response.text
+    assert response.json()["detail"] == f'User with name: {username} already exists'
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_create_user_stores_email_in_lower_case(client, session):
+    response = client.post(
+        "/api/auth/signup",
+        json={"username": "Mixed_Case", "email": "Mixed.Case@Example.com", "password": "password"},
+    )
+    assert response.status_code == 201, response.text
+    assert response.json()["user"]["email"] == "mixed.case@example.com"
+    assert response.json()["user"]["username"] == "Mixed_Case"
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_login_email_in_other_case(client, user):
+    response = client.post(
+        "/api/auth/login",
+        data={"username": user["email"].upper(), "password": user["password"]},
+    )
+    assert response.status_code == 202, response.text
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_signup_saves_email_in_outbox(client, session):
+    response = client.post(
+        "/api/auth/signup",
+        json={"username": "outbox_user", "email": "outbox_user@example.com", "password": "password"},
+    )
+    assert response.status_code == 201, response.text
+    emails = session.query(EmailOutbox).filter(EmailOutbox.email == "outbox_user@example.com").all()
+    assert [(outbox.kind, outbox.status, outbox.username) for outbox in emails] == \
+        [("confirm_email", "pending", "outbox_user")]
+    assert emails[0].host == "http://testserver/"
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_signup_conflict_saves_no_email(client, session, user):
+    before = session.query(EmailOutbox).count()
+    response = client.post("/api/auth/signup", json=user)
+    assert response.status_code == 409, response.text
+    assert session.query(EmailOutbox).count() == before
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.parametrize("url, kind", [
+    ("api/auth/request_email", "confirm_email"),
+    ("api/auth/reset_password", "reset_password"),
+])
+def test_requested_emails_are_saved_in_outbox(client, session, url, kind):
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        response = client.post(url, json={"email": "outbox_user@example.com"})
+        assert response.status_code == 202, response.text
+    kinds = [outbox.kind for outbox in session.query(EmailOutbox)
+             .filter(EmailOutbox.email == "outbox_user@example.com").order_by(EmailOutbox.id)]
+    assert kinds[-1] == kind
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_reset_password_unknown_email_saves_no_email(client, session):
+    before = session.query(EmailOutbox).count()
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        response = client.post("api/auth/reset_password", json={"email": "nobody@example.com"})
+        assert response.status_code == 202, response.text
+    assert session.query(EmailOutbox).count() == before
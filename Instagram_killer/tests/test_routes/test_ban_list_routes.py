@@ -0,0 +1,29 @@
+import pytest
+
+from src.services.ban_list import CIDRSet, UserAgentMatcher, ban_list
+
+
+"""To start the test, enter : pytest tests/test_routes/test_ban_list_routes.py -v
+You must be in the killer_instagram directory in the console"""
+
+
+@pytest.fixture(scope="function")
+def banned(monkeypatch):
+    monkeypatch.setattr(ban_list, "user_agents", UserAgentMatcher(["EvilBot", "re:^curl/"]))
+    monkeypatch.setattr(ban_list, "networks", CIDRSet(["203.0.113.0/24"]))
+    yield ban_list
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_banned_user_agent_is_refused(client, banned):
+    for user_agent in ("Mozilla/5.0 (compatible; EvilBot/2.0)", "curl/8.0.1"):
+        response = client.get("/api/images/", headers={"User-Agent": user_agent})
+        assert response.status_code == 403, response.text
+        assert response.json()["detail"] == "You are banned"
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_other_clients_are_let_in(client, banned):
+    response = client.get("/", headers={"User-Agent": "Mozilla/5.0"})
+    assert response.status_code == 200, response.text
+    assert client.get("/").status_code == 200
@@ -19,11 +19,9 @@ You must be in the killer_instagram directory in the console"""
 """Fixtures:"""
 
 @pytest.fixture(scope="function")
-def signup_admin(client, session, user, monkeypatch):
+def signup_admin(client, session, user):
     with patch.object(service_auth, 'r_cashe') as r_mock:
         r_mock.get.return_value = None
-        mock_send_email = MagicMock()
-        monkeypatch.setattr("src.routes.auth.service_email.send_email", mock_send_email)
         signup_response = client.post(
             "/api/auth/signup",
             json=user
@@ -35,11 +33,9 @@ def signup_admin(client, session, user, monkeypatch):
 #-----------------------------------------------------------------------------------------------------------------------------------------------
 
 @pytest.fixture(scope="function")
-def signup_user(client, session, user_id_2, monkeypatch):
+def signup_user(client, session, user_id_2):
     with patch.object(service_auth, 'r_cashe') as r_mock:
         r_mock.get.return_value = None
-        mock_send_email = MagicMock()
-        monkeypatch.setattr("src.routes.auth.service_email.send_email", mock_send_email)
         signup_response = client.post(
             "/api/auth/signup",
             json=user_id_2
@@ -249,3 +245,212 @@ def test_delete_comment_ok(client, get_access_token_admin):
 
 
 
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_list_image_comments_pages(client, get_access_token_user):
+     with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        headers = {"Authorization": f"Bearer {get_access_token_user}"}
+        for number in range(5):
+            response = client.post(
+                 "api/images/comments/",
+                 headers=headers,
+                 json={"comment": f"comment {number}", "image_id": 1}
+            )
+            assert response.status_code == 200, response.text
+
+        response = client.get("api/images/1/comments", params={"limit": 2}, headers=headers)
+        assert response.status_code == 200, response.text
+        first_page = response.json()
+        assert [comment["comment"] for comment in first_page["comments"]] == ["comment 0", "comment 1"]
+        assert first_page["comment_count"] == 5
+        assert first_page["next_cursor"] is not None
+
+        comments = first_page["comments"]
+        cursor = first_page["next_cursor"]
+        while cursor:
+            page = client.get("api/images/1/comments", params={"limit": 2, "cursor": cursor}, headers=headers).json()
+            comments += page["comments"]
+            cursor = page["next_cursor"]
+        assert [comment["comment"] for comment in comments] == [f"comment {number}" for number in range(5)]
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_comment_count_follows_delete(client, get_access_token_admin):
+     with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        headers = {"Authorization": f"Bearer {get_access_token_admin}"}
+        comments = client.get("api/images/1/comments", headers=headers).json()["comments"]
+        response = client.delete(f"api/images/comments/{comments[0]['id']}", headers=headers)
+        assert response.status_code == 200, response.text
+
+        response = client.get("api/images/1", headers=headers)
+        assert response.status_code == 200, response.text
+        assert response.json()["comment_count"] == 4
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_list_image_comments_invalid_cursor(client, get_access_token_user):
+     with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        response = client.get(
+             "api/images/1/comments",
+             params={"cursor": "not-a-cursor"},
+             headers={"Authorization": f"Bearer {get_access_token_user}"}
+        )
+        assert response.status_code == 400, response.text
+        assert response.json()["detail"] == "Invalid cursor"
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_list_image_comments_image_not_found(client, get_access_token_user):
+     with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        response = client.get(
+             "api/images/100/comments",
+             headers={"Authorization": f"Bearer {get_access_token_user}"}
+        )
+        assert response.status_code == 404, response.text
+        assert response.json()["detail"] == "Image not found"
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_bulk_delete_comments_forbidden(client, get_access_token_user):
+     with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        response = client.post(
+             "api/images/comments/bulk_delete",
+             headers={"Authorization": f"Bearer {get_access_token_user}"},
+             json={"image_id": 1}
+        )
+        assert response.status_code == 403, response.text
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_bulk_delete_comments_without_filters(client, get_access_token_admin):
+     with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        response = client.post(
+             "api/images/comments/bulk_delete",
+             headers={"Authorization": f"Bearer {get_access_token_admin}"},
+             json={"created_after": "2020-01-01T00:00:00"}
+        )
+        assert response.status_code == 422, response.text
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_bulk_delete_comments_dry_run(client, session, get_access_token_admin, user_id_2):
+     with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        headers = {"Authorization": f"Bearer {get_access_token_admin}"}
+        author: User = session.query(User).filter(User.email==user_id_2["email"]).first()
+        response = client.post(
+             "api/images/comments/bulk_delete",
+             headers=headers,
+             json={"user_id": author.id, "dry_run": True}
+        )
+        assert response.status_code == 200, response.text
+        assert response.json() == {"deleted": 4, "images": 1, "dry_run": True}
+        assert client.get("api/images/1", headers=headers).json()["comment_count"] == 4
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_bulk_delete_comments_by_ids(client, get_access_token_admin):
+     with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        headers = {"Authorization": f"Bearer {get_access_token_admin}"}
+        comments = client.get("api/images/1/comments", headers=headers).json()["comments"]
+        response = client.post(
+             "api/images/comments/bulk_delete",
+             headers=headers,
+             json={"comment_ids": [comments[0]["id"], comments[1]["id"], 100]}
+        )
+        assert response.status_code == 200, response.text
+        assert response.json() == {"deleted": 2, "images": 1, "dry_run": False}
+        page = client.get("api/images/1/comments", headers=headers).json()
+        assert page["comment_count"] == 2
+        assert [comment["id"] for comment in page["comments"]] == [comment["id"] for comment in comments[2:]]
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_bulk_delete_comments_by_image_and_window(client, get_access_token_admin):
+     with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        headers = {"Authorization": f"Bearer {get_access_token_admin}"}
+        response = client.post(
+             "api/images/comments/bulk_delete",
+             headers=headers,
+             json={"image_id": 1, "created_after": "2000-01-01T00:00:00", "created_before": "2001-01-01T00:00:00"}
+        )
+        assert response.json() == {"deleted": 0, "images": 0, "dry_run": False}
+
+        response = client.post(
+             "api/images/comments/bulk_delete",
+             headers=headers,
+             json={"image_id": 1, "created_after": "2000-01-01T00:00:00"}
+        )
+        assert response.status_code == 200, response.text
+        assert response.json() == {"deleted": 2, "images": 1, "dry_run": False}
+        page = client.get("api/images/1/comments", headers=headers).json()
+        assert page == {"comments": [], "comment_count": 0, "next_cursor": None}
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_bulk_delete_comments_by_user_uses_subqueries(client, session, get_access_token_user, get_access_token_admin,
+                                                     user_id_2, query_counter):
+     with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        for number in range(3):
+            response = client.post(
+                 "api/images/comments/",
+                 headers={"Authorization": f"Bearer {get_access_token_user}"},
+                 json={"comment": f"comment to moderate {number}", "image_id": 1}
+            )
+            assert response.status_code == 200, response.text
+        author: User = session.query(User).filter(User.email==user_id_2["email"]).first()
+        headers = {"Authorization": f"Bearer {get_access_token_admin}"}
+
+        start = query_counter.count
+        with query_counter.budget(4):
+            response = client.post("api/images/comments/bulk_delete", headers=headers, json={"user_id": author.id})
+        assert response.status_code == 200, response.text
+        assert response.json() == {"deleted": 3, "images": 1, "dry_run": False}
+        # the images are found by a subquery, not by a list of ids returned from the DELETE
+        update_statement = next(statement for statement in query_counter.statements[start:]
+                                if statement.startswith("UPDATE images_table"))
+        assert "IN (SELECT" in update_statement
+        assert client.get("api/images/1", headers=headers).json()["comment_count"] == 0
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_comment_count_follows_user_delete(client, session, user_id_3, get_access_token_admin):
+     with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        client.post("/api/auth/signup", json=user_id_3)
+        commenter: User = session.query(User).filter(User.email==user_id_3["email"]).first()
+        commenter.confirmed = True
+        session.commit()
+        login_response = client.post(
+            "/api/auth/login",
+            data={"username": user_id_3["email"], "password": user_id_3["password"]}
+        )
+        commenter_headers = {"Authorization": f"Bearer {login_response.json()['access_token']}"}
+        headers = {"Authorization": f"Bearer {get_access_token_admin}"}
+        comment_count = client.get("api/images/1", headers=headers).json()["comment_count"]
+        for number in range(2):
+            response = client.post(
+                 "api/images/comments/",
+                 headers=commenter_headers,
+                 json={"comment": f"comment of a deleted user {number}", "image_id": 1}
+            )
+            assert response.status_code == 200, response.text
+
+        response = client.delete(f"api/users/{commenter.id}", headers=headers)
+        assert response.status_code == 200, response.text
+
+        response = client.get("api/images/1", headers=headers)
+        assert response.status_code == 200, response.text
+        assert response.json()["comment_count"] == comment_count
+        comments = client.get("api/images/1/comments", headers=headers).json()["comments"]
+        assert len(comments) == comment_count
@@ -0,0 +1,92 @@
+from unittest.mock import patch
+
+import pytest
+
+from src.database.models import Image, User
+from src.services.auth import service_auth
+from src.services.feed import feed as service_feed
+from src.services.response_cache import response_cache
+
+
+"""To start the test, enter : pytest tests/test_routes/test_feed_routes.py -v
+You must be in the killer_instagram directory in the console"""
+
+
+@pytest.fixture(scope="function")
+def feed(client, fake_redis, monkeypatch):
+    monkeypatch.setattr(response_cache, "redis", fake_redis)
+    monkeypatch.setattr(response_cache, "enabled", True)
+    monkeypatch.setattr(response_cache, "redis_down_until", 0.0)
+    monkeypatch.setattr(service_feed, "redis", fake_redis)
+    monkeypatch.setattr(service_feed, "enabled", True)
+    monkeypatch.setattr(service_feed, "redis_down_until", 0.0)
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        yield service_feed
+
+
+@pytest.fixture(scope="module")
+def headers(client, user, session):
+    client.post("/api/auth/signup", json=user)
+    created_user: User = session.query(User).filter(User.email==user["email"]).first()
+    created_user.confirmed = True
+    session.commit()
+    response = client.post("/api/auth/login", data={"username": user["email"], "password": user["password"]})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture(scope="module")
+def image_ids(session):
+    owners = [User(username=f"author{number}", email=f"author{number}@example.com", password="password",
+                   confirmed=True) for number in range(2)]
+    session.add_all(owners)
+    session.flush()
+    images = [Image(user_id=owners[number % 2].id, description=f"feed {number}",
+                    image_url=f"https://example.com/feed_{number}.jpg", public_id=f"feed_{number}",
+                    file_extension="jpg") for number in range(5)]
+    session.add_all(images)
+    session.commit()
+    return [image.id for image in reversed(images)]
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_feed_returns_images_of_all_users_page_by_page(client, feed, headers, image_ids):
+    received, cursor = [], None
+    while True:
+        response = client.get("/api/feed/", params={"limit": 2, "cursor": cursor}, headers=headers)
+        assert response.status_code == 200, response.text
+        received += response.json()["images"]
+        cursor = response.json()["next_cursor"]
+        if cursor is None:
+            break
+    assert [image["id"] for image in received] == image_ids
+    assert {image["username"] for image in received} == {"author0", "author1"}
+    assert set(received[0]) == {"id", "user_id", "username", "description", "image_url", "comment_count",
+                                "upload_time"}
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_cached_page_does_not_read_images(client, feed, headers, image_ids, query_counter):
+    first = client.get("/api/feed/", params={"limit": 3}, headers=headers)
+    # only the current user and the blacklisted token are read
+    with query_counter.budget(2):
+        second = client.get("/api/feed/", params={"limit": 3}, headers=headers)
+    assert second.json() == first.json()
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_feed_without_redis(client, headers, image_ids):
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        response = client.get("/api/feed/", params={"limit": 10}, headers=headers)
+    assert response.status_code == 200, response.text
+    assert [image["id"] for image in response.json()["images"]] == image_ids
+    assert response.json()["next_cursor"] is None
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_invalid_cursor(client, headers):
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        response = client.get("/api/feed/", params={"cursor": "not a cursor"}, headers=headers)
+    assert response.status_code == 400
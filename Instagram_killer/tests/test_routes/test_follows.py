@@ -0,0 +1,118 @@
+from datetime import datetime
+from unittest.mock import patch
+
+import pytest
+
+from src.database.models import Follow, User
+from src.repository import users as repository_users
+from src.services.auth import service_auth
+
+
+"""To start the test, enter : pytest tests/test_routes/test_follows.py -v
+You must be in the killer_instagram directory in the console"""
+
+
+@pytest.fixture(scope="function")
+def no_redis():
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        yield r_mock
+
+
+@pytest.fixture(scope="module")
+def current_user_id(client, user, session):
+    client.post("/api/auth/signup", json=user)
+    created_user: User = session.query(User).filter(User.email==user["email"]).first()
+    created_user.confirmed = True
+    session.commit()
+    return created_user.id
+
+
+@pytest.fixture(scope="module")
+def headers(client, user, current_user_id):
+    response = client.post("/api/auth/login", data={"username": user["email"], "password": user["password"]})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture(scope="module")
+def user_ids(session):
+    users = [User(username=f"followed{number}", email=f"followed{number}@example.com", password="password",
+                  confirmed=True) for number in range(5)]
+    session.add_all(users)
+    session.commit()
+    return [user.id for user in users]
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_batch_follow_is_idempotent(client, no_redis, headers, current_user_id, user_ids):
+    body = {"user_ids": user_ids + [current_user_id, 10 ** 6]}
+    response = client.post("/api/users/follow", json=body, headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.json() == {"user_ids": user_ids, "following_count": 5}
+
+    response = client.post("/api/users/follow", json=body, headers=headers)
+    assert response.json() == {"user_ids": [], "following_count": 5}
+
+    response = client.get(f"/api/users/{user_ids[0]}/followers", headers=headers)
+    assert response.json()["count"] == 1
+    assert [follower["id"] for follower in response.json()["users"]] == [current_user_id]
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_following_is_listed_page_by_page(client, no_redis, headers, current_user_id, user_ids):
+    received, cursor = [], None
+    while True:
+        response = client.get(f"/api/users/{current_user_id}/following", params={"limit": 2, "cursor": cursor},
+                              headers=headers)
+        assert response.status_code == 200, response.text
+        assert response.json()["count"] == 5
+        received += response.json()["users"]
+        cursor = response.json()["next_cursor"]
+        if cursor is None:
+            break
+    # follows of one request have the same time, the newest id comes first
+    assert [followed["id"] for followed in received] == list(reversed(user_ids))
+    assert set(received[0]) == {"id", "username", "avatar", "followed_at"}
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_relationship_and_unfollow(client, no_redis, headers, current_user_id, user_ids, session):
+    # the other user follows back
+    session.add(Follow(follower_id=user_ids[1], followed_id=current_user_id, created_at=datetime.now()))
+    session.commit()
+
+    response = client.get(f"/api/users/{user_ids[1]}/relationship", headers=headers)
+    assert response.json() == {"following": True, "followed_by": True, "mutual": True}
+
+    response = client.delete(f"/api/users/{user_ids[1]}/follow", headers=headers)
+    assert response.json() == {"user_ids": [user_ids[1]], "following_count": 4}
+    response = client.delete(f"/api/users/{user_ids[1]}/follow", headers=headers)
+    assert response.json() == {"user_ids": [], "following_count": 4}
+
+    response = client.get(f"/api/users/{user_ids[1]}/relationship", headers=headers)
+    assert response.json() == {"following": False, "followed_by": True, "mutual": False}
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_follow_one_user(client, no_redis, headers, current_user_id, user_ids):
+    assert client.put(f"/api/users/{current_user_id}/follow", headers=headers).status_code == 400
+    assert client.put(f"/api/users/{10 ** 6}/follow", headers=headers).status_code == 404
+    response = client.put(f"/api/users/{user_ids[1]}/follow", headers=headers)
+    assert response.json() == {"user_ids": [user_ids[1]], "following_count": 5}
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_invalid_cursor(client, no_redis, headers, current_user_id):
+    response = client.get(f"/api/users/{current_user_id}/followers", params={"cursor": "not a cursor"},
+                          headers=headers)
+    assert response.status_code == 400
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_deleted_user_is_removed_from_follows(client, no_redis, headers, current_user_id, user_ids, session):
+    await repository_users.delete_user(user_ids[4], session)
+    response = client.get(f"/api/users/{current_user_id}/following", headers=headers)
+    assert response.json()["count"] == 4
+    assert user_ids[4] not in [followed["id"] for followed in response.json()["users"]]
+    assert session.query(Follow).filter(Follow.followed_id==user_ids[4]).count() == 0
@@ -0,0 +1,452 @@
+import sys
+from pathlib import Path
+
+path_root = Path(__file__).parent.parent
+sys.path.append(str(path_root))
+
+import pytest
+from unittest.mock import MagicMock, patch
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+from src.database.models import User, Image
+from src.services.auth import service_auth
+from src.services import tracing as service_tracing
+from src.conf.config import settings
+
+
+"""To start the test, enter : pytest tests/test_routes/test_images_routes.py -v 
+You must be in the killer_instagram directory in the console"""
+
+
+"""Fixtures:"""
+
+@pytest.fixture(scope="function")
+def get_access_token(client, user):
+    login_responce = client.post(
+            "/api/auth/login",
+            data={"username": user["email"], "password": user["password"]}
+        )
+    data = login_responce.json()
+    return data["access_token"]
+
+
+"""Tests:"""
+
+def test_signup_user(client, session, user):
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        signup_responce = client.post(
+            "/api/auth/signup",
+            json=user
+        )
+        current_user: User = session.query(User).filter(User.email==user["email"]).first()
+        current_user.confirmed = True
+        session.commit()
+        session.refresh(current_user)
+        assert signup_responce.status_code == 201, signup_responce.text
+        data = signup_responce.json()
+        created_user: dict = data["user"]
+        assert created_user["email"] == user["email"]
+        assert created_user["username"] == user["username"]
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_get_login_responce(client, user):
+    login_responce = client.post(
+            "/api/auth/login",
+            data={"username": user["email"], "password": user["password"]}
+        )
+    assert login_responce.status_code == 202, login_responce.text
+    login_responce_data = login_responce.json()
+    assert login_responce_data["token_type"] == "bearer"
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_upload_picture_ok(client, get_access_token, monkeypatch):
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        access_token: str = get_access_token
+
+        image_path = r"tests\test_routes\python_logo.jpg"
+        file = open(image_path, "rb")
+
+        cloudinary_responce = {"secure_url": "secure_url", "public_id": "public_id"}
+        mock_cloud_service = MagicMock(return_value=cloudinary_responce)
+        monkeypatch.setattr("src.routes.images.service_cloudinary.CloudImage.generate_name_image", mock_cloud_service)
+        monkeypatch.setattr("src.routes.images.service_cloudinary.CloudImage.upload_image", mock_cloud_service)
+        monkeypatch.setattr("src.routes.images.service_cloudinary.CloudImage.add_tags", mock_cloud_service)
+        
+        test_description = "test_description"
+        tag1 = "hello" 
+        tag2 = "world"
+        image_responce = client.post(
+            f"/api/images?description={test_description}&tags={tag1}&tags={tag2}",
+            headers={"Authorization": f"Bearer {access_token}"},
+            files={"file": ("python_logo.jpg", file, "python_logo.jpg")}
+        )
+        assert image_responce.status_code == 200, image_responce.text
+        data = image_responce.json()
+        image: dict = data
+        assert image["description"] == test_description
+        assert image["image_url"] == cloudinary_responce["secure_url"]
+        assert image["user_id"] == 1
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_get_image_ok(client, get_access_token):
+    image_id = 1
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        responce = client.get(
+            f"api/images/{image_id}",
+            headers={"Authorization": f"Bearer {get_access_token}"}
+        )
+        assert responce.status_code == 200, responce.text
+        data = responce.json()
+        assert data["id"] == image_id
+        assert data["description"] == "test_description"
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_get_image_query_budget(client, get_access_token, query_counter):
+    image_id = 1
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        # current user, blacklisted token and the image with its transformed links
+        with query_counter.budget(3):
+            responce = client.get(
+                f"api/images/{image_id}",
+                headers={"Authorization": f"Bearer {get_access_token}"}
+            )
+        assert responce.status_code == 200, responce.text
+        assert responce.json()["transformed_links"] == []
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_get_link_qrcode_without_links(client, get_access_token, query_counter):
+    image_id = 1
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        # current user, blacklisted token, the image and its first transformed link
+        with query_counter.budget(4):
+            responce = client.get(
+                f"api/images/get_link_qrcode/{image_id}",
+                headers={"Authorization": f"Bearer {get_access_token}"}
+            )
+        assert responce.status_code == 404, responce.text
+        assert responce.json()["detail"] == "No transformed links found for the image"
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_get_image_server_timing(client, get_access_token):
+    image_id = 1
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        responce = client.get(
+            f"api/images/{image_id}",
+            headers={"Authorization": f"Bearer {get_access_token}"}
+        )
+        assert responce.status_code == 200, responce.text
+        server_timing = responce.headers["Server-Timing"]
+        assert server_timing.startswith("db;dur=")
+        assert server_timing.endswith('desc="3 queries"')
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_get_image_traced(client, get_access_token):
+    image_id = 1
+    exporter = InMemorySpanExporter()
+    service_tracing.setup_tracing(sample_ratio=1, exporter=exporter)
+    try:
+        with patch.object(service_auth, 'r_cashe') as r_mock:
+            r_mock.get.return_value = None
+            responce = client.get(
+                f"api/images/{image_id}",
+                headers={"Authorization": f"Bearer {get_access_token}"}
+            )
+        assert responce.status_code == 200, responce.text
+        service_tracing._provider.force_flush()
+        spans = {span.name: span for span in exporter.get_finished_spans()}
+    finally:
+        service_tracing.shutdown_tracing()
+    request_span = spans["GET /api/images/{image_id}"]
+    repository_span = spans["repository.images.get_image_by_id"]
+    assert repository_span.context.trace_id == request_span.context.trace_id
+    assert "redis GET" not in spans  # redis client is mocked in tests
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_get_image_slow_query_logged(client, get_access_token, monkeypatch, caplog):
+    image_id = 1
+    monkeypatch.setattr(settings, "slow_query_threshold_ms", 0)
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        with caplog.at_level("WARNING", logger="src.database.db"):
+            responce = client.get(
+                f"api/images/{image_id}",
+                headers={"Authorization": f"Bearer {get_access_token}"}
+            )
+        assert responce.status_code == 200, responce.text
+        assert "Slow query" in caplog.text
+        assert "src.repository.images.get_image_by_id" in caplog.text
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_failed_query_start_time_dropped(session):
+    connection_info = session.connection().info
+    with pytest.raises(OperationalError):
+        session.execute(text("SELECT * FROM missing_table"))
+    session.rollback()
+    assert connection_info.get("query_start") == []
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_get_image_not_found(client, get_access_token):
+    image_id = 123
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        responce = client.get(
+            f"api/images/{image_id}",
+            headers={"Authorization": f"Bearer {get_access_token}"}
+        )
+        assert responce.status_code == 404, responce.text
+        data = responce.json()
+        assert data["detail"] == "Image not found"
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_get_images_batch_ok(client, get_access_token, query_counter):
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        single = client.get("api/images/1", headers={"Authorization": f"Bearer {get_access_token}"}).json()
+        # current user, blacklisted token and all images with their transformed links
+        with query_counter.budget(3):
+            responce = client.post(
+                "api/images/batch",
+                json={"ids": [1, 123, 1]},
+                headers={"Authorization": f"Bearer {get_access_token}"}
+            )
+        assert responce.status_code == 200, responce.text
+        assert responce.json() == {"images": {"1": single, "123": None}}
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_get_images_batch_too_many(client, get_access_token):
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        responce = client.post(
+            "api/images/batch",
+            json={"ids": list(range(1, 102))},
+            headers={"Authorization": f"Bearer {get_access_token}"}
+        )
+        assert responce.status_code == 422, responce.text
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_update_image_description(client, get_access_token, monkeypatch):
+    image_id = 1
+    new_description = "new_description"
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        mock_cloud_service = MagicMock(return_value=None)
+        monkeypatch.setattr("src.routes.images.service_cloudinary.CloudImage.update_image_description_cloudinary", mock_cloud_service)    
+        body = {"new_description": "new_description"}
+        image_responce = client.put(
+            f"api/images/{image_id}",
+            headers={"Authorization": f"Bearer {get_access_token}"},
+            json=body            
+        )
+        assert image_responce.status_code == 200, image_responce.text
+        data = image_responce.json()
+        assert data["description"] == new_description
+        assert data["id"] == image_id
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_find_images_by_keyword_ok(client, get_access_token):
+    image_id = 1
+    keyword = "new"
+    date = True
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        response = client.get(
+            f"api/images/find/by_keyword?keyword={keyword}&date={date}",
+            headers={"Authorization": f"Bearer {get_access_token}"}
+        )
+        assert response.status_code == 200, response.text
+        data = response.json()
+        image = data[0]
+        assert image['id'] == image_id
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_find_images_by_keyword_not_found(client, get_access_token):
+    keyword = "1"
+    date = True
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        response = client.get(
+            f"api/images/find/by_keyword?keyword={keyword}&date={date}",
+            headers={"Authorization": f"Bearer {get_access_token}"}
+        )
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert data == []
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_find_images_by_tag_ok(client, get_access_token):
+    image_id = 1
+    tag = "hello"
+    date = True
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        response = client.get(
+            f"api/images/find/by_tag?tag={tag}&date={date}",
+            headers={"Authorization": f"Bearer {get_access_token}"}
+        )
+        assert response.status_code == 200, response.text
+        data = response.json()
+        image = data[0]
+        assert image['id'] == image_id
+
+
+
+def test_find_images_by_tag_query_budget(client, get_access_token, query_counter):
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        # current user, tag and the images, rows are never lazy loaded one by one
+        with query_counter.budget(3):
+            response = client.get(
+                "api/images/find/by_tag?tag=hello&date=True",
+                headers={"Authorization": f"Bearer {get_access_token}"}
+            )
+        assert response.status_code == 200, response.text
+
+
+
+def test_find_images_by_tag_not_found(client, get_access_token):
+    image_id = 1
+    tag = "1"
+    date = True
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        response = client.get(
+            f"api/images/find/by_tag?tag={tag}&date={date}",
+            headers={"Authorization": f"Bearer {get_access_token}"}
+        )
+        assert response.status_code == 404, response.text
+        data = response.json()
+        assert data["detail"] == "There are no images with this tag"
+
+def test_delete_image(client, get_access_token, monkeypatch):
+    image_id = 1
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None    
+        mock_cloud_service = MagicMock(return_value=None)
+        monkeypatch.setattr("src.routes.images.service_cloudinary.CloudImage.delete_image", mock_cloud_service)
+        responce = client.delete(
+            f"api/images/{image_id}",
+            headers={"Authorization": f"Bearer {get_access_token}"} 
+        )
+        assert responce.status_code == 202, responce.text
+        data = responce.json()
+        assert data["message"] == "Image deleted successfully"
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_delete_image_not_found(client, get_access_token, session, monkeypatch):
+    image_id = 1
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None    
+        mock_cloud_service = MagicMock(return_value=None)
+        monkeypatch.setattr("src.routes.images.service_cloudinary.CloudImage.delete_image", mock_cloud_service)
+        responce = client.delete(
+            f"api/images/{image_id}",
+            headers={"Authorization": f"Bearer {get_access_token}"} 
+        )
+        image: None = session.query(Image).filter(Image.id==image_id).first()
+        print(image)
+        assert responce.status_code == 404, responce.text
+        data = responce.json()
+        assert data["detail"] == "Image not found"
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def fake_upload_image(file, public_id, tags=None):
+    if "broken" in public_id:
+        raise ConnectionError("Cloudinary timed out")
+    return {"secure_url": f"https://res.cloudinary.com/demo/{public_id}", "public_id": public_id}
+
+
+def album_files(*names):
+    return [("files", (name, b"image of " + name.encode(), "image/jpeg")) for name in names]
+
+
+def test_upload_album_partial_failure(client, get_access_token, session, monkeypatch, query_counter):
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        mock_upload = MagicMock(side_effect=fake_upload_image)
+        monkeypatch.setattr("src.routes.images.service_cloudinary.CloudImage.upload_image", mock_upload)
+        # current user, blacklisted token, the images, tags, new tags and links of the images, all in one transaction
+        with query_counter.budget(6):
+            responce = client.post(
+                "/api/images/album?description=holiday&tags=sea&tags=summer",
+                headers={"Authorization": f"Bearer {get_access_token}"},
+                files=album_files("sea.jpg", "broken.jpg", "sea.jpg", "sun.png")
+            )
+        assert responce.status_code == 207, responce.text
+        data = responce.json()
+        assert (data["uploaded"], data["failed"]) == (2, 2)
+        assert [result["filename"] for result in data["images"]] == ["sea.jpg", "broken.jpg", "sea.jpg", "sun.png"]
+        assert data["images"][1]["error"] == "Upload failed: Cloudinary timed out"
+        assert data["images"][2]["error"] == "Another file of the album has the same name"
+        assert mock_upload.call_count == 3
+        assert all(call.args[2] == ["sea", "summer"] for call in mock_upload.call_args_list)
+
+        for result in (data["images"][0], data["images"][3]):
+            assert result["error"] is None
+            image: Image = session.query(Image).filter(Image.id==result["image"]["id"]).first()
+            assert image.description == "holiday"
+            assert image.image_url == result["image"]["image_url"]
+            assert sorted(tag.tag for tag in image.tags) == ["sea", "summer"]
+        assert image.file_extension == "png"
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_upload_album_too_many_files(client, get_access_token, monkeypatch):
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        monkeypatch.setattr(settings, "album_max_files", 2)
+        responce = client.post(
+            "/api/images/album?description=holiday&tags=sea",
+            headers={"Authorization": f"Bearer {get_access_token}"},
+            files=album_files("one.jpg", "two.jpg", "three.jpg")
+        )
+        assert responce.status_code == 400, responce.text
+        assert responce.json()["detail"] == "Too many files. Maximum is 2."
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_upload_album_database_error(client, get_access_token, session, monkeypatch):
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        images_before = session.query(Image).count()
+        mock_delete = MagicMock(return_value=None)
+        monkeypatch.setattr("src.routes.images.service_cloudinary.CloudImage.upload_image",
+                            MagicMock(side_effect=fake_upload_image))
+        monkeypatch.setattr("src.routes.images.service_cloudinary.CloudImage.delete_image", mock_delete)
+        monkeypatch.setattr("src.services.album.repository_images.create_images",
+                            MagicMock(side_effect=RuntimeError("database is locked")))
+        responce = client.post(
+            "/api/images/album?description=holiday&tags=sea",
+            headers={"Authorization": f"Bearer {get_access_token}"},
+            files=album_files("first.jpg", "second.jpg")
+        )
+        assert responce.status_code == 500, responce.text
+        # files stored before the transaction failed are not left on Cloudinary
+        assert sorted(call.args[0].split("/")[-1].split(",")[0] for call in mock_delete.call_args_list) == \
+            ["first.jpg", "second.jpg"]
+        assert session.query(Image).count() == images_before
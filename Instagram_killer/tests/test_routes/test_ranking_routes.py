@@ -0,0 +1,100 @@
+from unittest.mock import patch
+
+import pytest
+
+from src.database.models import Image, User
+from src.services.auth import service_auth
+from src.services.ranking import ranking as service_ranking
+
+
+"""To start the test, enter : pytest tests/test_routes/test_ranking_routes.py -v
+You must be in the killer_instagram directory in the console"""
+
+
+@pytest.fixture(scope="function")
+def ranking(client, fake_redis, monkeypatch):
+    monkeypatch.setattr(service_ranking, "redis", fake_redis)
+    monkeypatch.setattr(service_ranking, "enabled", True)
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        yield service_ranking
+
+
+@pytest.fixture(scope="module")
+def headers(client, user, session):
+    client.post("/api/auth/signup", json=user)
+    created_user: User = session.query(User).filter(User.email==user["email"]).first()
+    created_user.confirmed = True
+    session.commit()
+    response = client.post("/api/auth/login", data={"username": user["email"], "password": user["password"]})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture(scope="module")
+def image_ids(session):
+    owner = User(username="photographer", email="photographer@example.com", password="password", confirmed=True)
+    session.add(owner)
+    session.flush()
+    images = [Image(user_id=owner.id, description=f"top {number}", image_url=f"https://example.com/top_{number}.jpg",
+                    public_id=f"top_{number}", file_extension="jpg") for number in range(3)]
+    session.add_all(images)
+    session.commit()
+    return [image.id for image in images]
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_rated_images_are_ranked(client, ranking, headers, image_ids):
+    for image_id, stars in zip(image_ids, [3, 5]):
+        response = client.post("/api/images/rating/", json={"image_id": image_id, "rating": stars}, headers=headers)
+        assert response.status_code == 200, response.text
+
+    received, cursor = [], None
+    while True:
+        response = client.get("/api/images/top", params={"sort": "rated", "limit": 1, "cursor": cursor},
+                              headers=headers)
+        assert response.status_code == 200, response.text
+        received += response.json()["images"]
+        cursor = response.json()["next_cursor"]
+        if cursor is None:
+            break
+    assert [image["image"]["id"] for image in received] == [image_ids[1], image_ids[0]]
+    assert [(image["rating"], image["rating_count"]) for image in received] == [(5, 1), (3, 1)]
+    assert received[0]["image"]["username"] == "photographer"
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_top_without_redis(client, headers, image_ids):
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        response = client.get("/api/images/top", headers=headers)
+    assert response.status_code == 200, response.text
+    assert [image["image"]["id"] for image in response.json()["images"]] == [image_ids[1], image_ids[0]]
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_top_when_redis_fails(client, ranking, headers, fake_redis):
+    fake_redis.down = True
+    response = client.get("/api/images/top", headers=headers)
+    assert response.status_code == 503
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_top_while_another_request_compacts(client, ranking, headers, fake_redis):
+    fake_redis.data["top:compaction"] = b"another process"
+    response = client.get("/api/images/top", headers=headers)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_invalid_cursor(client, ranking, headers):
+    response = client.get("/api/images/top", params={"cursor": "bm90IGEgY3Vyc29y"}, headers=headers)
+    assert response.status_code == 400
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_unknown_ranking(client, headers):
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        response = client.get("/api/images/top", params={"sort": "newest"}, headers=headers)
+    assert response.status_code == 422
@@ -0,0 +1,53 @@
+import pytest
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from src.services.rate_limit import Limit, limiter
+
+
+"""To start the test, enter : pytest tests/test_routes/test_rate_limit_routes.py -v
+You must be in the killer_instagram directory in the console"""
+
+
+@pytest.fixture(scope="function")
+def limits(client, monkeypatch):
+    async def redis_is_down(*args, **kwargs):
+        raise RedisConnectionError("Connection refused")
+
+    monkeypatch.setattr(limiter, "enabled", True)
+    monkeypatch.setattr(limiter, "redis_script", redis_is_down)
+    monkeypatch.setattr(limiter, "redis_down_until", 0.0)
+    monkeypatch.setattr(limiter, "limits", {})
+    limiter.local.clear()
+    yield limiter.limits
+    limiter.local.clear()
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_login_is_limited(client, limits):
+    limits["login"] = Limit(2, 60, "ip")
+    form = {"username": "nobody@example.com", "password": "password"}
+    responses = [client.post("/api/auth/login", data=form) for _ in range(3)]
+    assert [response.status_code for response in responses] == [401, 401, 429]
+    assert responses[2].json()["detail"] == "Too many requests, try again later"
+    assert responses[2].headers["X-RateLimit-Limit"] == "2"
+    assert responses[2].headers["X-RateLimit-Remaining"] == "0"
+    assert 1 <= int(responses[2].headers["Retry-After"]) <= 30
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_routes_with_the_same_limit_share_it(client, limits):
+    limits["email_request"] = Limit(1, 60, "ip")
+    body = {"email": "nobody@example.com"}
+    response = client.post("/api/auth/request_email", json=body)
+    assert response.status_code == 202, response.text
+    assert (response.headers["X-RateLimit-Limit"], response.headers["X-RateLimit-Remaining"]) == ("1", "0")
+    assert client.post("/api/auth/reset_password", json=body).status_code == 429
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_limit_can_be_turned_off(client, limits):
+    limits["login"] = Limit(0, 60, "ip")
+    form = {"username": "nobody@example.com", "password": "password"}
+    responses = [client.post("/api/auth/login", data=form) for _ in range(3)]
+    assert [response.status_code for response in responses] == [401, 401, 401]
+    assert "X-RateLimit-Limit" not in responses[0].headers
@@ -12,7 +12,7 @@ from src.services.auth import service_auth
 
 
 
-"""To start the test, enter : pytest tests/test_routes/test_rating.py -v 
+"""To start the test, enter : pytest tests/test_routes/test_rating_routes.py -v 
 You must be in the killer_instagram directory in the console"""
 
 
@@ -31,11 +31,9 @@ rating_id_not_found = 99
 """Fixtures:"""
 
 @pytest.fixture(scope="function")
-def signup_admin(client, session, user, monkeypatch):
+def signup_admin(client, session, user):
     with patch.object(service_auth, 'r_cashe') as r_mock:
         r_mock.get.return_value = None
-        mock_send_email = MagicMock()
-        monkeypatch.setattr("src.routes.auth.service_email.send_email", mock_send_email)
         signup_responce = client.post(
             "/api/auth/signup",
             json=user
@@ -46,11 +44,9 @@ def signup_admin(client, session, user, monkeypatch):
 #-----------------------------------------------------------------------------------------------------------------------------------------------
 
 @pytest.fixture(scope="function")
-def signup_user(client, session, user_id_2, monkeypatch):
+def signup_user(client, session, user_id_2):
     with patch.object(service_auth, 'r_cashe') as r_mock:
         r_mock.get.return_value = None
-        mock_send_email = MagicMock()
-        monkeypatch.setattr("src.routes.auth.service_email.send_email", mock_send_email)
         signup_responce = client.post(
             "/api/auth/signup",
             json=user_id_2
@@ -0,0 +1,93 @@
+from unittest.mock import patch
+
+import pytest
+
+from src.database.models import Image, User
+from src.services.auth import service_auth
+from src.services.response_cache import response_cache
+
+
+"""To start the test, enter : pytest tests/test_routes/test_response_cache_routes.py -v
+You must be in the killer_instagram directory in the console"""
+
+
+@pytest.fixture(scope="function")
+def cache(client, fake_redis, monkeypatch):
+    monkeypatch.setattr(response_cache, "redis", fake_redis)
+    monkeypatch.setattr(response_cache, "enabled", True)
+    monkeypatch.setattr(response_cache, "redis_down_until", 0.0)
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        yield response_cache
+
+
+@pytest.fixture(scope="module")
+def headers(client, user, session):
+    client.post("/api/auth/signup", json=user)
+    created_user: User = session.query(User).filter(User.email==user["email"]).first()
+    created_user.confirmed = True
+    session.commit()
+    response = client.post("/api/auth/login", data={"username": user["email"], "password": user["password"]})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture(scope="module")
+def image(session):
+    owner = User(username="owner", email="owner@example.com", password="password", confirmed=True)
+    session.add(owner)
+    session.flush()
+    image = Image(user_id=owner.id, description="cached", image_url="https://example.com/cached.jpg",
+                  public_id="cached", file_extension="jpg")
+    session.add(image)
+    session.commit()
+    return image
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_cached_image_is_served_without_the_database(client, cache, headers, image, query_counter):
+    response = client.get(f"/api/images/{image.id}", headers=headers)
+    assert response.status_code == 200, response.text
+    etag = response.headers["ETag"]
+
+    # only the current user and the blacklisted token are read
+    with query_counter.budget(2):
+        cached = client.get(f"/api/images/{image.id}", headers=headers)
+    with query_counter.budget(2):
+        not_modified = client.get(f"/api/images/{image.id}", headers={**headers, "If-None-Match": etag})
+    assert (cached.status_code, cached.json()) == (200, response.json())
+    assert cached.headers["ETag"] == etag
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_comment_changes_image_and_profile_of_its_owner(client, cache, headers, image):
+    image_etag = client.get(f"/api/images/{image.id}", headers=headers).headers["ETag"]
+    # the first response of a profile remembers the id of the username
+    client.get("/api/users/owner", headers=headers)
+    profile = client.get("/api/users/owner", headers=headers)
+    comments = profile.json()["quantity_of_comments"]
+
+    response = client.post("/api/images/comments/", json={"comment": "nice", "image_id": image.id}, headers=headers)
+    assert response.status_code == 200, response.text
+
+    response = client.get(f"/api/images/{image.id}", headers={**headers, "If-None-Match": image_etag})
+    assert response.status_code == 200
+    assert response.json()["comment_count"] == comments + 1
+    response = client.get("/api/users/owner", headers={**headers, "If-None-Match": profile.headers["ETag"]})
+    assert response.status_code == 200
+    assert response.json()["quantity_of_comments"] == comments + 1
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_updated_comment_is_not_served_from_the_cache(client, cache, headers, image):
+    comment_id = client.post("/api/images/comments/", json={"comment": "first", "image_id": image.id},
+                             headers=headers).json()["id"]
+    etag = client.get(f"/api/images/comments/{comment_id}", headers=headers).headers["ETag"]
+    response = client.put(f"/api/images/comments/{comment_id}", json={"new_comment": "second"}, headers=headers)
+    assert response.status_code == 200, response.text
+
+    response = client.get(f"/api/images/comments/{comment_id}", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["comment"] == "second"
+    assert response.headers["ETag"] != etag
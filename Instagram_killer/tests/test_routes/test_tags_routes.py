@@ -0,0 +1,161 @@
+import sys
+from pathlib import Path
+
+path_root = Path(__file__).parent.parent
+sys.path.append(str(path_root))
+
+import pytest
+from unittest.mock import MagicMock, patch
+from sqlalchemy.orm import sessionmaker
+
+from src.database.models import User
+from src.services.auth import service_auth
+from src.services.tags_index import tag_index
+
+
+"""To start the test, enter : pytest tests/test_routes/test_tags_routes.py -v 
+You must be in the killer_instagram directory in the console"""
+
+IMAGE_PATH = Path(__file__).parent / "python_logo.jpg"
+
+
+"""Fixtures:"""
+
+@pytest.fixture(scope="module", autouse=True)
+def reset_tag_index():
+    tag_index.loaded = False
+    yield
+    tag_index.loaded = False
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.fixture(scope="function")
+def get_access_token(client, user):
+    login_responce = client.post(
+            "/api/auth/login",
+            data={"username": user["email"], "password": user["password"]}
+        )
+    data = login_responce.json()
+    return data["access_token"]
+
+
+"""Tests:"""
+
+def test_signup_user(client, session, user):
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        signup_responce = client.post(
+            "/api/auth/signup",
+            json=user
+        )
+        current_user: User = session.query(User).filter(User.email==user["email"]).first()
+        current_user.confirmed = True
+        session.commit()
+        assert signup_responce.status_code == 201, signup_responce.text
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_autocomplete_tags_after_upload(client, get_access_token, monkeypatch):
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        file = open(IMAGE_PATH, "rb")
+
+        cloudinary_responce = {"secure_url": "secure_url", "public_id": "public_id"}
+        mock_cloud_service = MagicMock(return_value=cloudinary_responce)
+        monkeypatch.setattr("src.routes.images.service_cloudinary.CloudImage.generate_name_image", mock_cloud_service)
+        monkeypatch.setattr("src.routes.images.service_cloudinary.CloudImage.upload_image", mock_cloud_service)
+        monkeypatch.setattr("src.routes.images.service_cloudinary.CloudImage.add_tags", mock_cloud_service)
+
+        image_responce = client.post(
+            "/api/images?description=test_description&tags=summer&tags=sun&tags=sea",
+            headers={"Authorization": f"Bearer {get_access_token}"},
+            files={"file": ("python_logo.jpg", file, "python_logo.jpg")}
+        )
+        assert image_responce.status_code == 200, image_responce.text
+
+        responce = client.get(
+            "/api/tags/autocomplete?prefix=su",
+            headers={"Authorization": f"Bearer {get_access_token}"}
+        )
+        assert responce.status_code == 200, responce.text
+        assert responce.json() == ["summer", "sun"]
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_suggest_tags_by_usage(client, get_access_token, monkeypatch):
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        file = open(IMAGE_PATH, "rb")
+
+        cloudinary_responce = {"secure_url": "secure_url", "public_id": "public_id"}
+        mock_cloud_service = MagicMock(return_value=cloudinary_responce)
+        monkeypatch.setattr("src.routes.images.service_cloudinary.CloudImage.generate_name_image", mock_cloud_service)
+        monkeypatch.setattr("src.routes.images.service_cloudinary.CloudImage.upload_image", mock_cloud_service)
+        monkeypatch.setattr("src.routes.images.service_cloudinary.CloudImage.add_tags", mock_cloud_service)
+
+        image_responce = client.post(
+            "/api/images?description=test_description&tags=sun",
+            headers={"Authorization": f"Bearer {get_access_token}"},
+            files={"file": ("python_logo.jpg", file, "python_logo.jpg")}
+        )
+        assert image_responce.status_code == 200, image_responce.text
+
+        responce = client.get(
+            "/api/tags/suggest?prefix=s&limit=2",
+            headers={"Authorization": f"Bearer {get_access_token}"}
+        )
+        assert responce.status_code == 200, responce.text
+        assert responce.json() == [{"tag": "sun", "count": 2}, {"tag": "sea", "count": 1}]
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_suggest_tags_after_delete(client, get_access_token, monkeypatch):
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        monkeypatch.setattr("src.routes.images.service_cloudinary.CloudImage.delete_image", MagicMock(return_value=None))
+        responce = client.delete(
+            "/api/images/2",
+            headers={"Authorization": f"Bearer {get_access_token}"}
+        )
+        assert responce.status_code == 202, responce.text
+
+        responce = client.get(
+            "/api/tags/suggest?prefix=su",
+            headers={"Authorization": f"Bearer {get_access_token}"}
+        )
+        assert responce.status_code == 200, responce.text
+        assert responce.json() == [{"tag": "summer", "count": 1}, {"tag": "sun", "count": 1}]
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_stale_index_is_reloaded_after_response(client, session, get_access_token, monkeypatch):
+    monkeypatch.setattr("src.services.tags_index.SessionLocal", sessionmaker(bind=session.get_bind()))
+    tag_index.load([("sun", 100)])
+    tag_index.loaded_at -= 10 ** 6
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        responce = client.get(
+            "/api/tags/suggest?prefix=su",
+            headers={"Authorization": f"Bearer {get_access_token}"}
+        )
+        assert responce.status_code == 200, responce.text
+        assert responce.json() == [{"tag": "sun", "count": 100}]
+        assert tag_index.refreshing is False
+
+        responce = client.get(
+            "/api/tags/suggest?prefix=su",
+            headers={"Authorization": f"Bearer {get_access_token}"}
+        )
+        assert responce.status_code == 200, responce.text
+        assert responce.json() == [{"tag": "summer", "count": 1}, {"tag": "sun", "count": 1}]
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_autocomplete_tags_empty_prefix(client, get_access_token):
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        responce = client.get(
+            "/api/tags/autocomplete?prefix=",
+            headers={"Authorization": f"Bearer {get_access_token}"}
+        )
+        assert responce.status_code == 422, responce.text
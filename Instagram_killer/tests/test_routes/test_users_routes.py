@@ -0,0 +1,240 @@
+import csv
+import io
+import json
+import sys
+from pathlib import Path
+
+path_root = Path(__file__).parent.parent
+sys.path.append(str(path_root))
+
+import pytest
+from unittest.mock import MagicMock, patch
+
+from src.database.models import Image, Rating, User
+from src.services.auth import service_auth
+
+
+"""To run tests, enter: pytest tests/test_routes/test_users_routes.py -v
+in the killer_instagram directory in the console"""
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+"""Fixtures:"""
+
+@pytest.fixture(scope="function")
+def access_token(client, user, session):
+    signup_response = client.post(
+        "/api/auth/signup",
+        json=user,
+    )
+    created_user: User = session.query(User).filter(User.email==user["email"]).first()
+    created_user.confirmed = True
+    session.commit()
+    session.refresh(created_user)
+    login_response = client.post(
+        "/api/auth/login",
+        data={"username": user["email"], "password": user["password"]},
+    )
+    data = login_response.json()
+    access_token = data["access_token"]
+    return access_token
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.fixture(scope="function")
+def no_email_token():
+    data = {"sub": "wrong_email"}
+    token = service_auth.sync_create_access_token(data=data)
+    return token
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+"""Tests:"""
+
+def test_read_users_me_ok(client, access_token, user):
+     with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        response = client.get(
+            "/api/users/me",
+            headers={"Authorization": f"Bearer {access_token}"}
+        ) 
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert data["username"] == user["username"]
+        assert data["email"] == user["email"]
+        assert "id" in data
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_read_users_me_no_user(client, no_email_token):
+     with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        response = client.get(
+            "/api/users/me",
+            headers={"Authorization": f"Bearer {no_email_token}"}
+        ) 
+        assert response.status_code == 401, response.text
+        data = response.json()
+        assert data["detail"] == "Could not validate credentials"
+        
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_update_avatar_no_user(client, no_email_token, monkeypatch):
+    mock_cloud_service = MagicMock(return_value="image_url")
+    monkeypatch.setattr("src.routes.users.service_cloudinary.CloudImage.generate_name_avatar", mock_cloud_service)
+    monkeypatch.setattr("src.routes.users.service_cloudinary.CloudImage.upload_avatar", mock_cloud_service)
+    monkeypatch.setattr("src.routes.users.service_cloudinary.CloudImage.get_url", mock_cloud_service)
+    image_path = r"tests\test_routes\python_logo.jpg"
+    file = open(image_path, "rb")
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        response = client.patch(
+        "api/users/avatar",
+        files={"file": ("filename", file, "python_logo.jpg")},
+        headers={"Authorization": f"Bearer {no_email_token}"}
+    )
+    assert response.status_code == 401, response.text
+    data = response.json()
+    assert data["detail"] == "Could not validate credentials"
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_update_avatar_ok(client, access_token, monkeypatch):
+    new_avatar = "image_url"
+    mock_cloud_service = MagicMock(return_value=new_avatar)
+    monkeypatch.setattr("src.routes.users.service_cloudinary.CloudImage.generate_name_avatar", mock_cloud_service)
+    monkeypatch.setattr("src.routes.users.service_cloudinary.CloudImage.upload_avatar", mock_cloud_service)
+    monkeypatch.setattr("src.routes.users.service_cloudinary.CloudImage.get_url", mock_cloud_service)
+    image_path = r"tests\test_routes\python_logo.jpg"
+    file = open(image_path, "rb")
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        response = client.patch(
+        "api/users/avatar",
+        files={"file": ("filename", file, "python_logo.jpg")},
+        headers={"Authorization": f"Bearer {access_token}"}
+    )
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["avatar"] == new_avatar
+    assert "id" in data
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_get_user_profile_stats(client, session, access_token, user, query_counter):
+    owner: User = session.query(User).filter(User.email==user["email"]).first()
+    images = [Image(user_id=owner.id, description="test", image_url="url", public_id=f"profile_{number}",
+                    file_extension="jpg", comment_count=number) for number in range(1, 3)]
+    other = User(username="other_user", email="other@example.com", password="password")
+    session.add_all(images + [other])
+    session.flush()
+    other_image = Image(user_id=other.id, description="other", image_url="url", public_id="other",
+                        file_extension="jpg", comment_count=7)
+    session.add(other_image)
+    session.flush()
+    session.add_all([Rating(rating=2, image_id=other_image.id, user_id=owner.id),
+                     Rating(rating=4, image_id=images[0].id, user_id=owner.id),
+                     Rating(rating=5, image_id=images[0].id, user_id=owner.id),
+                     Rating(rating=1, image_id=images[1].id, user_id=owner.id)])
+    session.commit()
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        # current user, blacklisted token and the user with his stats
+        with query_counter.budget(3):
+            response = client.get(
+                f"/api/users/{user['username']}",
+                headers={"Authorization": f"Bearer {access_token}"}
+            )
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert data["username"] == user["username"]
+        assert data["quantity_of_loaded_images"] == 2
+        assert data["quantity_of_comments"] == 3
+        assert data["quantity_of_ratings"] == 3
+        assert data["average_rating"] == 3.33
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_get_user_profile_not_modified(client, access_token, user):
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        headers = {"Authorization": f"Bearer {access_token}"}
+        response = client.get(f"/api/users/{user['username']}", headers=headers)
+        etag = response.headers["ETag"]
+        assert response.headers["Cache-Control"] == "private, no-cache"
+
+        response = client.get(f"/api/users/{user['username']}", headers={**headers, "If-None-Match": etag})
+        assert response.status_code == 304, response.text
+        assert response.content == b""
+        assert response.headers["ETag"] == etag
+
+        response = client.get(f"/api/users/{user['username']}", headers={**headers, "If-None-Match": '"stale"'})
+        assert response.status_code == 200, response.text
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_get_user_profile_not_found(client, access_token):
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        response = client.get(
+            "/api/users/nobody",
+            headers={"Authorization": f"Bearer {access_token}"}
+        )
+        assert response.status_code == 409, response.text
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_get_all_usernames_pages(client, access_token, user):
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        headers = {"Authorization": f"Bearer {access_token}"}
+        response = client.get("/api/users/", params={"limit": 1}, headers=headers)
+        assert response.status_code == 200, response.text
+        first_page = response.json()
+        assert first_page["users"] == [{"id": 1, "username": user["username"]}]
+        assert first_page["next_cursor"]
+
+        response = client.get("/api/users/", params={"limit": 1, "cursor": first_page["next_cursor"]}, headers=headers)
+        second_page = response.json()
+        assert second_page == {"users": [{"id": 2, "username": "other_user"}], "next_cursor": None}
+
+        response = client.get("/api/users/", params={"cursor": "broken"}, headers=headers)
+        assert response.status_code == 400, response.text
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_export_users_ndjson(client, access_token, user):
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        response = client.get("/api/users/export", headers={"Authorization": f"Bearer {access_token}"})
+        assert response.status_code == 200, response.text
+        assert response.headers["content-type"] == "application/x-ndjson"
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert [row["username"] for row in rows] == [user["username"], "other_user"]
+        assert set(rows[0]) == {"id", "username", "email", "role", "confirmed", "banned", "created_at"}
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_export_users_csv(client, access_token, user):
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        response = client.get("/api/users/export", params={"format": "csv"},
+                              headers={"Authorization": f"Bearer {access_token}"})
+        assert response.status_code == 200, response.text
+        assert response.headers["content-disposition"] == 'attachment; filename="users.csv"'
+        rows = list(csv.DictReader(io.StringIO(response.text)))
+        assert [row["email"] for row in rows] == [user["email"], "other@example.com"]
+        assert "password" not in rows[0]
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_export_users_forbidden(client, session, user_id_2):
+    client.post("/api/auth/signup", json=user_id_2)
+    created_user: User = session.query(User).filter(User.email==user_id_2["email"]).first()
+    created_user.confirmed = True
+    session.commit()
+    token = client.post(
+        "/api/auth/login",
+        data={"username": user_id_2["email"], "password": user_id_2["password"]},
+    ).json()["access_token"]
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        response = client.get("/api/users/export", headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 403, response.text
@@ -1,12 +1,13 @@
 import trio
 import pytest
-from unittest.mock import MagicMock, patch
+from unittest.mock import patch
 from fastapi import HTTPException
 
+from src.database.models import EmailOutbox
 from src.services.auth import service_auth
 
 
-"""To start the test, enter : pytest tests/test_services/test_auth.py -v 
+"""To start the test, enter : pytest tests/test_services/test_auth_service.py -v 
 You must be in the killer_instagram directory in the console"""
 
 
@@ -28,9 +29,7 @@ def test_get_password_hash_verify_password_not_ok():
 #-----------------------------------------------------------------------------------------------------------------------------------------------    
 
 @pytest.mark.trio
-async def test_create_access_token_get_current_user_ok(client, user, session, monkeypatch):
-    mock_send_email = MagicMock()
-    monkeypatch.setattr("src.routes.auth.send_email", mock_send_email)
+async def test_create_access_token_get_current_user_ok(client, user, session):
     with patch.object(service_auth, 'r_cashe') as r_mock:
         r_mock.get.return_value = None
         responce = client.post(
@@ -38,6 +37,8 @@ async def test_create_access_token_get_current_user_ok(client, user, session, mo
             json=user
         )
         data = responce.json()
+        # the confirmation email is not sent by the request, it waits in the outbox for the worker
+        assert session.query(EmailOutbox).filter(EmailOutbox.email==user["email"]).count() == 1
         data_for_token = {"sub": data["user"]["email"]}
         access_token = await service_auth.create_access_token(data=data_for_token)
         current_user = await service_auth.get_current_user(token=access_token, db=session)
@@ -0,0 +1,103 @@
+import re
+from time import perf_counter
+
+import pytest
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from src.services.ban_list import BanList, CIDRSet, UserAgentMatcher, trie_regex
+
+
+"""To start the test, enter : pytest tests/test_services/test_ban_list_service.py -v
+You must be in the killer_instagram directory in the console"""
+
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_cidr_set():
+    networks = CIDRSet(["10.0.0.0/8", "192.168.1.7", "192.168.1.8/31", "2001:db8::/32", "not a network"])
+    assert "10.255.255.255" in networks
+    assert "192.168.1.9" in networks
+    assert "2001:db8:ffff::1" in networks
+    # IPv4 clients of a dual stack server come as IPv4-mapped IPv6 addresses
+    assert "::ffff:10.1.2.3" in networks
+    for address in ("11.0.0.0", "192.168.1.6", "192.168.1.10", "2001:db9::", "testclient", ""):
+        assert address not in networks
+    assert networks.invalid == ["not a network"]
+    # 192.168.1.7 and 192.168.1.8/31 are merged into one interval
+    assert len(networks) == 3
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_cidr_set_merges_overlapping_networks():
+    networks = CIDRSet(["10.0.0.0/24", "10.0.0.128/25", "10.0.1.0/24", "10.0.3.0/24"])
+    assert len(networks) == 2
+    assert "10.0.1.255" in networks
+    assert "10.0.2.0" not in networks
+    assert "10.0.3.0" in networks
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_trie_regex_finds_the_same_words_as_a_plain_search():
+    words = ["bot", "botnet", "crawler", "craw", "spider", "sp[i]der", "python-requests", "a.b"]
+    regex = re.compile(trie_regex(words))
+    for text in ["googlebot/2.1", "spydercrawl", "sp[i]der", "python-requests/2.31", "axb", "a.b", "Mozilla/5.0"]:
+        assert bool(regex.search(text)) == any(word in text for word in words), text
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_user_agent_matcher():
+    matcher = UserAgentMatcher(["EvilBot", "re:^curl/", "re:([", "  "])
+    assert matcher.matches("Mozilla/5.0 (compatible; evilbot/1.0)")
+    assert matcher.matches("curl/8.0.1")
+    assert not matcher.matches("Mozilla/5.0 curl/8.0.1")
+    assert not matcher.matches("Mozilla/5.0")
+    assert matcher.invalid == ["re:(["]
+    assert len(matcher) == 2
+    assert not UserAgentMatcher().matches("curl/8.0.1")
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_lists_are_reloaded_when_the_version_changes(fake_redis):
+    ban_list = BanList(fake_redis)
+    assert await ban_list.reload()
+    assert ban_list.check("203.0.113.7", "Mozilla/5.0") is None
+    assert not await ban_list.reload()
+
+    await ban_list.change("add", "ip", ["203.0.113.0/24"])
+    await ban_list.change("add", "user_agent", ["EvilBot"])
+    assert await ban_list.reload()
+    assert ban_list.check("203.0.113.7", "Mozilla/5.0") == "ip"
+    assert ban_list.check("198.51.100.1", "EvilBot/1.0") == "user_agent"
+    assert ban_list.check("198.51.100.1", None) is None
+
+    await ban_list.change("remove", "ip", ["203.0.113.0/24"])
+    assert await ban_list.reload()
+    assert ban_list.check("203.0.113.7", "Mozilla/5.0") is None
+    with pytest.raises(ValueError):
+        await ban_list.change("add", "ip", ["203.0.113.0/33"])
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_last_lists_are_kept_while_redis_is_down(fake_redis):
+    ban_list = BanList(fake_redis)
+    await ban_list.change("add", "ip", ["203.0.113.0/24"])
+    await ban_list.reload()
+    fake_redis.down = True
+    with pytest.raises(RedisConnectionError):
+        await ban_list.reload()
+    assert ban_list.check("203.0.113.7", None) == "ip"
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_check_of_a_large_list_takes_microseconds(fake_redis):
+    networks = [f"{10 + number // 65536}.{number // 256 % 256}.{number % 256}.0/31" for number in range(100000)]
+    ban_list = BanList(fake_redis)
+    ban_list.networks = CIDRSet(networks)
+    ban_list.user_agents = UserAgentMatcher([f"scanner-{number}" for number in range(1000)])
+    started = perf_counter()
+    for number in range(10000):
+        ban_list.check(f"10.{number % 256}.{number // 256 % 256}.1", "Mozilla/5.0 (X11; Linux x86_64)")
+    # generous for slow machines, benchmarks/bench_ban_list.py measures it properly
+    assert (perf_counter() - started) / 10000 < 0.0005
@@ -0,0 +1,46 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from src.services.etag import etag_matches, etag_response, make_etag
+
+
+"""To start the test, enter : pytest tests/test_services/test_etag.py -v
+You must be in the killer_instagram directory in the console"""
+
+
+def request_with(if_none_match=None):
+    request = MagicMock()
+    request.headers = {"if-none-match": if_none_match} if if_none_match else {}
+    return request
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_make_etag():
+    assert make_etag(b"body") == make_etag(b"body")
+    assert make_etag(b"body") != make_etag(b"other body")
+    assert make_etag(b"body").startswith('"') and make_etag(b"body").endswith('"')
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.parametrize("header, expected", [
+    (None, False),
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"old", "abc"', True),
+    ("*", True),
+    ('"old"', False),
+])
+def test_etag_matches(header, expected):
+    assert etag_matches(request_with(header), '"abc"') is expected
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_etag_response():
+    response = etag_response(request_with(), {"id": 1})
+    assert response.status_code == 200
+    assert response.body == b'{"id":1}'
+    not_modified = etag_response(request_with(response.headers["etag"]), {"id": 1})
+    assert not_modified.status_code == 304
+    assert not_modified.body == b""
+    assert not_modified.headers["etag"] == response.headers["etag"]
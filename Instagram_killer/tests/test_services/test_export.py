@@ -0,0 +1,42 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+from src.services.export import csv_chunks, ndjson_chunks
+
+
+"""To start the test, enter : pytest tests/test_services/test_export.py -v
+You must be in the killer_instagram directory in the console"""
+
+
+FIELDS = ("id", "username", "created_at")
+BATCHES = [
+    [(1, "first", datetime(2023, 1, 1, 10, 0)), (2, "sec,ond", None)],
+    [(3, "third", datetime(2023, 1, 3))],
+]
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_ndjson_chunks():
+    chunks = list(ndjson_chunks(iter(BATCHES), FIELDS))
+    assert len(chunks) == 2
+    rows = [json.loads(line) for line in "".join(chunks).splitlines()]
+    assert rows[0] == {"id": 1, "username": "first", "created_at": "2023-01-01T10:00:00"}
+    assert rows[1]["created_at"] is None
+    assert [row["id"] for row in rows] == [1, 2, 3]
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_csv_chunks():
+    chunks = list(csv_chunks(iter(BATCHES), FIELDS))
+    assert len(chunks) == 2
+    assert chunks[0].startswith("id,username,created_at")
+    rows = list(csv.DictReader(io.StringIO("".join(chunks))))
+    assert rows[1] == {"id": "2", "username": "sec,ond", "created_at": ""}
+    assert rows[2]["created_at"] == "2023-01-03T00:00:00"
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_csv_chunks_without_rows():
+    assert list(csv_chunks(iter([]), FIELDS)) == ["id,username,created_at\r\n"]
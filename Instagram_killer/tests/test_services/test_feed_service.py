@@ -0,0 +1,106 @@
+import pytest
+
+from src.database.models import Image, User
+from src.services.feed import Feed
+from src.services.response_cache import ResponseCache
+
+
+"""To start the test, enter : pytest tests/test_services/test_feed_service.py -v
+You must be in the killer_instagram directory in the console"""
+
+
+@pytest.fixture(scope="module")
+def image_ids(session):
+    owner = User(username="feeder", email="feeder@example.com", password="password", confirmed=True)
+    session.add(owner)
+    session.flush()
+    images = [Image(user_id=owner.id, description=f"image {number}", image_url=f"https://example.com/{number}.jpg",
+                    public_id=f"feed_{number}", file_extension="jpg") for number in range(12)]
+    session.add_all(images)
+    session.commit()
+    return sorted((image.id for image in images), reverse=True)
+
+
+@pytest.fixture(scope="function")
+def feed(fake_redis):
+    return Feed(fake_redis, ResponseCache(fake_redis, retry_interval=60), size=5, retry_interval=60)
+
+
+async def read_all(feed: Feed, session, limit: int) -> list:
+    pages, before = [], None
+    while True:
+        image_ids, before = await feed.page(session, limit=limit, before=before)
+        pages.append(image_ids)
+        if before is None:
+            return pages
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_pages_continue_from_the_database_after_the_timeline(feed, session, image_ids, fake_redis):
+    pages = await read_all(feed, session, limit=4)
+    assert pages == [image_ids[:4], image_ids[4:8], image_ids[8:12]]
+    # the timeline was rebuilt with the newest images only
+    assert sorted(map(int, fake_redis.data[feed.timeline]), reverse=True) == image_ids[:5]
+    assert fake_redis.expirations[feed.timeline] == feed.ttl
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_timeline_with_all_images_is_read_without_the_database(session, image_ids, fake_redis, query_counter):
+    feed = Feed(fake_redis, ResponseCache(fake_redis, retry_interval=60), size=100, retry_interval=60)
+    assert (await feed.page(session, limit=20))[0] == image_ids
+    # the timeline ends with END, so short pages and the last one are not looked up in the database
+    with query_counter.budget(0):
+        assert await feed.page(session, limit=20) == (image_ids, None)
+        assert await read_all(feed, session, limit=5) == [image_ids[:5], image_ids[5:10], image_ids[10:]]
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_new_image_is_fanned_out_and_timeline_is_trimmed(feed, session, image_ids, fake_redis):
+    await feed.page(session, limit=2)
+    new_image = Image(user_id=1, description="new", image_url="https://example.com/new.jpg", public_id="feed_new",
+                      file_extension="jpg")
+    session.add(new_image)
+    session.commit()
+    await feed.publish(new_image.id)
+    try:
+        assert (await feed.page(session, limit=2))[0] == [new_image.id, image_ids[0]]
+        assert len(fake_redis.data[feed.timeline]) == feed.size
+
+        await feed.remove(new_image.id)
+        assert (await feed.page(session, limit=2))[0] == image_ids[:2]
+    finally:
+        session.delete(new_image)
+        session.commit()
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_timeline_created_by_a_new_image_expires(feed, fake_redis):
+    await feed.publish(100)
+    assert fake_redis.expirations[feed.timeline] == feed.ttl
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_cards_are_cached_until_the_image_changes(feed, session, image_ids, query_counter):
+    cards = await feed.cards(session, image_ids[:3] + [10 ** 6])
+    assert len(cards) == 3
+    with query_counter.budget(0):
+        assert await feed.cards(session, image_ids[:3]) == cards
+    assert list(cards) == image_ids[:3]
+
+    await feed.cache.invalidate(f"image:{image_ids[1]}")
+    with query_counter.budget(1):
+        assert await feed.cards(session, image_ids[:3]) == cards
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_feed_is_read_from_the_database_while_redis_is_down(feed, session, image_ids, fake_redis):
+    fake_redis.down = True
+    await feed.publish(10 ** 6)
+    assert await read_all(feed, session, limit=5) == [image_ids[:5], image_ids[5:10], image_ids[10:]]
+    assert len(await feed.cards(session, image_ids[:5])) == 5
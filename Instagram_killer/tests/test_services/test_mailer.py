@@ -0,0 +1,131 @@
+from email.message import EmailMessage
+from time import monotonic
+from unittest.mock import MagicMock
+
+import aiosmtplib
+import pytest
+
+from src.services import email as service_email
+from src.services.mailer import Mailer, RateLimiter, SMTPPool, is_transient
+from src.services.smtp_sink import SMTPSink
+
+
+"""To start the test, enter : pytest tests/test_services/test_mailer.py -v
+You must be in the killer_instagram directory in the console"""
+
+
+def make_message(number: int) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = "app@example.com"
+    message["To"] = f"user{number}@example.com"
+    message["Subject"] = f"Message {number}"
+    message.set_content("<p>Hi</p>", subtype="html")
+    return message
+
+
+def make_mailer(sink: SMTPSink, **options) -> Mailer:
+    pool = SMTPPool(hostname=sink.host, port=sink.port, use_tls=False, timeout=5)
+    options = {"workers": 2, "rate_limit": 0, "retry_backoff": 0.01, **options}
+    return Mailer(pool, **options)
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_messages_share_pooled_connections():
+    async with SMTPSink() as sink:
+        mailer = make_mailer(sink)
+        for number in range(20):
+            mailer.enqueue(make_message(number))
+        await mailer.stop()
+        assert sorted(message["Subject"] for message in sink.messages) == sorted(f"Message {number}" for number in range(20))
+        assert sink.connections <= 2
+        assert mailer.pool.connections_opened == sink.connections
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_temporary_error_is_retried():
+    async with SMTPSink() as sink:
+        mailer = make_mailer(sink)
+        sink.fail_next(451, times=2)
+        await mailer.send(make_message(1))
+        await mailer.stop()
+        assert [message["To"] for message in sink.messages] == ["user1@example.com"]
+        assert sink.connections == 1
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_permanent_error_is_not_retried():
+    async with SMTPSink() as sink:
+        mailer = make_mailer(sink)
+        sink.fail_next(550, "Mailbox unavailable")
+        with pytest.raises(aiosmtplib.SMTPResponseException) as error:
+            await mailer.send(make_message(1))
+        assert error.value.code == 550
+        await mailer.send(make_message(2))
+        await mailer.stop()
+        assert [message["To"] for message in sink.messages] == ["user2@example.com"]
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_dropped_connection_is_reopened():
+    async with SMTPSink() as sink:
+        mailer = make_mailer(sink, workers=1)
+        sink.drop_next()
+        await mailer.send(make_message(1))
+        await mailer.send(make_message(2))
+        await mailer.stop()
+        assert [message["To"] for message in sink.messages] == ["user1@example.com", "user2@example.com"]
+        assert sink.connections == 2
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_retries_are_limited():
+    async with SMTPSink() as sink:
+        mailer = make_mailer(sink, max_retries=2)
+        sink.fail_next(421, times=3)
+        with pytest.raises(aiosmtplib.SMTPResponseException):
+            await mailer.send(make_message(1))
+        await mailer.stop()
+        assert sink.messages == []
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_rate_limiter():
+    limiter = RateLimiter(rate=100, burst=5)
+    started = monotonic()
+    for _ in range(15):
+        await limiter.acquire()
+    # 5 operations of the burst are free, the next 10 are spaced by 10ms
+    assert 0.09 <= monotonic() - started < 0.5
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.parametrize("error, expected", [
+    (aiosmtplib.SMTPServerDisconnected("gone"), True),
+    (aiosmtplib.SMTPResponseException(451, "later"), True),
+    (aiosmtplib.SMTPResponseException(550, "no such user"), False),
+    (aiosmtplib.SMTPRecipientsRefused([aiosmtplib.SMTPRecipientRefused(450, "busy", "a@b.c")]), True),
+    (aiosmtplib.SMTPRecipientsRefused([aiosmtplib.SMTPRecipientRefused(550, "unknown", "a@b.c")]), False),
+    (ValueError("bug"), False),
+])
+def test_is_transient(error, expected):
+    assert is_transient(error) is expected
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_send_email_renders_template(monkeypatch):
+    enqueue = MagicMock()
+    monkeypatch.setattr(service_email.mailer, "enqueue", enqueue)
+    await service_email.send_email("user@example.com", "username", "http://testserver/")
+    message: EmailMessage = enqueue.call_args.args[0]
+    assert message["To"] == "user@example.com"
+    assert message["Subject"] == "Confirm your email "
+    body = message.get_content()
+    assert "Hi username," in body
+    assert "http://testserver/api/auth/confirmed_email/" in body
@@ -0,0 +1,65 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from prometheus_client import REGISTRY
+
+from src.services import metrics as service_metrics
+from src.services.auth import service_auth
+
+
+"""To start the test, enter : pytest tests/test_services/test_metrics.py -v 
+You must be in the killer_instagram directory in the console"""
+
+
+def sample(name: str, labels: dict) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_parse_buckets():
+    assert service_metrics.parse_buckets("1, 0.1,,0.5") == [0.1, 0.5, 1.0]
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_track_cloudinary_ok():
+    @service_metrics.track_cloudinary
+    def test_upload():
+        return "uploaded"
+
+    before = sample("cloudinary_call_duration_seconds_count", {"operation": "test_upload"})
+    assert test_upload() == "uploaded"
+    assert sample("cloudinary_call_duration_seconds_count", {"operation": "test_upload"}) == before + 1
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_track_cloudinary_error():
+    @service_metrics.track_cloudinary
+    def test_destroy():
+        raise ValueError("cloudinary is down")
+
+    before = sample("cloudinary_call_errors_total", {"operation": "test_destroy"})
+    with pytest.raises(ValueError):
+        test_destroy()
+    assert sample("cloudinary_call_errors_total", {"operation": "test_destroy"}) == before + 1
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.trio
+async def test_instrumented_redis_command():
+    client = service_metrics.InstrumentedRedis()
+    before = sample("redis_command_duration_seconds_count", {"command": "GET"})
+    with patch("redis.asyncio.Redis.execute_command", AsyncMock(return_value=b"value")):
+        assert await client.get("key") == b"value"
+    assert sample("redis_command_duration_seconds_count", {"command": "GET"}) == before + 1
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_metrics_use_route_template(client):
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        client.get("/api/images/12345")
+        client.get("/api/images/67890")
+    response = client.get("/metrics")
+    assert response.status_code == 200, response.text
+    assert 'route="/api/images/{image_id}"' in response.text
+    assert "/api/images/12345" not in response.text
+    assert "http_requests_in_progress" in response.text
@@ -0,0 +1,195 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from src.database.models import EmailOutbox
+from src.repository import outbox as repository_outbox
+from src.services.mailer import Mailer, SMTPPool
+from src.services.outbox import OutboxCollector, OutboxWorker, message_id
+from src.services.smtp_sink import SMTPSink
+
+
+"""To start the test, enter : pytest tests/test_services/test_outbox.py -v
+You must be in the killer_instagram directory in the console"""
+
+
+@pytest.fixture(scope="function")
+def db(session):
+    session.query(EmailOutbox).delete()
+    session.commit()
+    yield session
+    session.rollback()
+
+
+@pytest.fixture(scope="function")
+def session_factory(session):
+    return sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=session.get_bind())
+
+
+async def add_emails(db, quantity: int, kind: str = "confirm_email"):
+    emails = [await repository_outbox.add_email(kind, f"user{number}@example.com", f"user{number}",
+                                                "http://testserver/", db)
+              for number in range(quantity)]
+    db.commit()
+    return emails
+
+
+def make_worker(session_factory, sink: SMTPSink, **options) -> OutboxWorker:
+    mailer = Mailer(SMTPPool(hostname=sink.host, port=sink.port, use_tls=False, timeout=5),
+                    workers=2, rate_limit=0, max_retries=0)
+    options = {"retry_backoff": 60, **options}
+    return OutboxWorker(session_factory, mailer, **options)
+
+
+def stored(db, outbox_id: int) -> EmailOutbox:
+    db.expire_all()
+    return db.get(EmailOutbox, outbox_id)
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_due_emails_are_sent_and_marked(db, session_factory):
+    emails = await add_emails(db, 3)
+    async with SMTPSink() as sink:
+        worker = make_worker(session_factory, sink)
+        assert await worker.drain_once() == 3
+        assert await worker.drain_once() == 0
+        await worker.mailer.stop()
+    assert sorted(message["To"] for message in sink.messages) == [f"user{number}@example.com" for number in range(3)]
+    assert {message["Message-ID"] for message in sink.messages} == {message_id(outbox) for outbox in emails}
+    assert "http://testserver/api/auth/confirmed_email/" in sink.messages[0].get_content()
+    for outbox in emails:
+        outbox = stored(db, outbox.id)
+        assert (outbox.status, outbox.attempts) == ("sent", 1)
+        assert outbox.sent_at is not None
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_temporary_error_is_retried_later(db, session_factory):
+    [outbox] = await add_emails(db, 1)
+    async with SMTPSink() as sink:
+        worker = make_worker(session_factory, sink)
+        sink.fail_next(451, "Try again later")
+        assert await worker.drain_once() == 1
+        # the next attempt waits for the backoff
+        assert await worker.drain_once() == 0
+        await worker.mailer.stop()
+    outbox = stored(db, outbox.id)
+    assert (outbox.status, outbox.attempts) == ("pending", 1)
+    assert "451" in outbox.last_error
+    assert outbox.next_attempt_at > repository_outbox.utcnow() + timedelta(seconds=25)
+    assert sink.messages == []
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_permanent_error_is_dead_lettered(db, session_factory):
+    [outbox] = await add_emails(db, 1)
+    async with SMTPSink() as sink:
+        worker = make_worker(session_factory, sink)
+        sink.fail_next(550, "Mailbox unavailable")
+        await worker.drain_once()
+        await worker.mailer.stop()
+    outbox = stored(db, outbox.id)
+    assert outbox.status == "dead"
+    assert "550" in outbox.last_error
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_email_out_of_attempts_is_dead_lettered(db, session_factory):
+    [outbox] = await add_emails(db, 1)
+    async with SMTPSink() as sink:
+        worker = make_worker(session_factory, sink, max_attempts=2, retry_backoff=0)
+        sink.fail_next(451, times=5)
+        await worker.drain_once()
+        assert stored(db, outbox.id).status == "pending"
+        await worker.drain_once()
+        await worker.mailer.stop()
+    outbox = stored(db, outbox.id)
+    assert (outbox.status, outbox.attempts) == ("dead", 2)
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_claimed_email_is_taken_again_after_its_lease(db, session_factory):
+    crashed, running = await add_emails(db, 2)
+    now = repository_outbox.utcnow()
+    # a worker crashed while sending the first email, another one is still sending the second
+    for outbox, lease_until in ((crashed, now - timedelta(seconds=1)), (running, now + timedelta(seconds=60))):
+        outbox.status, outbox.attempts, outbox.next_attempt_at = "sending", 1, lease_until
+    db.commit()
+    async with SMTPSink() as sink:
+        worker = make_worker(session_factory, sink)
+        assert await worker.drain_once() == 1
+        await worker.mailer.stop()
+    assert [message["To"] for message in sink.messages] == [crashed.email]
+    assert sink.messages[0]["Message-ID"] == message_id(crashed)
+    assert (stored(db, crashed.id).status, stored(db, crashed.id).attempts) == ("sent", 2)
+    assert stored(db, running.id).status == "sending"
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_email_crashing_every_worker_is_dead_lettered(db, session_factory):
+    [outbox] = await add_emails(db, 1)
+    # every claim of the email crashed its worker before the result was marked
+    outbox.status, outbox.attempts = "sending", 2
+    outbox.next_attempt_at = repository_outbox.utcnow() - timedelta(seconds=1)
+    db.commit()
+    async with SMTPSink() as sink:
+        worker = make_worker(session_factory, sink, max_attempts=2)
+        assert await worker.drain_once() == 0
+        await worker.mailer.stop()
+    assert sink.messages == []
+    outbox = stored(db, outbox.id)
+    assert (outbox.status, outbox.attempts) == ("dead", 2)
+    assert "lease expired" in outbox.last_error
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_stopped_worker_gives_emails_back(db, session_factory):
+    [outbox] = await add_emails(db, 1)
+    async with SMTPSink(connect_delay=5) as sink:
+        worker = make_worker(session_factory, sink, poll_interval=0.01)
+        worker.start()
+        while stored(db, outbox.id).status != "sending":
+            await asyncio.sleep(0.01)
+        await worker.stop()
+        await worker.mailer.stop(timeout=0)
+    outbox = stored(db, outbox.id)
+    assert (outbox.status, outbox.attempts) == ("pending", 1)
+    assert outbox.next_attempt_at <= repository_outbox.utcnow()
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_outbox_lag(db):
+    assert repository_outbox.get_outbox_lag(db) == (0, 0.0)
+    [outbox, _] = await add_emails(db, 2)
+    outbox.created_at -= timedelta(seconds=90)
+    db.commit()
+    waiting, lag = repository_outbox.get_outbox_lag(db)
+    assert waiting == 2
+    assert 90 <= lag < 120
+    metrics = {metric.name: metric.samples[0].value for metric in OutboxCollector(lambda: db).collect()}
+    assert metrics["email_outbox_waiting"] == 2
+    assert metrics["email_outbox_lag_seconds"] >= 90
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_requeue_dead_and_delete_sent(db):
+    dead, sent = await add_emails(db, 2)
+    dead.status, dead.attempts = "dead", 8
+    sent.status, sent.sent_at = "sent", repository_outbox.utcnow() - timedelta(days=10)
+    db.commit()
+    dead_id, sent_id = dead.id, sent.id
+    assert await repository_outbox.requeue_dead_emails(db) == 1
+    assert await repository_outbox.delete_sent_emails(timedelta(days=7), db) == 1
+    assert (stored(db, dead_id).status, stored(db, dead_id).attempts) == ("pending", 0)
+    assert stored(db, sent_id) is None
@@ -0,0 +1,25 @@
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from src.services.pagination import encode_cursor, decode_cursor
+
+
+"""To start the test, enter : pytest tests/test_services/test_pagination.py -v
+You must be in the killer_instagram directory in the console"""
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2023, 12, 1, 10, 30, 15, 123456)
+    cursor = encode_cursor(created_at, 42)
+    assert "=" not in cursor
+    assert decode_cursor(cursor, datetime, int) == [created_at, 42]
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", encode_cursor(1), encode_cursor("yesterday", 1), "e30"])
+def test_decode_invalid_cursor(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor, datetime, int)
+    assert error.value.status_code == 400
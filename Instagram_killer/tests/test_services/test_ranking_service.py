@@ -0,0 +1,142 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.database.models import Image, Rating, User
+from src.services.ranking import ImageRanking, RankingUnavailable, trending_score, wilson_lower_bound
+
+
+"""To start the test, enter : pytest tests/test_services/test_ranking_service.py -v
+You must be in the killer_instagram directory in the console"""
+
+
+@pytest.fixture(scope="module")
+def rated_images(session):
+    owner = User(username="ranked", email="ranked@example.com", password="password", confirmed=True)
+    raters = [User(username=f"rater{number}", email=f"rater{number}@example.com", password="password",
+                   confirmed=True) for number in range(3)]
+    session.add_all([owner] + raters)
+    session.flush()
+    now = datetime.utcnow()
+    # an old image rated well, a new one rated worse and a new one without ratings
+    images = [Image(user_id=owner.id, description=f"ranked {number}", image_url=f"https://example.com/r{number}.jpg",
+                    public_id=f"ranked_{number}", file_extension="jpg", upload_time=upload_time)
+              for number, upload_time in enumerate([now - timedelta(days=10), now, now])]
+    session.add_all(images)
+    session.flush()
+    session.add_all([Rating(image_id=images[0].id, user_id=rater.id, rating=5) for rater in raters]
+                    + [Rating(image_id=images[1].id, user_id=rater.id, rating=4) for rater in raters])
+    session.commit()
+    return [image.id for image in images]
+
+
+@pytest.fixture(scope="function")
+def ranking(fake_redis):
+    return ImageRanking(fake_redis, size=2, half_life_hours=24)
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_wilson_lower_bound_prefers_many_good_ratings():
+    assert wilson_lower_bound(0, 0) == 0
+    assert wilson_lower_bound(3, 3) == 0
+    assert wilson_lower_bound(1, 5) < wilson_lower_bound(100, 450) < wilson_lower_bound(100, 500) < 1
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_trending_score_halves_with_the_age():
+    uploaded = datetime(2023, 11, 5, 12)
+    half_life = 3600
+    assert trending_score(0.8, uploaded, half_life) == pytest.approx(
+        trending_score(0.4, uploaded + timedelta(seconds=half_life), half_life))
+    assert trending_score(0.4, uploaded, half_life) < trending_score(0.4, uploaded + timedelta(minutes=1), half_life)
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_updates_keep_the_best_images_only(ranking, fake_redis):
+    uploaded = datetime(2023, 11, 5, 12)
+    await ranking.update(1, uploaded, 10, 45)
+    await ranking.update(2, uploaded, 10, 30)
+    await ranking.update(3, uploaded, 10, 50)
+    assert [image_id for image_id, _ in await ranking.top(None, "rated", limit=10)] == [3, 1]
+
+    # an image without positive ratings is not ranked
+    await ranking.update(3, uploaded, 1, 1)
+    await ranking.remove(1)
+    assert await ranking.top(None, "rated", limit=10) == []
+    assert fake_redis.data[ranking.key("trending")] == {}
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_missing_rankings_are_compacted_from_the_database(ranking, session, rated_images):
+    old, new, unrated = rated_images
+    assert [image_id for image_id, _ in await ranking.top(session, "rated", limit=10)] == [old, new]
+    first = await ranking.top(session, "trending", limit=1)
+    assert [image_id for image_id, _ in first] == [new]
+    assert [image_id for image_id, _ in await ranking.top(session, "trending", limit=10,
+                                                          after=(first[0][1], new))] == [old]
+
+    await ranking.remove(new)
+    await ranking.refresh(session, new)
+    await ranking.refresh(session, unrated)
+    assert [image_id for image_id, _ in await ranking.top(session, "trending", limit=10)] == [new, old]
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_rankings_without_redis_are_read_from_the_database(session, rated_images, fake_redis):
+    ranking = ImageRanking(fake_redis, size=2, enabled=False)
+    fake_redis.down = True
+    old, new, _ = rated_images
+    first = await ranking.top(session, "trending", limit=1)
+    assert [image_id for image_id, _ in first] == [new]
+    assert [image_id for image_id, _ in await ranking.top(session, "trending", limit=1,
+                                                          after=(first[0][1], new))] == [old]
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_only_one_process_compacts_in_an_interval(ranking, monkeypatch):
+    compactions = []
+
+    async def compact(db):
+        compactions.append(db)
+        return 0
+    monkeypatch.setattr(ranking, "compact", compact)
+    assert await ranking.compact_if_due() is True
+    assert await ranking.compact_if_due() is False
+    assert len(compactions) == 1
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_pages_follow_the_last_image_of_the_previous_page(fake_redis):
+    ranking = ImageRanking(fake_redis, size=10)
+    uploaded = datetime(2023, 11, 5, 12)
+    # three images with the same score and one below them
+    for image_id in (3, 12, 7):
+        await ranking.update(image_id, uploaded, 10, 45)
+    await ranking.update(5, uploaded, 10, 30)
+
+    first = await ranking.top(None, "rated", limit=2)
+    assert [image_id for image_id, _ in first] == [7, 3]
+    # an image that moves above the cursor does not shift the next page
+    await ranking.update(5, uploaded, 10, 50)
+    last_score = first[-1][1]
+    assert [image_id for image_id, _ in await ranking.top(None, "rated", limit=2, after=(last_score, 3))] == [12]
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_missing_rankings_are_compacted_by_one_request(ranking, session, rated_images, fake_redis):
+    fake_redis.data["top:compaction"] = b"another process"
+    with pytest.raises(RankingUnavailable):
+        await ranking.top(session, "rated", limit=10)
+    assert ranking.key("rated") not in fake_redis.data
+
+    del fake_redis.data["top:compaction"]
+    old, new, _ = rated_images
+    assert [image_id for image_id, _ in await ranking.top(session, "rated", limit=10)] == [old, new]
+    # the lock is given back after the compaction
+    assert "top:compaction" not in fake_redis.data
@@ -0,0 +1,107 @@
+from time import perf_counter
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from redis.exceptions import ConnectionError as RedisConnectionError
+from starlette.requests import Request
+
+from src.services.auth import service_auth
+from src.services.rate_limit import Limit, Limiter, LocalBuckets, client_key, parse_limits
+
+
+"""To start the test, enter : pytest tests/test_services/test_rate_limit_service.py -v
+You must be in the killer_instagram directory in the console"""
+
+
+def make_limiter(script) -> Limiter:
+    redis_client = MagicMock()
+    redis_client.register_script.return_value = script
+    return Limiter(redis_client, retry_interval=60)
+
+
+def make_request(headers: dict = None, host: str = "10.0.0.1") -> Request:
+    return Request({
+        "type": "http", "method": "GET", "path": "/", "query_string": b"",
+        "headers": [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()],
+        "client": (host, 1234),
+    })
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_parse_limits():
+    assert parse_limits("login=5/60/ip, upload_image=20/30,signup=0/60") == {
+        "login": Limit(5, 60, "ip"),
+        "upload_image": Limit(20, 30, "user"),
+        "signup": Limit(0, 60, "user"),
+    }
+    assert parse_limits("") == {}
+    with pytest.raises(ValueError):
+        parse_limits("login=5/60/everyone")
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_local_buckets_refill(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("src.services.rate_limit.monotonic", lambda: now[0])
+    buckets = LocalBuckets()
+    limit = Limit(2, 10)
+    assert [buckets.take("key", limit).allowed for _ in range(3)] == [True, True, False]
+    assert buckets.take("key", limit).retry_after == pytest.approx(5)
+    assert buckets.take("other", limit).allowed
+    now[0] += 5
+    assert buckets.take("key", limit).allowed
+    assert not buckets.take("key", limit).allowed
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_local_buckets_forget_least_recently_used():
+    buckets = LocalBuckets(max_keys=2)
+    limit = Limit(1, 60)
+    for key in ("a", "b", "a", "c"):
+        buckets.take(key, limit)
+    assert list(buckets._buckets) == ["a", "c"]
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_redis_decides():
+    script = AsyncMock(return_value=[0, 0, 1500])
+    limiter = make_limiter(script)
+    decision = await limiter.hit("login", "ip:10.0.0.1", Limit(10, 60, "ip"))
+    assert (decision.allowed, decision.remaining, decision.retry_after) == (False, 0, 1.5)
+    script.assert_awaited_once_with(keys=["rate_limit:login:ip:10.0.0.1"], args=[10, 10 / 60])
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_memory_is_used_while_redis_is_down():
+    script = AsyncMock(side_effect=RedisConnectionError("Connection refused"))
+    limiter = make_limiter(script)
+    limit = Limit(2, 60)
+    decisions = [await limiter.hit("login", "ip:10.0.0.1", limit) for _ in range(3)]
+    assert [decision.allowed for decision in decisions] == [True, True, False]
+    # Redis is not asked again until the retry interval passes
+    assert script.await_count == 1
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_fallback_is_fast():
+    limiter = make_limiter(AsyncMock(side_effect=RedisConnectionError("Connection refused")))
+    limit = Limit(10 ** 6, 1)
+    started = perf_counter()
+    for number in range(10000):
+        await limiter.hit("login", f"ip:{number % 100}", limit)
+    assert (perf_counter() - started) / 10000 < 0.0005
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_client_key():
+    token = await service_auth.create_access_token({"sub": "user@example.com"})
+    refresh_token = await service_auth.create_refresh_token({"sub": "user@example.com"})
+    assert client_key(make_request({"Authorization": f"Bearer {token}"}), "user") == "user:user@example.com"
+    assert client_key(make_request({"Authorization": f"Bearer {token}"}), "ip") == "ip:10.0.0.1"
+    assert client_key(make_request({"Authorization": f"Bearer {refresh_token}"}), "user") == "ip:10.0.0.1"
+    assert client_key(make_request({"Authorization": "Bearer forged"}), "user") == "ip:10.0.0.1"
+    assert client_key(make_request(), "user") == "ip:10.0.0.1"
@@ -0,0 +1,109 @@
+import pytest
+from starlette.requests import Request
+
+from src.services.response_cache import ResponseCache
+
+
+"""To start the test, enter : pytest tests/test_services/test_response_cache_service.py -v
+You must be in the killer_instagram directory in the console"""
+
+
+def make_request(etag: str = None) -> Request:
+    headers = [(b"if-none-match", etag.encode())] if etag else []
+    return Request({"type": "http", "method": "GET", "path": "/", "query_string": b"", "headers": headers})
+
+
+@pytest.fixture(scope="function")
+def cache(fake_redis):
+    return ResponseCache(fake_redis, retry_interval=60)
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_rendered_body_is_served_until_the_resource_changes(cache):
+    entry = await cache.lookup(make_request(), "image", "image:1")
+    assert (entry.response, entry.result) == (None, "miss")
+    response = await entry.render({"id": 1, "description": "old"})
+    etag = response.headers["ETag"]
+
+    entry = await cache.lookup(make_request(), "image", "image:1")
+    assert entry.result == "hit"
+    assert entry.response.body == response.body
+    assert entry.response.headers["ETag"] == etag
+
+    await cache.invalidate("image:1")
+    entry = await cache.lookup(make_request(etag), "image", "image:1")
+    assert (entry.response, entry.result) == (None, "miss")
+    assert entry.etag != etag
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_client_with_the_current_version_gets_304(cache):
+    entry = await cache.lookup(make_request(), "image", "image:1")
+    etag = (await entry.render({"id": 1})).headers["ETag"]
+    entry = await cache.lookup(make_request(f'W/{etag}, "other"'), "image", "image:1")
+    assert entry.result == "not_modified"
+    assert entry.response.status_code == 304
+    assert entry.response.body == b""
+    # another representation of the same resource has its own ETag
+    other = await cache.lookup(make_request(etag), "transformed_image", "image:1")
+    assert other.result == "miss"
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_deletions_make_all_responses_stale(cache):
+    entries = [await cache.lookup(make_request(), "comment", f"comment:{number}") for number in (1, 2)]
+    etags = [(await entry.render({"id": number})).headers["ETag"] for number, entry in enumerate(entries)]
+    await cache.invalidate_all()
+    for number, etag in zip((1, 2), etags):
+        entry = await cache.lookup(make_request(etag), "comment", f"comment:{number}")
+        assert entry.result == "miss"
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_expired_version_is_not_used_again(cache, fake_redis):
+    entry = await cache.lookup(make_request(), "comment", "comment:1")
+    etag = (await entry.render({"id": 1})).headers["ETag"]
+    del fake_redis.data["response:version:comment:1"]
+    entry = await cache.lookup(make_request(etag), "comment", "comment:1")
+    assert entry.result == "miss"
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_etag_of_the_body_is_used_while_redis_is_down(cache, fake_redis):
+    fake_redis.down = True
+    entry = await cache.lookup(make_request(), "image", "image:1")
+    assert (entry.response, entry.result) == (None, "bypass")
+    response = await entry.render({"id": 1})
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    # the cache is not asked again for the retry interval, the client still gets 304 by the hash of the body
+    fake_redis.down = False
+    entry = await cache.lookup(make_request(etag), "image", "image:1")
+    assert entry.result == "bypass"
+    assert (await entry.render({"id": 1})).status_code == 304
+    assert fake_redis.data == {}
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_render_many_renders_only_missing_bodies(cache):
+    rendered = []
+
+    async def render(missing):
+        rendered.append(missing)
+        return {item: f'{{"id":{item}}}'.encode() for item in missing if item != 3}
+
+    keys = {item: f"image:{item}" for item in (2, 1, 3)}
+    assert await cache.render_many("card", keys, render) == {2: b'{"id":2}', 1: b'{"id":1}'}
+    assert await cache.render_many("card", keys, render) == {2: b'{"id":2}', 1: b'{"id":1}'}
+    assert rendered == [[2, 1, 3], [3]]
+
+    await cache.invalidate("image:1")
+    await cache.render_many("card", keys, render)
+    assert rendered[-1] == [1, 3]
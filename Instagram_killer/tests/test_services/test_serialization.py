@@ -0,0 +1,65 @@
+import json
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from src.database.models import Comment, Image, TransformedImageLink
+from src.schemas.comments import CommentListResponse
+from src.schemas.images import ImageResponse
+from src.services.serialization import FastJSONResponse, model_serializer, trusted_response
+
+
+"""To start the test, enter : pytest tests/test_services/test_serialization.py -v
+You must be in the killer_instagram directory in the console"""
+
+
+def make_image(comment_count=3) -> Image:
+    image = Image(id=7, user_id=2, description="sea", image_url="https://example.com/sea.jpg", public_id="sea",
+                  file_extension="jpg", comment_count=comment_count,
+                  upload_time=datetime(2023, 11, 5, 10, 30, 15, 123456, tzinfo=timezone.utc))
+    image.transformed_links = [
+        TransformedImageLink(id=1, image_id=7, created_at=datetime(2023, 11, 6, 8, 0),
+                             transformation_url="https://example.com/sea_round.jpg", qr_code_url=None),
+    ]
+    return image
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_fast_response_renders_like_the_default_one():
+    content = {
+        "image": ImageResponse.from_db_model(make_image()),
+        "created": datetime(2023, 11, 5, 10, 30, 15, 123456),
+        "rating": Decimal("3.5"),
+        1: ["a", None, True],
+    }
+    assert json.loads(FastJSONResponse(content).body) == json.loads(JSONResponse(jsonable_encoder(content)).body)
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_orm_objects_are_rendered_with_their_loaded_columns():
+    image = make_image()
+    del image.transformed_links
+    expected = jsonable_encoder(image)
+    assert json.loads(FastJSONResponse([image]).body) == [expected]
+    assert "transformed_links" not in expected
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_model_serializer_reads_orm_objects_like_from_attributes():
+    image = make_image()
+    assert model_serializer(ImageResponse)(image) == ImageResponse.model_validate(image).model_dump()
+    # the default of a field that is not Optional replaces None, like the validator of comment_count does
+    assert model_serializer(ImageResponse)(make_image(comment_count=None))["comment_count"] == 0
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_trusted_response_returns_only_fields_of_the_schema():
+    comments = [Comment(id=number, comment=f"comment {number}", image_id=7, user_id=3,
+                        created_at=datetime(2023, 11, 5, 10, number), updated_at=None) for number in range(3)]
+    content = {"comments": comments, "comment_count": 3, "next_cursor": None}
+    response = trusted_response(content, CommentListResponse)
+    expected = jsonable_encoder(CommentListResponse(**content))
+    assert json.loads(response.body) == expected
+    assert "user_id" not in json.loads(response.body)["comments"][0]
@@ -0,0 +1,123 @@
+from unittest.mock import MagicMock
+
+from src.services.tags_index import TagIndex
+
+
+"""To start the test, enter : pytest tests/test_services/test_tags_index.py -v
+You must be in the killer_instagram directory in the console"""
+
+
+def make_index(usage: dict, scan_limit: int = TagIndex.SCAN_LIMIT, top_size: int = TagIndex.TOP_SIZE) -> TagIndex:
+    tag_index = TagIndex()
+    tag_index.SCAN_LIMIT = scan_limit
+    tag_index.TOP_SIZE = top_size
+    tag_index.load(usage.items())
+    return tag_index
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_search_by_prefix_ok():
+    tag_index = make_index({"sea": 1, "sun": 1, "summer": 1, "sunset": 1, "snow": 1})
+    assert tag_index.search(prefix="su") == ["summer", "sun", "sunset"]
+    assert tag_index.search(prefix="su", limit=2) == ["summer", "sun"]
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_search_not_found():
+    tag_index = make_index({"sea": 1, "sun": 1})
+    assert tag_index.search(prefix="x") == []
+    assert tag_index.search(prefix="zzz") == []
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_add_keeps_index_sorted():
+    tag_index = make_index({"sea": 1, "sun": 1})
+    tag_index.add(["snow", "sea", "sky"])
+    assert tag_index.search(prefix="s") == ["sea", "sky", "snow", "sun"]
+    assert tag_index.count("sea") == 2
+    assert tag_index.count("sky") == 1
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_add_before_load_is_ignored():
+    tag_index = TagIndex()
+    tag_index.add(["sea"])
+    assert tag_index.loaded is False
+    assert tag_index.search(prefix="s") == []
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_suggest_orders_by_usage():
+    tag_index = make_index({"sea": 5, "sun": 9, "summer": 2, "snow": 7, "cat": 20})
+    assert tag_index.suggest(prefix="s", limit=3) == ["sun", "snow", "sea"]
+    assert tag_index.suggest(prefix="su") == ["sun", "summer"]
+    assert tag_index.suggest(prefix="", limit=1) == ["cat"]
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_suggest_cached_prefix_follows_updates():
+    tag_index = make_index({"sea": 5, "sun": 9, "summer": 2, "snow": 7}, scan_limit=0)
+    assert tag_index.suggest(prefix="s", limit=2) == ["sun", "snow"]
+    for _ in range(8):
+        tag_index.add(["summer"])
+    assert tag_index.suggest(prefix="s", limit=2) == ["summer", "sun"]
+    tag_index.add(["sky"])
+    assert "sky" in tag_index.suggest(prefix="s")
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_remove_decreases_usage():
+    tag_index = make_index({"sea": 5, "sun": 6}, scan_limit=0)
+    assert tag_index.suggest(prefix="s") == ["sun", "sea"]
+    tag_index.remove(["sun", "sun", "unknown"])
+    tag_index.remove(["sun"])
+    assert tag_index.count("sun") == 4
+    assert tag_index.suggest(prefix="s") == ["sea", "sun"]
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_remove_keeps_cached_prefixes():
+    tag_index = make_index({"sea": 5, "sun": 9, "snow": 7, "sky": 1}, scan_limit=0, top_size=2)
+    assert tag_index.suggest(prefix="s", limit=2) == ["sun", "snow"]
+    tag_index._rank = MagicMock(wraps=tag_index._rank)
+    for _ in range(3):
+        tag_index.remove(["sun"])
+    assert tag_index.suggest(prefix="s", limit=2) == ["snow", "sun"]
+    assert tag_index.suggest(prefix="", limit=1) == ["snow"]
+    tag_index._rank.assert_called_once_with(tag_index._tags, tag_index._usage, "")
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_remove_below_uncached_tag_ranks_prefix_again():
+    tag_index = make_index({"sea": 5, "sun": 9, "snow": 7, "sky": 1}, scan_limit=0, top_size=2)
+    assert tag_index.suggest(prefix="s", limit=2) == ["sun", "snow"]
+    for _ in range(5):
+        tag_index.remove(["sun"])
+    assert tag_index.suggest(prefix="s", limit=1) == ["snow"]
+    assert tag_index.suggest(prefix="s", limit=2) == ["snow", "sea"]
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_load_ranks_cached_prefixes_again():
+    tag_index = make_index({"sea": 5, "sun": 9, "snow": 7}, scan_limit=0, top_size=2)
+    assert tag_index.suggest(prefix="s", limit=2) == ["sun", "snow"]
+    tag_index.load({"sea": 10, "sun": 9, "snow": 7}.items())
+    tag_index._rank = MagicMock(wraps=tag_index._rank)
+    assert tag_index.suggest(prefix="s", limit=2) == ["sea", "sun"]
+    tag_index._rank.assert_not_called()
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_start_refresh_once():
+    tag_index = make_index({"sea": 1})
+    assert tag_index.start_refresh() is True
+    assert tag_index.start_refresh() is False
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_is_stale():
+    tag_index = make_index({"sea": 1})
+    assert tag_index.is_stale(0) is False
+    assert tag_index.is_stale(3600) is False
+    tag_index.loaded_at -= 7200
+    assert tag_index.is_stale(3600) is True
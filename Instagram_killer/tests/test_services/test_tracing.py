@@ -0,0 +1,127 @@
+from contextlib import nullcontext
+
+import pytest
+from unittest.mock import AsyncMock, patch
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.trace import StatusCode
+
+from src.services import tracing as service_tracing
+from src.services.auth import service_auth
+from src.services.metrics import InstrumentedRedis
+
+
+"""To start the test, enter : pytest tests/test_services/test_tracing.py -v
+You must be in the killer_instagram directory in the console"""
+
+
+"""Fixtures:"""
+
+@pytest.fixture(scope="function")
+def exporter():
+    exporter = InMemorySpanExporter()
+    service_tracing.setup_tracing(sample_ratio=1, exporter=exporter)
+    yield exporter
+    service_tracing.shutdown_tracing()
+
+
+def finished_spans(exporter: InMemorySpanExporter) -> dict:
+    service_tracing._provider.force_flush()
+    return {span.name: span for span in exporter.get_finished_spans()}
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.trio
+async def test_traced_without_tracing():
+    service_tracing.setup_tracing(sample_ratio=0)
+
+    @service_tracing.traced
+    async def get_value(value):
+        return value
+
+    assert service_tracing.get_tracer() is None
+    assert await get_value(5) == 5
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.trio
+async def test_traced_nested_spans(exporter):
+    @service_tracing.traced
+    def build_name(value):
+        return f"name-{value}"
+
+    @service_tracing.traced
+    async def get_name(value):
+        return build_name(value)
+
+    assert await get_name(5) == "name-5"
+    spans = finished_spans(exporter)
+    parent = spans[f"{__name__}.test_traced_nested_spans.<locals>.get_name"]
+    child = spans[f"{__name__}.test_traced_nested_spans.<locals>.build_name"]
+    assert child.parent.span_id == parent.context.span_id
+    assert child.context.trace_id == parent.context.trace_id
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_traced_error(exporter):
+    @service_tracing.traced
+    def fail():
+        raise ValueError("broken")
+
+    with pytest.raises(ValueError):
+        fail()
+    span = finished_spans(exporter)[f"{__name__}.test_traced_error.<locals>.fail"]
+    assert span.status.status_code == StatusCode.ERROR
+    assert span.events[0].name == "exception"
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_sampling_ratio():
+    exporter = InMemorySpanExporter()
+    service_tracing.setup_tracing(sample_ratio=1e-9, exporter=exporter)
+
+    @service_tracing.traced
+    def noop():
+        return None
+
+    for _ in range(100):
+        noop()
+    assert finished_spans(exporter) == {}
+    service_tracing.shutdown_tracing()
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_unsampled_trace_skips_child_spans(exporter):
+    headers = {"traceparent": "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-00"}
+    with service_tracing.start_request_span("GET", "/api/images/1", headers) as span:
+        assert span.is_recording() is False
+        assert isinstance(service_tracing.start_span("redis GET"), nullcontext)
+    assert finished_spans(exporter) == {}
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_span_name():
+    assert service_tracing.span_name(service_tracing.traced) == "services.tracing.traced"
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.trio
+async def test_redis_command_span(exporter):
+    client = InstrumentedRedis()
+    with patch("redis.asyncio.Redis.execute_command", AsyncMock(return_value=b"value")):
+        assert await client.get("key") == b"value"
+    span = finished_spans(exporter)["redis GET"]
+    assert span.attributes["db.system"] == "redis"
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_request_span_continues_trace(client, exporter):
+    trace_id = "4bf92f3577b34da6a3ce929d0e0e4736"
+    with patch.object(service_auth, 'r_cashe') as r_mock:
+        r_mock.get.return_value = None
+        response = client.get("/api/images/12345",
+                              headers={"traceparent": f"00-{trace_id}-00f067aa0ba902b7-01"})
+    assert response.status_code == 401, response.text
+    span = finished_spans(exporter)["GET /api/images/{image_id}"]
+    assert format(span.context.trace_id, "032x") == trace_id
+    assert span.attributes["http.route"] == "/api/images/{image_id}"
+    assert span.attributes["http.status_code"] == 401
@@ -1,23 +1,143 @@
+import sys
+from pathlib import Path
+
 import uvicorn
 
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, status, Response
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 
 from sqlalchemy.orm import Session
 from sqlalchemy import text 
 
-from Instagram_killer.src.routes import auth, users, images, rating, comments
+# the application is imported as src, like in the tests and benchmarks,
+# so its modules and their module level state (metrics) are loaded only once
+sys.path.append(str(Path(__file__).parent / "Instagram_killer"))
+
+from src.routes import auth, users, images, rating, comments, tags, feed, follows
 
-from Instagram_killer.src.database.db import get_db
+from src.database.db import get_db, engine
+from src.middlewares.middlewares import (
+    query_stats_middleware, metrics_middleware, tracing_middleware, ban_middleware
+)
+from src.conf.config import settings
+from src.services import (
+    ban_list as service_ban_list, email as service_email, metrics as service_metrics, outbox as service_outbox,
+    ranking as service_ranking, tracing as service_tracing
+)
 
 
 app = FastAPI(debug=True)
 
+app.middleware("http")(query_stats_middleware)
+app.middleware("http")(metrics_middleware)
+app.middleware("http")(tracing_middleware)
+# the last added middleware runs first, banned clients are refused before any other work
+app.middleware("http")(ban_middleware)
+service_metrics.register_db_pool(engine)
+service_outbox.register_outbox_metrics()
+service_tracing.setup_tracing()
+
 # # create route so i don't need to add contacts/... everytime to my routes functions
 app.include_router(auth.router, prefix='/api')
 app.include_router(users.router, prefix='/api')
 app.include_router(images.router, prefix='/api')
 app.include_router(rating.router, prefix='/api')
 app.include_router(comments.router, prefix='/api')
+app.include_router(tags.router, prefix='/api')
+app.include_router(feed.router, prefix='/api')
+app.include_router(follows.router, prefix='/api')
+
+
+@app.on_event("startup")
+async def start_ban_list():
+    """
+    The start_ban_list function loads the ban lists from Redis and keeps reloading them when they change.
+    
+    :return: None
+    """
+    service_ban_list.ban_list.start()
+
+
+@app.on_event("startup")
+async def start_mailer():
+    """
+    The start_mailer function starts the workers that send queued emails.
+    
+    :return: None
+    """
+    service_email.mailer.start()
+
+
+@app.on_event("startup")
+async def start_outbox_worker():
+    """
+    The start_outbox_worker function starts sending emails saved in the outbox,
+    unless the worker runs as its own process.
+    
+    :return: None
+    """
+    if settings.outbox_worker_in_app:
+        service_outbox.worker.start()
+
+
+@app.on_event("startup")
+async def start_ranking():
+    """
+    The start_ranking function rebuilds the top images from the database every TOP_IMAGES_COMPACTION_SECONDS.
+    
+    :return: None
+    """
+    service_ranking.ranking.start()
+
+
+@app.on_event("shutdown")
+async def stop_ban_list():
+    """
+    The stop_ban_list function stops reloading the ban lists.
+    
+    :return: None
+    """
+    await service_ban_list.ban_list.stop()
+
+
+@app.on_event("shutdown")
+async def stop_outbox_worker():
+    """
+    The stop_outbox_worker function stops the outbox worker before the mailer it sends with.
+    
+    :return: None
+    """
+    await service_outbox.worker.stop()
+
+
+@app.on_event("shutdown")
+async def stop_mailer():
+    """
+    The stop_mailer function sends emails that are still in the queue and closes SMTP connections.
+    
+    :return: None
+    """
+    await service_email.mailer.stop()
+
+
+@app.on_event("shutdown")
+async def stop_ranking():
+    """
+    The stop_ranking function stops rebuilding the top images.
+    
+    :return: None
+    """
+    await service_ranking.ranking.stop()
+
+
+@app.on_event("shutdown")
+def shutdown_tracing():
+    """
+    The shutdown_tracing function exports spans that are still waiting in the queue when the application stops.
+    
+    :return: None
+    """
+    service_tracing.shutdown_tracing()
 
 
 @app.get("/")
@@ -30,6 +150,16 @@ async def read_root():
     return {"message": "Hello World!"}
 
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """
+    The metrics function returns all collected metrics in the Prometheus text format.
+    
+    :return: A response with the metrics
+    """
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
 @app.get("/api/healthchecker")
 def healthchecker(db: Session = Depends(get_db)):
     """